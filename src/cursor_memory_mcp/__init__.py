@@ -9,6 +9,15 @@ __version__ = "0.1.1"
 __author__ = "zjmwqx"
 __email__ = "zjmaspire@gmail.com"
 
-from .server import main
+from .inprocess import MemoryClient, ToolCallError, connect
+from .server import CursorMemoryMCP, main
+from .store import MemoryStore
 
-__all__ = ["main"]
+__all__ = [
+    "CursorMemoryMCP",
+    "MemoryClient",
+    "MemoryStore",
+    "ToolCallError",
+    "connect",
+    "main",
+]
@@ -0,0 +1,391 @@
+"""
+记忆的访问频率统计
+
+每条记忆有一个按指数衰减的访问分数：每次访问加上一个权重，分数每经过一个半衰期
+（默认7天，``CURSOR_MEMORY_ACCESS_HALF_LIFE_DAYS``）减半。分数只保存 (分数, 时间)
+两个值，读取时换算到当前时间，不需要保存访问记录。
+
+访问来自服务自己的读取工具：读取记忆版本记为一次访问，出现在发起搜索的项目自己的
+搜索结果中记为 ``SEARCH_WEIGHT`` 次（其它项目中的命中不计）。Cursor直接加载规则
+文件不经过服务，设置 ``CURSOR_MEMORY_ACCESS_ATIME=1`` 后，每次重新平衡前还会检查
+各文件的访问时间（atime），比上次检查时新则记一次访问。大多数Linux系统以relatime挂载，atime
+最多每天更新一次，所以这只是粗略的采样。
+
+计数保存在 ``.cursor/cache/access.json``。访问先记在内存中，距上次保存超过
+``FLUSH_INTERVAL`` 秒时才写文件；写入时在文件锁内读出已有分数，加上本进程的增量
+后原子替换，多个服务进程的计数不会互相覆盖。进程退出时保存剩余的增量。
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .budget import DEFAULT_BUDGET_TOKENS, ESTIMATOR_CJK, analyze_rule_budget
+from .frontmatter import set_field
+from .history import archive_version
+from .layout import AUTO_ALWAYS_APPLY_FIELD, MemoryLayout, file_lock, get_layout
+from .patch import rewrite_memory_file
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 1
+
+DEFAULT_HALF_LIFE_DAYS = 7.0
+
+# 出现在搜索结果中的权重：比直接读取弱
+SEARCH_WEIGHT = 0.5
+
+# 两次保存之间的最短间隔（秒）
+FLUSH_INTERVAL = 30.0
+
+# 重新平衡的默认参数：最多几条alwaysApply记忆、提升需要的最低分数、
+# 分数低于多少时降级
+DEFAULT_TOP_N = 5
+DEFAULT_MIN_SCORE = 3.0
+DEFAULT_STALE_SCORE = 0.5
+
+
+def access_file(project_path: str) -> Path:
+    """返回访问计数文件路径"""
+    return Path(project_path) / ".cursor" / "cache" / "access.json"
+
+
+def _half_life_seconds() -> float:
+    days = float(
+        os.environ.get("CURSOR_MEMORY_ACCESS_HALF_LIFE_DAYS", DEFAULT_HALF_LIFE_DAYS)
+    )
+    return max(days, 1e-6) * 86400
+
+
+def decay(score: float, since: float, now: float, half_life: float) -> float:
+    """把since时刻的分数换算到now时刻"""
+    if now <= since:
+        return score
+    return score * 0.5 ** ((now - since) / half_life)
+
+
+class AccessCounters:
+    """单个项目的衰减访问计数"""
+
+    def __init__(self, project_path: str, half_life: Optional[float] = None):
+        self.project_path = project_path
+        self.path = access_file(project_path)
+        self.half_life = half_life or _half_life_seconds()
+        # 名称 -> [分数, 时间, 上次采样的atime(纳秒)]
+        self._counters: Dict[str, List[float]] = {}
+        # 本进程还没有保存的增量：名称 -> [分数, 时间, 0]
+        self._pending: Dict[str, List[float]] = {}
+        # 本进程还没有保存的atime采样：名称 -> atime(纳秒)
+        self._atimes: Dict[str, int] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _add(self, counters: Dict[str, List[float]], name: str, weight: float, now):
+        entry = counters.get(name)
+        if entry is None:
+            counters[name] = [weight, now, 0]
+        else:
+            entry[0] = decay(entry[0], entry[1], now, self.half_life) + weight
+            entry[1] = now
+
+    def record(self, names: Iterable[str], weight: float = 1.0, now=None):
+        """记录访问，必要时保存"""
+        now = time.time() if now is None else now
+        with self._lock:
+            for name in names:
+                self._add(self._pending, name, weight, now)
+                self._add(self._counters, name, weight, now)
+            due = time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def _read(self) -> Dict[str, List[float]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"访问计数文件损坏，忽略: {e}")
+            return {}
+        if data.get("version") != STORE_VERSION:
+            return {}
+        return data.get("counters", {})
+
+    def flush(self):
+        """把本进程的增量合并到计数文件"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            atimes, self._atimes = self._atimes, {}
+            self._last_flush = time.monotonic()
+        # 项目已被删除时不要重新创建目录
+        if not pending and not atimes or not Path(self.project_path).is_dir():
+            return
+        try:
+            with file_lock(self.path.with_suffix(".lock")):
+                counters = self._read()
+                for name, (score, at, _) in pending.items():
+                    entry = counters.setdefault(name, [0.0, at, 0])
+                    since = max(entry[1], at)
+                    entry[0] = decay(entry[0], entry[1], since, self.half_life) + (
+                        decay(score, at, since, self.half_life)
+                    )
+                    entry[1] = since
+                for name, atime in atimes.items():
+                    entry = counters.setdefault(name, [0.0, time.time(), 0])
+                    entry[2] = max(entry[2], atime)
+                self._write(counters)
+        except OSError as e:
+            logger.warning(f"无法保存访问计数: {e}")
+            with self._lock:
+                for name, (score, at, _) in pending.items():
+                    self._add(self._pending, name, score, at)
+                for name, atime in atimes.items():
+                    self._atimes.setdefault(name, atime)
+            return
+        self._merge(counters)
+
+    def _merge(self, counters: Dict[str, List[float]]):
+        """以文件中的计数为准，再加上本进程还没有保存的增量"""
+        with self._lock:
+            self._counters = counters
+            for name, (score, at, _) in self._pending.items():
+                self._add(self._counters, name, score, at)
+            for name, atime in self._atimes.items():
+                self._counters.setdefault(name, [0.0, time.time(), 0])[2] = atime
+
+    def _write(self, counters: Dict[str, List[float]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": STORE_VERSION,
+                    "counters": {
+                        name: [round(score, 6), round(at, 3), atime]
+                        for name, (score, at, atime) in counters.items()
+                    },
+                },
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        os.replace(temp_file, self.path)
+
+    def sample_atimes(self, paths: Dict[str, Path]):
+        """检查文件的访问时间，比上次采样新的记为一次访问"""
+        accessed = []
+        with self._lock:
+            for name, path in paths.items():
+                try:
+                    atime = os.stat(path).st_atime_ns
+                except OSError:
+                    continue
+                entry = self._counters.get(name)
+                previous = entry[2] if entry else 0
+                if atime == previous:
+                    continue
+                # 第一次采样只记录基准，不计为访问
+                if previous and atime > previous:
+                    accessed.append(name)
+                self._atimes[name] = atime
+                if entry:
+                    entry[2] = atime
+                else:
+                    self._counters[name] = [0.0, time.time(), atime]
+        self.record(accessed)
+
+    def scores(self, now=None) -> Dict[str, float]:
+        """各记忆在当前时刻的分数"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return {
+                name: decay(score, at, now, self.half_life)
+                for name, (score, at, _) in self._counters.items()
+            }
+
+    def load(self):
+        """读取计数文件（保留本进程还没有保存的增量）"""
+        self._merge(self._read())
+
+    def forget(self, names: Iterable[str]):
+        """删除已不存在的记忆的计数"""
+        names = set(names)
+        if not names:
+            return
+        with self._lock:
+            for name in names:
+                self._pending.pop(name, None)
+                self._atimes.pop(name, None)
+        with file_lock(self.path.with_suffix(".lock")):
+            counters = self._read()
+            for name in names:
+                counters.pop(name, None)
+            self._write(counters)
+        self.load()
+
+
+_counters: Dict[str, AccessCounters] = {}
+_counters_lock = threading.Lock()
+
+
+def get_access_counters(project_path: str) -> AccessCounters:
+    """返回项目的访问计数（进程内缓存，第一次使用时读取文件）"""
+    with _counters_lock:
+        counters = _counters.get(project_path)
+        if counters is None:
+            counters = _counters[project_path] = AccessCounters(project_path)
+            counters.load()
+        return counters
+
+
+def flush_all():
+    """保存所有项目还没有保存的访问计数"""
+    with _counters_lock:
+        counters = list(_counters.values())
+    for c in counters:
+        c.flush()
+
+
+atexit.register(flush_all)
+
+
+def _plan(
+    memories: List[Dict[str, Any]],
+    scores: Dict[str, float],
+    top_n: int,
+    budget_tokens: int,
+    min_score: float,
+    stale_score: float,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """决定要提升和降级的记忆，返回 (保留, 提升, 降级)
+
+    由重新平衡提升（``auto``）且分数低于stale_score的alwaysApply记忆降级；其余
+    alwaysApply记忆保留并先占用预算，用户手写的alwaysApply规则不经过服务读取，分数
+    总是0，所以从不降级。剩余的名额和预算按分数从高到低分给分数不低于min_score的
+    记忆。提升和降级使用不同的阈值，分数在两者之间的记忆保持原状，避免在两次重新
+    平衡之间来回切换。
+    """
+    entries = [
+        {"name": m["name"], "score": round(scores.get(m["name"], 0.0), 3), **m}
+        for m in memories
+    ]
+    demoted = [
+        e
+        for e in entries
+        if e["always_apply"] and e.get("auto") and e["score"] < stale_score
+    ]
+    kept = [e for e in entries if e["always_apply"] and e not in demoted]
+    used = sum(e["tokens"] for e in kept)
+    promoted = []
+    candidates = sorted(
+        (e for e in entries if not e["always_apply"] and e["score"] >= min_score),
+        key=lambda e: (-e["score"], e["name"]),
+    )
+    for entry in candidates:
+        if len(kept) + len(promoted) >= top_n:
+            break
+        if used + entry["tokens"] <= budget_tokens:
+            promoted.append(entry)
+            used += entry["tokens"]
+    return kept, promoted, demoted
+
+
+def _set_always_apply(project_path: str, layout: MemoryLayout, name: str, value: bool):
+    """只改写frontmatter中的alwaysApply行，正文和其它字段保持原样
+
+    提升时同时标记 ``autoAlwaysApply``，降级时去掉标记。改写前的内容存为历史版本。
+    """
+    path = layout.path_for(name)
+
+    def transform(text: str) -> str:
+        text = set_field(text, "alwaysApply", value)
+        return set_field(text, AUTO_ALWAYS_APPLY_FIELD, True if value else None)
+
+    def archive(old_content: str, content: str):
+        old_mtime = datetime.fromtimestamp(path.stat().st_mtime)
+        archive_version(project_path, name, old_content, content, old_mtime)
+
+    # 只改一个字段，对任何内容都可以应用，不需要检查内容哈希
+    result = rewrite_memory_file(path, None, transform, archive)
+    layout.register(name, path, result.content)
+
+
+def rebalance_always_apply(
+    project_path: str,
+    top_n: int = DEFAULT_TOP_N,
+    budget_tokens: int = DEFAULT_BUDGET_TOKENS,
+    min_score: float = DEFAULT_MIN_SCORE,
+    stale_score: float = DEFAULT_STALE_SCORE,
+    estimator: str = ESTIMATOR_CJK,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """按访问分数调整记忆的alwaysApply
+
+    Args:
+        project_path: 项目根目录
+        top_n: alwaysApply记忆的最大数量
+        budget_tokens: alwaysApply记忆的token预算
+        min_score: 提升为alwaysApply需要的最低分数
+        stale_score: alwaysApply记忆的分数低于该值时降级
+        estimator: token估算方式
+        dry_run: 只报告计划，不修改文件
+    """
+    layout = get_layout(project_path)
+    counters = get_access_counters(project_path)
+    if os.environ.get("CURSOR_MEMORY_ACCESS_ATIME", "0") == "1":
+        counters.sample_atimes({name: layout.path_for(name) for name in layout.names()})
+    # 合并其它进程的计数
+    counters.flush()
+    counters.load()
+    scores = counters.scores()
+    if not dry_run:
+        counters.forget(set(scores) - set(layout.memories))
+
+    report = analyze_rule_budget(project_path, estimator, top_n=1)
+    memories = [
+        {**m, "auto": layout.memories[m["name"]].get("auto_always_apply", False)}
+        for m in report["memories"]
+    ]
+    kept, promoted, demoted = _plan(
+        memories, scores, top_n, budget_tokens, min_score, stale_score
+    )
+
+    errors = []
+    if not dry_run:
+        for entries, value in ((promoted, True), (demoted, False)):
+            for entry in entries:
+                try:
+                    _set_always_apply(project_path, layout, entry["name"], value)
+                except (OSError, UnicodeDecodeError) as e:
+                    errors.append(f"{entry['name']}: {e}")
+                    entry["error"] = str(e)
+    final = kept + [e for e in promoted if "error" not in e]
+    final += [e for e in demoted if "error" in e]
+
+    def summary(entries):
+        return [
+            {"name": e["name"], "score": e["score"], "tokens": e["tokens"]}
+            for e in entries
+            if "error" not in e
+        ]
+
+    if promoted or demoted:
+        logger.info(
+            f"重新平衡alwaysApply: 提升 {len(promoted)} 条, 降级 {len(demoted)} 条"
+        )
+    return {
+        "dry_run": dry_run,
+        "promoted": summary(promoted),
+        "demoted": summary(demoted),
+        "always_apply": sorted(e["name"] for e in final),
+        "always_apply_tokens": sum(e["tokens"] for e in final),
+        "budget_tokens": budget_tokens,
+        "errors": errors,
+    }
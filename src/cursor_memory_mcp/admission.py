@@ -0,0 +1,186 @@
+"""
+工具调用的准入控制与背压
+
+在工具分发之前限制：
+
+- 同时执行的调用数（``max_in_flight``）
+- 排队等待的调用数（``max_queue_length``）和最长等待时间（``max_queue_wait``）
+- 已接纳但尚未完成的请求负载总字节数（``max_queued_bytes``）
+- 每个客户端的调用速率（令牌桶，``rate`` 每秒补充，容量 ``burst``）
+
+超出限制的调用立即以 :class:`Overloaded` 拒绝，并给出建议的重试间隔，
+而不是无限排队占用内存和文件描述符。
+"""
+
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+DEFAULT_MAX_IN_FLIGHT = 16
+DEFAULT_MAX_QUEUE_LENGTH = 64
+DEFAULT_MAX_QUEUED_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_QUEUE_WAIT = 1.0
+DEFAULT_RATE = 50.0
+DEFAULT_BURST = 100
+
+# 客户端令牌桶数量超过该值时清理长期空闲的客户端
+_MAX_TRACKED_CLIENTS = 1024
+
+# 服务时间指数移动平均的平滑系数
+_EWMA_ALPHA = 0.2
+
+_MIN_RETRY_AFTER = 0.05
+
+
+class Overloaded(Exception):
+    """调用因过载被拒绝"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionStats:
+    """准入统计"""
+
+    admitted: int = 0
+    rejected: int = 0
+    in_flight: int = 0
+    queued: int = 0
+    queued_bytes: int = 0
+
+
+class AdmissionController:
+    """工具调用的准入控制器（在单个事件循环内使用）"""
+
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        max_queue_length: int = DEFAULT_MAX_QUEUE_LENGTH,
+        max_queued_bytes: int = DEFAULT_MAX_QUEUED_BYTES,
+        max_queue_wait: float = DEFAULT_MAX_QUEUE_WAIT,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue_length = max_queue_length
+        self.max_queued_bytes = max_queued_bytes
+        self.max_queue_wait = max_queue_wait
+        self.rate = rate
+        self.burst = burst
+
+        self.stats = AdmissionStats()
+        self._slots: Optional[asyncio.Semaphore] = None
+        # 客户端 -> (剩余令牌, 上次更新时间)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._service_time = 0.01
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """根据环境变量创建控制器"""
+        env = os.environ
+        return cls(
+            max_in_flight=int(
+                env.get("CURSOR_MEMORY_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT)
+            ),
+            max_queue_length=int(
+                env.get("CURSOR_MEMORY_MAX_QUEUE_LENGTH", DEFAULT_MAX_QUEUE_LENGTH)
+            ),
+            max_queued_bytes=int(
+                env.get("CURSOR_MEMORY_MAX_QUEUED_BYTES", DEFAULT_MAX_QUEUED_BYTES)
+            ),
+            max_queue_wait=float(
+                env.get("CURSOR_MEMORY_MAX_QUEUE_WAIT", DEFAULT_MAX_QUEUE_WAIT)
+            ),
+            rate=float(env.get("CURSOR_MEMORY_RATE", DEFAULT_RATE)),
+            burst=int(env.get("CURSOR_MEMORY_BURST", DEFAULT_BURST)),
+        )
+
+    def _retry_after_for_capacity(self) -> float:
+        """根据排队长度和平均服务时间估算重试间隔"""
+        waves = (self.stats.queued + 1) / self.max_in_flight
+        return max(_MIN_RETRY_AFTER, round(self._service_time * (waves + 1), 3))
+
+    def _take_token(self, client_id: str, now: float):
+        """从客户端的令牌桶中取一个令牌，不足时拒绝"""
+        if self.rate <= 0:
+            return
+        tokens, last = self._buckets.get(client_id, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self._buckets[client_id] = (tokens, now)
+            raise Overloaded("调用速率超出限制", round((1 - tokens) / self.rate, 3))
+        self._buckets[client_id] = (tokens - 1, now)
+
+        if len(self._buckets) > _MAX_TRACKED_CLIENTS:
+            idle = self.burst / self.rate
+            self._buckets = {
+                k: v for k, v in self._buckets.items() if now - v[1] < idle
+            }
+
+    @asynccontextmanager
+    async def admit(self, client_id: str, payload_bytes: int) -> AsyncIterator[None]:
+        """申请执行一次调用，退出上下文时释放资源
+
+        Raises:
+            Overloaded: 超出速率、排队或字节预算限制
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+
+        now = time.monotonic()
+        try:
+            self._take_token(client_id, now)
+            if self.stats.queued_bytes + payload_bytes > self.max_queued_bytes:
+                raise Overloaded(
+                    "排队请求的总大小超出限制", self._retry_after_for_capacity()
+                )
+            if self._slots.locked() and self.stats.queued >= self.max_queue_length:
+                raise Overloaded("等待队列已满", self._retry_after_for_capacity())
+        except Overloaded:
+            self.stats.rejected += 1
+            raise
+
+        self.stats.queued_bytes += payload_bytes
+        self.stats.queued += 1
+        try:
+            try:
+                if self._slots.locked():
+                    await asyncio.wait_for(self._slots.acquire(), self.max_queue_wait)
+                else:
+                    await self._slots.acquire()
+            except asyncio.TimeoutError:
+                self.stats.rejected += 1
+                raise Overloaded(
+                    "排队等待超时", self._retry_after_for_capacity()
+                ) from None
+            finally:
+                self.stats.queued -= 1
+
+            self.stats.admitted += 1
+            self.stats.in_flight += 1
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self.stats.in_flight -= 1
+                self._slots.release()
+                elapsed = time.monotonic() - started
+                self._service_time += _EWMA_ALPHA * (elapsed - self._service_time)
+        finally:
+            self.stats.queued_bytes -= payload_bytes
+
+
+def payload_size(arguments: Dict[str, Any]) -> int:
+    """工具参数序列化为JSON后的字节数
+
+    包括嵌套的列表和对象（例如 ``patches``），它们不能绕过排队字节预算。
+    """
+    text = json.dumps(arguments, ensure_ascii=False, default=str)
+    return len(text.encode("utf-8", errors="replace"))
@@ -0,0 +1,125 @@
+"""
+向已有记忆追加带时间戳的小节
+
+增量的进度记录不需要每次重写整个文件：新的小节以一次 ``O_APPEND`` 写入追加到文件
+末尾，写入期间持有文件锁。frontmatter位于文件开头，追加不会触及它；追加中途崩溃
+最多在文件末尾留下不完整的小节。
+
+历史版本以最新文件为基准反向还原，追加同样会改变最新文件，因此调用方可以传入
+``before_append``，在持有锁时拿到追加前的长度，把旧版本记为截断到这个长度。
+
+以下情况退回到 临时文件 + 原子替换 的重写方式：
+
+- 文件有多个硬链接：原地追加会同时修改其它链接指向的内容
+- 单次写入没有写完（例如磁盘已满）：先截断回原来的长度，再重写
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows上没有fcntl，只依赖O_APPEND的原子性
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SECTION_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+MODE_APPEND = "append"
+MODE_REWRITE = "rewrite"
+
+
+@dataclass
+class AppendResult:
+    """追加结果"""
+
+    mode: str
+    bytes_appended: int
+    size: int
+
+
+def format_section(
+    note: str, title: Optional[str] = None, now: Optional[datetime] = None
+) -> str:
+    """生成追加的小节：二级标题为时间戳（和可选的标题），正文为记录内容"""
+    heading = (now or datetime.now()).strftime(SECTION_TIME_FORMAT)
+    if title:
+        heading = f"{heading} {title}"
+    return f"## {heading}\n{note.rstrip()}\n"
+
+
+def _separator(f, size: int) -> bytes:
+    """新小节之前需要的分隔：与上一节之间空一行"""
+    if size == 0:
+        return b""
+    f.seek(size - 1)
+    return b"\n" if f.read(1) == b"\n" else b"\n\n"
+
+
+def _rewrite(path: Path, data: bytes) -> int:
+    """读取整个文件，把追加后的内容写入临时文件再原子替换"""
+    with open(path, "rb") as f:
+        content = f.read()
+        separator = _separator(f, len(content))
+    new_content = content + separator + data
+    temp_file = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_file, "wb") as f:
+        f.write(new_content)
+    os.replace(temp_file, path)
+    return len(new_content)
+
+
+def open_locked(path: Path) -> int:
+    """以O_APPEND打开记忆文件并加排它锁，返回文件描述符
+
+    追加和按小节更新都在持有这把锁时进行。等待锁期间文件可能被重写替换（旧的
+    inode已不在目录中），此时重新打开，保证操作的是当前的文件。
+    """
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_APPEND)
+        if fcntl is None:
+            return fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                return fd
+        except OSError:
+            os.close(fd)
+            raise
+        os.close(fd)
+
+
+def append_section(
+    path: Path,
+    section: str,
+    before_append: Optional[Callable[[os.stat_result], None]] = None,
+) -> AppendResult:
+    """把小节追加到记忆文件末尾
+
+    Args:
+        path: 记忆文件，必须已存在
+        section: 要追加的文本（通常由 :func:`format_section` 生成）
+        before_append: 写入之前以追加前文件的stat调用，例如按原来的长度归档旧版本；
+            调用时持有文件锁，抛出异常则不追加
+    """
+    data = section.encode("utf-8")
+    fd = open_locked(path)
+    with os.fdopen(fd, "rb+", buffering=0) as f:
+        stat = os.fstat(fd)
+        if before_append is not None:
+            before_append(stat)
+        if stat.st_nlink > 1:
+            return AppendResult(MODE_REWRITE, len(data), _rewrite(path, data))
+        chunk = _separator(f, stat.st_size) + data
+        written = os.write(fd, chunk)
+        if written != len(chunk):
+            logger.warning(f"追加写入不完整 ({written}/{len(chunk)})，改为重写: {path}")
+            os.ftruncate(fd, stat.st_size)
+            return AppendResult(MODE_REWRITE, len(data), _rewrite(path, data))
+        return AppendResult(MODE_APPEND, len(data), stat.st_size + written)
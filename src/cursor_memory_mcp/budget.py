@@ -0,0 +1,307 @@
+"""
+.cursor/rules 的上下文预算分析
+
+估算每条记忆占用的token数，找出 ``alwaysApply`` 规则、近似重复的记忆和体积最大的记忆，
+并给出优化建议。每个文件的估算结果按内容哈希缓存在 ``.cursor/cache/rule_budget.json``，
+文件列表和内容哈希取自记忆清单，文件未变化（修改时间和大小相同）时不会重新读取，
+因此重复分析几乎是即时的。
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from .frontmatter import parse_memory_file
+from .layout import content_hash, get_layout
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+ESTIMATOR_CJK = "cjk"
+ESTIMATOR_SIMPLE = "simple"
+ESTIMATORS = (ESTIMATOR_CJK, ESTIMATOR_SIMPLE)
+
+# 非CJK文本平均每个token对应的字符数
+CHARS_PER_TOKEN = 4
+
+# CJK字符（汉字、假名、谚文、全角标点）平均每个字符对应的token数
+TOKENS_PER_CJK_CHAR = 1.0
+
+# SimHash海明距离不超过该值时视为近似重复
+NEAR_DUPLICATE_DISTANCE = 6
+
+# 单条alwaysApply记忆超过该token数时建议改为按需加载
+LARGE_ALWAYS_APPLY_TOKENS = 1000
+
+# 单条记忆超过该token数时建议拆分
+LARGE_MEMORY_TOKENS = 4000
+
+DEFAULT_BUDGET_TOKENS = 8000
+
+_CJK_PATTERN = re.compile(
+    "[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff"
+    "\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]"
+)
+_WHITESPACE = re.compile(r"\s+")
+
+_SHINGLE_SIZE = 3
+_SIMHASH_BITS = 64
+
+# 计算SimHash时只取哈希值最小的这么多个shingle（bottom-k采样），
+# 让大文件的指纹计算成本有上限，同时保持相似文本的采样结果相似
+_SIMHASH_FEATURES = 256
+
+
+def cache_file(project_path: str) -> Path:
+    """返回预算缓存文件路径"""
+    return Path(project_path) / ".cursor" / "cache" / "rule_budget.json"
+
+
+def estimate_tokens(text: str, estimator: str = ESTIMATOR_CJK) -> int:
+    """估算文本的token数
+
+    ``simple`` 按每4个字符一个token估算；``cjk`` 对中日韩字符按每字一个token计算，
+    其余字符仍按每4个字符一个token估算。对中文为主的文本，``simple`` 会严重低估。
+    """
+    if not text:
+        return 0
+    if estimator == ESTIMATOR_SIMPLE:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    cjk = len(_CJK_PATTERN.findall(text))
+    return math.ceil(cjk * TOKENS_PER_CJK_CHAR + (len(text) - cjk) / CHARS_PER_TOKEN)
+
+
+def simhash(text: str) -> int:
+    """计算文本的64位SimHash指纹（基于字符3-gram，对中英文都适用）"""
+    normalized = _WHITESPACE.sub(" ", text.lower()).strip()
+    hashes = {
+        int.from_bytes(
+            hashlib.blake2b(
+                normalized[i : i + _SHINGLE_SIZE].encode("utf-8"), digest_size=8
+            ).digest(),
+            "big",
+        )
+        for i in range(max(1, len(normalized) - _SHINGLE_SIZE + 1))
+    }
+    weights = [0] * _SIMHASH_BITS
+    for h in heapq.nsmallest(_SIMHASH_FEATURES, hashes):
+        for bit in range(_SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(_SIMHASH_BITS) if weights[bit] > 0)
+
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def find_near_duplicates(
+    fingerprints: Dict[str, int], max_distance: int = NEAR_DUPLICATE_DISTANCE
+) -> List[Tuple[str, str, int]]:
+    """找出指纹海明距离不超过max_distance的记忆对
+
+    把64位指纹切成 max_distance+1 段：距离不超过max_distance的两个指纹
+    至少有一段完全相同，因此只需要比较落在同一个桶里的记忆，而不是两两比较。
+    """
+    bands = max_distance + 1
+    width = _SIMHASH_BITS // bands
+    mask = (1 << width) - 1
+    buckets: Dict[Tuple[int, int], List[str]] = {}
+    for name, fp in fingerprints.items():
+        for band in range(bands):
+            buckets.setdefault((band, fp >> (band * width) & mask), []).append(name)
+
+    pairs = {}
+    for names in buckets.values():
+        for i in range(len(names)):
+            for j in range(i + 1, len(names)):
+                a, b = sorted((names[i], names[j]))
+                if (a, b) not in pairs:
+                    distance = _hamming(fingerprints[a], fingerprints[b])
+                    if distance <= max_distance:
+                        pairs[(a, b)] = distance
+    return sorted((a, b, d) for (a, b), d in pairs.items())
+
+
+class BudgetCache:
+    """按内容哈希缓存的估算结果"""
+
+    def __init__(self, project_path: str):
+        self.path = cache_file(project_path)
+        # 文件名 -> [mtime_ns, size, 内容哈希]
+        self.files: Dict[str, List] = {}
+        # 内容哈希 -> 估算结果
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == CACHE_VERSION:
+            self.files = data.get("files", {})
+            self.entries = data.get("entries", {})
+
+    def save(self, live_names: set):
+        """保存缓存，同时清理已删除文件的条目"""
+        if not self.dirty and live_names == self.files.keys():
+            return
+        self.files = {k: v for k, v in self.files.items() if k in live_names}
+        live_hashes = {v[2] for v in self.files.values()}
+        self.entries = {k: v for k, v in self.entries.items() if k in live_hashes}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = self.path.with_suffix(".tmp")
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "version": CACHE_VERSION,
+                        "files": self.files,
+                        "entries": self.entries,
+                    },
+                    f,
+                    separators=(",", ":"),
+                )
+            temp_file.replace(self.path)
+        except OSError as e:
+            logger.warning(f"无法保存预算缓存: {e}")
+
+    def analyze(self, name: str, path: Path, meta: Dict[str, Any]) -> Dict[str, Any]:
+        """返回单个文件的估算结果
+
+        文件未变化时直接使用缓存；文件与清单记录一致时使用清单中的内容哈希查找
+        缓存（例如内容相同的另一条记忆），只有两者都没有命中时才读取文件。
+        """
+        stat = os.stat(path)
+        key = [stat.st_mtime_ns, stat.st_size]
+        cached = self.files.get(name)
+        if cached and cached[:2] == key and cached[2] in self.entries:
+            return self.entries[cached[2]]
+        if key == [meta["modified"], meta["size"]] and meta["hash"] in self.entries:
+            self.files[name] = key + [meta["hash"]]
+            self.dirty = True
+            return self.entries[meta["hash"]]
+
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        digest = content_hash(text)
+        self.files[name] = [stat.st_mtime_ns, stat.st_size, digest]
+        self.dirty = True
+        if digest not in self.entries:
+            fields, body = parse_memory_file(text)
+            self.entries[digest] = {
+                "tokens": {e: estimate_tokens(text, e) for e in ESTIMATORS},
+                "bytes": stat.st_size,
+                "always_apply": fields.get("alwaysApply") is True,
+                "globs": fields.get("globs") or "",
+                "description": fields.get("description") or "",
+                "simhash": str(simhash(body)),
+            }
+        return self.entries[digest]
+
+
+def analyze_rule_budget(
+    project_path: str,
+    estimator: str = ESTIMATOR_CJK,
+    top_n: int = 10,
+    budget_tokens: int = DEFAULT_BUDGET_TOKENS,
+) -> Dict[str, Any]:
+    """分析项目记忆的上下文预算
+
+    Args:
+        project_path: 项目根目录
+        estimator: token估算方式，``cjk`` 或 ``simple``
+        top_n: 报告中列出的最大记忆数量
+        budget_tokens: alwaysApply记忆的token预算
+    """
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"未知的估算方式: {estimator}")
+
+    cache = BudgetCache(project_path)
+    memories = []
+    fingerprints: Dict[str, int] = {}
+    errors = []
+    layout = get_layout(project_path)
+    for name, meta in sorted(layout.memories.items()):
+        try:
+            result = cache.analyze(name, layout.path_for(name), meta)
+        except (OSError, UnicodeDecodeError) as e:
+            errors.append(f"{name}: {e}")
+            continue
+        memories.append(
+            {
+                "name": name,
+                "tokens": result["tokens"][estimator],
+                "bytes": result["bytes"],
+                "always_apply": result["always_apply"],
+                "has_globs": bool(result["globs"]),
+            }
+        )
+        fingerprints[name] = int(result["simhash"])
+    cache.save({m["name"] for m in memories})
+
+    memories.sort(key=lambda m: (-m["tokens"], m["name"]))
+    always_apply = [m for m in memories if m["always_apply"]]
+    total_tokens = sum(m["tokens"] for m in memories)
+    always_apply_tokens = sum(m["tokens"] for m in always_apply)
+    near_duplicates = [
+        {"a": a, "b": b, "similarity": round(1 - d / _SIMHASH_BITS, 3)}
+        for a, b, d in find_near_duplicates(fingerprints)
+    ]
+
+    return {
+        "estimator": estimator,
+        "memory_count": len(memories),
+        "total_tokens": total_tokens,
+        "always_apply_count": len(always_apply),
+        "always_apply_tokens": always_apply_tokens,
+        "budget_tokens": budget_tokens,
+        "largest": memories[:top_n],
+        "always_apply": [m["name"] for m in always_apply],
+        "near_duplicates": near_duplicates,
+        "recommendations": _recommendations(
+            memories, always_apply_tokens, budget_tokens, near_duplicates
+        ),
+        "memories": memories,
+        "errors": errors,
+    }
+
+
+def _recommendations(
+    memories: List[Dict[str, Any]],
+    always_apply_tokens: int,
+    budget_tokens: int,
+    near_duplicates: List[Dict[str, Any]],
+) -> List[str]:
+    """根据分析结果生成优化建议"""
+    recommendations = []
+    if always_apply_tokens > budget_tokens:
+        recommendations.append(
+            f"alwaysApply记忆共约 {always_apply_tokens} tokens，超出预算 "
+            f"{budget_tokens} tokens，每次请求都会加载，建议减少alwaysApply规则"
+        )
+    for m in memories:
+        if m["always_apply"] and m["tokens"] > LARGE_ALWAYS_APPLY_TOKENS:
+            recommendations.append(
+                f"{m['name']} 是alwaysApply规则且约 {m['tokens']} tokens，"
+                "建议改为按需加载或通过globs自动附加"
+            )
+        if m["tokens"] > LARGE_MEMORY_TOKENS:
+            recommendations.append(
+                f"{m['name']} 约 {m['tokens']} tokens，建议拆分为更小的主题记忆"
+            )
+    for pair in near_duplicates:
+        recommendations.append(
+            f"{pair['a']} 与 {pair['b']} 内容高度相似"
+            f"（相似度 {pair['similarity']:.0%}），建议合并"
+        )
+    return recommendations
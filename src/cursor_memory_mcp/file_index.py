@@ -0,0 +1,343 @@
+"""
+项目文件索引
+
+记录项目中所有未被 ``.gitignore`` 忽略的文件，用于根据任务总结推导 ``globs``。
+索引按目录缓存：刷新时只对每个目录做一次 ``stat``，目录的修改时间未变化时直接复用
+缓存的文件列表，因此在热缓存下即使是十万级文件的仓库也只需要很短的时间。
+缓存同时持久化到 ``.cursor/cache/file_index.json``，新进程也可以从热缓存启动。
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+# 始终跳过的目录
+ALWAYS_SKIPPED = {".git", ".cursor"}
+
+# 同一进程内两次刷新之间的最短间隔（秒）
+DEFAULT_MAX_AGE = 2.0
+
+
+def cache_file(project_path: str) -> Path:
+    """返回索引缓存文件路径"""
+    return Path(project_path) / ".cursor" / "cache" / "file_index.json"
+
+
+def _translate(pattern: str) -> str:
+    """把gitignore通配符转换为正则表达式"""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            parts.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                parts.append(re.escape("["))
+                i += 1
+            else:
+                parts.append(pattern[i : end + 1].replace("[!", "[^"))
+                i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts) + r"\Z"
+
+
+class IgnoreRule:
+    """单条gitignore规则"""
+
+    __slots__ = ("base", "negate", "dir_only", "anchored", "regex")
+
+    def __init__(self, base: str, line: str):
+        self.base = base
+        self.negate = line.startswith("!")
+        if self.negate:
+            line = line[1:]
+        self.dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        self.anchored = "/" in line
+        self.regex = re.compile(_translate(line.lstrip("/")))
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        """判断相对项目根目录的路径是否匹配该规则"""
+        if self.dir_only and not is_dir:
+            return False
+        if self.base:
+            if not rel_path.startswith(self.base + "/"):
+                return False
+            rel_path = rel_path[len(self.base) + 1 :]
+        if self.anchored:
+            return self.regex.match(rel_path) is not None
+        return self.regex.match(rel_path.rsplit("/", 1)[-1]) is not None
+
+
+def parse_gitignore(path: Path, base: str) -> List[IgnoreRule]:
+    """解析一个.gitignore文件"""
+    rules = []
+    try:
+        text = path.read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return rules
+    for raw in text.splitlines():
+        line = raw.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("\\"):
+            line = line[1:]
+        rules.append(IgnoreRule(base, line))
+    return rules
+
+
+def is_ignored(rules: List[IgnoreRule], rel_path: str, is_dir: bool) -> bool:
+    """按gitignore语义判断路径是否被忽略（最后一条匹配的规则生效）"""
+    ignored = False
+    for rule in rules:
+        if rule.matches(rel_path, is_dir):
+            ignored = not rule.negate
+    return ignored
+
+
+class ProjectFileIndex:
+    """单个项目的文件索引"""
+
+    def __init__(self, project_path: str):
+        self.root = Path(project_path)
+        # 目录相对路径 -> (mtime_ns, 文件名列表, 子目录名列表)
+        self._dirs: Dict[str, Tuple[int, List[str], List[str]]] = {}
+        # .gitignore相对路径 -> mtime_ns
+        self._ignore_files: Dict[str, int] = {}
+        self._files: Optional[List[str]] = None
+        self._by_name: Optional[Dict[str, List[str]]] = None
+        self._by_stem: Optional[Dict[str, List[str]]] = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._load_cache()
+
+    def _load_cache(self):
+        """从磁盘加载持久化的缓存"""
+        path = cache_file(str(self.root))
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != CACHE_VERSION:
+            return
+        self._dirs = {k: tuple(v) for k, v in data.get("dirs", {}).items()}
+        self._ignore_files = data.get("ignore_files", {})
+
+    def _save_cache(self):
+        """原子地持久化缓存"""
+        path = cache_file(str(self.root))
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = path.with_suffix(".tmp")
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "version": CACHE_VERSION,
+                        "dirs": self._dirs,
+                        "ignore_files": self._ignore_files,
+                    },
+                    f,
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                )
+            temp_file.replace(path)
+        except OSError as e:
+            logger.warning(f"无法保存文件索引缓存: {e}")
+
+    def _ignore_files_changed(self) -> bool:
+        """检查已知的.gitignore文件是否被修改或删除"""
+        for rel_path, mtime_ns in self._ignore_files.items():
+            try:
+                if os.stat(self.root / rel_path).st_mtime_ns != mtime_ns:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def refresh(self, max_age: float = DEFAULT_MAX_AGE) -> bool:
+        """增量刷新索引
+
+        Args:
+            max_age: 距离上次刷新不足该秒数时直接复用内存中的结果
+
+        Returns:
+            索引内容是否发生变化
+        """
+        with self._lock:
+            if self._refreshed_at and time.monotonic() - self._refreshed_at < max_age:
+                return False
+
+            # 先确保缓存目录存在，避免保存缓存时改变项目根目录的修改时间
+            try:
+                cache_file(str(self.root)).parent.mkdir(parents=True, exist_ok=True)
+            except OSError:
+                pass
+
+            if self._ignore_files_changed():
+                # gitignore变化会影响整棵子树的过滤结果，全量重建
+                self._dirs = {}
+                self._ignore_files = {}
+
+            new_dirs: Dict[str, Tuple[int, List[str], List[str]]] = {}
+            new_ignore_files: Dict[str, int] = {}
+            changed = self._walk("", [], new_dirs, new_ignore_files, False)
+            changed = changed or new_dirs.keys() != self._dirs.keys()
+            mtimes_changed = any(
+                self._dirs.get(k, (None,))[0] != v[0] for k, v in new_dirs.items()
+            )
+
+            self._dirs = new_dirs
+            self._ignore_files = new_ignore_files
+            self._refreshed_at = time.monotonic()
+            if changed or self._files is None:
+                self._files = None
+                self._by_name = None
+                self._by_stem = None
+            if changed or mtimes_changed:
+                self._save_cache()
+            return changed
+
+    def _walk(
+        self,
+        rel_dir: str,
+        rules: List[IgnoreRule],
+        new_dirs: Dict[str, Tuple[int, List[str], List[str]]],
+        new_ignore_files: Dict[str, int],
+        force: bool,
+    ) -> bool:
+        """递归刷新目录，返回子树是否有变化
+
+        force为True时忽略缓存重新扫描（祖先目录新增了.gitignore）。
+        """
+        abs_dir = self.root / rel_dir if rel_dir else self.root
+        try:
+            mtime_ns = os.stat(abs_dir).st_mtime_ns
+        except OSError:
+            return True
+
+        gitignore = abs_dir / ".gitignore"
+        gitignore_rel = f"{rel_dir}/.gitignore" if rel_dir else ".gitignore"
+        try:
+            new_ignore_files[gitignore_rel] = os.stat(gitignore).st_mtime_ns
+            rules = rules + parse_gitignore(gitignore, rel_dir)
+            force = force or gitignore_rel not in self._ignore_files
+        except OSError:
+            pass
+
+        cached = self._dirs.get(rel_dir)
+        changed = False
+        if not force and cached is not None and cached[0] == mtime_ns:
+            files, subdirs = cached[1], cached[2]
+        else:
+            files, subdirs = self._scan_dir(abs_dir, rel_dir, rules)
+            changed = cached is None or (files, subdirs) != (
+                list(cached[1]),
+                list(cached[2]),
+            )
+        new_dirs[rel_dir] = (mtime_ns, files, subdirs)
+
+        for name in subdirs:
+            child = f"{rel_dir}/{name}" if rel_dir else name
+            if self._walk(child, rules, new_dirs, new_ignore_files, force):
+                changed = True
+        return changed
+
+    def _scan_dir(
+        self, abs_dir: Path, rel_dir: str, rules: List[IgnoreRule]
+    ) -> Tuple[List[str], List[str]]:
+        """列出目录中未被忽略的文件和子目录"""
+        files: List[str] = []
+        subdirs: List[str] = []
+        try:
+            with os.scandir(abs_dir) as it:
+                for entry in it:
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if is_dir and entry.name in ALWAYS_SKIPPED:
+                        continue
+                    if is_ignored(rules, rel_path, is_dir):
+                        continue
+                    (subdirs if is_dir else files).append(entry.name)
+        except OSError as e:
+            logger.warning(f"无法读取目录 {abs_dir}: {e}")
+        files.sort()
+        subdirs.sort()
+        return files, subdirs
+
+    def files(self) -> List[str]:
+        """返回所有文件的相对路径（使用 / 分隔）"""
+        if self._files is None:
+            self._files = list(self._iter_files())
+        return self._files
+
+    def _iter_files(self) -> Iterator[str]:
+        for rel_dir, (_, files, _) in self._dirs.items():
+            prefix = f"{rel_dir}/" if rel_dir else ""
+            for name in files:
+                yield prefix + name
+
+    def by_name(self) -> Dict[str, List[str]]:
+        """文件名（小写） -> 相对路径列表"""
+        if self._by_name is None:
+            by_name: Dict[str, List[str]] = {}
+            for path in self.files():
+                by_name.setdefault(path.rsplit("/", 1)[-1].lower(), []).append(path)
+            self._by_name = by_name
+        return self._by_name
+
+    def by_stem(self) -> Dict[str, List[str]]:
+        """文件名去掉扩展名（小写） -> 相对路径列表"""
+        if self._by_stem is None:
+            by_stem: Dict[str, List[str]] = {}
+            for name, paths in self.by_name().items():
+                by_stem.setdefault(name.split(".", 1)[0], []).extend(paths)
+            self._by_stem = by_stem
+        return self._by_stem
+
+    def dirs(self) -> List[str]:
+        """返回所有目录的相对路径（不含项目根目录）"""
+        return [d for d in self._dirs if d]
+
+
+_INDEXES: Dict[str, ProjectFileIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_file_index(project_path: str, max_age: float = DEFAULT_MAX_AGE):
+    """获取（并按需刷新）项目的文件索引，同一进程内共享"""
+    key = str(Path(project_path).resolve())
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(key)
+        if index is None:
+            index = _INDEXES[key] = ProjectFileIndex(key)
+    index.refresh(max_age)
+    return index
@@ -0,0 +1,131 @@
+"""
+.mdc 文件 frontmatter 的解析与生成
+
+Cursor 规则文件的格式为：
+
+    ---
+    description: "..."
+    globs:
+    alwaysApply: false
+    ---
+    正文
+
+这里只实现该格式需要的最小子集（逐行 ``key: value``），不依赖 YAML 库。
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+FRONTMATTER_DELIMITER = "---"
+
+# 生成时需要加双引号的字段
+QUOTED_FIELDS = {"description", "branch"}
+
+
+def _parse_value(raw: str) -> Any:
+    """解析单个字段的值"""
+    value = raw.strip()
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    return value
+
+
+def _render_value(key: str, value: Any) -> str:
+    """把字段值渲染为frontmatter中的文本"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return ""
+    if key in QUOTED_FIELDS:
+        return f'"{value}"'
+    return str(value)
+
+
+def _frontmatter_span(text: str) -> Optional[Tuple[int, int]]:
+    """frontmatter字段所在的范围 (开始, 结束)，没有frontmatter时返回None"""
+    if not text.startswith(FRONTMATTER_DELIMITER + "\n"):
+        return None
+    start = len(FRONTMATTER_DELIMITER) + 1
+    closing = "\n" + FRONTMATTER_DELIMITER
+    end = text.find(closing + "\n", start - 1)
+    if end == -1:
+        if not text.endswith(closing):
+            return None
+        end = len(text) - len(closing)
+    return start, end
+
+
+def parse_memory_file(text: str) -> Tuple[Dict[str, Any], str]:
+    """解析记忆文件，返回 (frontmatter字段, 正文)
+
+    没有frontmatter的文件返回空字典和原始文本。
+    """
+    span = _frontmatter_span(text)
+    if span is None:
+        return {}, text
+    start, end = span
+
+    fields: Dict[str, Any] = {}
+    for line in text[start:end].splitlines():
+        key, sep, raw = line.partition(":")
+        if sep and key.strip():
+            fields[key.strip()] = _parse_value(raw)
+
+    body_start = end + len(FRONTMATTER_DELIMITER) + 1
+    if text.startswith("\n", body_start):
+        body_start += 1
+    return fields, text[body_start:]
+
+
+def set_field(text: str, key: str, value: Any) -> str:
+    """只改写frontmatter中一个字段所在的行，其余内容原样保留
+
+    手写的规则中可能有本模块解析不了的行（例如YAML列表形式的globs），整体重新生成
+    会丢掉它们。字段的值跨多行（下面跟着缩进的行）时一起替换；字段不存在时加在
+    frontmatter末尾；value为None时删除该字段。
+
+    Args:
+        text: 记忆文件内容
+        key: 字段名
+        value: 新的值
+    """
+    span = _frontmatter_span(text)
+    if span is None:
+        if value is None:
+            return text
+        return render_memory_file({key: value}, text)
+    start, end = span
+
+    lines = text[start:end].split("\n") if end > start else []
+    rendered = _render_value(key, value)
+    new_line = f"{key}: {rendered}" if rendered else f"{key}:"
+    for i, line in enumerate(lines):
+        name, sep, _ = line.partition(":")
+        if not sep or line[:1].isspace() or name.strip() != key:
+            continue
+        stop = i + 1
+        while stop < len(lines) and lines[stop][:1].isspace():
+            stop += 1
+        lines[i:stop] = [] if value is None else [new_line]
+        break
+    else:
+        if value is None:
+            return text
+        lines.append(new_line)
+
+    if not lines:
+        return text[: start - 1] + text[end:]
+    return text[:start] + "\n".join(lines) + text[end:]
+
+
+def render_memory_file(fields: Dict[str, Any], body: str) -> str:
+    """根据frontmatter字段和正文生成记忆文件内容"""
+    lines = [FRONTMATTER_DELIMITER]
+    for key, value in fields.items():
+        rendered = _render_value(key, value)
+        lines.append(f"{key}: {rendered}" if rendered else f"{key}:")
+    lines.append(FRONTMATTER_DELIMITER)
+    return "\n".join(lines) + "\n" + body
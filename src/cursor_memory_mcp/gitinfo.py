@@ -0,0 +1,353 @@
+"""
+读取项目当前的git分支和提交
+
+直接解析 ``.git/HEAD``、松散引用和 ``packed-refs``，不启动 ``git`` 进程。
+结果按项目缓存，HEAD、当前分支的引用文件或 ``packed-refs`` 的修改时间变化时
+重新读取，每次查询只需要几次 ``stat``。
+
+记忆写入时在frontmatter中记录 ``branch`` 和 ``commit``，清单中保存同样的字段；
+:func:`find_memories_by_revision` 基于清单建立的修订索引按分支或提交查询记忆。
+"提交X之后"的顺序取自 ``.git/logs/HEAD`` （HEAD的reflog）中提交第一次出现的位置，
+同样不需要读取对象库。
+"""
+
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .layout import MemoryLayout
+
+logger = logging.getLogger(__name__)
+
+HEAD_REF_PREFIX = "ref: "
+BRANCH_PREFIX = "refs/heads/"
+
+# 符号引用最多跟随的层数
+MAX_REF_DEPTH = 5
+
+SHA_LENGTH = 40
+ZERO_SHA = "0" * SHA_LENGTH
+
+
+@dataclass(frozen=True)
+class GitRevision:
+    """项目当前的git状态"""
+
+    # 分离HEAD时为None
+    branch: Optional[str]
+    # 还没有任何提交的分支为None
+    commit: Optional[str]
+
+
+@dataclass(frozen=True)
+class GitDirs:
+    """git目录：HEAD所在的目录和引用所在的公共目录（工作树中两者不同）"""
+
+    git_dir: Path
+    common_dir: Path
+
+
+def _read_text(path: Path) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _is_sha(value: str) -> bool:
+    return len(value) == SHA_LENGTH and all(c in "0123456789abcdef" for c in value)
+
+
+def find_git_dirs(project_path: str) -> Optional[GitDirs]:
+    """从项目目录向上查找 ``.git``
+
+    ``.git`` 可以是目录，也可以是工作树和子模块使用的 ``gitdir: <路径>`` 文件；
+    工作树的引用在 ``commondir`` 指向的目录中。
+    """
+    directory = Path(project_path).resolve()
+    for candidate in (directory, *directory.parents):
+        dot_git = candidate / ".git"
+        if dot_git.is_dir():
+            return GitDirs(dot_git, dot_git)
+        if not dot_git.is_file():
+            continue
+        text = _read_text(dot_git) or ""
+        if not text.startswith("gitdir:"):
+            return None
+        git_dir = (candidate / text[len("gitdir:") :].strip()).resolve()
+        common = _read_text(git_dir / "commondir")
+        common_dir = (git_dir / common.strip()).resolve() if common else git_dir
+        return GitDirs(git_dir, common_dir)
+    return None
+
+
+def _packed_refs(common_dir: Path) -> Dict[str, str]:
+    """解析packed-refs：引用名 -> 提交"""
+    refs = {}
+    for line in (_read_text(common_dir / "packed-refs") or "").splitlines():
+        # 注释行和附注标签的 ^peeled 行
+        if not line or line[0] in "#^":
+            continue
+        sha, _, ref = line.partition(" ")
+        refs[ref.strip()] = sha
+    return refs
+
+
+def _loose_ref_paths(dirs: GitDirs, ref: str) -> Tuple[Path, ...]:
+    """松散引用可能所在的文件：工作树私有的引用在git_dir，其它在公共目录"""
+    if dirs.git_dir == dirs.common_dir:
+        return (dirs.git_dir / ref,)
+    return (dirs.git_dir / ref, dirs.common_dir / ref)
+
+
+def _resolve_ref(dirs: GitDirs, ref: str) -> Optional[str]:
+    """把引用解析为提交，引用不存在（例如还没有提交的分支）时返回None"""
+    packed: Optional[Dict[str, str]] = None
+    for _ in range(MAX_REF_DEPTH):
+        value = None
+        for path in _loose_ref_paths(dirs, ref):
+            value = _read_text(path)
+            if value is not None:
+                break
+        if value is None:
+            if packed is None:
+                packed = _packed_refs(dirs.common_dir)
+            value = packed.get(ref)
+            if value is None:
+                return None
+        value = value.strip()
+        if not value.startswith(HEAD_REF_PREFIX):
+            return value if _is_sha(value) else None
+        ref = value[len(HEAD_REF_PREFIX) :].strip()
+    return None
+
+
+def read_revision(dirs: GitDirs) -> Tuple[GitRevision, Tuple[Path, ...]]:
+    """读取HEAD指向的分支和提交
+
+    Returns:
+        (当前状态, 决定这个状态的文件)，后者用于判断缓存是否失效
+    """
+    head = (_read_text(dirs.git_dir / "HEAD") or "").strip()
+    watched = (dirs.git_dir / "HEAD", dirs.common_dir / "packed-refs")
+    if not head.startswith(HEAD_REF_PREFIX):
+        return GitRevision(None, head if _is_sha(head) else None), watched
+    ref = head[len(HEAD_REF_PREFIX) :].strip()
+    branch = ref[len(BRANCH_PREFIX) :] if ref.startswith(BRANCH_PREFIX) else ref
+    return (
+        GitRevision(branch, _resolve_ref(dirs, ref)),
+        watched + _loose_ref_paths(dirs, ref),
+    )
+
+
+def _stat_key(paths: Tuple[Path, ...]) -> Tuple[Any, ...]:
+    """文件的 (inode, 修改时间)，git用重命名替换引用文件，两者至少有一个会变"""
+    key = []
+    for path in paths:
+        try:
+            stat = path.stat()
+            key.append((stat.st_ino, stat.st_mtime_ns))
+        except OSError:
+            key.append(None)
+    return tuple(key)
+
+
+@dataclass
+class _CachedRevision:
+    dirs: GitDirs
+    revision: GitRevision
+    paths: Tuple[Path, ...]
+    key: Tuple[Any, ...]
+
+
+_revisions: Dict[str, _CachedRevision] = {}
+_revisions_lock = threading.Lock()
+
+
+def current_revision(project_path: str) -> Optional[GitRevision]:
+    """返回项目当前的分支和提交，不在git仓库中时返回None"""
+    with _revisions_lock:
+        cached = _revisions.get(project_path)
+    if cached is not None and _stat_key(cached.paths) == cached.key:
+        return cached.revision
+
+    dirs = cached.dirs if cached is not None else None
+    if dirs is None or not (dirs.git_dir / "HEAD").is_file():
+        # 第一次查询，或仓库被删除、移动后重新查找
+        dirs = find_git_dirs(project_path)
+        if dirs is None:
+            with _revisions_lock:
+                _revisions.pop(project_path, None)
+            return None
+    revision, paths = read_revision(dirs)
+    key = _stat_key(paths)
+    if read_revision(dirs)[0] == revision:
+        # 读取过程中引用没有被改写，结果与记录的文件状态一致，可以缓存
+        with _revisions_lock:
+            _revisions[project_path] = _CachedRevision(dirs, revision, paths, key)
+    return revision
+
+
+class Reflog:
+    """HEAD的reflog中每个提交第一次出现的位置，按文件大小和修改时间缓存"""
+
+    def __init__(self, git_dir: Path):
+        self.path = git_dir / "logs" / "HEAD"
+        self.positions: Dict[str, int] = {}
+        self._key: Optional[Tuple[int, int]] = None
+
+    def refresh(self):
+        try:
+            stat = self.path.stat()
+        except OSError:
+            self.positions, self._key = {}, None
+            return
+        key = (stat.st_size, stat.st_mtime_ns)
+        if key == self._key:
+            return
+        positions: Dict[str, int] = {}
+        for line in (_read_text(self.path) or "").splitlines():
+            # <旧提交> <新提交> <作者> <时间戳> <时区>\t<说明>
+            old, _, rest = line.partition(" ")
+            new = rest[:SHA_LENGTH]
+            for sha in (old, new):
+                if _is_sha(sha) and sha != ZERO_SHA and sha not in positions:
+                    positions[sha] = len(positions)
+        self.positions, self._key = positions, key
+
+
+_reflogs: Dict[Path, Reflog] = {}
+
+
+def _reflog(git_dir: Path) -> Reflog:
+    with _revisions_lock:
+        reflog = _reflogs.get(git_dir)
+        if reflog is None:
+            reflog = _reflogs[git_dir] = Reflog(git_dir)
+    reflog.refresh()
+    return reflog
+
+
+class RevisionIndex:
+    """清单中记忆的修订索引：分支 -> 名称，提交 -> 名称"""
+
+    def __init__(self):
+        self.generation: Optional[int] = None
+        self.by_branch: Dict[str, List[str]] = {}
+        self.by_commit: Dict[str, List[str]] = {}
+
+    def refresh(self, layout: MemoryLayout):
+        """清单的generation变化时重建"""
+        if self.generation == layout.generation:
+            return
+        by_branch: Dict[str, List[str]] = {}
+        by_commit: Dict[str, List[str]] = {}
+        for name, meta in layout.memories.items():
+            if meta.get("branch"):
+                by_branch.setdefault(meta["branch"], []).append(name)
+            if meta.get("commit"):
+                by_commit.setdefault(meta["commit"], []).append(name)
+        self.by_branch, self.by_commit = by_branch, by_commit
+        self.generation = layout.generation
+
+
+_indexes: Dict[str, RevisionIndex] = {}
+
+
+def get_revision_index(layout: MemoryLayout) -> RevisionIndex:
+    """返回项目的修订索引（进程内缓存）"""
+    with _revisions_lock:
+        index = _indexes.get(layout.project_path)
+        if index is None:
+            index = _indexes[layout.project_path] = RevisionIndex()
+    index.refresh(layout)
+    return index
+
+
+def _resolve_since(prefix: str, candidates: List[str]) -> str:
+    """把提交的前缀解析为完整的提交"""
+    prefix = prefix.lower()
+    matches = sorted({sha for sha in candidates if sha.startswith(prefix)})
+    if not matches:
+        raise ValueError(f"HEAD的reflog和记忆中都没有提交: {prefix}")
+    if len(matches) > 1:
+        raise ValueError(f"提交前缀不唯一: {prefix}")
+    return matches[0]
+
+
+def _names_since(
+    index: RevisionIndex, positions: Dict[str, int], since: str
+) -> Tuple[str, set, List[str]]:
+    """在提交since时或之后写入的记忆，以及提交不在reflog中、无法判断的记忆"""
+    commit = _resolve_since(since, [*positions, *index.by_commit])
+    start = positions.get(commit)
+    names = set(index.by_commit.get(commit, []))
+    unresolved = []
+    for sha, memory_names in index.by_commit.items():
+        position = positions.get(sha)
+        if position is None:
+            if sha != commit:
+                unresolved.extend(memory_names)
+        elif start is not None and position >= start:
+            names.update(memory_names)
+    return commit, names, sorted(unresolved)
+
+
+def find_memories_by_revision(
+    layout: MemoryLayout, branch: Optional[str] = None, since: Optional[str] = None
+) -> Dict[str, Any]:
+    """按分支和/或提交查询记忆
+
+    Args:
+        layout: 项目的记忆清单
+        branch: 只返回在该分支上写入的记忆；和since都没有给出时取当前分支
+        since: 只返回在该提交或之后（按HEAD的reflog中的顺序）写入的记忆，
+            可以是提交的前缀
+
+    Raises:
+        ValueError: 需要当前分支或reflog但项目不在git仓库中，或提交无法解析
+    """
+    head = current_revision(layout.project_path)
+    if branch is None and since is None:
+        if head is None or head.branch is None:
+            raise ValueError("项目不在git仓库中或处于分离HEAD状态，请指定branch")
+        branch = head.branch
+
+    index = get_revision_index(layout)
+    names = set(layout.memories)
+    if branch is not None:
+        names &= set(index.by_branch.get(branch, []))
+    commit = None
+    unresolved: List[str] = []
+    if since is not None:
+        dirs = find_git_dirs(layout.project_path)
+        positions = _reflog(dirs.git_dir).positions if dirs else {}
+        commit, since_names, unresolved = _names_since(index, positions, since)
+        unresolved = [name for name in unresolved if name in names]
+        names &= since_names
+
+    memories = sorted(
+        (
+            {
+                "name": name,
+                "description": layout.memories[name]["description"],
+                "branch": layout.memories[name].get("branch"),
+                "commit": layout.memories[name].get("commit"),
+                "created_at": layout.memories[name]["created"],
+            }
+            for name in names
+        ),
+        key=lambda m: (m["created_at"], m["name"]),
+    )
+    return {
+        "head": (
+            None if head is None else {"branch": head.branch, "commit": head.commit}
+        ),
+        "branch": branch,
+        "since": commit,
+        "memories": memories,
+        "unresolved": unresolved,
+    }
@@ -0,0 +1,120 @@
+"""
+根据任务总结推导 ``globs``
+
+从总结中提取文件路径和标识符，与项目文件索引匹配，生成尽量精确的 glob 模式，
+让 Cursor 在打开相关文件时自动附加该记忆。
+"""
+
+import re
+from typing import Dict, Iterable, List, Set
+
+from .file_index import ProjectFileIndex, get_file_index
+
+# 单个记忆最多生成的glob数量
+MAX_GLOBS = 10
+
+# 同一目录下同一扩展名的匹配文件达到该数量时合并为 dir/*.ext
+COLLAPSE_THRESHOLD = 3
+
+# 一个文件名匹配到的文件超过该数量时认为过于宽泛（如 __init__.py、index.ts）
+MAX_MATCHES_PER_NAME = 5
+
+# 形如 src/app/main.py、./lib/util.ts、README.md 的路径
+_PATH_PATTERN = re.compile(
+    r"(?<![\w/.-])(?:\.\.?/)?((?:[\w.-]+/)*[\w-][\w.-]*\.[A-Za-z0-9]{1,8})\b"
+)
+
+# 形如 src/components/ 的目录
+_DIR_PATTERN = re.compile(r"(?<![\w/.-])((?:[\w.-]+/)+)(?![\w.])")
+
+# 驼峰或下划线形式的标识符，如 UserService、user_service
+_IDENTIFIER_PATTERN = re.compile(
+    r"\b([A-Z][a-z0-9]+(?:[A-Z][a-z0-9]*)+|[a-z][a-z0-9]*(?:_[a-z0-9]+)+)\b"
+)
+
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def extract_candidates(text: str) -> Dict[str, Set[str]]:
+    """从文本中提取候选的路径、目录和标识符"""
+    paths = {m.group(1) for m in _PATH_PATTERN.finditer(text)}
+    dirs = {m.group(1).rstrip("/") for m in _DIR_PATTERN.finditer(text)}
+    identifiers = set()
+    for m in _IDENTIFIER_PATTERN.finditer(text):
+        identifier = m.group(1)
+        identifiers.add(identifier.lower())
+        identifiers.add(_CAMEL_BOUNDARY.sub("_", identifier).lower())
+    return {"paths": paths, "dirs": dirs, "identifiers": identifiers}
+
+
+def match_files(candidates: Dict[str, Set[str]], index: ProjectFileIndex) -> Set[str]:
+    """把候选项匹配到项目中的具体文件"""
+    matched: Set[str] = set()
+    by_name = index.by_name()
+
+    for path in candidates["paths"]:
+        name = path.rsplit("/", 1)[-1].lower()
+        hits = by_name.get(name, [])
+        if "/" in path:
+            suffix = path.lower()
+            hits = [
+                h
+                for h in hits
+                if h.lower() == suffix or h.lower().endswith("/" + suffix)
+            ]
+        if 0 < len(hits) <= MAX_MATCHES_PER_NAME:
+            matched.update(hits)
+
+    if candidates["identifiers"]:
+        by_stem = index.by_stem()
+        for identifier in candidates["identifiers"]:
+            hits = by_stem.get(identifier, [])
+            if 0 < len(hits) <= MAX_MATCHES_PER_NAME:
+                matched.update(hits)
+
+    return matched
+
+
+def _dir_globs(candidates: Dict[str, Set[str]], index: ProjectFileIndex) -> List[str]:
+    """为总结中提到的真实目录生成 dir/** 模式"""
+    if not candidates["dirs"]:
+        return []
+    known_dirs = set(index.dirs())
+    globs = []
+    for d in sorted(candidates["dirs"]):
+        while d.startswith("./"):
+            d = d[2:]
+        if d in known_dirs:
+            globs.append(f"{d}/**")
+    return globs
+
+
+def build_globs(paths: Iterable[str]) -> List[str]:
+    """把匹配到的文件合并为精简的glob列表"""
+    groups: Dict[tuple, List[str]] = {}
+    for path in sorted(paths):
+        directory, _, name = path.rpartition("/")
+        ext = name.rsplit(".", 1)[-1] if "." in name else ""
+        groups.setdefault((directory, ext), []).append(path)
+
+    globs: List[str] = []
+    for (directory, ext), members in groups.items():
+        if ext and len(members) >= COLLAPSE_THRESHOLD:
+            globs.append(f"{directory}/*.{ext}" if directory else f"*.{ext}")
+        else:
+            globs.extend(members)
+    return globs
+
+
+def derive_globs(project_path: str, task_summary: str) -> str:
+    """根据任务总结推导frontmatter中的globs字段值（逗号分隔）"""
+    candidates = extract_candidates(task_summary)
+    if not any(candidates.values()):
+        return ""
+
+    index = get_file_index(project_path)
+    globs = _dir_globs(candidates, index)
+    covered = tuple(g[:-2] for g in globs)
+    matched = {f for f in match_files(candidates, index) if not f.startswith(covered)}
+    globs.extend(build_globs(matched))
+    return ",".join(globs[:MAX_GLOBS])
@@ -0,0 +1,300 @@
+"""
+记忆文件的版本历史
+
+同名任务再次写入时，只保留最新版本作为 ``.cursor/rules/<name>.mdc``，
+旧版本追加到 ``.cursor/history/<name>.jsonl``。历史文件每行一个版本，以反向增量存储：
+版本 n 记录的是从版本 n+1 还原到版本 n 所需的行级差异。追加小节只在末尾增加内容，
+旧版本记为截断到原来的字节长度，不需要读取文件。
+
+上次快照之后累计的增量字节数达到旧版本大小的 ``SNAPSHOT_DELTA_RATIO`` 倍时，
+改为保存一次完整快照，因此还原任意版本读取的增量不超过一份内容的大小，历史文件
+的大小也只随增量的大小增长。
+
+版本数和累计的增量字节数保存在旁边的 ``<name>.idx`` 中，归档时不必重新读取整个
+历史文件。索引记录了历史文件当时的长度、修改时间和inode，与实际不符（例如中断的
+写入或从快照恢复）时重新扫描历史文件。
+"""
+
+import difflib
+import itertools
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SUFFIX = ".jsonl"
+INDEX_SUFFIX = ".idx"
+SNAPSHOT_DELTA_RATIO = 1.0
+
+KIND_SNAPSHOT = "snapshot"
+KIND_DELTA = "delta"
+KIND_TRUNCATE = "truncate"
+
+
+def history_dir(project_path: str) -> Path:
+    """返回项目的.cursor/history目录"""
+    return Path(project_path) / ".cursor" / "history"
+
+
+def history_file(project_path: str, name: str) -> Path:
+    """返回指定任务的历史文件路径"""
+    return history_dir(project_path) / f"{name}{HISTORY_SUFFIX}"
+
+
+def make_delta(base: str, target: str) -> List[list]:
+    """计算从base还原出target的行级增量
+
+    增量是操作列表：``["c", i1, i2]`` 复制base的第i1到i2行，``["i", text]`` 插入文本。
+    追加小节后target是base的前缀，这时不需要逐行比较。
+    """
+    if base.startswith(target):
+        lines = target.splitlines(keepends=True)
+        if not lines:
+            return []
+        if lines[-1].endswith("\n"):
+            return [["c", 0, len(lines)]]
+        # 最后一行没有换行符，追加时补上了分隔，这一行按原样插入
+        return [["c", 0, len(lines) - 1], ["i", lines[-1]]]
+
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+
+    ops: List[list] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["c", i1, i2])
+        elif j2 > j1:
+            ops.append(["i", "".join(target_lines[j1:j2])])
+    return ops
+
+
+def apply_delta(base: str, ops: List[list]) -> str:
+    """把增量应用到base上"""
+    base_lines = base.splitlines(keepends=True)
+    parts: List[str] = []
+    for op in ops:
+        if op[0] == "c":
+            parts.extend(base_lines[op[1] : op[2]])
+        else:
+            parts.append(op[1])
+    return "".join(parts)
+
+
+def _read_records(path: Path) -> List[Dict[str, Any]]:
+    """读取历史文件中的全部版本记录"""
+    if not path.exists():
+        return []
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    return records
+
+
+def _scan_index(path: Path) -> Dict[str, Any]:
+    """扫描历史文件，统计版本数和上次快照之后的增量字节数"""
+    index: Dict[str, Any] = {"count": 0, "delta_bytes": 0}
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            index["count"] += 1
+            kind = json.loads(line)["kind"]
+            if kind == KIND_SNAPSHOT:
+                index["delta_bytes"] = 0
+            elif kind == KIND_DELTA:
+                index["delta_bytes"] += len(line)
+    return index
+
+
+def _load_index(path: Path) -> Dict[str, Any]:
+    """读取历史文件的索引，与历史文件不一致时重新扫描"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return {"count": 0, "delta_bytes": 0}
+    try:
+        with open(path.with_suffix(INDEX_SUFFIX), encoding="utf-8") as f:
+            index = json.load(f)
+        if index["file"] == [stat.st_size, stat.st_mtime_ns, stat.st_ino]:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    return _scan_index(path)
+
+
+def _save_index(path: Path, index: Dict[str, Any]):
+    """在历史文件写入之后保存索引，记录历史文件当时的状态"""
+    stat = os.stat(path)
+    index = {**index, "file": [stat.st_size, stat.st_mtime_ns, stat.st_ino]}
+    index_path = path.with_suffix(INDEX_SUFFIX)
+    temp_file = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(temp_file, index_path)
+
+
+def _append_record(path: Path, record: Dict[str, Any], index: Dict[str, Any]):
+    """把一个版本记录追加到历史文件并更新索引"""
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, line.encode("utf-8"))
+    finally:
+        os.close(fd)
+    _save_index(path, index)
+
+
+def archive_version(
+    project_path: str,
+    name: str,
+    old_content: str,
+    new_content: str,
+    created_at: Optional[datetime] = None,
+) -> int:
+    """把即将被覆盖的旧版本追加到历史文件
+
+    调用方需要持有记忆文件的锁，同一记忆的归档不会并发进行。
+
+    Args:
+        project_path: 项目根目录
+        name: 任务名称
+        old_content: 当前的文件内容（将成为历史版本）
+        new_content: 即将写入的新内容（增量以它为基准）
+        created_at: 旧版本的创建时间
+
+    Returns:
+        新的最新版本号
+    """
+    path = history_file(project_path, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    index = _load_index(path)
+
+    version = index["count"] + 1
+    size = len(old_content.encode("utf-8"))
+    record: Dict[str, Any] = {
+        "version": version,
+        "created_at": (created_at or datetime.now()).isoformat(),
+        "size": size,
+        "kind": KIND_DELTA,
+        "data": make_delta(new_content, old_content),
+    }
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    delta_bytes = index["delta_bytes"] + len(line.encode("utf-8"))
+    if delta_bytes >= size * SNAPSHOT_DELTA_RATIO:
+        record["kind"] = KIND_SNAPSHOT
+        record["data"] = old_content
+        delta_bytes = 0
+
+    _append_record(path, record, {"count": version, "delta_bytes": delta_bytes})
+    logger.info(f"已归档历史版本: {name} v{version} ({record['kind']})")
+    return version + 1
+
+
+def archive_append(
+    project_path: str, name: str, size: int, created_at: Optional[datetime] = None
+) -> int:
+    """在末尾追加内容之前归档旧版本：只记录旧的字节长度，不读取文件
+
+    Args:
+        size: 追加之前的文件字节数
+        created_at: 旧版本的创建时间
+
+    Returns:
+        新的最新版本号
+    """
+    path = history_file(project_path, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    index = _load_index(path)
+
+    version = index["count"] + 1
+    record = {
+        "version": version,
+        "created_at": (created_at or datetime.now()).isoformat(),
+        "size": size,
+        "kind": KIND_TRUNCATE,
+        "data": size,
+    }
+    _append_record(path, record, {**index, "count": version})
+    logger.info(f"已归档历史版本: {name} v{version} ({KIND_TRUNCATE})")
+    return version + 1
+
+
+def list_versions(project_path: str, name: str, live_file: Path) -> Dict[str, Any]:
+    """列出任务的所有版本（不包含内容）"""
+    versions = [
+        {
+            "version": r["version"],
+            "created_at": r["created_at"],
+            "size": r["size"],
+            "kind": r["kind"],
+        }
+        for r in _read_records(history_file(project_path, name))
+    ]
+    latest = len(versions) + 1
+    if live_file.exists():
+        stat = live_file.stat()
+        versions.append(
+            {
+                "version": latest,
+                "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                "size": stat.st_size,
+                "kind": "live",
+            }
+        )
+    return {"latest_version": latest, "versions": versions}
+
+
+def _truncate(content: str, size: int) -> str:
+    return content.encode("utf-8")[:size].decode("utf-8")
+
+
+def get_version(project_path: str, name: str, version: int, live_file: Path) -> str:
+    """还原指定版本的内容
+
+    从不早于目标版本的最近快照（或当前文件）开始，依次应用反向增量。连续的截断
+    只需应用最早的一个。
+
+    Raises:
+        KeyError: 版本不存在
+    """
+    path = history_file(project_path, name)
+    latest = _load_index(path)["count"] + 1
+    if version < 1 or version > latest:
+        raise KeyError(version)
+    if version == latest:
+        return live_file.read_bytes().decode("utf-8")
+
+    # 只解析目标版本到下一个快照之间的记录
+    chain = []
+    with open(path, encoding="utf-8") as f:
+        lines = (line for line in f if line.strip())
+        for line in itertools.islice(lines, version - 1, None):
+            chain.append(json.loads(line))
+            if chain[-1]["kind"] == KIND_SNAPSHOT:
+                break
+    if chain[-1]["kind"] == KIND_SNAPSHOT:
+        content = chain.pop()["data"]
+    else:
+        content = live_file.read_bytes().decode("utf-8")
+
+    for i in range(len(chain) - 1, -1, -1):
+        record = chain[i]
+        if record["kind"] == KIND_DELTA:
+            content = apply_delta(content, record["data"])
+        elif i == 0 or chain[i - 1]["kind"] != KIND_TRUNCATE:
+            content = _truncate(content, record["data"])
+    return content
+
+
+def history_size(project_path: str, name: str) -> int:
+    """历史文件的字节数"""
+    path = history_file(project_path, name)
+    return path.stat().st_size if path.exists() else 0
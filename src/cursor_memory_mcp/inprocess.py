@@ -0,0 +1,94 @@
+"""
+在进程内通过内存对象流运行MCP服务
+
+测试通常直接调用 ``CursorMemoryMCP`` 的私有方法，跳过了协议层；回放和压测启动子进程
+走stdio，又多了进程和管道的开销。这里用一对内存对象流把服务和 ``mcp`` 的
+``ClientSession`` 连起来：请求完整经过初始化握手、JSON-RPC会话、参数校验和工具分发，
+但不经过序列化、管道和进程切换。基准可以单独测量协议本身的开销，宿主程序也可以
+把服务嵌入自己的事件循环::
+
+    async with connect() as client:
+        data = await client.call("create_cursor_memory", task_name="...", ...)
+
+每次 ``connect`` 是一个独立的MCP会话，准入控制按会话区分客户端。
+"""
+
+import json
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import anyio
+import mcp.types as types
+from mcp.client.session import ClientSession
+from mcp.shared.memory import create_client_server_memory_streams
+
+from . import __version__
+from .server import CursorMemoryMCP
+
+CLIENT_NAME = "cursor-memory-inprocess"
+
+
+class ToolCallError(RuntimeError):
+    """工具调用在协议层失败（例如未知工具），而不是返回了业务错误"""
+
+
+class MemoryClient:
+    """进程内客户端，工具调用的结果按服务的约定解析为字典"""
+
+    def __init__(self, session: ClientSession, server: CursorMemoryMCP):
+        self.session = session
+        self.server = server
+
+    async def list_tools(self) -> List[str]:
+        """服务提供的工具名称"""
+        result = await self.session.list_tools()
+        return [tool.name for tool in result.tools]
+
+    async def call(self, name: str, **arguments: Any) -> Dict[str, Any]:
+        """调用工具，返回响应的JSON对象
+
+        参数校验失败等业务错误和stdio上一样以 ``{"error": ...}`` 返回。
+
+        Raises:
+            ToolCallError: 协议层返回了错误结果
+        """
+        result = await self.session.call_tool(name, arguments)
+        text = "".join(
+            item.text for item in result.content if isinstance(item, types.TextContent)
+        )
+        if result.isError:
+            raise ToolCallError(text)
+        return json.loads(text)
+
+
+@asynccontextmanager
+async def connect(
+    server: Optional[CursorMemoryMCP] = None,
+    timeout: Optional[float] = None,
+    raise_exceptions: bool = False,
+) -> AsyncIterator[MemoryClient]:
+    """在当前事件循环中启动服务会话，返回已完成初始化的客户端
+
+    Args:
+        server: 要连接的服务实例，默认新建一个（按环境变量配置）
+        timeout: 每个请求等待响应的秒数，默认不限
+        raise_exceptions: 服务处理请求时的异常直接抛出，便于调试
+    """
+    server = server or CursorMemoryMCP()
+    read_timeout = timedelta(seconds=timeout) if timeout is not None else None
+    async with create_client_server_memory_streams() as (client_streams, streams):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(server.run_streams, *streams, raise_exceptions)
+            try:
+                async with ClientSession(
+                    *client_streams,
+                    read_timeout_seconds=read_timeout,
+                    client_info=types.Implementation(
+                        name=CLIENT_NAME, version=__version__
+                    ),
+                ) as session:
+                    await session.initialize()
+                    yield MemoryClient(session, server)
+            finally:
+                tg.cancel_scope.cancel()
@@ -0,0 +1,245 @@
+"""
+从总结中提取关键词，生成frontmatter的description
+
+Cursor按description决定是否加载agent-requested规则，所有记忆共用同一个描述模板时
+无法区分它们。这里把总结切分为候选短语（RAKE：在停用词和标点处断开），
+用项目内的文档频率给短语中的词项加权（TF-IDF），取分数最高的几个短语。
+
+词项和 :mod:`search` 使用同一套分词，文档频率在进程内按项目缓存：
+第一次使用时从搜索索引的缓存文件载入，之后按清单中的内容哈希增量更新，
+每次写入只需要重新分词变化了的记忆。
+"""
+
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from .frontmatter import parse_memory_file
+from .layout import get_layout
+from .search import SearchIndex, _doc_key, tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEYWORDS = 5
+
+# 英文短语最多的单词数
+MAX_PHRASE_WORDS = 3
+
+# 超过该长度的CJK片段按句子处理，分数打折
+MAX_CJK_PHRASE_CHARS = 8
+
+ENGLISH_STOPWORDS = frozenset("""
+    a about above after again against all also am an and any are as at avoid be
+    because been before being below between both bound but by can cause caused
+    contain contains could did do does doing done down during each either else etc
+    every few first fix fixed for from further get gets got had has have having he
+    her here hers him his how i if in into is it its itself just last let like make
+    makes may me might more most must my need needs new next no nor not now of off
+    on once only or other our out over own per please same set sets she should
+    since so some step steps such than that the their them then there these they
+    this those through to too under until up upon us use used uses using very via
+    was we were what when where which while who whom why will with would yet you
+    your redacted
+    """.split())
+
+# 作为完整的词切掉的虚词和常见动词，按长度降序匹配
+CJK_STOPWORDS = sorted(
+    """
+    然后 但是 因为 所以 如果 需要 可以 已经 进行 使用 通过 之后 之前 时候 这个 那个
+    一个 两个 没有 我们 他们 你们 还是 或者 以及 并且 而且 为了 是否 其中 这些 那些
+    这样 那样 不要 不能 不会 不允许 应该 直接 目前 现在 注意 的话 以后 以前 一下 一些
+    相关 一起 同时 步骤 第一次 执行 返回 负责 开启 设为 改为 改用 放在 存在 新增 报错
+    替换为
+    的 了 和 与 及 或 在 是 把 被 将 先 再 就 也 都 但 从 到 这 那 吗 呢 吧 啊 很 又
+    让 给 等 每 各 其 该 对 以 加 跑 由
+    """.split(),
+    key=len,
+    reverse=True,
+)
+
+# 常作为方位、时间后缀的单字，和前后的字组成名词时不切
+CJK_CONTEXT_STOPWORDS = (
+    "(?<![超及准按实])时(?![间候区长序效钟刻])",
+    "后(?![端台缀续])",
+    "前(?![端缀台置])",
+    "中(?![间文心])",
+    "用(?![户例量法途])",
+)
+
+_CJK_STOP_PATTERN = re.compile(
+    "|".join([*map(re.escape, CJK_STOPWORDS), *CJK_CONTEXT_STOPWORDS])
+)
+
+# ASCII单词（允许文件名和标识符中的 . - / _）、CJK片段，其余字符都是分隔符
+_WORD_PATTERN = re.compile(
+    r"[A-Za-z0-9_][A-Za-z0-9_./-]*[A-Za-z0-9_]|[A-Za-z0-9_]"
+    r"|[\u3400-\u4dbf\u4e00-\u9fff]+"
+    r"|[ \t]+"
+    r"|[\s\S]"
+)
+
+
+def _is_cjk(token: str) -> bool:
+    return token[0] >= "\u3400"
+
+
+def candidate_phrases(text: str) -> List[str]:
+    """RAKE候选短语：连续的英文实词（空格分隔，最多3个），以及在虚词处断开的CJK片段"""
+    phrases: List[str] = []
+    words: List[str] = []
+
+    def flush():
+        if words:
+            phrases.append(" ".join(words))
+            words.clear()
+
+    for match in _WORD_PATTERN.finditer(text):
+        token = match.group()
+        if token[0] in " \t":
+            continue
+        if _is_cjk(token):
+            flush()
+            phrases.extend(
+                segment
+                for segment in _CJK_STOP_PATTERN.split(token)
+                if len(segment) >= 2
+            )
+        elif token[0].isalnum() or token[0] == "_":
+            if token.lower() in ENGLISH_STOPWORDS or token.isdigit():
+                flush()
+                continue
+            words.append(token)
+            if len(words) == MAX_PHRASE_WORDS:
+                flush()
+        else:
+            flush()
+    flush()
+    return phrases
+
+
+class TermStats:
+    """单个项目的文档频率，按清单的代数和内容哈希增量更新"""
+
+    def __init__(self, project_path: str):
+        self.project_path = project_path
+        self.df: Counter = Counter()
+        # 名称 -> (内容哈希, 词项集合)
+        self.docs: Dict[str, Tuple[str, FrozenSet[str]]] = {}
+        self.generation: Optional[int] = None
+        self.indexed = 0
+        self._lock = threading.Lock()
+
+    def _seed(self):
+        """从搜索索引的缓存文件载入，避免第一次使用时读取所有记忆"""
+        for name, doc in SearchIndex(self.project_path)._load().items():
+            terms = frozenset(doc["terms"])
+            self.docs[name] = (doc["hash"], terms)
+            self.df.update(terms)
+
+    def _set(self, name: str, entry: Optional[Tuple[str, FrozenSet[str]]]):
+        previous = self.docs.pop(name, None)
+        if previous is not None:
+            self.df.subtract(previous[1])
+        if entry is not None:
+            self.docs[name] = entry
+            self.df.update(entry[1])
+
+    def refresh(self):
+        """清单变化后更新：只重新分词内容哈希变化了的记忆"""
+        with self._lock:
+            layout = get_layout(self.project_path)
+            if self.generation == layout.generation:
+                return
+            if self.generation is None:
+                self._seed()
+            self.indexed = 0
+            memories = layout.memories
+            for name in [n for n in self.docs if n not in memories]:
+                self._set(name, None)
+            for name, meta in memories.items():
+                key = _doc_key(meta)
+                doc = self.docs.get(name)
+                if doc is not None and doc[0] == key:
+                    continue
+                try:
+                    with open(layout.path_for(name), encoding="utf-8") as f:
+                        _, body = parse_memory_file(f.read())
+                except (OSError, UnicodeDecodeError) as e:
+                    logger.warning(f"无法读取记忆 {name}: {e}")
+                    self._set(name, None)
+                    continue
+                self._set(name, (key, frozenset(tokenize(body))))
+                self.indexed += 1
+            self.df += Counter()  # 去掉减到0的词项
+            self.generation = layout.generation
+
+    def idf(self, term: str) -> float:
+        """平滑的IDF，新项目（没有其它记忆）时所有词项相同"""
+        return math.log((len(self.docs) + 1) / (self.df.get(term, 0) + 1)) + 1
+
+
+def _phrase_score(terms: List[str], weights: Dict[str, float], phrase: str) -> float:
+    """短语中词项权重的平均值，多个词项的短语按log加成，过长的CJK片段打折"""
+    score = sum(weights[t] for t in terms) / len(terms) * (1 + math.log(len(terms)))
+    if _is_cjk(phrase) and len(phrase) > MAX_CJK_PHRASE_CHARS:
+        score *= MAX_CJK_PHRASE_CHARS / len(phrase)
+    return score
+
+
+def extract_keywords(
+    text: str, stats: Optional[TermStats] = None, top_k: int = DEFAULT_KEYWORDS
+) -> List[str]:
+    """提取总结中分数最高的短语
+
+    Args:
+        text: 总结正文
+        stats: 项目的文档频率，None时只按词频排序
+        top_k: 最多返回的短语数量
+    """
+    tf = Counter(tokenize(text))
+    weights = {
+        term: (1 + math.log(count)) * (stats.idf(term) if stats else 1.0)
+        for term, count in tf.items()
+    }
+    # 小写短语 -> (第一次出现时的写法, 分数)
+    scored: Dict[str, Tuple[str, float]] = {}
+    for phrase in candidate_phrases(text):
+        terms = tokenize(phrase)
+        if terms and phrase.lower() not in scored:
+            scored[phrase.lower()] = (phrase, _phrase_score(terms, weights, phrase))
+
+    keywords: List[str] = []
+    selected: List[str] = []
+    for lowered, (phrase, _) in sorted(scored.items(), key=lambda i: -i[1][1]):
+        # 跳过已选短语的一部分，以及包含已选短语的更长短语
+        if any(lowered in k or k in lowered for k in selected):
+            continue
+        keywords.append(phrase)
+        selected.append(lowered)
+        if len(keywords) == top_k:
+            break
+    return keywords
+
+
+_stats: Dict[str, TermStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_term_stats(project_path: str) -> TermStats:
+    """返回项目的文档频率（进程内缓存），已按当前清单更新"""
+    with _stats_lock:
+        stats = _stats.get(project_path)
+        if stats is None:
+            stats = _stats[project_path] = TermStats(project_path)
+    stats.refresh()
+    return stats
+
+
+def describe(
+    project_path: str, summary: str, top_k: int = DEFAULT_KEYWORDS
+) -> List[str]:
+    """按项目的文档频率提取总结的关键词"""
+    return extract_keywords(summary, get_term_stats(project_path), top_k)
@@ -0,0 +1,697 @@
+"""
+.cursor/rules 的目录布局和记忆清单
+
+默认是平铺布局：每条记忆是 ``.cursor/rules/<name>.mdc``。记忆达到数万条时，对单个
+目录的 ``scandir``、``exists()`` 探测和Cursor的规则扫描都会变慢，可以改用分片布局
+（Cursor支持嵌套的规则目录）：
+
+- ``hash``：按名称哈希的前两位十六进制字符分片，``rules/3f/<name>.mdc``（256个分片）
+- ``date``：按创建月份分片，``rules/2024/05/<name>.mdc``
+
+每个项目在 ``.cursor/memory_manifest.json`` 中维护记忆清单：名称 -> 分片、大小、内容
+哈希、创建时间和描述。写入记忆时增量更新清单（原子替换），列出记忆、检查重名和统计
+都直接读取清单，不需要遍历目录。清单同时记录各个规则目录的修改时间，目录的修改时间
+与记录不一致说明有清单之外的增删或重命名，此时重新扫描目录重建清单；原地修改文件
+内容不会改变目录的修改时间，不在检测范围内。
+
+``cursor-memory-mcp reshard`` 在原地迁移已有的记忆，每个分片先在临时目录中通过硬链接
+组装完整，再一次重命名发布，最后才删除旧文件，中途中断时重新运行即可继续。
+"""
+
+import filecmp
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .frontmatter import parse_memory_file
+
+try:
+    import fcntl
+except ImportError:  # Windows上没有fcntl，清单更新退化为不加锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MEMORY_SUFFIX = ".mdc"
+
+SCHEME_FLAT = "flat"
+SCHEME_HASH = "hash"
+SCHEME_DATE = "date"
+SCHEMES = (SCHEME_FLAT, SCHEME_HASH, SCHEME_DATE)
+
+MANIFEST_VERSION = 3
+
+# hash布局中分片目录名的长度（十六进制字符数）
+HASH_SHARD_CHARS = 2
+
+_RESHARD_TEMP_PREFIX = ".reshard-"
+
+# 重新平衡提升的记忆在frontmatter中带有该字段，只有它们会被自动降级
+AUTO_ALWAYS_APPLY_FIELD = "autoAlwaysApply"
+
+# 拆分写入的父记忆在frontmatter中记录它拥有的各个部分（逗号分隔的名称）
+CHUNKS_FIELD = "chunks"
+
+
+def rules_dir(project_path: str) -> Path:
+    """返回项目的.cursor/rules目录"""
+    return Path(project_path) / ".cursor" / "rules"
+
+
+def global_store_path() -> Path:
+    """用户级全局记忆存储的根目录，目录结构与项目相同
+
+    默认是 ``~/.cursor-memory``，可以用 ``CURSOR_MEMORY_GLOBAL_DIR`` 覆盖。
+    """
+    path = os.environ.get("CURSOR_MEMORY_GLOBAL_DIR")
+    return Path(path).expanduser() if path else Path.home() / ".cursor-memory"
+
+
+def manifest_file(project_path: str) -> Path:
+    """返回记忆清单文件路径"""
+    return Path(project_path) / ".cursor" / "memory_manifest.json"
+
+
+def iter_memory_files(cursor_dir: Path) -> Iterator[os.DirEntry]:
+    """流式遍历目录中的记忆文件（不在内存中收集整个目录列表）"""
+    if not cursor_dir.is_dir():
+        return
+    with os.scandir(cursor_dir) as it:
+        for entry in it:
+            if entry.name.endswith(MEMORY_SUFFIX) and entry.is_file():
+                yield entry
+
+
+def memory_name(filename: str) -> str:
+    """从文件名得到记忆名称"""
+    return filename[: -len(MEMORY_SUFFIX)]
+
+
+def content_hash(content: str) -> str:
+    """计算记忆内容的哈希，用于去重"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def hash_shard(name: str) -> str:
+    """hash布局下名称所在的分片"""
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()[:HASH_SHARD_CHARS]
+
+
+def date_shard(created: datetime) -> str:
+    """date布局下创建时间所在的分片"""
+    return created.strftime("%Y/%m")
+
+
+def _memory_metadata(
+    shard: str, content: str, stat: os.stat_result, created: Optional[str] = None
+) -> Dict[str, Any]:
+    """清单中单条记忆的元数据"""
+    fields, _ = parse_memory_file(content)
+    description = fields.get("description")
+    branch, commit = fields.get("branch"), fields.get("commit")
+    return {
+        "shard": shard,
+        "size": stat.st_size,
+        "modified": stat.st_mtime_ns,
+        "hash": content_hash(content),
+        "created": created
+        or datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"),
+        "description": description if isinstance(description, str) else "",
+        # 写入时的git分支和提交，见 gitinfo.find_memories_by_revision
+        "branch": branch if isinstance(branch, str) and branch else None,
+        "commit": commit if isinstance(commit, str) and commit else None,
+        "auto_always_apply": fields.get(AUTO_ALWAYS_APPLY_FIELD) is True,
+        "chunks": _chunk_names(fields.get(CHUNKS_FIELD)),
+    }
+
+
+def _chunk_names(value: Any) -> List[str]:
+    if not isinstance(value, str):
+        return []
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+@contextmanager
+def file_lock(path: Path):
+    """用锁文件跨进程串行化对某个文件的 读取-修改-写入"""
+    if fcntl is None:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class MemoryLayout:
+    """项目记忆的目录布局和清单，负责在名称和文件路径之间转换"""
+
+    def __init__(self, project_path: str, readonly: bool = False):
+        self.project_path = project_path
+        self.root = rules_dir(project_path)
+        # 只读时重建的清单只保存在内存中，见 read_layout
+        self.readonly = readonly
+        self.scheme = SCHEME_FLAT
+        # 名称 -> 元数据（分片、大小、修改时间、内容哈希、创建时间、描述）
+        self.memories: Dict[str, Dict[str, Any]] = {}
+        # 清单每次写入时递增
+        self.generation = 0
+        # 规则目录（相对rules目录） -> 写入清单时的修改时间
+        self.dirs: Dict[str, int] = {}
+        self._mtime_ns: Optional[int] = None
+        self._load()
+
+    @property
+    def sharded(self) -> bool:
+        return self.scheme != SCHEME_FLAT
+
+    @property
+    def shards(self) -> Dict[str, str]:
+        """名称 -> 分片（相对rules目录，位于rules目录本身时为空）"""
+        return {name: meta["shard"] for name, meta in self.memories.items()}
+
+    def _load(self):
+        path = manifest_file(self.project_path)
+        try:
+            stat = path.stat()
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            self.rebuild()
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"记忆清单损坏，重新扫描目录: {e}")
+            self.rebuild()
+            return
+        scheme = data.get("scheme")
+        if data.get("version") != MANIFEST_VERSION or scheme not in SCHEMES:
+            logger.info("记忆清单版本已过期，重新扫描目录")
+            self.rebuild(scheme if scheme in SCHEMES else None)
+            return
+        self.scheme = scheme
+        self.memories = data.get("memories", {})
+        self.generation = data.get("generation", 0)
+        self.dirs = data.get("dirs", {})
+        self._mtime_ns = stat.st_mtime_ns
+        if not self.is_consistent():
+            logger.info("检测到清单之外的目录修改，重新扫描目录")
+            self.rebuild(self.scheme)
+
+    def is_stale(self) -> bool:
+        """清单文件是否被其它进程修改过"""
+        try:
+            mtime_ns = manifest_file(self.project_path).stat().st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        return mtime_ns != self._mtime_ns
+
+    def is_consistent(self) -> bool:
+        """规则目录的修改时间是否与清单记录的一致
+
+        每个目录只需要一次 ``stat``，不读取目录内容。
+        """
+        if not self.dirs:
+            return not self.root.exists()
+        for directory, mtime_ns in self.dirs.items():
+            try:
+                if (self.root / directory).stat().st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _dir_mtimes(self) -> Dict[str, int]:
+        """已记录的目录和所有分片目录（含上级目录）当前的修改时间"""
+        directories: Set[str] = {""} | set(self.dirs)
+        for meta in self.memories.values():
+            parts = meta["shard"].split("/") if meta["shard"] else []
+            for i in range(1, len(parts) + 1):
+                directories.add("/".join(parts[:i]))
+        mtimes = {}
+        for directory in directories:
+            try:
+                mtimes[directory] = (self.root / directory).stat().st_mtime_ns
+            except OSError:
+                continue
+        return mtimes
+
+    def save(self, dirs: Optional[Dict[str, int]] = None):
+        """原子地写入清单
+
+        Args:
+            dirs: 要记录的目录修改时间，默认取当前值
+        """
+        if self.readonly:
+            raise PermissionError(f"只读打开的项目不能写入清单: {self.project_path}")
+        path = manifest_file(self.project_path)
+        self.generation += 1
+        self.dirs = self._dir_mtimes() if dirs is None else dirs
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "scheme": self.scheme,
+                    "generation": self.generation,
+                    "dirs": self.dirs,
+                    "memories": self.memories,
+                },
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        os.replace(temp_file, path)
+        self._mtime_ns = path.stat().st_mtime_ns
+
+    def rebuild(self, scheme: Optional[str] = None):
+        """遍历rules目录重建清单
+
+        大小和修改时间都没有变化的文件沿用已有的元数据，不重新读取。
+
+        Args:
+            scheme: 布局，None时为平铺布局。手写的嵌套规则（例如
+                ``rules/frontend/react.mdc``）不说明项目使用了分片布局，
+                分片布局只来自清单的记录或显式的 ``reshard``
+        """
+        previous = self.memories
+        self.memories = {}
+        # 每个目录在读取内容之前记录修改时间，遍历期间发生的修改会在下次检查时被发现
+        dirs: Dict[str, int] = {}
+        for name, shard, path in walk_memory_files(self.root, dirs):
+            old = previous.get(name)
+            try:
+                stat = path.stat()
+                if (
+                    old
+                    and old["shard"] == shard
+                    and old["size"] == stat.st_size
+                    and old["modified"] == stat.st_mtime_ns
+                ):
+                    self.memories[name] = old
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    content = f.read()
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"无法读取记忆文件 {path}: {e}")
+                continue
+            created = old["created"] if old else None
+            self.memories[name] = _memory_metadata(shard, content, stat, created)
+
+        self.scheme = scheme or SCHEME_FLAT
+        if not dirs:
+            # rules目录不存在，不为空项目创建清单
+            self.dirs = {}
+            return
+        if self.readonly:
+            self.generation += 1
+            self.dirs = dirs
+            return
+        try:
+            self.save(dirs)
+        except OSError as e:
+            logger.warning(f"无法保存记忆清单: {e}")
+
+    def shard_for_new(self, name: str, created: Optional[datetime] = None) -> str:
+        """新记忆应放入的分片"""
+        if self.scheme == SCHEME_HASH:
+            return hash_shard(name)
+        if self.scheme == SCHEME_DATE:
+            return date_shard(created or datetime.now())
+        return ""
+
+    def path_for(self, name: str, created: Optional[datetime] = None) -> Path:
+        """记忆文件的路径：已存在的记忆返回其所在位置，否则返回新记忆应写入的位置"""
+        filename = f"{name}{MEMORY_SUFFIX}"
+        meta = self.memories.get(name)
+        if meta is not None:
+            shard = meta["shard"]
+        elif self.sharded:
+            shard = self.shard_for_new(name, created)
+        else:
+            shard = ""
+        return self.root / shard / filename if shard else self.root / filename
+
+    def exists(self, name: str) -> bool:
+        """记忆是否存在（只查清单）"""
+        return name in self.memories
+
+    def chunks_of(self, name: str) -> List[str]:
+        """拆分写入的父记忆拥有的各个部分，不是父记忆时返回空列表"""
+        meta = self.memories.get(name)
+        return list(meta.get("chunks") or []) if meta else []
+
+    def register(self, name: str, path: Path, content: str):
+        """记录新写入或更新的记忆"""
+        self.register_many({name: (path, content)})
+
+    def register_many(self, items: Dict[str, Tuple[Path, str]]):
+        """批量记录新写入或更新的记忆，只写一次清单
+
+        Args:
+            items: 名称 -> (文件路径, 文件内容)
+        """
+        if not items:
+            return
+        with file_lock(manifest_file(self.project_path).with_suffix(".lock")):
+            if self.is_stale():
+                # 合并其它进程写入的条目
+                self._load()
+            now = datetime.now().isoformat(timespec="seconds")
+            for name, (path, content) in items.items():
+                old = self.memories.get(name)
+                self.memories[name] = _memory_metadata(
+                    _shard_of(self.root, path),
+                    content,
+                    path.stat(),
+                    old["created"] if old else now,
+                )
+            self.save()
+
+    def unregister(self, names: Iterable[str]):
+        """从清单中删除已被删除的记忆"""
+        names = [name for name in names if name in self.memories]
+        if not names:
+            return
+        with file_lock(manifest_file(self.project_path).with_suffix(".lock")):
+            if self.is_stale():
+                self._load()
+            for name in names:
+                self.memories.pop(name, None)
+            self.save()
+
+    def register_append(self, name: str, path: Path):
+        """记录原地追加后的记忆，不读取文件内容
+
+        只更新大小和修改时间；内容哈希无法增量计算，记为None，需要时再从文件计算
+        （见 :meth:`hashes`）。描述在frontmatter中，追加不会改变它。
+        """
+        with file_lock(manifest_file(self.project_path).with_suffix(".lock")):
+            if self.is_stale():
+                self._load()
+            meta = self.memories.get(name)
+            if meta is None:
+                # 清单中没有这条记忆（例如被外部添加），按普通写入登记
+                with open(path, encoding="utf-8") as f:
+                    content = f.read()
+                self.memories[name] = _memory_metadata(
+                    _shard_of(self.root, path),
+                    content,
+                    path.stat(),
+                    datetime.now().isoformat(timespec="seconds"),
+                )
+            else:
+                stat = path.stat()
+                meta.update(size=stat.st_size, modified=stat.st_mtime_ns, hash=None)
+            self.save()
+
+    def iter_files(self) -> Iterator[os.DirEntry]:
+        """遍历所有记忆文件
+
+        只扫描rules目录和清单中出现过的分片，不递归遍历整个目录树。
+        """
+        shards = {meta["shard"] for meta in self.memories.values()}
+        shards.add("")
+        for shard in sorted(shards):
+            yield from iter_memory_files(self.root / shard if shard else self.root)
+
+    def names(self) -> List[str]:
+        """列出所有记忆名称（只读清单）"""
+        return sorted(self.memories)
+
+    def hashes(self) -> Set[str]:
+        """所有记忆的内容哈希
+
+        追加后尚未计算哈希的记忆在这里读取文件补算（不写回清单）。
+        """
+        hashes = set()
+        for name, meta in self.memories.items():
+            if meta["hash"] is None:
+                try:
+                    with open(self.path_for(name), encoding="utf-8") as f:
+                        meta["hash"] = content_hash(f.read())
+                except (OSError, UnicodeDecodeError) as e:
+                    logger.warning(f"无法读取记忆 {name}: {e}")
+                    continue
+            hashes.add(meta["hash"])
+        return hashes
+
+    def stats(self) -> Dict[str, Any]:
+        """记忆数量和总大小（只读清单）"""
+        return {
+            "scheme": self.scheme,
+            "generation": self.generation,
+            "memory_count": len(self.memories),
+            "total_bytes": sum(meta["size"] for meta in self.memories.values()),
+        }
+
+
+_layouts: Dict[str, MemoryLayout] = {}
+_layouts_lock = threading.Lock()
+
+
+def get_layout(project_path: str) -> MemoryLayout:
+    """返回项目的布局和清单
+
+    清单文件未变化时复用已加载的实例；目录被清单之外的操作修改过时重建清单。
+    """
+    key = str(Path(project_path).resolve())
+    with _layouts_lock:
+        layout = _layouts.get(key)
+        if layout is None or layout.is_stale():
+            layout = MemoryLayout(key)
+            _layouts[key] = layout
+        elif not layout.is_consistent():
+            logger.info("检测到清单之外的目录修改，重新扫描目录")
+            layout.rebuild(layout.scheme)
+        return layout
+
+
+def read_layout(
+    project_path: str, cached: Optional[MemoryLayout] = None
+) -> MemoryLayout:
+    """只读地打开项目的布局和清单，不写入任何文件
+
+    用于其它项目（例如跨项目搜索）：清单缺失、过期或与目录不一致时只在内存中重建。
+
+    Args:
+        project_path: 项目根目录
+        cached: 上次返回的实例；清单文件未变化时复用它，只重新读取变化了的文件
+    """
+    if cached is None or cached.is_stale():
+        return MemoryLayout(str(Path(project_path).resolve()), readonly=True)
+    if not cached.is_consistent():
+        cached.rebuild(cached.scheme)
+    return cached
+
+
+def walk_memory_files(
+    root: Path, dir_mtimes: Optional[Dict[str, int]] = None
+) -> Iterator[Tuple[str, str, Path]]:
+    """递归遍历rules目录，返回 (名称, 分片, 路径)，跳过迁移用的临时目录
+
+    Args:
+        root: rules目录
+        dir_mtimes: 传入时，记录每个目录在读取之前的修改时间
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            if dir_mtimes is not None:
+                relative = directory.relative_to(root).as_posix()
+                mtime_ns = directory.stat().st_mtime_ns
+                dir_mtimes["" if relative == "." else relative] = mtime_ns
+            it = os.scandir(directory)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith(_RESHARD_TEMP_PREFIX):
+                        stack.append(Path(entry.path))
+                elif entry.name.endswith(MEMORY_SUFFIX) and entry.is_file():
+                    shard = directory.relative_to(root).as_posix()
+                    yield (
+                        memory_name(entry.name),
+                        "" if shard == "." else shard,
+                        Path(entry.path),
+                    )
+
+
+@dataclass
+class ReshardStats:
+    """迁移统计"""
+
+    scheme: str
+    moved: int = 0
+    unchanged: int = 0
+    shards: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def _link_or_copy(source: Path, target: Path):
+    """优先使用硬链接（不复制数据），文件系统不支持时退回复制"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _shard_of(root: Path, path: Path) -> str:
+    shard = path.parent.relative_to(root).as_posix()
+    return "" if shard == "." else shard
+
+
+def _collect_current(
+    root: Path, known: Dict[str, str], stats: ReshardStats
+) -> Dict[str, Path]:
+    """找出每条记忆当前的文件
+
+    上次迁移中断时同一条记忆可能同时存在于新旧位置：内容相同时保留目标位置的
+    文件并删除其余的，内容不同时都保留并报告错误。
+    """
+    locations: Dict[str, List[Path]] = {}
+    for name, _, path in walk_memory_files(root):
+        locations.setdefault(name, []).append(path)
+
+    current = {}
+    for name, paths in locations.items():
+        if len(paths) == 1:
+            current[name] = paths[0]
+            continue
+        paths.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+        keep = next(
+            (p for p in paths if _shard_of(root, p) == known.get(name)),
+            paths[0],
+        )
+        for other in paths:
+            if other == keep:
+                continue
+            if filecmp.cmp(keep, other, shallow=False):
+                other.unlink()
+            else:
+                stats.errors.append(f"记忆 {name} 存在内容不同的多个文件: {other}")
+        current[name] = keep
+    return current
+
+
+def _plan_moves(
+    root: Path, known: Dict[str, str], layout: MemoryLayout, stats: ReshardStats
+) -> Tuple[Dict[str, List[Tuple[str, Path]]], Dict[str, str]]:
+    """计算每条记忆的目标分片
+
+    Returns:
+        (目标分片 -> [(名称, 当前路径)], 名称 -> 目标分片)
+    """
+    moves: Dict[str, List[Tuple[str, Path]]] = {}
+    shards: Dict[str, str] = {}
+    for name, path in _collect_current(root, known, stats).items():
+        created = datetime.fromtimestamp(path.stat().st_mtime)
+        target = layout.shard_for_new(name, created)
+        shards[name] = target
+        if target == _shard_of(root, path):
+            stats.unchanged += 1
+        else:
+            moves.setdefault(target, []).append((name, path))
+    return moves, shards
+
+
+def reshard(project_path: str, scheme: str) -> ReshardStats:
+    """把项目的记忆迁移到指定布局
+
+    每个目标分片先在 ``rules/.reshard-*`` 临时目录中用硬链接组装完整，目标分片
+    不存在时一次重命名发布（原子操作）；已存在时逐个文件原子替换。发布成功并更新
+    清单之后才删除旧位置的文件。date布局以文件修改时间作为创建时间。
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"未知的布局: {scheme}")
+
+    root = rules_dir(project_path)
+    root.mkdir(parents=True, exist_ok=True)
+    for leftover in root.glob(f"{_RESHARD_TEMP_PREFIX}*"):
+        shutil.rmtree(leftover, ignore_errors=True)
+
+    layout = MemoryLayout(project_path)
+    known = layout.shards
+    layout.scheme = scheme
+    stats = ReshardStats(scheme=scheme)
+
+    moves, shards = _plan_moves(root, known, layout, stats)
+    for target, items in sorted(moves.items()):
+        try:
+            _publish_shard(root, target, items)
+        except OSError as e:
+            stats.errors.append(f"分片 {target or '.'} 迁移失败: {e}")
+            for name, path in items:
+                shards[name] = _shard_of(root, path)
+            continue
+        stats.moved += len(items)
+        stats.shards += 1
+
+    for name, shard in shards.items():
+        if name in layout.memories:
+            layout.memories[name]["shard"] = shard
+    layout.save()
+
+    # 清单已指向新位置，删除旧文件
+    _remove_moved(root, moves, shards)
+    _remove_empty_dirs(root)
+    # 记录迁移后的目录修改时间（元数据沿用，不重新读取文件）
+    layout.rebuild(scheme)
+
+    logger.info(
+        f"迁移完成: 布局 {scheme}, 移动 {stats.moved} 条记忆到 {stats.shards} 个分片"
+    )
+    return stats
+
+
+def _publish_shard(root: Path, target: str, items: List[Tuple[str, Path]]):
+    """在临时目录中组装分片，然后发布到目标位置"""
+    temp_dir = root / f"{_RESHARD_TEMP_PREFIX}{target.replace('/', '-') or 'root'}"
+    temp_dir.mkdir()
+    try:
+        for name, path in items:
+            _link_or_copy(path, temp_dir / f"{name}{MEMORY_SUFFIX}")
+        destination = root / target if target else root
+        if target and not destination.exists():
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(temp_dir, destination)
+            return
+        destination.mkdir(parents=True, exist_ok=True)
+        for name, _ in items:
+            filename = f"{name}{MEMORY_SUFFIX}"
+            os.replace(temp_dir / filename, destination / filename)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _remove_moved(
+    root: Path, moves: Dict[str, List[Tuple[str, Path]]], shards: Dict[str, str]
+):
+    """删除已发布到新分片的记忆的旧文件"""
+    for items in moves.values():
+        for name, path in items:
+            if shards[name] != _shard_of(root, path):
+                path.unlink(missing_ok=True)
+
+
+def _remove_empty_dirs(root: Path):
+    """删除迁移后留下的空分片目录"""
+    for directory, _, _ in sorted(os.walk(root), key=lambda d: -len(d[0])):
+        if Path(directory) != root:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
@@ -0,0 +1,241 @@
+"""
+跨多个项目的离线维护
+
+夜间任务需要维护上百个仓库的记忆：重建清单和索引、压缩签名文件和旧快照、
+汇总统计、批量导出。这些操作彼此独立且以读写文件为主，这里把它们写成以项目路径
+为参数的顶层函数（可以在子进程中执行），由 :func:`run_parallel` 放入进程池并行
+处理，并逐个报告进度。单个项目失败不影响其它项目。
+"""
+
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, List, Optional
+
+from . import file_index, minhash
+from .access import get_access_counters
+from .file_index import cache_file, get_file_index
+from .history import history_dir
+from .layout import get_layout, rules_dir
+from .minhash import get_signature_store, signature_file
+from .registry import ProjectRegistry
+from .search import SearchIndex, index_file
+from .snapshot import default_keep, list_snapshots, prune_snapshots, snapshots_dir
+from .store import _validate_project_path
+from .transfer import export_memories
+
+logger = logging.getLogger(__name__)
+
+# 中断的写入留下的临时文件超过该秒数后由compact删除
+STALE_TEMP_SECONDS = 3600
+
+
+def resolve_projects(patterns: Iterable[str], known: bool = False) -> List[str]:
+    """把命令行给出的项目路径和glob模式展开为去重后的项目根目录
+
+    glob模式只保留匹配到的目录；直接给出的路径不存在时抛出 ``ValueError``。
+
+    Args:
+        patterns: 项目路径或glob模式（支持 ``**``）
+        known: 同时包含服务记录过的所有项目（跨项目搜索使用的注册表）
+    """
+    projects: Dict[str, None] = {}
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            for match in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isdir(match):
+                    projects[str(Path(match).resolve())] = None
+        else:
+            projects[_validate_project_path(pattern)] = None
+    if known:
+        for project in ProjectRegistry().projects():
+            projects[project] = None
+    return list(projects)
+
+
+def _tree_bytes(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def reindex_project(project_path: str, full: bool = False) -> Dict[str, Any]:
+    """重建项目的记忆清单、搜索索引、文件索引和MinHash签名
+
+    Args:
+        full: 先删除搜索索引、文件索引和签名的缓存文件，全部从头计算；
+            默认只重新处理大小、修改时间或内容哈希变化了的记忆
+    """
+    if full:
+        for path in (index_file(project_path), cache_file(project_path)):
+            path.unlink(missing_ok=True)
+        signature_file(project_path).unlink(missing_ok=True)
+        # 在当前进程中执行时（jobs=1）丢弃已加载的实例，下面重新计算
+        with minhash._stores_lock:
+            minhash._stores.pop(project_path, None)
+        with file_index._INDEXES_LOCK:
+            file_index._INDEXES.pop(str(Path(project_path).resolve()), None)
+    layout = get_layout(project_path)
+    layout.rebuild(layout.scheme)
+    search = SearchIndex(project_path)
+    search.refresh()
+    files = get_file_index(project_path, max_age=0)
+    signatures = get_signature_store(project_path)
+    return {
+        "memories": len(layout.memories),
+        "search_indexed": search.indexed,
+        "search_reused": search.reused,
+        "files": len(files.files()),
+        "signatures": len(signatures),
+    }
+
+
+def compact_project(project_path: str, keep: Optional[int] = None) -> Dict[str, Any]:
+    """压缩签名文件、删除多余的旧快照和中断写入留下的临时文件
+
+    Args:
+        keep: 保留的快照数量，默认取 ``CURSOR_MEMORY_SNAPSHOT_KEEP``
+    """
+    signatures = get_signature_store(project_path)
+    path = signature_file(project_path)
+    before = path.stat().st_size if path.exists() else 0
+    signatures.compact()
+    after = path.stat().st_size if path.exists() else 0
+
+    # 记忆已删除的访问计数不再参与排序
+    counters = get_access_counters(project_path)
+    stale = set(counters.scores()) - set(get_layout(project_path).memories)
+    counters.forget(stale)
+
+    pruned = prune_snapshots(project_path, default_keep() if keep is None else keep)
+
+    removed_temp = 0
+    root = rules_dir(project_path)
+    cutoff = time.time() - STALE_TEMP_SECONDS
+    for temp_file in root.rglob("*.tmp") if root.exists() else ():
+        try:
+            if temp_file.stat().st_mtime < cutoff:
+                temp_file.unlink()
+                removed_temp += 1
+        except OSError:
+            continue
+    return {
+        "signature_bytes_before": before,
+        "signature_bytes_after": after,
+        "access_counters_removed": len(stale),
+        "snapshots_pruned": len(pruned),
+        "temp_files_removed": removed_temp,
+    }
+
+
+def project_stats(project_path: str) -> Dict[str, Any]:
+    """项目的记忆数量和各类缓存占用的磁盘空间（只读）"""
+    layout = get_layout(project_path)
+    signature_path = signature_file(project_path)
+    return {
+        **layout.stats(),
+        "history_bytes": _tree_bytes(history_dir(project_path)),
+        "signature_bytes": (
+            signature_path.stat().st_size if signature_path.exists() else 0
+        ),
+        "snapshots": len(list_snapshots(project_path)),
+        "snapshot_bytes": _tree_bytes(snapshots_dir(project_path)),
+    }
+
+
+def export_output(project_path: str, output_dir: str, compress: bool) -> str:
+    """批量导出时每个项目的输出文件：目录名加路径哈希，避免同名项目冲突"""
+    digest = hashlib.sha256(project_path.encode("utf-8")).hexdigest()[:8]
+    suffix = ".jsonl.gz" if compress else ".jsonl"
+    return os.path.join(output_dir, f"{Path(project_path).name}-{digest}{suffix}")
+
+
+def export_project(
+    project_path: str, output_dir: str, compress: bool = False, overwrite: bool = False
+) -> Dict[str, Any]:
+    """把项目记忆导出到输出目录中的单独文件，文件已存在时只在overwrite时覆盖"""
+    output = export_output(project_path, output_dir, compress)
+    stats = export_memories(project_path, output, compress, overwrite)
+    if stats.errors:
+        raise OSError("; ".join(stats.errors))
+    return {"exported": stats.exported, "output": output}
+
+
+def _timed(func: Callable[..., Dict[str, Any]], project: str, *args) -> Dict:
+    start = time.perf_counter()
+    result = func(project, *args)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_parallel(
+    func: Callable[..., Dict[str, Any]],
+    projects: List[str],
+    *args: Any,
+    jobs: Optional[int] = None,
+    progress: Optional[IO[str]] = None,
+) -> Dict[str, Any]:
+    """在进程池中对每个项目执行func，返回汇总结果
+
+    Args:
+        func: 以项目路径为第一个参数的顶层函数
+        projects: 项目根目录
+        *args: 传给func的其它参数
+        jobs: 工作进程数，默认取CPU核数；为1时在当前进程中依次执行
+        progress: 每完成一个项目向其写一行进度，默认不输出
+    """
+    jobs = jobs or min(os.cpu_count() or 1, len(projects)) or 1
+    results: Dict[str, Any] = {}
+    failed = 0
+    start = time.perf_counter()
+
+    def report(project: str, outcome: Dict[str, Any]):
+        nonlocal failed
+        results[project] = outcome
+        failed += "error" in outcome
+        if progress is not None:
+            status = f"失败: {outcome['error']}" if "error" in outcome else "完成"
+            print(
+                f"[{len(results)}/{len(projects)}] {project} {status}",
+                file=progress,
+                flush=True,
+            )
+
+    if jobs == 1:
+        for project in projects:
+            try:
+                report(project, _timed(func, project, *args))
+            except Exception as e:
+                report(project, {"error": str(e)})
+    else:
+        # 与跨项目搜索相同，使用spawn避免fork带来的锁状态问题
+        with ProcessPoolExecutor(
+            jobs, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = {
+                pool.submit(_timed, func, project, *args): project
+                for project in projects
+            }
+            for future in as_completed(futures):
+                try:
+                    report(futures[future], future.result())
+                except Exception as e:
+                    report(futures[future], {"error": str(e)})
+
+    return {
+        "projects": {project: results[project] for project in projects},
+        "succeeded": len(projects) - failed,
+        "failed": failed,
+        "jobs": jobs,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
@@ -0,0 +1,320 @@
+"""
+写入时的近似重复检测（MinHash + LSH）
+
+同一个任务经常被写成多条措辞略有不同的记忆，内容哈希只能发现完全相同的内容。
+这里为每条记忆计算MinHash签名（字符3-gram的 ``NUM_PERM`` 个最小哈希），两条记忆的
+签名中相同位置取值相同的比例就是它们Jaccard相似度的估计。
+
+签名按 ``BANDS`` 段、每段 ``ROWS`` 个值切分做LSH：相似的记忆至少有一段完全相同的
+概率很高，因此查询只需要查看同一个桶中的记忆，与记忆总数无关。候选再用完整签名
+估计相似度，低于阈值的丢弃。
+
+每个项目的签名保存在 ``.cursor/cache/minhash.bin``，这是一个只追加的记录文件：
+每条记录是 名称长度(2字节) + 名称 + ``NUM_PERM`` 个32位整数（本机字节序），以一次
+``O_APPEND`` 写入，多个进程可以同时追加。同一名称以最后一条记录为准，失效记录超过
+一半时在加载时压缩。进程内缓存已加载的签名和桶，文件增长时只读取新增的部分。
+
+安装了NumPy（``pip install cursor-memory-mcp[fast]``）时签名以向量化方式计算；
+否则使用纯Python实现，两者的结果完全相同，签名文件可以互换。
+"""
+
+import logging
+import os
+import random
+import re
+import struct
+import threading
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from .frontmatter import parse_memory_file
+from .layout import file_lock, get_layout
+
+try:
+    import numpy as np
+except ImportError:  # 没有NumPy时使用纯Python实现
+    np = None
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+DEFAULT_THRESHOLD = 0.8
+
+SHINGLE_SIZE = 3
+
+# 哈希函数 h(x) = (a*x + b) mod p，p取2^31-1，
+# 使 a*x（x为32位）不超过64位，NumPy和纯Python的结果一致
+_PRIME = (1 << 31) - 1
+_rng = random.Random(20240601)
+_A = [_rng.randrange(1, _PRIME) for _ in range(NUM_PERM)]
+_B = [_rng.randrange(0, _PRIME) for _ in range(NUM_PERM)]
+
+# NumPy每次处理的shingle数
+_CHUNK = 4096
+
+_RECORD_HEADER = struct.Struct("<H")
+_SIGNATURE_BYTES = NUM_PERM * 4
+
+# 存储的签名超过存活名称的该倍数时压缩
+_COMPACT_RATIO = 2
+
+_WHITESPACE = re.compile(r"\s+")
+
+if np is not None:
+    _A_VEC = np.array(_A, dtype=np.uint64)
+    _B_VEC = np.array(_B, dtype=np.uint64)
+
+
+def signature_file(project_path: str) -> Path:
+    """返回签名文件路径"""
+    return Path(project_path) / ".cursor" / "cache" / "minhash.bin"
+
+
+def shingles(text: str) -> Set[int]:
+    """把文本规范化（小写、合并空白）后切分为字符3-gram，返回各自的32位哈希"""
+    normalized = _WHITESPACE.sub(" ", text.lower()).strip()
+    return {
+        zlib.crc32(normalized[i : i + SHINGLE_SIZE].encode("utf-8"))
+        for i in range(max(1, len(normalized) - SHINGLE_SIZE + 1))
+    }
+
+
+def minhash_signature(text: str) -> array:
+    """计算文本的MinHash签名，返回 ``NUM_PERM`` 个32位整数"""
+    values = shingles(text)
+    if np is not None:
+        x = np.fromiter(values, dtype=np.uint64, count=len(values))
+        result = np.full(NUM_PERM, _PRIME, dtype=np.uint64)
+        # 分块计算，大文件的中间矩阵大小有上限
+        for start in range(0, len(x), _CHUNK):
+            hashed = (np.outer(x[start : start + _CHUNK], _A_VEC) + _B_VEC) % _PRIME
+            np.minimum(result, hashed.min(axis=0), out=result)
+        return array("I", result.astype(np.uint32).tobytes())
+    return array(
+        "I",
+        (
+            min((a * x + b) % _PRIME for x in values) if values else _PRIME
+            for a, b in zip(_A, _B, strict=True)
+        ),
+    )
+
+
+def merge_signatures(a: array, b: array) -> array:
+    """两段文本合并后的签名：逐位取最小值"""
+    return array("I", map(min, a, b))
+
+
+def estimate_jaccard(a: array, b: array) -> float:
+    """用签名估计两段文本的Jaccard相似度"""
+    if np is not None:
+        return float(
+            np.count_nonzero(
+                np.frombuffer(a, dtype=np.uint32) == np.frombuffer(b, dtype=np.uint32)
+            )
+            / NUM_PERM
+        )
+    return sum(x == y for x, y in zip(a, b, strict=True)) / NUM_PERM
+
+
+_BAND_BYTES = ROWS * 4
+
+
+def _band_keys(data: bytes) -> List[bytes]:
+    """签名（字节形式）各段的取值，第i个元素对应第i段的桶"""
+    return [data[i : i + _BAND_BYTES] for i in range(0, _SIGNATURE_BYTES, _BAND_BYTES)]
+
+
+def _encode(name: str, signature: array) -> bytes:
+    encoded = name.encode("utf-8")
+    return _RECORD_HEADER.pack(len(encoded)) + encoded + signature.tobytes()
+
+
+class SignatureStore:
+    """单个项目的签名和LSH桶"""
+
+    def __init__(self, project_path: str):
+        self.project_path = project_path
+        self.path = signature_file(project_path)
+        self.signatures: Dict[str, array] = {}
+        # 每段一个字典：段内取值 -> 名称（只有一个名称时不建集合，节省加载时间和内存）
+        self.buckets: List[Dict[bytes, Union[str, Set[str]]]] = [
+            {} for _ in range(BANDS)
+        ]
+        self.records = 0
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def _index(self, name: str, data: bytes):
+        old = self.signatures.get(name)
+        if old is not None:
+            keys = _band_keys(old.tobytes())
+            for buckets, key in zip(self.buckets, keys, strict=True):
+                bucket = buckets.get(key)
+                if bucket == name:
+                    del buckets[key]
+                elif isinstance(bucket, set):
+                    bucket.discard(name)
+        signature = array("I")
+        signature.frombytes(data)
+        self.signatures[name] = signature
+        for buckets, key in zip(self.buckets, _band_keys(data), strict=True):
+            bucket = buckets.setdefault(key, name)
+            if bucket == name:
+                continue
+            if isinstance(bucket, set):
+                bucket.add(name)
+            else:
+                buckets[key] = {bucket, name}
+
+    def _reset(self):
+        self.signatures = {}
+        self.buckets = [{} for _ in range(BANDS)]
+        self.records = 0
+        self._offset = 0
+
+    def refresh(self):
+        """读取签名文件中新增的记录；文件被替换（压缩）时重新加载"""
+        with self._lock:
+            try:
+                stat = self.path.stat()
+            except FileNotFoundError:
+                self._reset()
+                self._inode = None
+                return
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._reset()
+                self._inode = stat.st_ino
+            if stat.st_size == self._offset:
+                return
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            self._offset += self._parse(data)
+
+    def _parse(self, data: bytes) -> int:
+        """解析记录，返回完整记录占用的字节数（末尾不完整的记录留到下次）"""
+        pos = 0
+        header = _RECORD_HEADER.size
+        while pos + header <= len(data):
+            (length,) = _RECORD_HEADER.unpack_from(data, pos)
+            end = pos + header + length + _SIGNATURE_BYTES
+            if end > len(data):
+                break
+            name = data[pos + header : pos + header + length].decode("utf-8")
+            self._index(name, data[pos + header + length : end])
+            self.records += 1
+            pos = end
+        return pos
+
+    def add_many(self, items: Iterable[Tuple[str, array]]):
+        """追加多条签名，一次写入"""
+        data = b"".join(_encode(name, signature) for name, signature in items)
+        if not data:
+            return
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.path.with_suffix(".lock")):
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(fd, view) :]
+                finally:
+                    os.close(fd)
+            self.refresh()
+
+    def add(self, name: str, signature: array):
+        """追加一条签名（同名的旧签名失效）"""
+        self.add_many([(name, signature)])
+
+    def query(
+        self,
+        signature: array,
+        threshold: float = DEFAULT_THRESHOLD,
+        exclude: Optional[str] = None,
+    ) -> List[Tuple[str, float]]:
+        """查找估计Jaccard相似度不低于threshold的记忆，按相似度降序
+
+        Returns:
+            [(名称, 相似度)]
+        """
+        with self._lock:
+            candidates: Set[str] = set()
+            keys = _band_keys(signature.tobytes())
+            for buckets, key in zip(self.buckets, keys, strict=True):
+                bucket = buckets.get(key)
+                if isinstance(bucket, set):
+                    candidates.update(bucket)
+                elif bucket is not None:
+                    candidates.add(bucket)
+            candidates.discard(exclude)
+            matches = []
+            for name in candidates:
+                similarity = estimate_jaccard(signature, self.signatures[name])
+                if similarity >= threshold:
+                    matches.append((name, round(similarity, 3)))
+        matches.sort(key=lambda m: (-m[1], m[0]))
+        return matches
+
+    def compact(self):
+        """只保留每个名称的最新签名，原子地替换签名文件"""
+        with self._lock, file_lock(self.path.with_suffix(".lock")):
+            self.refresh()
+            temp_file = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(temp_file, "wb") as f:
+                for name, signature in self.signatures.items():
+                    f.write(_encode(name, signature))
+            os.replace(temp_file, self.path)
+        self.refresh()
+
+
+_stores: Dict[str, SignatureStore] = {}
+_stores_lock = threading.Lock()
+
+
+def memory_body(path: Path) -> Optional[str]:
+    """读取记忆的正文（不含frontmatter），读取失败时返回None"""
+    try:
+        _, body = parse_memory_file(path.read_text(encoding="utf-8"))
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning(f"无法读取记忆 {path}: {e}")
+        return None
+    return body
+
+
+def get_signature_store(project_path: str) -> SignatureStore:
+    """返回项目的签名库
+
+    每个进程第一次使用时加载签名文件，为清单中还没有签名的记忆补算签名，
+    失效记录过多时压缩。
+    """
+    with _stores_lock:
+        store = _stores.get(project_path)
+        if store is not None:
+            store.refresh()
+            return store
+        store = SignatureStore(project_path)
+        store.refresh()
+        layout = get_layout(project_path)
+        missing = []
+        for name in layout.names():
+            if name not in store.signatures:
+                body = memory_body(layout.path_for(name))
+                if body is not None:
+                    missing.append((name, minhash_signature(body)))
+        if missing:
+            logger.info(f"为 {len(missing)} 条记忆补算MinHash签名")
+            store.add_many(missing)
+        if store.records > _COMPACT_RATIO * max(len(store), 1):
+            store.compact()
+        _stores[project_path] = store
+        return store
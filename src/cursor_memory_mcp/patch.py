@@ -0,0 +1,284 @@
+"""
+按小节修改记忆
+
+补丁以Markdown标题定位小节，支持以下操作：
+
+- ``replace``：替换标题下的内容（包括下级小节），保留标题行
+- ``insert``：在小节末尾（下一个同级或更高级标题之前）插入内容，
+  不指定标题时插入到文件末尾
+- ``delete``：删除整个小节（包括标题行和下级小节）
+- ``set``：修改frontmatter字段 ``description``、``globs`` 或 ``alwaysApply``
+
+更新使用乐观并发控制：调用方传入读取时的内容哈希，文件在此之后被修改过则拒绝更新。
+检查和写入在文件锁内完成，写入使用 临时文件 + 原子替换。
+
+正文只解析一次，得到小节列表和标题索引；每个补丁只改动它所定位的小节，最后拼接
+一次，因此一次更新的成本与文件大小成线性关系，与补丁在文件中的位置无关。
+"""
+
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .append import open_locked
+from .frontmatter import parse_memory_file, set_field
+from .layout import content_hash
+
+OP_REPLACE = "replace"
+OP_INSERT = "insert"
+OP_DELETE = "delete"
+OP_SET = "set"
+OPS = (OP_REPLACE, OP_INSERT, OP_DELETE, OP_SET)
+
+# 可以修改的frontmatter字段 -> 值的类型
+EDITABLE_FIELDS = {"description": str, "globs": str, "alwaysApply": bool}
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.*?)[ \t#]*$")
+_FENCE_PATTERN = re.compile(r"^[ \t]*(```|~~~)")
+
+
+class PatchError(ValueError):
+    """补丁无效或无法应用"""
+
+
+class HashMismatch(Exception):
+    """文件在调用方读取之后被修改过"""
+
+    def __init__(self, current_hash: str):
+        super().__init__("记忆已被修改，请重新读取后再更新")
+        self.current_hash = current_hash
+
+
+@dataclass
+class Patch:
+    """单个补丁"""
+
+    op: str
+    heading: Optional[str] = None
+    content: str = ""
+    field: Optional[str] = None
+    value: Any = None
+
+
+def parse_patch(data: Dict[str, Any]) -> Patch:
+    """从请求参数构造补丁并检查各操作需要的字段"""
+    op = data.get("op")
+    if op not in OPS:
+        raise PatchError(f"op只能是: {', '.join(OPS)}")
+    patch = Patch(
+        op=op,
+        heading=data.get("heading"),
+        content=data.get("content") or "",
+        field=data.get("field"),
+        value=data.get("value"),
+    )
+    if op == OP_SET:
+        expected = EDITABLE_FIELDS.get(patch.field)
+        if expected is None:
+            raise PatchError(f"field只能是: {', '.join(EDITABLE_FIELDS)}")
+        if not isinstance(patch.value, expected):
+            raise PatchError(f"{patch.field}的值必须是{expected.__name__}")
+        if expected is str and "\n" in patch.value:
+            raise PatchError(f"{patch.field}不能包含换行")
+        return patch
+    if op in (OP_REPLACE, OP_DELETE) and not patch.heading:
+        raise PatchError(f"{op}操作需要指定heading")
+    if op in (OP_REPLACE, OP_INSERT) and not patch.content.strip():
+        raise PatchError(f"{op}操作需要content")
+    return patch
+
+
+def _heading_key(text: str) -> str:
+    """标题的匹配键：去掉开头的#和首尾空白"""
+    return text.strip().lstrip("#").strip()
+
+
+@dataclass
+class _Section:
+    """正文中的一个小节：标题行（开头部分没有标题）和之后直到下一个标题的行"""
+
+    level: int
+    heading: Optional[str]
+    lines: List[str] = field(default_factory=list)
+    # 下一个同级或更高级小节的下标
+    end: int = 0
+    deleted: bool = False
+    patched: bool = False
+
+
+def _parse_sections(body: str) -> List[_Section]:
+    """一次遍历把正文切分为小节，代码块中的 # 行不是标题"""
+    sections = [_Section(0, None)]
+    in_fence = False
+    for line in body.splitlines(keepends=True):
+        if _FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = _HEADING_PATTERN.match(line.rstrip("\r\n"))
+            if match:
+                sections.append(_Section(len(match.group(1)), line))
+                continue
+        sections[-1].lines.append(line)
+
+    # 用栈求每个小节的范围
+    stack: List[int] = []
+    for i, section in enumerate(sections):
+        while stack and sections[stack[-1]].level >= section.level:
+            sections[stack.pop()].end = i
+        stack.append(i)
+    for i in stack:
+        sections[i].end = len(sections)
+    return sections
+
+
+def _block(content: str) -> List[str]:
+    """把补丁内容转换为以换行结尾的行"""
+    return [content.strip("\n") + "\n"]
+
+
+class _Document:
+    """已解析的正文，按标题定位小节"""
+
+    def __init__(self, body: str):
+        self.sections = _parse_sections(body)
+        self.index: Dict[str, int] = {}
+        for i, section in enumerate(self.sections):
+            if section.heading is not None:
+                self.index.setdefault(_heading_key(section.heading), i)
+
+    def _find(self, heading: str) -> int:
+        i = self.index.get(_heading_key(heading))
+        if i is None or self.sections[i].deleted:
+            raise PatchError(f"标题不存在: {heading}")
+        return i
+
+    def _delete_range(self, start: int, end: int):
+        for section in self.sections[start:end]:
+            section.deleted = True
+
+    def apply(self, patch: Patch):
+        if patch.op == OP_INSERT and not patch.heading:
+            i, end = 0, len(self.sections)
+        else:
+            i = self._find(patch.heading)
+            end = self.sections[i].end
+        section = self.sections[i]
+        if section.heading is not None and not section.heading.endswith("\n"):
+            # 文件以标题行结尾且没有换行
+            section.heading += "\n"
+        if patch.op == OP_REPLACE:
+            section.lines = _block(patch.content)
+            section.patched = True
+            self._delete_range(i + 1, end)
+        elif patch.op == OP_DELETE:
+            self._delete_range(i, end)
+        else:
+            last = next(s for s in reversed(self.sections[i:end]) if not s.deleted)
+            if last.lines and not last.lines[-1].endswith("\n"):
+                last.lines[-1] += "\n"
+            if last.lines and last.lines[-1].strip():
+                last.lines.append("\n")
+            last.lines.extend(_block(patch.content))
+            last.patched = True
+
+    def render(self) -> str:
+        live = [s for s in self.sections if not s.deleted]
+        parts = []
+        for n, section in enumerate(live):
+            if section.heading is not None:
+                parts.append(section.heading)
+            parts.extend(section.lines)
+            # 修改过的小节与后面的标题之间空一行
+            if section.patched and n + 1 < len(live) and section.lines:
+                if section.lines[-1].strip():
+                    parts.append("\n")
+        return "".join(parts)
+
+
+def apply_patches(text: str, patches: Sequence[Patch]) -> str:
+    """把补丁依次应用到记忆文件内容上，返回新内容"""
+    _, body = parse_memory_file(text)
+    frontmatter = text[: len(text) - len(body)]
+
+    section_patches = [p for p in patches if p.op != OP_SET]
+    if section_patches:
+        document = _Document(body)
+        for patch in section_patches:
+            document.apply(patch)
+        body = document.render()
+
+    # 只改写被设置的字段所在的行，frontmatter中的其它行原样保留
+    text = frontmatter + body
+    for patch in patches:
+        if patch.op == OP_SET:
+            text = set_field(text, patch.field, patch.value)
+    return text
+
+
+@dataclass
+class UpdateResult:
+    """更新结果"""
+
+    old_content: str
+    content: str
+    hash: str
+
+
+def rewrite_memory_file(
+    path: Path,
+    expected_hash: Optional[str],
+    transform: Callable[[str], str],
+    before_replace: Optional[Callable[[str, str], None]] = None,
+) -> UpdateResult:
+    """在文件锁内检查内容哈希、用transform生成新内容并原子地替换文件
+
+    Args:
+        path: 记忆文件
+        expected_hash: 调用方读取时的内容哈希，None表示不检查
+        transform: 由旧内容生成新内容
+        before_replace: 替换文件之前以 (旧内容, 新内容) 调用，用于存入历史
+
+    Raises:
+        HashMismatch: 文件内容的哈希与expected_hash不一致
+    """
+    fd = open_locked(path)
+    with os.fdopen(fd, "rb+", buffering=0) as f:
+        old_content = f.read().decode("utf-8")
+        if expected_hash is not None:
+            current_hash = content_hash(old_content)
+            if current_hash != expected_hash:
+                raise HashMismatch(current_hash)
+        content = transform(old_content)
+        if before_replace is not None:
+            before_replace(old_content, content)
+        temp_file = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_file, "wb") as out:
+            out.write(content.encode("utf-8"))
+        os.replace(temp_file, path)
+    return UpdateResult(old_content, content, content_hash(content))
+
+
+def update_memory_file(
+    path: Path,
+    expected_hash: str,
+    patches: Sequence[Patch],
+    before_replace: Optional[Callable[[str, str], None]] = None,
+) -> UpdateResult:
+    """在文件锁内检查内容哈希、应用补丁并原子地替换文件
+
+    Args:
+        path: 记忆文件
+        expected_hash: 调用方读取时的内容哈希
+        patches: 补丁列表
+        before_replace: 替换文件之前以 (旧内容, 新内容) 调用，用于存入历史
+
+    Raises:
+        HashMismatch: 文件内容的哈希与expected_hash不一致
+        PatchError: 补丁无法应用（例如标题不存在）
+    """
+    return rewrite_memory_file(
+        path, expected_hash, lambda text: apply_patches(text, patches), before_replace
+    )
@@ -0,0 +1,341 @@
+"""
+按需性能剖析
+
+不需要重启服务就能剖析线上行为：开启后，接下来的N次工具调用（或只保留耗时超过阈值的
+调用）在cProfile和/或tracemalloc下执行，结果写入服务端配置的目录
+（``CURSOR_MEMORY_PROFILE_DIR``，默认系统临时目录下的
+``cursor-memory-profiles-<uid>``）：
+
+- ``<时间>_<工具>_<序号>.prof``：cProfile统计，可以用 ``pstats``/snakeviz 打开
+- ``<时间>_<工具>_<序号>.alloc.json``：本次调用期间净增长最多的内存分配位置
+
+通过环境变量在启动时开启，或者调用 ``start_profiling`` 工具临时开启（工具不能指定
+目录，客户端无法让服务写入或读取任意路径）::
+
+    CURSOR_MEMORY_PROFILE_DIR=/tmp/profiles
+    CURSOR_MEMORY_PROFILE_CALLS=20        # 默认 10
+    CURSOR_MEMORY_PROFILE_SLOW_MS=500     # 只保留超过500ms的调用
+    CURSOR_MEMORY_PROFILE_MODE=both       # cpu（默认）、memory 或 both
+
+剖析结果目录只能属于服务的用户，且其它用户不能写入（默认目录以0700权限创建）：
+报告通过 ``pstats``（marshal）加载目录中的 ``.prof`` 文件，不能读取别人放进去的文件。
+
+未开启时服务只检查一次 ``Profiler.active``，没有额外开销。cProfile只记录开启它的线程，
+所以被剖析的调用经由 :func:`to_thread` 交给工作线程的函数在工作线程中另开一个
+cProfile，保存时与事件循环线程的统计合并。同一时刻只剖析一个调用。
+"""
+
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MODE_CPU = "cpu"
+MODE_MEMORY = "memory"
+MODE_BOTH = "both"
+MODES = (MODE_CPU, MODE_MEMORY, MODE_BOTH)
+
+DEFAULT_CALLS = 10
+
+# 每个分配统计文件保存的位置数量
+_ALLOC_SITES_PER_CALL = 50
+
+# tracemalloc为每个分配记录的调用栈深度
+_TRACEMALLOC_FRAMES = 10
+
+
+# 当前任务正在被剖析时，工作线程中的剖析结果收集到这里
+_worker_profiles: ContextVar[Optional[List[cProfile.Profile]]] = ContextVar(
+    "cursor_memory_worker_profiles", default=None
+)
+
+
+def default_output_dir() -> str:
+    """默认的剖析结果目录，每个用户一个"""
+    getuid = getattr(os, "getuid", None)
+    suffix = f"-{getuid()}" if getuid else ""
+    return os.path.join(tempfile.gettempdir(), f"cursor-memory-profiles{suffix}")
+
+
+def _ensure_private_dir(path: Path):
+    """创建剖析结果目录（0700），已存在时检查它属于当前用户且其它用户不能写入
+
+    Raises:
+        PermissionError: 目录属于其它用户或者其它用户可以写入
+    """
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    getuid = getattr(os, "getuid", None)
+    if getuid is None:
+        return
+    stat = path.stat()
+    if stat.st_uid != getuid():
+        raise PermissionError(f"剖析目录属于其它用户: {path}")
+    if stat.st_mode & 0o022:
+        raise PermissionError(f"剖析目录可以被其它用户写入: {path}")
+
+
+async def to_thread(func: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    """同 :func:`asyncio.to_thread`，调用方正在被剖析时在工作线程中也开启cProfile"""
+    profiles = _worker_profiles.get()
+    if profiles is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await asyncio.to_thread(_profiled, profiles, func, *args, **kwargs)
+
+
+def _profiled(
+    profiles: List[cProfile.Profile], func: Callable[..., T], /, *args, **kwargs
+) -> T:
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12起cProfile基于sys.monitoring，事件循环线程上的剖析已覆盖所有线程
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.disable()
+        profiles.append(profile)
+
+
+def _start_cprofile() -> Optional[cProfile.Profile]:
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError as e:
+        # Python 3.12起同一时刻只能有一个profiler
+        logger.warning(f"无法启动cProfile: {e}")
+        return None
+    return profile
+
+
+class Profiler:
+    """工具调用的按需剖析器"""
+
+    def __init__(self, output_dir: Optional[str] = None):
+        self.active = False
+        self.output_dir = Path(output_dir or default_output_dir())
+        self.remaining = 0
+        self.slow_ms: Optional[float] = None
+        self.mode = MODE_CPU
+        self.saved = 0
+        self._busy = False
+        self._seq = 0
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        """根据环境变量创建剖析器，未设置剖析目录时不开启"""
+        env = os.environ
+        output_dir = env.get("CURSOR_MEMORY_PROFILE_DIR")
+        profiler = cls(output_dir)
+        if output_dir:
+            slow_ms = env.get("CURSOR_MEMORY_PROFILE_SLOW_MS")
+            profiler.start(
+                calls=int(env.get("CURSOR_MEMORY_PROFILE_CALLS", DEFAULT_CALLS)),
+                slow_ms=float(slow_ms) if slow_ms else None,
+                mode=env.get("CURSOR_MEMORY_PROFILE_MODE", MODE_CPU),
+            )
+        return profiler
+
+    def start(
+        self,
+        output_dir: Optional[str] = None,
+        calls: int = DEFAULT_CALLS,
+        slow_ms: Optional[float] = None,
+        mode: str = MODE_CPU,
+    ):
+        """开启剖析，保存calls个调用的结果后自动关闭
+
+        设置slow_ms时每个调用都会被剖析，但只保存耗时超过阈值的结果。
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的剖析模式: {mode}")
+        if output_dir:
+            self.output_dir = Path(output_dir)
+        _ensure_private_dir(self.output_dir)
+        self.remaining = calls
+        self.slow_ms = slow_ms
+        self.mode = mode
+        self.active = calls > 0
+        logger.info(
+            f"开启性能剖析: {calls} 次调用, 模式 {mode}, 输出到 {self.output_dir}"
+        )
+
+    def stop(self):
+        """关闭剖析"""
+        self.active = False
+        self.remaining = 0
+
+    async def run(self, name: str, call: Callable[[], Awaitable[T]]) -> T:
+        """在剖析下执行一次调用
+
+        已经有调用在剖析中时直接执行，不做剖析（cProfile和tracemalloc都是全局的）。
+        """
+        if not self.active or self._busy:
+            return await call()
+
+        self._busy = True
+        cpu = self.mode in (MODE_CPU, MODE_BOTH)
+        memory = self.mode in (MODE_MEMORY, MODE_BOTH)
+        started_tracing = False
+        before = None
+        profile = None
+        workers: List[cProfile.Profile] = []
+        token = None
+        try:
+            if memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(_TRACEMALLOC_FRAMES)
+                    started_tracing = True
+                before = tracemalloc.take_snapshot()
+            profile = _start_cprofile() if cpu else None
+            if profile:
+                token = _worker_profiles.set(workers)
+            start = time.perf_counter()
+            try:
+                return await call()
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if profile:
+                    profile.disable()
+                after = tracemalloc.take_snapshot() if memory else None
+                if self.slow_ms is None or elapsed_ms >= self.slow_ms:
+                    self._save(name, elapsed_ms, profile, workers, before, after)
+        finally:
+            if token is not None:
+                _worker_profiles.reset(token)
+            if started_tracing:
+                tracemalloc.stop()
+            self._busy = False
+
+    def _save(
+        self,
+        name: str,
+        elapsed_ms: float,
+        profile: Optional[cProfile.Profile],
+        workers: List[cProfile.Profile],
+        before: Optional[tracemalloc.Snapshot],
+        after: Optional[tracemalloc.Snapshot],
+    ):
+        """保存一次调用的剖析结果，工作线程的统计合并到同一个文件"""
+        self._seq += 1
+        stem = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{name}_{self._seq:04d}"
+        try:
+            if profile:
+                stats = pstats.Stats(profile)
+                for worker in workers:
+                    stats.add(worker)
+                stats.dump_stats(str(self.output_dir / f"{stem}.prof"))
+            if after is not None and before is not None:
+                sites = [
+                    {
+                        "site": str(stat.traceback[0]),
+                        "size_diff": stat.size_diff,
+                        "count_diff": stat.count_diff,
+                    }
+                    for stat in after.compare_to(before, "lineno")[
+                        :_ALLOC_SITES_PER_CALL
+                    ]
+                ]
+                with open(
+                    self.output_dir / f"{stem}.alloc.json", "w", encoding="utf-8"
+                ) as f:
+                    json.dump(
+                        {
+                            "tool": name,
+                            "elapsed_ms": round(elapsed_ms, 3),
+                            "sites": sites,
+                        },
+                        f,
+                        ensure_ascii=False,
+                    )
+        except OSError as e:
+            logger.warning(f"保存剖析结果失败: {e}")
+            return
+
+        self.saved += 1
+        self.remaining -= 1
+        logger.info(f"已保存剖析结果: {stem} ({elapsed_ms:.1f}ms)")
+        if self.remaining <= 0:
+            self.active = False
+            logger.info("性能剖析已完成")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "remaining_calls": self.remaining,
+            "saved": self.saved,
+            "mode": self.mode,
+            "slow_ms": self.slow_ms,
+            "output_dir": str(self.output_dir),
+        }
+
+
+def profile_report(output_dir: str, top_n: int = 20) -> Dict[str, Any]:
+    """汇总目录中的剖析结果
+
+    合并所有 ``.prof`` 文件，按累计时间列出最耗时的函数；合并所有 ``.alloc.json``
+    文件，按净增长字节数列出分配最多的位置。
+
+    Raises:
+        PermissionError: 目录属于其它用户或者其它用户可以写入
+    """
+    directory = Path(output_dir)
+    if directory.exists():
+        _ensure_private_dir(directory)
+    prof_files = sorted(str(p) for p in directory.glob("*.prof"))
+    alloc_files = sorted(directory.glob("*.alloc.json"))
+
+    functions: List[Dict[str, Any]] = []
+    if prof_files:
+        stats = pstats.Stats(*prof_files)
+        rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:top_n]
+        for (filename, line, func), (_, ncalls, tottime, cumtime, _) in rows:
+            functions.append(
+                {
+                    "function": f"{filename}:{line}({func})",
+                    "ncalls": ncalls,
+                    "tottime_ms": round(tottime * 1000, 3),
+                    "cumtime_ms": round(cumtime * 1000, 3),
+                }
+            )
+
+    sites: Dict[str, Dict[str, int]] = {}
+    for path in alloc_files:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取分配统计失败 {path}: {e}")
+            continue
+        for site in data.get("sites", []):
+            total = sites.setdefault(site["site"], {"size_diff": 0, "count_diff": 0})
+            total["size_diff"] += site["size_diff"]
+            total["count_diff"] += site["count_diff"]
+    allocations = [
+        {"site": site, **totals}
+        for site, totals in sorted(
+            sites.items(), key=lambda item: -item[1]["size_diff"]
+        )
+    ][:top_n]
+
+    return {
+        "output_dir": str(directory),
+        "profiles": len(prof_files),
+        "allocation_profiles": len(alloc_files),
+        "functions": functions,
+        "allocations": allocations,
+    }
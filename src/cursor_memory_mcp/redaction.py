@@ -0,0 +1,186 @@
+"""
+写入前的敏感信息脱敏
+
+任务总结中有时会带上token、密钥或带密码的连接串，写入 ``.cursor/rules`` 后会随代码
+一起提交。所有写入记忆的文本在落盘之前经过这里：匹配到的内容被替换为
+``[REDACTED:<模式名>]``。
+
+所有模式合并为一个带命名分组的正则，整段文本只扫描一次，由 ``lastgroup`` 得知命中
+的是哪个模式，因此模式数量增加不会带来额外的扫描遍数。各模式之前有一个共用的
+前置条件：只在ASCII标记（字母、数字或 ``+/=_-``）的开头尝试匹配，其余位置只做一次
+检查就跳过，所以模式本身也必须从这样的字符开始。模式中名为 ``secret`` 的分组表示
+只替换这一部分（例如连接串中的密码，保留协议、用户名和主机）。
+
+高熵字符串模式只找出足够长的候选，再计算香农熵，低于阈值的原样保留，避免把
+提交哈希等当成密钥。长的CamelCase/snake_case标识符（例如
+``handleUserAuthenticationCallbackV2WithRetry``）的熵也可能超过阈值，所以由单词
+组成的候选（大部分字符属于小写单词，且单词中元音的比例接近自然语言）同样保留；
+随机的base64密钥几乎不会满足这一点。
+
+模式集可以配置：``CURSOR_MEMORY_REDACT_PATTERNS`` 指向一个JSON文件，内容为
+``{模式名: 正则}``，与默认模式合并，值为null表示禁用同名的默认模式。
+``CURSOR_MEMORY_REDACT=0`` 关闭脱敏。
+"""
+
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HIGH_ENTROPY = "high_entropy"
+
+# 默认模式，按优先级排列：同一位置能匹配多个模式时，先列出的优先
+DEFAULT_PATTERNS: Dict[str, str] = {
+    "private_key": (
+        r"-----BEGIN [A-Z ]*PRIVATE KEY-----[\s\S]*?-----END [A-Z ]*PRIVATE KEY-----"
+    ),
+    "aws_access_key": r"\b(?:AKIA|ASIA)[0-9A-Z]{16}\b",
+    "github_token": r"\b(?:gh[pousr]_[A-Za-z0-9]{36,}|github_pat_[A-Za-z0-9_]{22,})",
+    "api_key": r"\bsk-(?:ant-|proj-)?[A-Za-z0-9_-]{20,}",
+    "slack_token": r"\bxox[abprs]-[A-Za-z0-9-]{10,}",
+    "google_api_key": r"\bAIza[0-9A-Za-z_-]{35}",
+    "jwt": r"\beyJ[A-Za-z0-9_-]{8,}\.[A-Za-z0-9_-]{8,}\.[A-Za-z0-9_-]{8,}",
+    "url_credentials": r"\b[a-zA-Z][a-zA-Z0-9+.-]*://[^\s:/@]+:(?P<secret>[^\s/@]+)@",
+    "authorization": (
+        r"(?i:authorization[\"']?\s*[:=]\s*[\"']?(?:(?:bearer|basic|token)\s+)?)"
+        r"(?P<secret>[^\s\"',;]{6,})"
+    ),
+    "bearer_token": r"(?i:bearer\s+)(?P<secret>[A-Za-z0-9._~+/-]{16,}=*)",
+    # 关键字前可以带环境变量式的大写前缀，例如DB_PASSWORD、GITHUB_TOKEN
+    "assignment": (
+        r"(?:(?=[PpSsTtAa])|(?:[A-Z0-9]+_)+)"
+        r"(?i:(?:password|passwd|pwd|secret|token|api[_-]?key|access[_-]?key)"
+        r"\b[\"']?\s*[:=]\s*[\"']?)(?P<secret>[^\s\"',;]{6,})"
+    ),
+    HIGH_ENTROPY: r"(?<![A-Za-z0-9+/=_-])[A-Za-z0-9+/=_-]{32,}(?![A-Za-z0-9+/=_-])",
+}
+
+# 高熵候选的香农熵阈值（比特/字符）：40位十六进制的提交哈希最多4比特，不会被替换
+DEFAULT_ENTROPY_THRESHOLD = 4.2
+
+# 标识符中的单词：可以首字母大写的小写字母串
+_WORD = re.compile(r"[A-Z]?[a-z]{2,}")
+_VOWELS = frozenset("aeiouAEIOU")
+
+# 单词覆盖候选中至少这个比例的字符，且单词中元音至少占这个比例时视为标识符
+_WORD_COVERAGE = 0.7
+_WORD_VOWEL_RATIO = 0.3
+
+_SECRET_GROUP = "(?P<secret>"
+
+# 所有模式共用的前置条件：只在ASCII标记的开头尝试匹配。大多数位置（单词中间、
+# 空白、CJK字符）在这一步就被排除，不必逐个尝试各模式的分支
+_GUARD = r"(?<![A-Za-z0-9_])(?=[A-Za-z0-9+/=_-])"
+
+
+def shannon_entropy(text: str) -> float:
+    """字符串的香农熵（比特/字符）"""
+    if not text:
+        return 0.0
+    length = len(text)
+    return -sum(
+        count / length * math.log2(count / length) for count in Counter(text).values()
+    )
+
+
+def looks_like_identifier(text: str) -> bool:
+    """字符串是否由单词组成，例如CamelCase或snake_case的标识符"""
+    words = _WORD.findall(text)
+    letters = sum(len(word) for word in words)
+    if letters < _WORD_COVERAGE * len(text):
+        return False
+    vowels = sum(c in _VOWELS for word in words for c in word)
+    return vowels >= _WORD_VOWEL_RATIO * letters
+
+
+class Redactor:
+    """用一个合并的正则对文本脱敏"""
+
+    def __init__(
+        self,
+        patterns: Optional[Mapping[str, str]] = None,
+        entropy_threshold: float = DEFAULT_ENTROPY_THRESHOLD,
+        enabled: bool = True,
+    ):
+        self.patterns = dict(DEFAULT_PATTERNS if patterns is None else patterns)
+        self.entropy_threshold = entropy_threshold
+        self.enabled = enabled and bool(self.patterns)
+        self._pattern = self._compile() if self.enabled else None
+
+    def _compile(self) -> "re.Pattern[str]":
+        """把各模式合并为 前置条件(?:(?P<模式名>...)|(?P<模式名>...))"""
+        branches = []
+        for name, pattern in self.patterns.items():
+            if not name.isidentifier() or "__" in name:
+                raise ValueError(f"模式名只能包含字母、数字和单个下划线: {name}")
+            # 各分支的secret分组改为唯一的名字
+            pattern = pattern.replace(_SECRET_GROUP, f"(?P<{name}__secret>")
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"模式 {name} 不是合法的正则: {e}") from e
+            branches.append(f"(?P<{name}>{pattern})")
+        return re.compile(f"{_GUARD}(?:{'|'.join(branches)})")
+
+    @classmethod
+    def from_env(cls) -> "Redactor":
+        """根据环境变量创建脱敏器"""
+        env = os.environ
+        enabled = env.get("CURSOR_MEMORY_REDACT", "1").lower() not in (
+            "0",
+            "false",
+            "no",
+        )
+        patterns = dict(DEFAULT_PATTERNS)
+        path = env.get("CURSOR_MEMORY_REDACT_PATTERNS")
+        if path:
+            with open(path, encoding="utf-8") as f:
+                for name, pattern in json.load(f).items():
+                    if pattern is None:
+                        patterns.pop(name, None)
+                    else:
+                        patterns[name] = pattern
+        return cls(
+            patterns,
+            entropy_threshold=float(
+                env.get("CURSOR_MEMORY_REDACT_ENTROPY", DEFAULT_ENTROPY_THRESHOLD)
+            ),
+            enabled=enabled,
+        )
+
+    def redact(self, text: str) -> Tuple[str, Dict[str, int]]:
+        """脱敏，返回 (新文本, {模式名: 替换次数})"""
+        if self._pattern is None or not text:
+            return text, {}
+        counts: Counter = Counter()
+
+        def replace(match: "re.Match[str]") -> str:
+            name = match.lastgroup
+            if name == HIGH_ENTROPY:
+                value = match.group()
+                if not (
+                    shannon_entropy(value) >= self.entropy_threshold
+                    and any(c.isdigit() for c in value)
+                    and any(c.isalpha() for c in value)
+                    and not looks_like_identifier(value)
+                ):
+                    return value
+            counts[name] += 1
+            marker = f"[REDACTED:{name}]"
+            secret = f"{name}__secret"
+            if secret in self._pattern.groupindex and match.group(secret) is not None:
+                start, end = match.span(secret)
+                offset = match.start()
+                value = match.group()
+                return value[: start - offset] + marker + value[end - offset :]
+            return marker
+
+        redacted = self._pattern.sub(replace, text)
+        if counts:
+            logger.info(f"脱敏: {dict(counts)}")
+        return redacted, dict(counts)
@@ -0,0 +1,95 @@
+"""
+项目登记表
+
+记录服务见过的每个 ``project_path``，供跨项目搜索使用。登记表保存在全局存储下的
+``projects.json``（默认 ``~/.cursor-memory/projects.json``），多个服务进程共享。
+同一进程内已登记过的项目不会重复写文件，因此登记只在第一次见到项目时有成本。
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .layout import file_lock, global_store_path, rules_dir
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_VERSION = 1
+
+
+def registry_file() -> Path:
+    """返回登记表文件路径"""
+    return global_store_path() / "projects.json"
+
+
+class ProjectRegistry:
+    """已知项目的登记表"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or registry_file()
+        # 项目路径 -> 首次登记时间
+        self._projects: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"项目登记表损坏，忽略: {e}")
+            return
+        if data.get("version") == REGISTRY_VERSION:
+            self._projects = data.get("projects", {})
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": REGISTRY_VERSION, "projects": self._projects},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        os.replace(temp_file, self.path)
+
+    def add(self, project_path: str) -> bool:
+        """登记项目，返回是否是新项目
+
+        不存在的目录和全局存储本身不登记。
+        """
+        try:
+            path = str(Path(project_path).resolve())
+        except (OSError, RuntimeError):
+            return False
+        if path in self._projects:
+            return False
+        if not Path(path).is_dir() or Path(path) == global_store_path().resolve():
+            return False
+        with self._lock, file_lock(self.path.with_suffix(".lock")):
+            # 合并其它进程登记的项目
+            self._load()
+            if path in self._projects:
+                return False
+            self._projects[path] = datetime.now().isoformat(timespec="seconds")
+            try:
+                self._save()
+            except OSError as e:
+                logger.warning(f"无法保存项目登记表: {e}")
+                return False
+        logger.info(f"登记新项目: {path}")
+        return True
+
+    def projects(self) -> List[str]:
+        """所有已登记且仍有记忆目录的项目"""
+        with self._lock:
+            self._load()
+            paths = sorted(self._projects)
+        return [p for p in paths if rules_dir(p).is_dir()]
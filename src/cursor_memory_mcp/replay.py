@@ -0,0 +1,334 @@
+"""
+stdio JSON-RPC消息的录制与回放
+
+录制：``cursor-memory-mcp serve --record traffic.jsonl`` 把客户端发来的每条JSON-RPC
+消息连同相对时间写入JSONL文件。加上 ``--redact`` 时，工具参数中的字符串被替换为
+等长的占位内容（保留字节数和中英文比例），任务名称和项目路径替换为稳定的哈希值，
+仍能体现"同一个任务反复更新"之类的访问模式。
+
+回放：``cursor-memory-mcp replay traffic.jsonl --speed 0`` 启动一个新的服务进程，按
+录制时的节奏（``--speed 2`` 为两倍速，``0`` 为尽可能快）重新发送请求，并报告吞吐量
+和延迟分位数。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import anyio
+from anyio.streams.memory import MemoryObjectReceiveStream
+
+from .trace_summary import latency_stats
+
+logger = logging.getLogger(__name__)
+
+# 脱敏时保留的参数：它们不包含用户内容，回放时需要原样使用
+# （嵌套对象中的同名字段也一样，例如补丁的op和field）
+_KEEP_ARGUMENTS = {"version", "estimator", "mode", "compress", "op", "field"}
+
+# 脱敏时替换为稳定哈希的参数：相同的值映射到相同的占位符
+_HASH_ARGUMENTS = {"task_name"}
+_PATH_ARGUMENTS = {"project_path", "output_path", "input_path", "output_dir"}
+
+# 回放时读取服务输出的单行上限，需要容纳超大总结的响应
+_READ_LIMIT = 64 * 1024 * 1024
+
+
+def _mask(value: str) -> str:
+    """把字符串替换为等长占位内容：ASCII字符替换为x，其余字符替换为"字"，保留空白"""
+    return "".join(c if c.isspace() else ("x" if c.isascii() else "字") for c in value)
+
+
+def _stable_token(value: str, length: int) -> str:
+    digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+    return (digest * (length // len(digest) + 1))[: max(1, length)]
+
+
+def _redact_value(key: str, value: Any) -> Any:
+    """按参数名对值脱敏，递归处理嵌套的列表和对象
+
+    对象中的值按各自的字段名处理，列表中的元素沿用列表的参数名；
+    字符串以外的标量（数字、布尔值）原样保留。
+    """
+    if isinstance(value, dict):
+        return {k: _redact_value(k, v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact_value(key, item) for item in value]
+    if not isinstance(value, str) or key in _KEEP_ARGUMENTS:
+        return value
+    if key in _HASH_ARGUMENTS:
+        return _stable_token(value, len(value))
+    if key in _PATH_ARGUMENTS:
+        return f"/redacted/{_stable_token(value, 12)}"
+    return _mask(value)
+
+
+def redact_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """对一条JSON-RPC消息中的工具参数脱敏"""
+    params = message.get("params")
+    if not isinstance(params, dict) or not isinstance(params.get("arguments"), dict):
+        return message
+
+    arguments = _redact_value("arguments", params["arguments"])
+    return {**message, "params": {**params, "arguments": arguments}}
+
+
+@asynccontextmanager
+async def record_messages(
+    read_stream: MemoryObjectReceiveStream, path: str, redact: bool = False
+) -> AsyncIterator[MemoryObjectReceiveStream]:
+    """把读取流中的消息同时写入录制文件，返回转发后的读取流"""
+    send_stream, receive_stream = anyio.create_memory_object_stream(0)
+
+    async def pump():
+        start = time.monotonic()
+        with open(path, "a", encoding="utf-8") as f:
+            async with send_stream:
+                async for item in read_stream:
+                    if not isinstance(item, Exception):
+                        message = item.message.model_dump(
+                            by_alias=True, mode="json", exclude_none=True
+                        )
+                        if redact:
+                            message = redact_message(message)
+                        record = {
+                            "t": round(time.monotonic() - start, 6),
+                            "message": message,
+                        }
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        f.flush()
+                    await send_stream.send(item)
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(pump)
+        try:
+            yield receive_stream
+        finally:
+            tg.cancel_scope.cancel()
+
+
+def load_recording(path: str) -> List[Dict[str, Any]]:
+    """读取录制文件，跳过无法解析的行"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and isinstance(record.get("message"), dict):
+                records.append(record)
+    return records
+
+
+def _label(message: Dict[str, Any]) -> str:
+    """请求的统计分组：工具调用按工具名区分"""
+    method = message.get("method", "")
+    if method == "tools/call":
+        return f"tools/call:{message.get('params', {}).get('name', '')}"
+    return method
+
+
+def _is_error(response: Dict[str, Any]) -> bool:
+    """JSON-RPC错误、isError结果或工具返回的错误响应都视为失败"""
+    if "error" in response:
+        return True
+    result = response.get("result") or {}
+    if result.get("isError"):
+        return True
+    for content in result.get("content") or []:
+        text = content.get("text", "") if isinstance(content, dict) else ""
+        if text.startswith("{") and '"error"' in text:
+            try:
+                return "error" in json.loads(text)
+            except ValueError:
+                return False
+    return False
+
+
+class _ProjectMapper:
+    """把录制中的项目路径映射到回放用的目录"""
+
+    def __init__(self, root: Optional[str]):
+        self.root = Path(root) if root else None
+        self.mapping: Dict[str, str] = {}
+
+    def rewrite(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        if self.root is None:
+            return message
+        arguments = (message.get("params") or {}).get("arguments")
+        if not isinstance(arguments, dict) or "project_path" not in arguments:
+            return message
+        original = arguments["project_path"]
+        if original not in self.mapping:
+            path = self.root / f"project_{len(self.mapping)}"
+            path.mkdir(parents=True, exist_ok=True)
+            self.mapping[original] = str(path)
+        params = {
+            **message["params"],
+            "arguments": {**arguments, "project_path": self.mapping[original]},
+        }
+        return {**message, "params": params}
+
+
+def default_server_command() -> List[str]:
+    """回放时启动的服务命令"""
+    return [sys.executable, "-m", "cursor_memory_mcp.server", "serve"]
+
+
+async def spawn_server(
+    command: Optional[Sequence[str]] = None, env: Optional[Dict[str, str]] = None
+) -> asyncio.subprocess.Process:
+    """启动一个通过stdio通信的服务进程"""
+    return await asyncio.create_subprocess_exec(
+        *(command or default_server_command()),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        limit=_READ_LIMIT,
+        env=env,
+    )
+
+
+async def stop_server(process: asyncio.subprocess.Process, timeout: float = 5.0):
+    """关闭服务进程的标准输入，等待其退出，超时后强制结束"""
+    if process.stdin and not process.stdin.is_closing():
+        process.stdin.close()
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+class StdioClient:
+    """向服务进程发送JSON-RPC消息，并按请求id统计响应延迟"""
+
+    def __init__(self, process: asyncio.subprocess.Process, timeout: float):
+        self.process = process
+        self.timeout = timeout
+        # 请求id -> (发送时间, 分组, 响应Future)
+        self.pending: Dict[int, Tuple[float, str, asyncio.Future]] = {}
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.sent = 0
+        # 初始化完成的时间，吞吐量从这里开始计算，不包含服务进程的启动耗时
+        self.ready_at: Optional[float] = None
+        self._next_id = 0
+
+    async def read_responses(self):
+        async for line in self.process.stdout:
+            try:
+                response = json.loads(line)
+            except ValueError:
+                continue
+            entry = self.pending.pop(response.get("id"), None)
+            if entry is None:
+                continue
+            sent_at, label, future = entry
+            self.latencies.setdefault(label, []).append(
+                (time.perf_counter() - sent_at) * 1000
+            )
+            if _is_error(response):
+                self.errors[label] = self.errors.get(label, 0) + 1
+            future.set_result(response)
+
+    async def send(self, message: Dict[str, Any]) -> Optional[asyncio.Future]:
+        """发送一条消息，返回等待响应的Future（通知没有响应，返回None）
+
+        请求会被重新编号，以免录制中多次会话的id冲突。
+        """
+        future = None
+        if "id" in message:
+            self._next_id += 1
+            message = {**message, "id": self._next_id}
+            future = asyncio.get_running_loop().create_future()
+            self.pending[self._next_id] = (time.perf_counter(), _label(message), future)
+        self.process.stdin.write(
+            json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+        )
+        await self.process.stdin.drain()
+        self.sent += 1
+
+        # 初始化完成之前服务不会处理其它请求
+        if future is not None and message["method"] == "initialize":
+            await asyncio.wait_for(future, self.timeout)
+            self.ready_at = time.perf_counter()
+        return future
+
+    async def wait_pending(self, reader: asyncio.Task):
+        deadline = time.perf_counter() + self.timeout
+        while self.pending and time.perf_counter() < deadline and not reader.done():
+            await asyncio.sleep(0.01)
+
+    def report(self, speed: float, duration: float) -> Dict[str, Any]:
+        all_latencies = [v for values in self.latencies.values() for v in values]
+        return {
+            "messages_sent": self.sent,
+            "requests": len(all_latencies) + len(self.pending),
+            "responses": len(all_latencies),
+            "unanswered": len(self.pending),
+            "errors": sum(self.errors.values()),
+            "speed": speed,
+            "duration_s": round(duration, 3),
+            "throughput_rps": (
+                round(len(all_latencies) / duration, 2) if duration else 0
+            ),
+            "latency": latency_stats(all_latencies),
+            "by_method": {
+                label: {
+                    "count": len(values),
+                    "errors": self.errors.get(label, 0),
+                    **latency_stats(values),
+                }
+                for label, values in sorted(self.latencies.items())
+            },
+        }
+
+
+async def replay(
+    recording: str,
+    speed: float = 1.0,
+    command: Optional[Sequence[str]] = None,
+    project_root: Optional[str] = None,
+    timeout: float = 60.0,
+) -> Dict[str, Any]:
+    """启动服务进程并回放录制的请求
+
+    Args:
+        recording: 录制文件路径
+        speed: 回放倍速，0表示不等待、尽可能快地发送
+        command: 服务命令，默认在当前解释器中启动cursor-memory-mcp
+        project_root: 设置时把每个不同的project_path映射到该目录下的新子目录
+        timeout: 发送完毕后等待剩余响应的秒数
+    """
+    records = load_recording(recording)
+    mapper = _ProjectMapper(project_root)
+    process = await spawn_server(command)
+    replayer = StdioClient(process, timeout)
+    reader = asyncio.create_task(replayer.read_responses())
+    start = time.perf_counter()
+    try:
+        for record in records:
+            message = record["message"]
+            if "method" not in message:
+                # 客户端对服务端请求的响应，新进程不会发出对应请求
+                continue
+            if speed > 0:
+                delay = record.get("t", 0) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await replayer.send(mapper.rewrite(message))
+        await replayer.wait_pending(reader)
+        duration = time.perf_counter() - (replayer.ready_at or start)
+    finally:
+        await stop_server(process)
+        reader.cancel()
+
+    return replayer.report(speed, duration)
@@ -0,0 +1,363 @@
+"""
+跨项目记忆搜索
+
+在所有登记过的项目（以及全局存储）中搜索记忆，回答“上次在别的项目里是怎么解决X的”。
+每个项目在 ``.cursor/cache/search_index.json`` 中维护一份词项索引，按记忆清单中的
+内容哈希增量更新：只有新增或修改过的记忆才需要重新读取和分词。
+
+除了调用方自己的项目（和全局存储），其它项目只读打开：已有的索引照常使用，清单或
+索引过期时只在工作进程的内存中更新，不在别人的项目里写入清单或索引。
+
+搜索时每个项目交给进程池中的一个任务，结果按BM25分数合并取前k条。进程池在第一次
+搜索时创建并在之后复用，工作进程按清单的代数缓存已加载的索引，因此热缓存下的搜索
+不需要读取任何记忆文件。每个项目的搜索在提交后 ``timeout`` 秒内没有完成就放弃，
+整体延迟因此有上限，超时的项目在结果中单独列出。已经开始执行的超时任务无法取消，
+会一直占用工作进程，后续的搜索只能排在它们后面，因此出现这种任务时终止整个进程池，
+下次搜索时重新创建。
+
+分词对ASCII按单词切分，对CJK文本按相邻两字切分（单字的词保留单字），不依赖分词库。
+各项目的IDF只在项目内部统计，不同项目之间的分数是近似可比的。
+"""
+
+import atexit
+import heapq
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .frontmatter import parse_memory_file
+from .layout import MemoryLayout, get_layout, read_layout
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+DEFAULT_TOP_K = 10
+DEFAULT_TIMEOUT = 5.0
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SNIPPET_CHARS = 200
+
+_TOKEN_PATTERN = re.compile("[a-z0-9_]+|[\u3400-\u4dbf\u4e00-\u9fff]+")
+
+
+def index_file(project_path: str) -> Path:
+    """返回搜索索引文件路径"""
+    return Path(project_path) / ".cursor" / "cache" / "search_index.json"
+
+
+def tokenize(text: str) -> List[str]:
+    """把文本切分为词项：ASCII单词和CJK二元组"""
+    terms = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if token[0] >= "\u3400":
+            if len(token) == 1:
+                terms.append(token)
+            else:
+                terms.extend(token[i : i + 2] for i in range(len(token) - 1))
+        elif len(token) > 1:
+            terms.append(token)
+    return terms
+
+
+def _doc_key(meta: Dict[str, Any]) -> str:
+    """判断记忆是否变化的键：内容哈希，追加后尚无哈希时用大小和修改时间"""
+    return meta["hash"] or f"{meta['size']}:{meta['modified']}"
+
+
+class SearchIndex:
+    """单个项目的词项索引"""
+
+    def __init__(self, project_path: str, readonly: bool = False):
+        self.project_path = project_path
+        self.path = index_file(project_path)
+        # 只读时不保存索引，清单也以 read_layout 只读打开
+        self.readonly = readonly
+        self.layout: Optional[MemoryLayout] = None
+        # 名称 -> {hash, description, length, terms: {词项: 词频}}
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.generation: Optional[int] = None
+        self.reused = 0
+        self.indexed = 0
+        self._postings: Dict[str, List[Tuple[str, int]]] = {}
+        self._avg_length = 0.0
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != INDEX_VERSION:
+            return {}
+        return data.get("docs", {})
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": INDEX_VERSION, "docs": self.docs},
+                    f,
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                )
+            os.replace(temp_file, self.path)
+        except OSError as e:
+            logger.warning(f"无法保存搜索索引: {e}")
+
+    def refresh(self):
+        """根据记忆清单更新索引，内容哈希未变化的记忆沿用已有的词项"""
+        if self.readonly:
+            layout = read_layout(self.project_path, self.layout)
+        else:
+            layout = get_layout(self.project_path)
+        if layout is self.layout and self.generation == layout.generation:
+            self.reused, self.indexed = len(self.docs), 0
+            return
+        self.layout = layout
+        previous = self.docs or self._load()
+        self.docs = {}
+        self.reused = self.indexed = 0
+        for name, meta in layout.memories.items():
+            doc = previous.get(name)
+            key = _doc_key(meta)
+            if doc and doc["hash"] == key:
+                self.docs[name] = doc
+                self.reused += 1
+                continue
+            try:
+                with open(layout.path_for(name), encoding="utf-8") as f:
+                    _, body = parse_memory_file(f.read())
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"无法读取记忆 {name}: {e}")
+                continue
+            description = meta["description"]
+            terms = tokenize(f"{name.replace('_', ' ')} {description} {body}")
+            self.docs[name] = {
+                "hash": key,
+                "description": description,
+                "length": len(terms),
+                "terms": dict(Counter(terms)),
+            }
+            self.indexed += 1
+        if not self.readonly and (self.indexed or len(self.docs) != len(previous)):
+            self._save()
+        self.generation = layout.generation
+        self._build_postings()
+
+    def _build_postings(self):
+        postings: Dict[str, List[Tuple[str, int]]] = {}
+        for name, doc in self.docs.items():
+            for term, tf in doc["terms"].items():
+                postings.setdefault(term, []).append((name, tf))
+        self._postings = postings
+        lengths = [doc["length"] for doc in self.docs.values()]
+        self._avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    def search(self, terms: Sequence[str], top_k: int) -> List[Tuple[float, str]]:
+        """BM25打分，返回 [(分数, 名称)]，按分数降序"""
+        count = len(self.docs)
+        scores: Dict[str, float] = {}
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for name, tf in postings:
+                norm = (
+                    1
+                    - BM25_B
+                    + BM25_B * self.docs[name]["length"] / (self._avg_length or 1)
+                )
+                weight = tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+                scores[name] = scores.get(name, 0.0) + idf * weight
+        return heapq.nlargest(top_k, ((s, n) for n, s in scores.items()))
+
+
+# 工作进程内缓存的索引：(项目路径, 是否只读) -> 索引
+_indexes: Dict[Tuple[str, bool], SearchIndex] = {}
+
+
+def _snippet(path: Path, query: str) -> str:
+    """记忆正文中第一处包含查询词的行"""
+    try:
+        _, body = parse_memory_file(path.read_text(encoding="utf-8"))
+    except (OSError, UnicodeDecodeError):
+        return ""
+    words = set(tokenize(query))
+    lines = [line.strip() for line in body.splitlines() if line.strip()]
+    for line in lines:
+        if any(w in line.lower() for w in words):
+            return line[:SNIPPET_CHARS]
+    return lines[0][:SNIPPET_CHARS] if lines else ""
+
+
+def search_project(
+    project_path: str, query: str, top_k: int, readonly: bool = False
+) -> Dict[str, Any]:
+    """在单个项目中搜索（在工作进程中执行）
+
+    Args:
+        readonly: 只读打开项目，不写入清单和索引
+    """
+    start = time.perf_counter()
+    index = _indexes.get((project_path, readonly))
+    if index is None:
+        index = _indexes[(project_path, readonly)] = SearchIndex(project_path, readonly)
+    index.refresh()
+    layout = index.layout
+    results = []
+    for score, name in index.search(tokenize(query), top_k):
+        path = layout.path_for(name)
+        results.append(
+            {
+                "project": project_path,
+                "name": name,
+                "score": round(score, 4),
+                "description": index.docs[name]["description"],
+                "file_path": str(path),
+                "snippet": _snippet(path, query),
+            }
+        )
+    return {
+        "project": project_path,
+        "results": results,
+        "memories": len(index.docs),
+        "indexed": index.indexed,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(max_workers: Optional[int]) -> ProcessPoolExecutor:
+    """返回复用的进程池，工作进程数变化时重新创建"""
+    global _pool, _pool_workers
+    workers = max_workers or min(os.cpu_count() or 1, 8)
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # 服务进程中有后台线程，使用spawn避免fork带来的锁状态问题
+            _pool = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _recycle_pool(pool: ProcessPoolExecutor):
+    """终止仍在执行超时任务的进程池，下次搜索时重新创建
+
+    同一时刻使用这个进程池的其它搜索中尚未完成的项目会记为错误。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    terminate = getattr(pool, "terminate_workers", None)
+    if terminate is not None:
+        terminate()
+        return
+    # Python 3.14之前没有公开的终止接口
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    """关闭搜索进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def search_all_projects(
+    query: str,
+    projects: Sequence[str],
+    top_k: int = DEFAULT_TOP_K,
+    timeout: float = DEFAULT_TIMEOUT,
+    max_workers: Optional[int] = None,
+    writable: Sequence[str] = (),
+) -> Dict[str, Any]:
+    """在多个项目中并行搜索，合并前k条结果
+
+    Args:
+        query: 查询文本
+        projects: 项目路径列表
+        top_k: 返回的结果数量
+        timeout: 每个项目的超时时间（秒），从提交时开始计算
+        max_workers: 进程池大小，默认为CPU数（最多8个）
+        writable: 可以写入清单和索引的项目（调用方自己的），其余只读打开
+    """
+    start = time.perf_counter()
+    report: Dict[str, Any] = {
+        "query": query,
+        "results": [],
+        "projects_searched": 0,
+        "memories_searched": 0,
+        "timed_out": [],
+        "errors": [],
+    }
+    if projects and tokenize(query):
+        pool = _get_pool(max_workers)
+        own = set(writable)
+        futures = {
+            pool.submit(search_project, p, query, top_k, p not in own): p
+            for p in projects
+        }
+        done, not_done = wait(futures, timeout=timeout)
+        # 还在排队的任务可以取消；已经开始执行的只能终止工作进程。终止时进程池会为
+        # 所有未完成的任务设置异常，已取消的任务再设置会在管理线程中抛出
+        # InvalidStateError，所以有任务已经开始执行时不取消排队的任务
+        if any(f.running() for f in not_done):
+            running = list(not_done)
+        else:
+            running = [f for f in not_done if not f.cancel()]
+        if running:
+            logger.warning(f"{len(running)} 个超时的搜索仍在执行，重建进程池")
+            _recycle_pool(pool)
+        report["timed_out"] = sorted(futures[f] for f in not_done)
+
+        candidates = []
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                report["errors"].append(f"{futures[future]}: {e}")
+                continue
+            report["projects_searched"] += 1
+            report["memories_searched"] += result["memories"]
+            candidates.extend(result["results"])
+        report["results"] = heapq.nlargest(
+            top_k, candidates, key=lambda r: (r["score"], r["name"])
+        )
+
+    report["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    if report["timed_out"]:
+        logger.warning(f"搜索超时的项目: {len(report['timed_out'])} 个")
+    return report
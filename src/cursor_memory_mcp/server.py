@@ -5,19 +5,77 @@ Cursor Memory MCP Server
 该MCP服务用于在项目的.cursor/目录中创建任务记忆文件
 """
 
+import argparse
 import asyncio
+import glob
 import json
 import logging
-import re
-from datetime import datetime
+import os
+import sys
+import tempfile
+import time
+from dataclasses import asdict
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool
 from pydantic import BaseModel, Field, ValidationError, field_validator
 
+from .access import (
+    DEFAULT_MIN_SCORE,
+    DEFAULT_STALE_SCORE,
+    DEFAULT_TOP_N,
+    SEARCH_WEIGHT,
+    get_access_counters,
+    rebalance_always_apply,
+)
+from .admission import AdmissionController, Overloaded, payload_size
+from .budget import DEFAULT_BUDGET_TOKENS, ESTIMATORS, analyze_rule_budget
+from .gitinfo import find_memories_by_revision
+from .layout import (
+    SCHEMES,
+    get_layout,
+    global_store_path,
+    reshard,
+    rules_dir,
+)
+from .maintenance import (
+    compact_project,
+    export_project,
+    project_stats,
+    reindex_project,
+    resolve_projects,
+    run_parallel,
+)
+from .patch import HashMismatch, PatchError, parse_patch
+from .profiling import (
+    DEFAULT_CALLS,
+    MODE_CPU,
+    MODES,
+    Profiler,
+    profile_report,
+    to_thread,
+)
+from .redaction import Redactor
+from .registry import ProjectRegistry
+from .replay import record_messages, replay
+from .search import DEFAULT_TIMEOUT, DEFAULT_TOP_K, search_all_projects
+from .snapshot import create_snapshot, list_snapshots, restore_snapshot
+from .store import (
+    SCOPES,
+    CreateMemoryRequest,
+    MemoryStore,
+    _validate_project_path,
+    _validate_task_name,
+    generate_file_content,
+)
+from .trace_summary import latency_stats
+from .tracing import Tracer, current_span, set_tracer, span
+from .transfer import DEFAULT_BATCH_SIZE, export_memories, import_memories
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -25,52 +83,355 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class CreateMemoryRequest(BaseModel):
-    """创建记忆文件的请求模型"""
+def _json_response(data: Dict[str, Any]) -> list[Dict[str, Any]]:
+    """把结果包装为MCP文本内容"""
+    return [
+        {
+            "type": "text",
+            "text": json.dumps(data, ensure_ascii=False, indent=2),
+        }
+    ]
+
+
+def _validation_error_response(e: ValidationError) -> list[Dict[str, Any]]:
+    """把参数验证错误转换为错误响应"""
+    error_details = []
+    for error in e.errors():
+        field = ".".join(str(loc) for loc in error["loc"])
+        error_details.append(f"{field}: {error['msg']}")
+
+    error_msg = f"参数验证失败: {'; '.join(error_details)}"
+    logger.error(error_msg)
+    return _json_response({"error": error_msg})
+
+
+class AppendMemoryRequest(BaseModel):
+    """向已有记忆追加小节的请求模型"""
+
+    project_path: str = Field(..., description="当前项目的绝对路径")
+    task_name: str = Field(..., description="任务名称", min_length=1, max_length=50)
+    note: str = Field(..., description="要追加的内容", min_length=1)
+    title: Optional[str] = Field(
+        None, description="小节标题，显示在时间戳之后", max_length=100
+    )
+
+    @field_validator("task_name")
+    def validate_task_name(cls, v):
+        """验证任务名称格式"""
+        return _validate_task_name(v)
+
+    @field_validator("note")
+    def validate_note(cls, v):
+        """验证追加内容不为空"""
+        if not v.strip():
+            raise ValueError("note不能为空字符串")
+        return v.strip()
+
+    @field_validator("title")
+    def validate_title(cls, v):
+        """标题只能是单行"""
+        if v is not None and "\n" in v:
+            raise ValueError("title不能包含换行")
+        return v.strip() if v else None
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
 
-    task_summary: str = Field(
-        ..., description="当前任务执行的详细上下文总结", min_length=1
+class UpdateMemoryRequest(BaseModel):
+    """按小节修改记忆的请求模型"""
+
+    project_path: str = Field(..., description="当前项目的绝对路径")
+    task_name: str = Field(..., description="任务名称", min_length=1, max_length=50)
+    expected_hash: str = Field(
+        ..., description="读取记忆时的内容哈希(sha256)", pattern="^[0-9a-f]{64}$"
     )
-    task_name: str = Field(
-        ..., description="当前任务的简短名称，用作文件名", min_length=1, max_length=50
+    patches: List[Dict[str, Any]] = Field(
+        ..., description="按顺序应用的补丁", min_length=1, max_length=100
     )
+
+    @field_validator("task_name")
+    def validate_task_name(cls, v):
+        """验证任务名称格式"""
+        return _validate_task_name(v)
+
+    @field_validator("patches")
+    def validate_patches(cls, v):
+        """验证每个补丁的操作和字段"""
+        return [parse_patch(patch) for patch in v]
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
+
+class MemoryHistoryRequest(BaseModel):
+    """查询记忆历史的请求模型"""
+
     project_path: str = Field(..., description="当前项目的绝对路径")
-    task_description: Optional[str] = Field(None, description="任务的详细描述")
+    task_name: str = Field(..., description="任务名称", min_length=1, max_length=50)
 
     @field_validator("task_name")
     def validate_task_name(cls, v):
         """验证任务名称格式"""
-        if not re.match(r"^[a-zA-Z0-9_-]+$", v):
-            raise ValueError("task_name只允许字母、数字、下划线、连字符")
+        return _validate_task_name(v)
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
+
+class MemoryVersionRequest(MemoryHistoryRequest):
+    """读取记忆指定版本的请求模型"""
+
+    version: int = Field(..., description="版本号，从1开始", ge=1)
+
+
+class RuleBudgetRequest(BaseModel):
+    """上下文预算分析的请求模型"""
+
+    project_path: str = Field(..., description="当前项目的绝对路径")
+    estimator: str = Field("cjk", description="token估算方式: cjk 或 simple")
+    top_n: int = Field(10, description="列出的最大记忆数量", ge=1, le=1000)
+    budget_tokens: int = Field(
+        DEFAULT_BUDGET_TOKENS, description="alwaysApply记忆的token预算", ge=0
+    )
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
+    @field_validator("estimator")
+    def validate_estimator(cls, v):
+        """验证估算方式"""
+        if v not in ESTIMATORS:
+            raise ValueError(f"estimator只能是: {', '.join(ESTIMATORS)}")
+        return v
+
+
+class RebalanceRequest(BaseModel):
+    """按访问频率调整alwaysApply的请求模型"""
+
+    project_path: str = Field(..., description="当前项目的绝对路径")
+    top_n: int = Field(
+        DEFAULT_TOP_N, description="alwaysApply记忆的最大数量", ge=0, le=100
+    )
+    budget_tokens: int = Field(
+        DEFAULT_BUDGET_TOKENS, description="alwaysApply记忆的token预算", ge=0
+    )
+    min_score: float = Field(
+        DEFAULT_MIN_SCORE, description="提升为alwaysApply需要的最低访问分数", ge=0
+    )
+    stale_score: float = Field(
+        DEFAULT_STALE_SCORE, description="访问分数低于该值时降级", ge=0
+    )
+    estimator: str = Field("cjk", description="token估算方式: cjk 或 simple")
+    dry_run: bool = Field(False, description="只报告计划，不修改文件")
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
+    @field_validator("estimator")
+    def validate_estimator(cls, v):
+        """验证估算方式"""
+        if v not in ESTIMATORS:
+            raise ValueError(f"estimator只能是: {', '.join(ESTIMATORS)}")
         return v
 
-    @field_validator("task_summary")
-    def validate_task_summary(cls, v):
-        """验证任务总结不为空"""
-        if not v or not v.strip():
-            raise ValueError("task_summary不能为空字符串")
+
+class SnapshotRequest(BaseModel):
+    """创建快照的请求模型"""
+
+    project_path: str = Field(..., description="当前项目的绝对路径")
+    label: Optional[str] = Field(
+        None, description="附加在快照ID后面的标签", max_length=50
+    )
+    keep: Optional[int] = Field(None, description="保留的快照数量", ge=1, le=1000)
+
+    @field_validator("label")
+    def validate_label(cls, v):
+        """标签用作目录名的一部分，规则与任务名称相同"""
+        return _validate_task_name(v) if v else None
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
+
+class RestoreSnapshotRequest(BaseModel):
+    """恢复快照的请求模型"""
+
+    project_path: str = Field(..., description="当前项目的绝对路径")
+    snapshot_id: str = Field(..., description="快照ID", min_length=1)
+    backup: bool = Field(True, description="恢复之前是否为当前状态创建快照")
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
+
+class ListMemoriesRequest(BaseModel):
+    """列出记忆的请求模型"""
+
+    project_path: str = Field(..., description="当前项目的绝对路径")
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
+
+class RevisionQueryRequest(BaseModel):
+    """按git分支和提交查询记忆的请求模型"""
+
+    project_path: str = Field(..., description="当前项目的绝对路径")
+    branch: Optional[str] = Field(
+        None, description="分支名称", min_length=1, max_length=255
+    )
+    since: Optional[str] = Field(
+        None, description="提交或其前缀", pattern=r"^[0-9a-fA-F]{4,40}$"
+    )
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
+
+class SearchAllProjectsRequest(BaseModel):
+    """跨项目搜索的请求模型"""
+
+    query: str = Field(..., description="查询文本", min_length=1, max_length=1000)
+    top_k: int = Field(DEFAULT_TOP_K, description="返回的结果数量", ge=1, le=100)
+    timeout: float = Field(
+        DEFAULT_TIMEOUT, description="每个项目的超时时间（秒）", gt=0, le=60
+    )
+    project_path: Optional[str] = Field(
+        None, description="发起搜索的项目，只有它的命中计为访问"
+    )
+
+    @field_validator("query")
+    def validate_query(cls, v):
+        """验证查询不为空"""
+        if not v.strip():
+            raise ValueError("query不能为空字符串")
         return v.strip()
 
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径"""
+        return _validate_project_path(v) if v is not None else None
+
+
+class ExportMemoriesRequest(BaseModel):
+    """导出记忆的请求模型"""
+
+    project_path: str = Field(..., description="要导出的项目的绝对路径")
+    output_path: str = Field(..., description="导出的JSONL文件路径", min_length=1)
+    compress: Optional[bool] = Field(
+        None, description="是否gzip压缩，默认根据文件后缀(.gz)判断"
+    )
+    overwrite: bool = Field(False, description="输出文件已存在时是否覆盖")
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
+
+class ImportMemoriesRequest(BaseModel):
+    """导入记忆的请求模型"""
+
+    project_path: str = Field(..., description="要导入到的项目的绝对路径")
+    input_path: str = Field(..., description="JSONL文件路径（可以是gzip压缩的）")
+    batch_size: int = Field(
+        DEFAULT_BATCH_SIZE, description="每批写入的记录数", ge=1, le=10000
+    )
+
     @field_validator("project_path")
     def validate_project_path(cls, v):
         """验证项目路径是否存在"""
-        if not v or not v.strip():
-            raise ValueError("project_path不能为空")
+        return _validate_project_path(v)
+
+    @field_validator("input_path")
+    def validate_input_path(cls, v):
+        """验证输入文件是否存在"""
+        if not Path(v).is_file():
+            raise ValueError(f"输入文件不存在: {v}")
+        return v
+
+
+class StartProfilingRequest(BaseModel):
+    """开启性能剖析的请求模型"""
+
+    calls: int = Field(DEFAULT_CALLS, description="要剖析的调用次数", ge=1, le=1000)
+    slow_ms: Optional[float] = Field(
+        None, description="只保留耗时超过该毫秒数的调用", ge=0
+    )
+    mode: str = Field(MODE_CPU, description="剖析模式: cpu、memory 或 both")
+
+    @field_validator("mode")
+    def validate_mode(cls, v):
+        """验证剖析模式"""
+        if v not in MODES:
+            raise ValueError(f"mode只能是: {', '.join(MODES)}")
+        return v
+
 
-        path = Path(v.strip())
-        if not path.exists():
-            raise ValueError(f"项目路径不存在: {v}")
-        if not path.is_dir():
-            raise ValueError(f"项目路径必须是一个目录: {v}")
+class ProfileReportRequest(BaseModel):
+    """剖析报告的请求模型"""
 
-        return str(path.resolve())
+    top_n: int = Field(20, description="列出的函数和分配位置数量", ge=1, le=1000)
+
+
+# 所有工具的名称
+_TOOLS = (
+    "create_cursor_memory",
+    "append_cursor_memory",
+    "update_cursor_memory",
+    "get_memory_history",
+    "get_memory_version",
+    "list_cursor_memories",
+    "find_memories_by_revision",
+    "search_all_projects",
+    "analyze_rule_budget",
+    "rebalance_always_apply",
+    "export_cursor_memories",
+    "import_cursor_memories",
+    "snapshot_cursor_memories",
+    "restore_snapshot",
+    "start_profiling",
+    "get_profile_report",
+)
+
+# 剖析相关的工具本身不参与剖析
+_PROFILING_TOOLS = ("start_profiling", "get_profile_report")
 
 
 class CursorMemoryMCP:
     """Cursor Memory MCP 服务实现"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        admission: Optional[AdmissionController] = None,
+        profiler: Optional[Profiler] = None,
+        registry: Optional[ProjectRegistry] = None,
+        redactor: Optional[Redactor] = None,
+    ):
         self.server = Server("cursor-memory-mcp")
+        self.admission = admission or AdmissionController.from_env()
+        self.profiler = profiler or Profiler.from_env()
+        self.registry = registry or ProjectRegistry()
+        self.redactor = redactor or Redactor.from_env()
         self._setup_tools()
 
     def _setup_tools(self):
@@ -106,173 +467,1329 @@ class CursorMemoryMCP:
                                 "type": "string",
                                 "description": "任务的详细描述（可选）",
                             },
+                            "auto_globs": {
+                                "type": "boolean",
+                                "description": "是否根据总结中提到的文件自动生成globs"
+                                "（可选，默认true）",
+                            },
+                            "auto_description": {
+                                "type": "boolean",
+                                "description": "是否从总结中提取关键词生成description"
+                                "（可选，默认true）",
+                            },
+                            "split": {
+                                "type": "boolean",
+                                "description": "总结过大时按标题和段落拆分为多个记忆"
+                                "和一条链接它们的父记忆（可选，默认true）",
+                            },
+                            "scope": {
+                                "type": "string",
+                                "enum": list(SCOPES),
+                                "description": "写入位置: project项目（默认）, "
+                                "global用户级全局存储(~/.cursor-memory), both两者",
+                            },
                         },
                         "required": ["task_summary", "task_name", "project_path"],
                     },
-                )
-            ]
-
-        @self.server.call_tool()
-        async def call_tool(
-            name: str, arguments: Dict[str, Any]
-        ) -> list[Dict[str, Any]]:
-            """处理工具调用"""
-            if name == "create_cursor_memory":
-                return await self._create_cursor_memory(arguments)
-            else:
-                raise ValueError(f"未知工具: {name}")
-
-    async def _create_cursor_memory(
-        self, arguments: Dict[str, Any]
-    ) -> list[Dict[str, Any]]:
-        """创建Cursor记忆文件的主要逻辑"""
-        try:
-            # 参数验证
-            request = CreateMemoryRequest(**arguments)
-
-            # 设置默认task_description
-            if not request.task_description:
-                request.task_description = request.task_name
-
-            # 使用传入的项目路径而不是当前工作目录
-            project_root = Path(request.project_path)
-            cursor_dir = project_root / ".cursor" / "rules"
-
-            # 确保.cursor/rules目录存在
-            try:
-                cursor_dir.mkdir(parents=True, exist_ok=True)
-                logger.info(f"确保.cursor/rules目录存在: {cursor_dir}")
-            except Exception as e:
-                error_msg = f"无法创建.cursor/rules目录: {e}"
-                logger.error(error_msg)
-                return [
-                    {
-                        "type": "text",
-                        "text": json.dumps(
-                            {"error": f"文件操作失败: {error_msg}"},
-                            ensure_ascii=False,
-                            indent=2,
-                        ),
-                    }
-                ]
-
-            # 生成文件名（处理重复文件名）
-            filename = f"{request.task_name}.mdc"
-            file_path = cursor_dir / filename
-
-            # 检查文件是否已存在，如果存在则添加时间戳
-            if file_path.exists():
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"{request.task_name}_{timestamp}.mdc"
-                file_path = cursor_dir / filename
-                logger.info(f"文件已存在，使用时间戳文件名: {filename}")
-
-            # 生成文件内容
-            content = self._generate_file_content(
-                request.task_description, request.task_summary
-            )
-
-            # 写入文件
-            try:
-                # 使用临时文件确保原子操作
-                temp_file = file_path.with_suffix(".tmp")
-                with open(temp_file, "w", encoding="utf-8") as f:
-                    f.write(content)
-
-                # 重命名临时文件
-                temp_file.rename(file_path)
-
-                logger.info(f"成功创建记忆文件: {file_path}")
-
-                # 构建成功响应
-                response = {
-                    "success": True,
-                    "message": "成功创建记忆文件",
-                    "file_path": str(file_path),
-                    "created_at": datetime.now().isoformat(),
-                }
-
-                if filename != f"{request.task_name}.mdc":
-                    response["message"] += f"，文件名已调整为: {filename}"
-
-                return [
-                    {
-                        "type": "text",
-                        "text": json.dumps(response, ensure_ascii=False, indent=2),
-                    }
-                ]
-
-            except Exception as e:
-                error_msg = f"写入文件失败: {e}"
-                logger.error(error_msg)
-                return [
-                    {
-                        "type": "text",
-                        "text": json.dumps(
-                            {"error": f"文件操作失败: {error_msg}"},
-                            ensure_ascii=False,
-                            indent=2,
-                        ),
-                    }
-                ]
-
-        except ValidationError as e:
-            error_details = []
-            for error in e.errors():
-                field = ".".join(str(loc) for loc in error["loc"])
-                error_details.append(f"{field}: {error['msg']}")
-
-            error_msg = f"参数验证失败: {'; '.join(error_details)}"
-            logger.error(error_msg)
-            return [
-                {
-                    "type": "text",
-                    "text": json.dumps(
-                        {"error": error_msg}, ensure_ascii=False, indent=2
-                    ),
-                }
-            ]
-
-        except Exception as e:
-            error_msg = f"服务内部错误: {e}"
-            logger.error(error_msg, exc_info=True)
-            return [
-                {
-                    "type": "text",
-                    "text": json.dumps(
-                        {"error": error_msg}, ensure_ascii=False, indent=2
-                    ),
-                }
-            ]
-
-    def _generate_file_content(self, task_description: str, task_summary: str) -> str:
-        """生成文件内容"""
-        return f"""---
-description: "get the summary of previous step: {task_description}"
-globs:
-alwaysApply: false
----
-{task_summary}"""
-
-    async def run(self):
-        """运行MCP服务器"""
-        logger.info("启动Cursor Memory MCP服务器...")
-        async with stdio_server() as (read_stream, write_stream):
-            await self.server.run(
-                read_stream, write_stream, self.server.create_initialization_options()
-            )
-
-
-def main():
-    """主函数"""
-    try:
-        mcp_server = CursorMemoryMCP()
-        asyncio.run(mcp_server.run())
-    except KeyboardInterrupt:
-        logger.info("服务器已停止")
-    except Exception as e:
-        logger.error(f"服务器运行错误: {e}", exc_info=True)
+                ),
+                Tool(
+                    name="append_cursor_memory",
+                    description="向已有的任务记忆末尾追加一个带时间戳的小节，"
+                    "适合记录任务的后续进展",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径",
+                            },
+                            "task_name": {
+                                "type": "string",
+                                "description": "任务名称",
+                                "pattern": "^[a-zA-Z0-9_-]+$",
+                            },
+                            "note": {
+                                "type": "string",
+                                "description": "要追加的内容",
+                            },
+                            "title": {
+                                "type": "string",
+                                "description": "小节标题，显示在时间戳之后（可选）",
+                            },
+                        },
+                        "required": ["project_path", "task_name", "note"],
+                    },
+                ),
+                Tool(
+                    name="update_cursor_memory",
+                    description="按标题修改任务记忆的某个小节或frontmatter字段，"
+                    "记忆在读取之后被修改过时拒绝更新",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径",
+                            },
+                            "task_name": {
+                                "type": "string",
+                                "description": "任务名称",
+                                "pattern": "^[a-zA-Z0-9_-]+$",
+                            },
+                            "expected_hash": {
+                                "type": "string",
+                                "description": "读取记忆时的内容哈希，"
+                                "由get_memory_version返回",
+                            },
+                            "patches": {
+                                "type": "array",
+                                "description": "按顺序应用的补丁",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "op": {
+                                            "type": "string",
+                                            "enum": [
+                                                "replace",
+                                                "insert",
+                                                "delete",
+                                                "set",
+                                            ],
+                                            "description": "replace替换小节内容, "
+                                            "insert插入到小节末尾, delete删除小节, "
+                                            "set修改frontmatter字段",
+                                        },
+                                        "heading": {
+                                            "type": "string",
+                                            "description": "小节标题，"
+                                            "insert不指定时插入到文件末尾",
+                                        },
+                                        "content": {
+                                            "type": "string",
+                                            "description": "replace和insert的内容",
+                                        },
+                                        "field": {
+                                            "type": "string",
+                                            "enum": [
+                                                "description",
+                                                "globs",
+                                                "alwaysApply",
+                                            ],
+                                            "description": "set修改的字段",
+                                        },
+                                        "value": {
+                                            "description": "set的新值",
+                                        },
+                                    },
+                                    "required": ["op"],
+                                },
+                            },
+                        },
+                        "required": [
+                            "project_path",
+                            "task_name",
+                            "expected_hash",
+                            "patches",
+                        ],
+                    },
+                ),
+                Tool(
+                    name="get_memory_history",
+                    description="列出任务记忆的所有历史版本",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径",
+                            },
+                            "task_name": {
+                                "type": "string",
+                                "description": "任务名称",
+                                "pattern": "^[a-zA-Z0-9_-]+$",
+                            },
+                        },
+                        "required": ["project_path", "task_name"],
+                    },
+                ),
+                Tool(
+                    name="get_memory_version",
+                    description="读取任务记忆的指定历史版本内容",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径",
+                            },
+                            "task_name": {
+                                "type": "string",
+                                "description": "任务名称",
+                                "pattern": "^[a-zA-Z0-9_-]+$",
+                            },
+                            "version": {
+                                "type": "integer",
+                                "description": "版本号，从1开始",
+                                "minimum": 1,
+                            },
+                        },
+                        "required": ["project_path", "task_name", "version"],
+                    },
+                ),
+                Tool(
+                    name="list_cursor_memories",
+                    description="列出项目的所有记忆及其描述、大小和创建时间",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径",
+                            },
+                        },
+                        "required": ["project_path"],
+                    },
+                ),
+                Tool(
+                    name="find_memories_by_revision",
+                    description="按git分支和提交查询记忆：在某个分支上、"
+                    "或者在某个提交之后写入的记忆",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径",
+                            },
+                            "branch": {
+                                "type": "string",
+                                "description": "分支名称（可选，和since都不填时"
+                                "取当前分支）",
+                            },
+                            "since": {
+                                "type": "string",
+                                "description": "提交或至少4位的前缀，只返回在该提交"
+                                "或之后写入的记忆（可选）",
+                            },
+                        },
+                        "required": ["project_path"],
+                    },
+                ),
+                Tool(
+                    name="search_all_projects",
+                    description="在所有用过本服务的项目和全局存储中搜索记忆，"
+                    "用于查找其它项目中类似问题的解决方法",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "查询文本",
+                            },
+                            "top_k": {
+                                "type": "integer",
+                                "description": "返回的结果数量（默认10）",
+                                "minimum": 1,
+                                "maximum": 100,
+                            },
+                            "timeout": {
+                                "type": "number",
+                                "description": "每个项目的超时时间，单位秒（默认5）",
+                            },
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径（可选），"
+                                "该项目中的命中计为一次较弱的访问",
+                            },
+                        },
+                        "required": ["query"],
+                    },
+                ),
+                Tool(
+                    name="analyze_rule_budget",
+                    description="分析.cursor/rules的上下文预算：token占用、alwaysApply规则、"
+                    "近似重复和体积最大的记忆，并给出优化建议",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径",
+                            },
+                            "estimator": {
+                                "type": "string",
+                                "description": "token估算方式，cjk适合中文为主的记忆"
+                                "（可选，默认cjk）",
+                                "enum": list(ESTIMATORS),
+                            },
+                            "top_n": {
+                                "type": "integer",
+                                "description": "列出的最大记忆数量（可选）",
+                                "minimum": 1,
+                                "maximum": 1000,
+                            },
+                            "budget_tokens": {
+                                "type": "integer",
+                                "description": "alwaysApply记忆的token预算（可选）",
+                                "minimum": 0,
+                            },
+                        },
+                        "required": ["project_path"],
+                    },
+                ),
+                Tool(
+                    name="rebalance_always_apply",
+                    description="按记忆的访问频率调整alwaysApply：在token预算内提升"
+                    "最常用的记忆，降级长期未使用的记忆，只改写frontmatter",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径",
+                            },
+                            "top_n": {
+                                "type": "integer",
+                                "description": "alwaysApply记忆的最大数量（可选）",
+                                "minimum": 0,
+                                "maximum": 100,
+                            },
+                            "budget_tokens": {
+                                "type": "integer",
+                                "description": "alwaysApply记忆的token预算（可选）",
+                                "minimum": 0,
+                            },
+                            "min_score": {
+                                "type": "number",
+                                "description": "提升需要的最低访问分数（可选）",
+                                "minimum": 0,
+                            },
+                            "stale_score": {
+                                "type": "number",
+                                "description": "访问分数低于该值时降级（可选）",
+                                "minimum": 0,
+                            },
+                            "estimator": {
+                                "type": "string",
+                                "description": "token估算方式（可选，默认cjk）",
+                                "enum": list(ESTIMATORS),
+                            },
+                            "dry_run": {
+                                "type": "boolean",
+                                "description": "只报告计划，不修改文件（可选）",
+                            },
+                        },
+                        "required": ["project_path"],
+                    },
+                ),
+                Tool(
+                    name="export_cursor_memories",
+                    description="把项目的所有记忆导出为JSONL文件（可选gzip压缩）",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "要导出的项目的绝对路径",
+                            },
+                            "output_path": {
+                                "type": "string",
+                                "description": "导出的JSONL文件路径，以.gz结尾时压缩",
+                                "minLength": 1,
+                            },
+                            "compress": {
+                                "type": "boolean",
+                                "description": "是否gzip压缩（可选）",
+                            },
+                            "overwrite": {
+                                "type": "boolean",
+                                "description": "输出文件已存在时是否覆盖（默认false）",
+                            },
+                        },
+                        "required": ["project_path", "output_path"],
+                    },
+                ),
+                Tool(
+                    name="import_cursor_memories",
+                    description="从JSONL文件批量导入记忆，跳过重复内容并自动处理重名",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "要导入到的项目的绝对路径",
+                            },
+                            "input_path": {
+                                "type": "string",
+                                "description": "JSONL文件路径（可以是gzip压缩的）",
+                            },
+                            "batch_size": {
+                                "type": "integer",
+                                "description": "每批写入的记录数（可选）",
+                                "minimum": 1,
+                                "maximum": 10000,
+                            },
+                        },
+                        "required": ["project_path", "input_path"],
+                    },
+                ),
+                Tool(
+                    name="snapshot_cursor_memories",
+                    description="为项目的记忆和历史创建时间点快照（只复制变化了的记忆），"
+                    "用于在批量操作之前留下回滚点",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径",
+                            },
+                            "label": {
+                                "type": "string",
+                                "description": "附加在快照ID后面的标签（可选）",
+                                "pattern": "^[a-zA-Z0-9_-]+$",
+                            },
+                            "keep": {
+                                "type": "integer",
+                                "description": "保留的快照数量（可选，默认10）",
+                                "minimum": 1,
+                                "maximum": 1000,
+                            },
+                        },
+                        "required": ["project_path"],
+                    },
+                ),
+                Tool(
+                    name="restore_snapshot",
+                    description="把项目的记忆和历史恢复到指定快照时的状态",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "project_path": {
+                                "type": "string",
+                                "description": "当前项目的绝对路径",
+                            },
+                            "snapshot_id": {
+                                "type": "string",
+                                "description": "快照ID",
+                            },
+                            "backup": {
+                                "type": "boolean",
+                                "description": "恢复之前是否为当前状态创建快照"
+                                "（可选，默认true）",
+                            },
+                        },
+                        "required": ["project_path", "snapshot_id"],
+                    },
+                ),
+                Tool(
+                    name="start_profiling",
+                    description="对接下来的工具调用开启cProfile/tracemalloc性能剖析",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "calls": {
+                                "type": "integer",
+                                "description": "要保存剖析结果的调用次数（可选）",
+                                "minimum": 1,
+                                "maximum": 1000,
+                            },
+                            "slow_ms": {
+                                "type": "number",
+                                "description": "只保留耗时超过该毫秒数的调用（可选）",
+                                "minimum": 0,
+                            },
+                            "mode": {
+                                "type": "string",
+                                "description": "剖析模式（可选，默认cpu）",
+                                "enum": list(MODES),
+                            },
+                        },
+                    },
+                ),
+                Tool(
+                    name="get_profile_report",
+                    description="汇总剖析结果：累计耗时最多的函数和内存分配最多的位置",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "top_n": {
+                                "type": "integer",
+                                "description": "列出的函数和分配位置数量（可选）",
+                                "minimum": 1,
+                                "maximum": 1000,
+                            },
+                        },
+                    },
+                ),
+            ]
+
+        # 参数由各工具的请求模型校验；mcp的输入校验每次调用都会先用元schema检查
+        # 整个inputSchema，一次调用约10ms，比写入记忆本身还慢
+        @self.server.call_tool(validate_input=False)
+        async def call_tool(
+            name: str, arguments: Dict[str, Any]
+        ) -> list[Dict[str, Any]]:
+            """处理工具调用"""
+            return await self._handle_tool_call(name, arguments, self._client_id())
+
+    def _client_id(self) -> str:
+        """当前请求所属的客户端标识（按MCP会话区分）"""
+        try:
+            return f"session-{id(self.server.request_context.session)}"
+        except LookupError:
+            return "local"
+
+    async def _handle_tool_call(
+        self, name: str, arguments: Dict[str, Any], client_id: str = "local"
+    ) -> list[Dict[str, Any]]:
+        """经过准入控制后分发工具调用，过载时快速返回繁忙错误"""
+        size = payload_size(arguments)
+        with span(
+            "call_tool", tool=name, client_id=client_id, payload_bytes=size
+        ) as root:
+            try:
+                async with self.admission.admit(client_id, size):
+                    if self.profiler.active and name not in _PROFILING_TOOLS:
+                        result = await self.profiler.run(
+                            name, lambda: self._dispatch_tool(name, arguments)
+                        )
+                    else:
+                        result = await self._dispatch_tool(name, arguments)
+                project_path = arguments.get("project_path")
+                if isinstance(project_path, str):
+                    # 记录见过的项目，供跨项目搜索使用
+                    self.registry.add(project_path)
+            except Overloaded as e:
+                logger.warning(f"拒绝工具调用 {name}: {e.reason}")
+                root.set_attribute("busy", True)
+                root.set_error(e.reason)
+                return _json_response(
+                    {
+                        "error": f"服务繁忙，请稍后重试: {e.reason}",
+                        "busy": True,
+                        "retry_after": e.retry_after,
+                    }
+                )
+            # 各工具把错误写在响应里而不是抛出异常，记录到span状态中
+            if root.sampled:
+                error = json.loads(result[0]["text"]).get("error")
+                if error:
+                    root.set_error(error)
+            return result
+
+    async def _dispatch_tool(
+        self, name: str, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """根据工具名称调用对应的处理函数"""
+        if name not in _TOOLS:
+            raise ValueError(f"未知工具: {name}")
+        # 每个工具由同名的 _<工具名> 方法处理
+        return await getattr(self, f"_{name}")(arguments)
+
+    async def _create_cursor_memory(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """创建Cursor记忆文件，由 :class:`MemoryStore` 完成写入"""
+        try:
+            # 参数验证
+            with span("validate"):
+                request = CreateMemoryRequest(**arguments)
+            current_span().set_attribute("project", request.project_path)
+            current_span().set_attribute("scope", request.scope)
+            store = MemoryStore(request.project_path, self.redactor)
+            return _json_response(await store.acreate_from(request))
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except OSError as e:
+            return _json_response({"error": str(e)})
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _append_cursor_memory(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """向已有记忆追加带时间戳的小节，由 :class:`MemoryStore` 完成写入"""
+        try:
+            request = AppendMemoryRequest(**arguments)
+            current_span().set_attribute("project", request.project_path)
+            store = MemoryStore(request.project_path, self.redactor)
+            try:
+                result = await store.aappend(
+                    request.task_name, request.note, request.title
+                )
+            except KeyError as e:
+                return _json_response({"error": e.args[0]})
+            except OSError as e:
+                error_msg = f"文件操作失败: {e}"
+                logger.error(error_msg)
+                return _json_response({"error": error_msg})
+
+            return _json_response(
+                {"success": True, "message": "成功追加记忆", **result}
+            )
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _update_cursor_memory(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """按小节修改记忆，内容哈希不一致时拒绝"""
+        try:
+            request = UpdateMemoryRequest(**arguments)
+            current_span().set_attribute("project", request.project_path)
+            store = MemoryStore(request.project_path, self.redactor)
+            try:
+                result = await store.aupdate(
+                    request.task_name, request.expected_hash, request.patches
+                )
+            except KeyError as e:
+                return _json_response({"error": e.args[0]})
+            except HashMismatch as e:
+                logger.warning(f"更新冲突: {request.task_name}")
+                return _json_response(
+                    {"error": str(e), "conflict": True, "current_hash": e.current_hash}
+                )
+            except PatchError as e:
+                return _json_response({"error": f"补丁无法应用: {e}"})
+            except OSError as e:
+                error_msg = f"文件操作失败: {e}"
+                logger.error(error_msg)
+                return _json_response({"error": error_msg})
+
+            previous = result["version"] - 1
+            return _json_response(
+                {
+                    "success": True,
+                    "message": f"成功更新记忆，旧版本已存入历史: v{previous}",
+                    **result,
+                }
+            )
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _get_memory_history(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """列出任务记忆的历史版本"""
+        try:
+            request = MemoryHistoryRequest(**arguments)
+            store = MemoryStore(request.project_path, self.redactor)
+            try:
+                history = await store.ahistory(request.task_name)
+            except KeyError as e:
+                return _json_response({"error": e.args[0]})
+            return _json_response(
+                {"success": True, "task_name": request.task_name, **history}
+            )
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _get_memory_version(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """读取任务记忆的指定版本"""
+        try:
+            request = MemoryVersionRequest(**arguments)
+            store = MemoryStore(request.project_path, self.redactor)
+            try:
+                version = await store.aversion(request.task_name, request.version)
+            except KeyError as e:
+                return _json_response({"error": e.args[0]})
+            return _json_response({"success": True, **version})
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _list_cursor_memories(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """从清单列出项目的记忆，不扫描目录"""
+        try:
+            request = ListMemoriesRequest(**arguments)
+            store = MemoryStore(request.project_path, self.redactor)
+            memories = await store.alist()
+            return _json_response(
+                {"success": True, **store.stats(), "memories": memories}
+            )
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _find_memories_by_revision(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """从清单的修订索引查询某个分支上或某个提交之后写入的记忆"""
+        try:
+            request = RevisionQueryRequest(**arguments)
+            layout = get_layout(request.project_path)
+            report = await to_thread(
+                find_memories_by_revision, layout, request.branch, request.since
+            )
+            return _json_response({"success": True, **report})
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except ValueError as e:
+            return _json_response({"error": str(e)})
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _search_all_projects(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """在所有登记过的项目和全局存储中搜索记忆"""
+        try:
+            request = SearchAllProjectsRequest(**arguments)
+            projects = self.registry.projects()
+            store = global_store_path()
+            # 只有当前项目和全局存储可以写入清单和索引，其它项目只读打开
+            writable = [str(store.resolve())]
+            if rules_dir(str(store)).is_dir():
+                projects.append(writable[0])
+            if request.project_path:
+                writable.append(request.project_path)
+            report = await to_thread(
+                search_all_projects,
+                request.query,
+                projects,
+                request.top_k,
+                request.timeout,
+                writable=writable,
+            )
+            # 当前项目中的命中算一次（较弱的）访问；其它项目只读，
+            # 不能因为被搜索到就影响那些项目的alwaysApply重新平衡
+            names = [
+                result["name"]
+                for result in report["results"]
+                if result["project"] == request.project_path
+            ]
+            if names:
+                get_access_counters(request.project_path).record(names, SEARCH_WEIGHT)
+            return _json_response({"success": True, **report})
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _analyze_rule_budget(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """分析项目记忆的上下文预算"""
+        try:
+            request = RuleBudgetRequest(**arguments)
+            report = await to_thread(
+                analyze_rule_budget,
+                request.project_path,
+                request.estimator,
+                request.top_n,
+                request.budget_tokens,
+            )
+            return _json_response({"success": True, **report})
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _rebalance_always_apply(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """按访问频率提升或降级记忆的alwaysApply"""
+        try:
+            request = RebalanceRequest(**arguments)
+            report = await to_thread(
+                rebalance_always_apply,
+                request.project_path,
+                request.top_n,
+                request.budget_tokens,
+                request.min_score,
+                request.stale_score,
+                request.estimator,
+                request.dry_run,
+            )
+            return _json_response({"success": True, **report})
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _export_cursor_memories(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """导出项目记忆为JSONL文件"""
+        try:
+            request = ExportMemoriesRequest(**arguments)
+            stats = await to_thread(
+                export_memories,
+                request.project_path,
+                request.output_path,
+                request.compress,
+                request.overwrite,
+            )
+            return _json_response(
+                {
+                    "success": True,
+                    "message": f"成功导出 {stats.exported} 条记忆",
+                    "output_path": request.output_path,
+                    "exported": stats.exported,
+                    "errors": stats.errors,
+                }
+            )
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except OSError as e:
+            error_msg = f"文件操作失败: 导出失败: {e}"
+            logger.error(error_msg)
+            return _json_response({"error": error_msg})
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _import_cursor_memories(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """从JSONL文件导入记忆"""
+        try:
+            request = ImportMemoriesRequest(**arguments)
+            stats = await to_thread(
+                import_memories,
+                request.project_path,
+                request.input_path,
+                request.batch_size,
+                self.redactor,
+            )
+            return _json_response(
+                {
+                    "success": True,
+                    "message": f"成功导入 {stats.imported} 条记忆",
+                    "imported": stats.imported,
+                    "renamed": stats.renamed,
+                    "skipped_duplicates": stats.skipped_duplicates,
+                    "failed": stats.failed,
+                    "errors": stats.errors,
+                    **({"redacted": dict(stats.redacted)} if stats.redacted else {}),
+                }
+            )
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except OSError as e:
+            error_msg = f"文件操作失败: 导入失败: {e}"
+            logger.error(error_msg)
+            return _json_response({"error": error_msg})
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _snapshot_cursor_memories(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """为项目的记忆创建快照"""
+        try:
+            request = SnapshotRequest(**arguments)
+            try:
+                stats = await to_thread(
+                    create_snapshot, request.project_path, request.label, request.keep
+                )
+            except OSError as e:
+                error_msg = f"文件操作失败: {e}"
+                logger.error(error_msg)
+                return _json_response({"error": error_msg})
+            return _json_response(
+                {
+                    "success": True,
+                    "snapshot_id": stats.snapshot_id,
+                    "memories": stats.memories,
+                    "linked": stats.linked,
+                    "copied": stats.copied,
+                    "pruned": stats.pruned,
+                    "elapsed_ms": stats.elapsed_ms,
+                    "snapshots": list_snapshots(request.project_path),
+                }
+            )
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _restore_snapshot(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """把项目的记忆恢复到快照时的状态"""
+        try:
+            request = RestoreSnapshotRequest(**arguments)
+            try:
+                stats = await to_thread(
+                    restore_snapshot,
+                    request.project_path,
+                    request.snapshot_id,
+                    request.backup,
+                )
+            except FileNotFoundError as e:
+                snapshots = list_snapshots(request.project_path)
+                return _json_response(
+                    {"error": str(e), "snapshots": [s["id"] for s in snapshots]}
+                )
+            except OSError as e:
+                error_msg = f"文件操作失败: {e}"
+                logger.error(error_msg)
+                return _json_response({"error": error_msg})
+            return _json_response(
+                {
+                    "success": True,
+                    "snapshot_id": stats.snapshot_id,
+                    "backup_id": stats.backup_id,
+                    "memories": stats.memories,
+                    "restored": stats.restored,
+                    "unchanged": stats.unchanged,
+                    "removed": stats.removed,
+                    "elapsed_ms": stats.elapsed_ms,
+                }
+            )
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _start_profiling(self, arguments: Dict[str, Any]) -> list[Dict[str, Any]]:
+        """开启性能剖析"""
+        try:
+            request = StartProfilingRequest(**arguments)
+            # 输出目录只能由服务端配置（CURSOR_MEMORY_PROFILE_DIR），客户端不能指定
+            # 写入位置，报告也只读取这个目录中服务自己生成的剖析文件
+            self.profiler.start(
+                calls=request.calls, slow_ms=request.slow_ms, mode=request.mode
+            )
+            return _json_response(
+                {
+                    "success": True,
+                    "message": f"已开启性能剖析，将保存 {request.calls} 次调用的结果",
+                    **self.profiler.status(),
+                }
+            )
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except OSError as e:
+            error_msg = f"文件操作失败: 无法创建剖析目录: {e}"
+            logger.error(error_msg)
+            return _json_response({"error": error_msg})
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    async def _get_profile_report(
+        self, arguments: Dict[str, Any]
+    ) -> list[Dict[str, Any]]:
+        """汇总剖析结果"""
+        try:
+            request = ProfileReportRequest(**arguments)
+            report = await to_thread(
+                profile_report, str(self.profiler.output_dir), request.top_n
+            )
+            return _json_response(
+                {"success": True, "status": self.profiler.status(), **report}
+            )
+
+        except ValidationError as e:
+            return _validation_error_response(e)
+
+        except OSError as e:
+            error_msg = f"文件操作失败: 无法读取剖析结果: {e}"
+            logger.error(error_msg)
+            return _json_response({"error": error_msg})
+
+        except Exception as e:
+            error_msg = f"服务内部错误: {e}"
+            logger.error(error_msg, exc_info=True)
+            return _json_response({"error": error_msg})
+
+    _generate_file_content = staticmethod(generate_file_content)
+
+    async def run_streams(
+        self,
+        read_stream: MemoryObjectReceiveStream,
+        write_stream: MemoryObjectSendStream,
+        raise_exceptions: bool = False,
+    ):
+        """在给定的一对消息流上运行MCP会话，直到读取流关闭
+
+        stdio和进程内传输（:mod:`inprocess`）都经过这里。
+
+        Args:
+            read_stream: 客户端发来的消息
+            write_stream: 发给客户端的消息
+            raise_exceptions: 处理请求时的异常直接抛出，而不是作为错误响应返回
+        """
+        await self.server.run(
+            read_stream,
+            write_stream,
+            self.server.create_initialization_options(),
+            raise_exceptions=raise_exceptions,
+        )
+
+    async def run(self, record_path: Optional[str] = None, redact: bool = False):
+        """运行MCP服务器
+
+        Args:
+            record_path: 设置时把收到的JSON-RPC消息录制到该文件，供回放使用
+            redact: 录制时对工具参数脱敏
+        """
+        logger.info("启动Cursor Memory MCP服务器...")
+        async with stdio_server() as (read_stream, write_stream):
+            if record_path:
+                logger.info(f"录制收到的消息到: {record_path}")
+                async with record_messages(
+                    read_stream, record_path, redact
+                ) as recorded_stream:
+                    await self.run_streams(recorded_stream, write_stream)
+            else:
+                await self.run_streams(read_stream, write_stream)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        prog="cursor-memory-mcp", description="Cursor项目记忆文件创建器"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help="启动stdio MCP服务器（默认）")
+    serve_parser.add_argument(
+        "--record", metavar="FILE", help="把收到的JSON-RPC消息录制到JSONL文件"
+    )
+    serve_parser.add_argument(
+        "--redact", action="store_true", help="录制时对工具参数中的内容脱敏"
+    )
+
+    export_parser = subparsers.add_parser("export", help="把项目记忆导出为JSONL")
+    export_parser.add_argument(
+        "project_path",
+        nargs="+",
+        help="项目根目录或glob模式；多个项目时并行导出到 -o 指定的目录",
+    )
+    export_parser.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help="输出文件路径 (默认: 标准输出)；多个项目时为输出目录",
+    )
+    export_parser.add_argument(
+        "-j", "--jobs", type=int, help="多个项目时的工作进程数 (默认: CPU核数)"
+    )
+    export_parser.add_argument(
+        "--gzip",
+        action="store_true",
+        default=None,
+        help="gzip压缩输出 (默认根据.gz后缀判断)",
+    )
+    export_parser.add_argument(
+        "-f", "--force", action="store_true", help="覆盖已存在的输出文件"
+    )
+
+    import_parser = subparsers.add_parser("import", help="从JSONL导入项目记忆")
+    import_parser.add_argument("project_path", help="项目根目录")
+    import_parser.add_argument(
+        "input", nargs="?", default="-", help="输入文件路径 (默认: 标准输入)"
+    )
+    import_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"每批写入的记录数 (默认: {DEFAULT_BATCH_SIZE})",
+    )
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="启动新的服务进程并回放录制的消息"
+    )
+    replay_parser.add_argument("recording", help="录制文件路径")
+    replay_parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="回放倍速，0表示尽可能快 (默认: 1.0)",
+    )
+    replay_parser.add_argument(
+        "--project-root",
+        help="把录制中的每个项目路径映射到该目录下的新子目录",
+    )
+    replay_parser.add_argument(
+        "--timeout", type=float, default=60.0, help="等待剩余响应的秒数 (默认: 60)"
+    )
+
+    reshard_parser = subparsers.add_parser(
+        "reshard", help="把项目记忆迁移到平铺或分片目录布局"
+    )
+    reshard_parser.add_argument("project_path", help="项目根目录")
+    reshard_parser.add_argument(
+        "--scheme",
+        choices=SCHEMES,
+        required=True,
+        help="目标布局: flat平铺, hash按名称哈希分片, date按创建月份分片",
+    )
+
+    reindex_parser = subparsers.add_parser(
+        "reindex", help="并行重建多个项目的清单、搜索索引、文件索引和签名"
+    )
+    _add_projects_arguments(reindex_parser)
+    reindex_parser.add_argument(
+        "--full", action="store_true", help="删除索引缓存，全部从头计算"
+    )
+
+    compact_parser = subparsers.add_parser(
+        "compact", help="并行压缩多个项目的签名文件、旧快照和访问计数"
+    )
+    _add_projects_arguments(compact_parser)
+    compact_parser.add_argument(
+        "--keep",
+        type=int,
+        help="保留的快照数量 (默认: CURSOR_MEMORY_SNAPSHOT_KEEP)",
+    )
+
+    stats_parser = subparsers.add_parser(
+        "stats", help="汇总多个项目的记忆数量和磁盘占用"
+    )
+    _add_projects_arguments(stats_parser)
+
+    bench_parser = subparsers.add_parser(
+        "bench", help="测量直接调用和经过进程内MCP协议创建记忆的延迟"
+    )
+    bench_parser.add_argument(
+        "--calls", type=int, default=200, help="每种方式的调用次数 (默认: 200)"
+    )
+
+    return parser
+
+
+def _add_projects_arguments(parser: argparse.ArgumentParser):
+    """离线维护命令共用的参数：项目列表和并行度"""
+    parser.add_argument(
+        "projects", nargs="*", help="项目根目录或glob模式（例如 '~/src/*'）"
+    )
+    parser.add_argument("--known", action="store_true", help="包含服务登记过的所有项目")
+    parser.add_argument("-j", "--jobs", type=int, help="工作进程数 (默认: CPU核数)")
+
+
+def _serve(record_path: Optional[str] = None, redact: bool = False):
+    """启动MCP服务器"""
+    tracer = Tracer.from_env()
+    set_tracer(tracer)
+    try:
+        mcp_server = CursorMemoryMCP()
+        asyncio.run(mcp_server.run(record_path, redact))
+    except KeyboardInterrupt:
+        logger.info("服务器已停止")
+    except Exception as e:
+        logger.error(f"服务器运行错误: {e}", exc_info=True)
+    finally:
+        if tracer.exporter:
+            tracer.exporter.shutdown()
+
+
+_MAINTENANCE_COMMANDS = {
+    "reindex": lambda args: (reindex_project, args.full),
+    "compact": lambda args: (compact_project, args.keep),
+    "stats": lambda args: (project_stats,),
+}
+
+
+def _maintain(args: argparse.Namespace) -> int:
+    """在进程池中对多个项目执行维护命令，进度写到标准错误，汇总写到标准输出"""
+    if args.command == "export":
+        patterns, known = args.project_path, False
+        if args.output == "-":
+            print("错误: 导出多个项目时需要用 -o 指定输出目录", file=sys.stderr)
+            return 1
+        os.makedirs(args.output, exist_ok=True)
+        task = (export_project, args.output, bool(args.gzip), args.force)
+    else:
+        patterns, known = args.projects, args.known
+        task = _MAINTENANCE_COMMANDS[args.command](args)
+    try:
+        projects = resolve_projects(patterns, known)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    if not projects:
+        print("错误: 没有匹配的项目", file=sys.stderr)
+        return 1
+    summary = run_parallel(
+        task[0], projects, *task[1:], jobs=args.jobs, progress=sys.stderr
+    )
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0 if not summary["failed"] else 1
+
+
+async def _bench(calls: int) -> Dict[str, Any]:
+    """在临时项目中分别直接调用和经过进程内MCP协议创建记忆，比较延迟"""
+    from .inprocess import connect
+
+    # 不让速率限制影响测量
+    server = CursorMemoryMCP(admission=AdmissionController(rate=1e9, burst=10**9))
+    report: Dict[str, Any] = {"calls": calls}
+    with tempfile.TemporaryDirectory() as project:
+        store = MemoryStore(project)
+        durations = []
+        for i in range(calls):
+            start = time.perf_counter()
+            await store.acreate(f"direct_{i % 20}", f"第{i}次：修改了 main.py")
+            durations.append((time.perf_counter() - start) * 1000)
+        report["direct"] = latency_stats(durations)
+
+        durations = []
+        async with connect(server) as client:
+            for i in range(calls):
+                start = time.perf_counter()
+                await client.call(
+                    "create_cursor_memory",
+                    project_path=project,
+                    task_name=f"mcp_{i % 20}",
+                    task_summary=f"第{i}次：修改了 main.py",
+                )
+                durations.append((time.perf_counter() - start) * 1000)
+        report["inprocess"] = latency_stats(durations)
+    return report
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """主函数"""
+    args = _build_parser().parse_args(argv)
+
+    if args.command in (None, "serve"):
+        _serve(getattr(args, "record", None), getattr(args, "redact", False))
+        return 0
+
+    if args.command == "replay":
+        if not Path(args.recording).is_file():
+            print(f"错误: 录制文件不存在: {args.recording}", file=sys.stderr)
+            return 1
+        report = asyncio.run(
+            replay(
+                args.recording,
+                speed=args.speed,
+                project_root=args.project_root,
+                timeout=args.timeout,
+            )
+        )
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.command in _MAINTENANCE_COMMANDS:
+        return _maintain(args)
+
+    if args.command == "bench":
+        report = asyncio.run(_bench(args.calls))
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.command == "export":
+        if len(args.project_path) > 1 or glob.has_magic(args.project_path[0]):
+            return _maintain(args)
+        args.project_path = args.project_path[0]
+    return _run_project_command(args)
+
+
+def _run_project_command(args: argparse.Namespace) -> int:
+    """对单个项目执行export、import或reshard"""
+    try:
+        project_path = _validate_project_path(args.project_path)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+
+    try:
+        if args.command == "export":
+            stats = export_memories(project_path, args.output, args.gzip, args.force)
+            result = {"exported": stats.exported, "errors": stats.errors}
+        elif args.command == "reshard":
+            stats = reshard(project_path, args.scheme)
+            result = asdict(stats)
+        else:
+            stats = import_memories(project_path, args.input, args.batch_size)
+            result = {
+                "imported": stats.imported,
+                "renamed": stats.renamed,
+                "skipped_duplicates": stats.skipped_duplicates,
+                "failed": stats.failed,
+                "errors": stats.errors,
+                "redacted": dict(stats.redacted),
+            }
+    except OSError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+
+    # 导出到标准输出时，统计信息写到标准错误，避免混入JSONL数据
+    out = sys.stderr if args.command == "export" and args.output == "-" else sys.stdout
+    print(json.dumps(result, ensure_ascii=False, indent=2), file=out)
+    return 0 if not stats.errors else 1
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
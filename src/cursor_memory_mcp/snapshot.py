@@ -0,0 +1,464 @@
+"""
+记忆的时间点快照
+
+在压缩、清理或批量导入之前创建快照，出问题时可以整体回滚。快照保存在
+``.cursor/.snapshots/<快照ID>/``：
+
+- ``rules/<名称>.mdc``：每条记忆一份，与分片布局无关
+- ``history/<名称>.jsonl``：历史文件的硬链接
+- ``manifest.json``：记忆清单的硬链接
+- ``snapshot.json``：创建时间、标签、各记忆文件的 (大小, 修改时间, SHA-256)
+  和各历史文件当时的长度
+
+快照中的记忆文件从不与live文件共用inode：Cursor、VS Code等编辑器原地保存文件，
+共用inode时编辑会同时改掉快照中的内容。创建快照时，大小和修改时间与上一个快照
+记录的相同的记忆直接硬链接上一个快照中的文件（它同样是快照私有的），其余的复制
+一份并保留修改时间。因此只有变化了的记忆占用额外的空间，未变化的记忆在多个快照
+之间共享同一个inode。恢复时按记录的大小、修改时间和哈希判断记忆是否变化，只把
+变化了的复制回去。
+
+清单只由服务以 临时文件 + 原子替换 写入，可以直接硬链接。历史文件是原地追加的，
+快照中的链接会看到之后追加的版本，所以同时记录创建快照时的文件长度，恢复时只取
+这一段。
+
+快照先在临时目录中组装，完成后一次重命名发布。创建快照后按
+``CURSOR_MEMORY_SNAPSHOT_KEEP``（默认10）删除最旧的快照。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .history import HISTORY_SUFFIX, INDEX_SUFFIX, history_dir, history_file
+from .layout import (
+    MEMORY_SUFFIX,
+    MemoryLayout,
+    file_lock,
+    get_layout,
+    manifest_file,
+)
+from .minhash import get_signature_store, memory_body, minhash_signature
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+# 版本1的快照硬链接live文件，没有记录各文件的哈希，恢复时所有记忆都复制回去
+_READABLE_VERSIONS = (1, SNAPSHOT_VERSION)
+
+DEFAULT_KEEP = 10
+
+# 恢复之前自动创建的快照的标签
+BACKUP_LABEL = "before-restore"
+
+_META_FILE = "snapshot.json"
+_MANIFEST_FILE = "manifest.json"
+_TEMP_PREFIX = ".tmp-"
+
+
+def snapshots_dir(project_path: str) -> Path:
+    """返回项目的快照目录"""
+    return Path(project_path) / ".cursor" / ".snapshots"
+
+
+def default_keep() -> int:
+    """保留的快照数量"""
+    return max(1, int(os.environ.get("CURSOR_MEMORY_SNAPSHOT_KEEP", DEFAULT_KEEP)))
+
+
+@dataclass
+class SnapshotStats:
+    """快照创建或恢复的统计"""
+
+    snapshot_id: str
+    memories: int = 0
+    linked: int = 0
+    copied: int = 0
+    restored: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    pruned: List[str] = field(default_factory=list)
+    backup_id: Optional[str] = None
+    elapsed_ms: float = 0.0
+
+
+def _link(source: Path, target: Path) -> bool:
+    """创建硬链接，文件系统不支持时退回复制；返回是否为硬链接"""
+    try:
+        os.link(source, target)
+        return True
+    except OSError:
+        shutil.copy2(source, target)
+        return False
+
+
+def _new_id(root: Path, label: Optional[str]) -> str:
+    snapshot_id = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    if label:
+        snapshot_id = f"{snapshot_id}-{label}"
+    # 同一微秒内创建多个快照时加序号
+    candidate, n = snapshot_id, 1
+    while (root / candidate).exists():
+        candidate = f"{snapshot_id}.{n}"
+        n += 1
+    return candidate
+
+
+def list_snapshots(project_path: str) -> List[Dict[str, Any]]:
+    """按创建时间列出快照"""
+    root = snapshots_dir(project_path)
+    snapshots = []
+    try:
+        entries = sorted(os.scandir(root), key=lambda e: e.name)
+    except FileNotFoundError:
+        return []
+    for entry in entries:
+        if entry.name.startswith(".") or not entry.is_dir():
+            continue
+        try:
+            meta = _read_meta(Path(entry.path))
+        except (OSError, ValueError):
+            continue
+        snapshots.append(
+            {
+                "id": entry.name,
+                "created_at": meta["created_at"],
+                "label": meta.get("label"),
+                "memories": meta["memories"],
+            }
+        )
+    return snapshots
+
+
+def _read_meta(path: Path) -> Dict[str, Any]:
+    with open(path / _META_FILE, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") not in _READABLE_VERSIONS:
+        raise ValueError(f"不支持的快照版本: {meta.get('version')}")
+    return meta
+
+
+def create_snapshot(
+    project_path: str, label: Optional[str] = None, keep: Optional[int] = None
+) -> SnapshotStats:
+    """为项目的记忆和历史创建快照
+
+    Args:
+        project_path: 项目根目录
+        label: 附加在快照ID后面的标签
+        keep: 保留的快照数量，默认取 ``CURSOR_MEMORY_SNAPSHOT_KEEP``
+    """
+    start = time.perf_counter()
+    root = snapshots_dir(project_path)
+    root.mkdir(parents=True, exist_ok=True)
+    stats = SnapshotStats(snapshot_id=_new_id(root, label))
+    temp_dir = root / f"{_TEMP_PREFIX}{stats.snapshot_id}"
+    (temp_dir / "rules").mkdir(parents=True)
+    (temp_dir / "history").mkdir()
+
+    try:
+        layout = get_layout(project_path)
+        # 清单中的元数据让恢复时不必重新读取文件
+        if manifest_file(project_path).exists():
+            _link(manifest_file(project_path), temp_dir / _MANIFEST_FILE)
+        files = _capture_memories(
+            layout, temp_dir / "rules", _latest_snapshot(root), stats
+        )
+        stats.memories = len(files)
+        histories = _link_histories(project_path, temp_dir / "history", stats)
+
+        with open(temp_dir / _META_FILE, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": SNAPSHOT_VERSION,
+                    "created_at": datetime.now().isoformat(),
+                    "label": label,
+                    "memories": len(files),
+                    "files": files,
+                    "history": histories,
+                },
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        os.rename(temp_dir, root / stats.snapshot_id)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    stats.pruned = prune_snapshots(project_path, keep or default_keep())
+    stats.elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+    logger.info(
+        f"已创建快照 {stats.snapshot_id}: {stats.memories} 条记忆, "
+        f"{stats.linked} 个硬链接, {stats.copied} 个复制"
+    )
+    return stats
+
+
+def _latest_snapshot(root: Path) -> Optional[Path]:
+    """最新的、记录了各文件信息的快照"""
+    try:
+        entries = sorted(
+            (e for e in os.scandir(root) if not e.name.startswith(".") and e.is_dir()),
+            key=lambda e: e.name,
+            reverse=True,
+        )
+    except FileNotFoundError:
+        return None
+    for entry in entries:
+        try:
+            if "files" in _read_meta(Path(entry.path)):
+                return Path(entry.path)
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def _copy_file(source: str, target: str) -> List[Any]:
+    """复制文件并保留修改时间，返回复制的内容的 [大小, 修改时间, SHA-256]"""
+    with open(source, "rb") as f:
+        stat = os.fstat(f.fileno())
+        data = f.read()
+    with open(target, "wb") as f:
+        f.write(data)
+    os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    return [len(data), stat.st_mtime_ns, hashlib.sha256(data).hexdigest()]
+
+
+def _capture_memories(
+    layout: MemoryLayout,
+    target: Path,
+    previous: Optional[Path],
+    stats: SnapshotStats,
+) -> Dict[str, List[Any]]:
+    """把每条记忆放入快照，返回 名称 -> [大小, 修改时间, SHA-256]
+
+    大小和修改时间与上一个快照记录的相同时硬链接上一个快照中的文件，否则复制
+    live文件。快照中的文件都不与live文件共用inode。
+    """
+    recorded = _read_meta(previous)["files"] if previous else {}
+    files: Dict[str, List[Any]] = {}
+    for name, meta in layout.memories.items():
+        filename = f"{name}{MEMORY_SUFFIX}"
+        live = os.path.join(layout.root, meta["shard"], filename)
+        try:
+            stat = os.stat(live)
+            old = recorded.get(name)
+            if old and old[:2] == [stat.st_size, stat.st_mtime_ns]:
+                try:
+                    os.link(previous / "rules" / filename, target / filename)
+                    files[name] = old
+                    stats.linked += 1
+                    continue
+                except OSError:
+                    pass
+            files[name] = _copy_file(live, os.path.join(target, filename))
+            stats.copied += 1
+        except FileNotFoundError:
+            logger.warning(f"记忆文件不存在，快照中跳过: {live}")
+    return files
+
+
+def _link_histories(project_path: str, target: Path, stats: SnapshotStats):
+    """链接所有历史文件，返回 名称 -> 当时的长度"""
+    histories: Dict[str, int] = {}
+    try:
+        entries = list(os.scandir(history_dir(project_path)))
+    except FileNotFoundError:
+        return histories
+    for entry in entries:
+        if not entry.name.endswith(HISTORY_SUFFIX) or not entry.is_file():
+            continue
+        # 先取长度再链接：之间追加的版本会被恢复时的长度截掉
+        size = entry.stat().st_size
+        if _link(Path(entry.path), target / entry.name):
+            stats.linked += 1
+        else:
+            stats.copied += 1
+        histories[entry.name[: -len(HISTORY_SUFFIX)]] = size
+    return histories
+
+
+def prune_snapshots(project_path: str, keep: int) -> List[str]:
+    """删除最旧的快照，只保留keep个，返回被删除的快照ID"""
+    root = snapshots_dir(project_path)
+    snapshots = [s["id"] for s in list_snapshots(project_path)]
+    pruned = snapshots[: max(0, len(snapshots) - keep)]
+    for snapshot_id in pruned:
+        shutil.rmtree(root / snapshot_id, ignore_errors=True)
+    # 清理中断的创建留下的临时目录
+    for leftover in root.glob(f"{_TEMP_PREFIX}*"):
+        if time.time() - leftover.stat().st_mtime > 3600:
+            shutil.rmtree(leftover, ignore_errors=True)
+    if pruned:
+        logger.info(f"删除旧快照: {', '.join(pruned)}")
+    return pruned
+
+
+def _is_unchanged(layout: MemoryLayout, name: str, record: List[Any]) -> bool:
+    """记忆当前的文件是否与快照记录的大小、修改时间和哈希都一致"""
+    meta = layout.memories.get(name)
+    if meta is None:
+        return False
+    live = os.path.join(layout.root, meta["shard"], f"{name}{MEMORY_SUFFIX}")
+    try:
+        with open(live, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if [stat.st_size, stat.st_mtime_ns] != record[:2]:
+                return False
+            return hashlib.sha256(f.read()).hexdigest() == record[2]
+    except FileNotFoundError:
+        return False
+
+
+def _replace_with_copy(source: Path, target: Path):
+    """用source的副本（保留修改时间）原子地替换target"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp = target.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    shutil.copy2(source, temp)
+    os.replace(temp, target)
+
+
+def _restore_prefix(source: Path, target: Path, size: int):
+    """把source的前size字节原子地写到target（历史文件创建快照后可能还有追加）"""
+    if target.exists() and target.stat().st_size == size:
+        if os.path.samefile(source, target):
+            return
+    temp = target.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(source, "rb") as src, open(temp, "wb") as dst:
+        remaining = size
+        while remaining:
+            chunk = src.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            dst.write(chunk)
+            remaining -= len(chunk)
+    os.replace(temp, target)
+
+
+def restore_snapshot(
+    project_path: str, snapshot_id: str, backup: bool = True
+) -> SnapshotStats:
+    """把记忆和历史恢复到快照时的状态
+
+    快照之后新建的记忆被删除，改写过的记忆换回快照中文件的副本，大小、修改时间和
+    哈希都与快照记录一致的记忆不做任何操作。
+
+    Args:
+        project_path: 项目根目录
+        snapshot_id: 快照ID
+        backup: 恢复之前是否为当前状态创建快照，便于撤销
+
+    Raises:
+        FileNotFoundError: 快照不存在
+    """
+    start = time.perf_counter()
+    path = snapshots_dir(project_path) / snapshot_id
+    if snapshot_id.startswith(".") or "/" in snapshot_id or not path.is_dir():
+        raise FileNotFoundError(f"快照不存在: {snapshot_id}")
+    meta = _read_meta(path)
+    names = [
+        entry.name[: -len(MEMORY_SUFFIX)]
+        for entry in os.scandir(path / "rules")
+        if entry.name.endswith(MEMORY_SUFFIX)
+    ]
+    files = meta.get("files", {})
+    metadata = _read_manifest(path)
+    stats = SnapshotStats(snapshot_id=snapshot_id, memories=len(names))
+    if backup:
+        stats.backup_id = create_snapshot(project_path, BACKUP_LABEL).snapshot_id
+
+    layout = get_layout(project_path)
+    changed = []
+    for name in names:
+        if name in files and _is_unchanged(layout, name, files[name]):
+            stats.unchanged += 1
+            continue
+        created = metadata.get(name, {}).get("created")
+        created = datetime.fromisoformat(created) if created else None
+        source = path / "rules" / f"{name}{MEMORY_SUFFIX}"
+        _replace_with_copy(source, layout.path_for(name, created))
+        stats.restored += 1
+        changed.append(name)
+    for name in set(layout.memories) - set(names):
+        layout.path_for(name).unlink(missing_ok=True)
+        stats.removed += 1
+    _restore_histories(project_path, path / "history", meta["history"])
+
+    if stats.restored or stats.removed:
+        _restore_manifest(
+            project_path,
+            layout,
+            {name: metadata[name] for name in names if name in metadata},
+        )
+        _refresh_signatures(project_path, layout, changed)
+
+    stats.elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+    logger.info(
+        f"已恢复快照 {snapshot_id}: 恢复 {stats.restored} 条, "
+        f"删除 {stats.removed} 条, 未变化 {stats.unchanged} 条"
+    )
+    return stats
+
+
+def _read_manifest(path: Path) -> Dict[str, Dict[str, Any]]:
+    """快照中清单记录的元数据，没有或损坏时返回空字典（恢复时重新读取文件）"""
+    try:
+        with open(path / _MANIFEST_FILE, encoding="utf-8") as f:
+            return json.load(f).get("memories", {})
+    except (OSError, ValueError) as e:
+        logger.warning(f"快照中没有可用的清单，恢复时重新读取文件: {e}")
+        return {}
+
+
+def _restore_manifest(project_path: str, layout, memories: Dict[str, Any]):
+    """以快照中的元数据重建清单
+
+    恢复的文件保留了快照中的修改时间，与快照中的元数据一致时重建不必重新读取
+    文件；没有元数据或不一致的记忆在重建时读取。
+    """
+    with file_lock(manifest_file(project_path).with_suffix(".lock")):
+        current = layout.memories
+        layout.memories = {
+            name: {**item, "shard": current.get(name, item)["shard"]}
+            for name, item in memories.items()
+        }
+        layout.rebuild(layout.scheme)
+
+
+def _restore_histories(project_path: str, source: Path, histories: Dict[str, int]):
+    directory = history_dir(project_path)
+    for name, size in histories.items():
+        directory.mkdir(parents=True, exist_ok=True)
+        _restore_prefix(
+            source / f"{name}{HISTORY_SUFFIX}", history_file(project_path, name), size
+        )
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        # 索引与历史文件不符时会重新扫描，只需删除已没有历史文件的索引
+        for suffix in (HISTORY_SUFFIX, INDEX_SUFFIX):
+            name = entry.name[: -len(suffix)]
+            if entry.name.endswith(suffix) and name not in histories:
+                os.unlink(entry.path)
+
+
+def _refresh_signatures(project_path: str, layout, names: List[str]):
+    """为内容被换回的记忆重新计算近似重复检测的签名"""
+    if not names:
+        return
+    signatures = []
+    for name in names:
+        body = memory_body(layout.path_for(name))
+        if body is not None:
+            signatures.append((name, minhash_signature(body)))
+    get_signature_store(project_path).add_many(signatures)
@@ -0,0 +1,482 @@
+"""
+多进程浸泡测试（soak）
+
+同时启动K个 ``cursor-memory-mcp`` 服务进程，让它们在一组共享的临时项目上持续执行
+工具调用，定期采样每个进程的RSS、打开的文件描述符、CPU和磁盘读写字节数，最后输出
+机器可读的JSON报告：延迟分位数、错误率和资源漂移（用于发现泄漏），便于对比每晚的
+运行结果::
+
+    cursor-memory-soak --processes 4 --projects 8 --duration 600 -o soak.json
+
+需要安装psutil（``pip install cursor-memory-mcp[bench]``）。服务进程关闭了按客户端
+限速，浸泡测试关注的是长时间运行的稳定性而不是准入控制。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from .replay import StdioClient, spawn_server, stop_server
+from .trace_summary import latency_stats
+
+REPORT_SCHEMA = 1
+
+DEFAULT_PROCESSES = 4
+DEFAULT_PROJECTS = 8
+DEFAULT_DURATION = 60.0
+DEFAULT_INTERVAL = 1.0
+DEFAULT_SUMMARY_CHARS = 2000
+
+# 每个进程使用的任务名称数量，反复更新同一批任务会让历史文件持续增长
+TASKS_PER_WORKER = 20
+
+# 工具调用的比例
+OPERATION_WEIGHTS = {
+    "create_cursor_memory": 80,
+    "get_memory_history": 10,
+    "analyze_rule_budget": 10,
+}
+
+# RSS增长超过该比例且超过该字节数，或文件描述符增长超过该数量时判定为疑似泄漏
+LEAK_RSS_RATIO = 0.2
+LEAK_RSS_BYTES = 20 * 1024 * 1024
+LEAK_FDS = 10
+
+_SUMMARY_WORDS = [
+    "修改了",
+    "main.py",
+    "登录逻辑",
+    "重构",
+    "UserService",
+    "缓存",
+    "测试",
+]
+
+
+def _initialize_message() -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": 0,
+        "method": "initialize",
+        "params": {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "cursor-memory-soak", "version": "1.0"},
+        },
+    }
+
+
+def _tool_call(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": 0,
+        "method": "tools/call",
+        "params": {"name": name, "arguments": arguments},
+    }
+
+
+def _slope_per_minute(points: List[tuple]) -> float:
+    """最小二乘斜率（每分钟的变化量），points为(秒, 值)"""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var = sum((t - mean_t) ** 2 for t, _ in points)
+    if var == 0:
+        return 0.0
+    cov = sum((t - mean_t) * (v - mean_v) for t, v in points)
+    return cov / var * 60
+
+
+def summarize_resources(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总单个进程的资源采样，比较前后四分之一时间段以衡量漂移"""
+    if not samples:
+        return {}
+    quarter = max(1, len(samples) // 4)
+    head, tail = samples[:quarter], samples[-quarter:]
+
+    def mean(rows, key):
+        return sum(r[key] for r in rows) / len(rows)
+
+    rss_start, rss_end = mean(head, "rss"), mean(tail, "rss")
+    fds_start, fds_end = mean(head, "fds"), mean(tail, "fds")
+    rss_growth = rss_end - rss_start
+    fds_growth = fds_end - fds_start
+    return {
+        "samples": len(samples),
+        "rss_start": int(rss_start),
+        "rss_end": int(rss_end),
+        "rss_peak": max(r["rss"] for r in samples),
+        "rss_growth": int(rss_growth),
+        "rss_slope_bytes_per_min": round(
+            _slope_per_minute([(r["t"], r["rss"]) for r in samples]), 1
+        ),
+        "fds_start": round(fds_start, 1),
+        "fds_end": round(fds_end, 1),
+        "fds_growth": round(fds_growth, 1),
+        "cpu_percent_mean": round(mean(samples, "cpu_percent"), 1),
+        "cpu_percent_max": round(max(r["cpu_percent"] for r in samples), 1),
+        "read_bytes": samples[-1]["read_bytes"] - samples[0]["read_bytes"],
+        "write_bytes": samples[-1]["write_bytes"] - samples[0]["write_bytes"],
+        "leak_suspected": (
+            (rss_growth > LEAK_RSS_BYTES and rss_growth > rss_start * LEAK_RSS_RATIO)
+            or fds_growth > LEAK_FDS
+        ),
+    }
+
+
+class _Sampler:
+    """定期采样一组进程的资源使用"""
+
+    def __init__(self, pids: Sequence[int], interval: float):
+        import psutil
+
+        self.psutil = psutil
+        self.interval = interval
+        self.processes = {pid: psutil.Process(pid) for pid in pids}
+        self.samples: Dict[int, List[Dict[str, Any]]] = {pid: [] for pid in pids}
+        for process in self.processes.values():
+            process.cpu_percent()
+
+    def sample(self, elapsed: float):
+        for pid, process in self.processes.items():
+            try:
+                with process.oneshot():
+                    row = {
+                        "t": round(elapsed, 3),
+                        "rss": process.memory_info().rss,
+                        "fds": _num_fds(process),
+                        "cpu_percent": process.cpu_percent(),
+                        "read_bytes": 0,
+                        "write_bytes": 0,
+                    }
+                    try:
+                        io = process.io_counters()
+                        row["read_bytes"] = io.read_bytes
+                        row["write_bytes"] = io.write_bytes
+                    except (AttributeError, self.psutil.AccessDenied):
+                        pass
+            except (self.psutil.NoSuchProcess, self.psutil.AccessDenied):
+                continue
+            self.samples[pid].append(row)
+
+    async def run(self, start: float, stop: asyncio.Event):
+        while not stop.is_set():
+            self.sample(time.perf_counter() - start)
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def _num_fds(process) -> int:
+    """打开的文件描述符数量（Windows上为句柄数）"""
+    if hasattr(process, "num_fds"):
+        return process.num_fds()
+    return process.num_handles()
+
+
+class _Worker:
+    """驱动一个服务进程的闭环客户端：收到上一个响应后才发送下一个请求"""
+
+    def __init__(
+        self,
+        index: int,
+        projects: List[str],
+        summary_chars: int,
+        shared_tasks: bool,
+        timeout: float,
+        seed: int,
+    ):
+        self.index = index
+        self.projects = projects
+        self.summary_chars = summary_chars
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        prefix = "soak" if shared_tasks else f"soak_w{index}"
+        self.tasks = [f"{prefix}_{i}" for i in range(TASKS_PER_WORKER)]
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.client: Optional[StdioClient] = None
+        self.timeouts = 0
+        # 已创建的(项目, 任务)，查询历史只针对它们，避免把"记忆不存在"计为错误
+        self.created: List[tuple] = []
+        self._created_set: set = set()
+
+    def _summary(self) -> str:
+        words = []
+        length = 0
+        while length < self.summary_chars:
+            word = self.random.choice(_SUMMARY_WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)
+
+    def _next_call(self) -> Dict[str, Any]:
+        project = self.random.choice(self.projects)
+        task = self.random.choice(self.tasks)
+        name = self.random.choices(
+            list(OPERATION_WEIGHTS), weights=list(OPERATION_WEIGHTS.values())
+        )[0]
+        if name == "get_memory_history" and self.created:
+            project, task = self.random.choice(self.created)
+            arguments = {"task_name": task, "project_path": project}
+        elif name != "analyze_rule_budget":
+            name = "create_cursor_memory"
+            arguments = {
+                "task_summary": self._summary(),
+                "task_name": task,
+                "project_path": project,
+            }
+            if (project, task) not in self._created_set:
+                self._created_set.add((project, task))
+                self.created.append((project, task))
+        else:
+            arguments = {"project_path": project}
+        return _tool_call(name, arguments)
+
+    async def start(self, env: Dict[str, str]):
+        self.process = await spawn_server(env=env)
+        self.client = StdioClient(self.process, self.timeout)
+        self._reader = asyncio.create_task(self.client.read_responses())
+        await self.client.send(_initialize_message())
+        await self.client.send(
+            {"jsonrpc": "2.0", "method": "notifications/initialized"}
+        )
+
+    async def run(self, stop: asyncio.Event):
+        while not stop.is_set():
+            future = await self.client.send(self._next_call())
+            try:
+                await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+            if self._reader.done():
+                break
+
+    async def close(self):
+        if self.process:
+            await stop_server(self.process)
+            self._reader.cancel()
+
+
+async def run_soak(
+    processes: int = DEFAULT_PROCESSES,
+    projects: int = DEFAULT_PROJECTS,
+    duration: float = DEFAULT_DURATION,
+    interval: float = DEFAULT_INTERVAL,
+    summary_chars: int = DEFAULT_SUMMARY_CHARS,
+    shared_tasks: bool = False,
+    include_samples: bool = False,
+    work_dir: Optional[str] = None,
+    timeout: float = 30.0,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """运行一次浸泡测试并返回报告
+
+    Args:
+        processes: 服务进程数量
+        projects: 共享的临时项目数量
+        duration: 持续时间（秒），不包含进程启动
+        interval: 资源采样间隔（秒）
+        summary_chars: 每次创建记忆的总结长度
+        shared_tasks: 所有进程使用同一批任务名称（会产生并发写同一文件的竞争）
+        include_samples: 报告中包含原始采样数据
+        work_dir: 项目所在目录，默认使用临时目录并在结束后删除
+        timeout: 单个请求的超时时间
+        seed: 随机种子，相同种子生成相同的请求序列
+    """
+    root = Path(work_dir or tempfile.mkdtemp(prefix="cursor_memory_soak_"))
+    project_paths = []
+    for i in range(projects):
+        path = root / f"project_{i}"
+        path.mkdir(parents=True, exist_ok=True)
+        project_paths.append(str(path))
+
+    # 全局存储（包括项目登记表）也放在工作目录下，不污染用户目录
+    env = {
+        **os.environ,
+        "CURSOR_MEMORY_RATE": "0",
+        "CURSOR_MEMORY_GLOBAL_DIR": str(root / "global"),
+    }
+    workers = [
+        _Worker(i, project_paths, summary_chars, shared_tasks, timeout, seed + i)
+        for i in range(processes)
+    ]
+    try:
+        await asyncio.gather(*(w.start(env) for w in workers))
+        sampler = _Sampler([w.process.pid for w in workers], interval)
+        stop = asyncio.Event()
+        start = time.perf_counter()
+        sampling = asyncio.create_task(sampler.run(start, stop))
+        running = [asyncio.create_task(w.run(stop)) for w in workers]
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(*running)
+        elapsed = time.perf_counter() - start
+        await sampling
+        sampler.sample(elapsed)
+    finally:
+        await asyncio.gather(*(w.close() for w in workers))
+        if work_dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    config = {
+        "processes": processes,
+        "projects": projects,
+        "duration_s": duration,
+        "interval_s": interval,
+        "summary_chars": summary_chars,
+        "shared_tasks": shared_tasks,
+        "seed": seed,
+    }
+    return _report(config, workers, sampler, elapsed, include_samples)
+
+
+def _report(
+    config: Dict[str, Any],
+    workers: List[_Worker],
+    sampler: _Sampler,
+    elapsed: float,
+    include_samples: bool,
+) -> Dict[str, Any]:
+    """生成浸泡测试报告"""
+    by_tool: Dict[str, List[float]] = {}
+    errors_by_tool: Dict[str, int] = {}
+    per_process = []
+    for w in workers:
+        client = w.client
+        requests = errors = 0
+        for label, values in client.latencies.items():
+            if label == "initialize":
+                continue
+            tool = label.split(":", 1)[-1]
+            by_tool.setdefault(tool, []).extend(values)
+            label_errors = client.errors.get(label, 0)
+            errors_by_tool[tool] = errors_by_tool.get(tool, 0) + label_errors
+            requests += len(values)
+            errors += label_errors
+        entry = {
+            "worker": w.index,
+            "pid": w.process.pid,
+            "requests": requests,
+            "errors": errors,
+            "timeouts": w.timeouts,
+            "exit_code": w.process.returncode,
+            "resources": summarize_resources(sampler.samples[w.process.pid]),
+        }
+        if include_samples:
+            entry["samples"] = sampler.samples[w.process.pid]
+        per_process.append(entry)
+
+    all_latencies = [v for values in by_tool.values() for v in values]
+    requests = len(all_latencies)
+    errors = sum(errors_by_tool.values())
+    timeouts = sum(w.timeouts for w in workers)
+    resources = [p["resources"] for p in per_process if p["resources"]]
+    return {
+        "schema": REPORT_SCHEMA,
+        "started_at": datetime.now().isoformat(),
+        "config": config,
+        "elapsed_s": round(elapsed, 3),
+        "requests": requests,
+        "errors": errors,
+        "timeouts": timeouts,
+        "error_rate": round((errors + timeouts) / requests, 6) if requests else 0.0,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "latency": latency_stats(all_latencies),
+        "by_tool": {
+            tool: {
+                "count": len(values),
+                "errors": errors_by_tool.get(tool, 0),
+                **latency_stats(values),
+            }
+            for tool, values in sorted(by_tool.items())
+        },
+        "drift": {
+            "rss_growth_max": max((r["rss_growth"] for r in resources), default=0),
+            "rss_slope_bytes_per_min_max": max(
+                (r["rss_slope_bytes_per_min"] for r in resources), default=0
+            ),
+            "fds_growth_max": max((r["fds_growth"] for r in resources), default=0),
+            "leak_suspected": any(r["leak_suspected"] for r in resources),
+        },
+        "processes": per_process,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(
+        prog="cursor-memory-soak", description="多进程浸泡测试"
+    )
+    parser.add_argument(
+        "--processes", type=int, default=DEFAULT_PROCESSES, help="服务进程数量"
+    )
+    parser.add_argument(
+        "--projects", type=int, default=DEFAULT_PROJECTS, help="共享的临时项目数量"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=DEFAULT_DURATION, help="持续时间（秒）"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=DEFAULT_INTERVAL, help="资源采样间隔（秒）"
+    )
+    parser.add_argument(
+        "--summary-chars",
+        type=int,
+        default=DEFAULT_SUMMARY_CHARS,
+        help="每次创建记忆的总结长度",
+    )
+    parser.add_argument(
+        "--shared-tasks", action="store_true", help="所有进程写同一批任务"
+    )
+    parser.add_argument(
+        "--include-samples", action="store_true", help="报告中包含原始采样数据"
+    )
+    parser.add_argument("--work-dir", help="项目目录（默认使用临时目录）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("-o", "--output", default="-", help="报告输出路径")
+    args = parser.parse_args(argv)
+
+    try:
+        import psutil  # noqa: F401
+    except ImportError:
+        print(
+            "错误: 浸泡测试需要psutil，请安装: pip install cursor-memory-mcp[bench]",
+            file=sys.stderr,
+        )
+        return 1
+
+    report = asyncio.run(
+        run_soak(
+            processes=args.processes,
+            projects=args.projects,
+            duration=args.duration,
+            interval=args.interval,
+            summary_chars=args.summary_chars,
+            shared_tasks=args.shared_tasks,
+            include_samples=args.include_samples,
+            work_dir=args.work_dir,
+            seed=args.seed,
+        )
+    )
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    return 1 if report["drift"]["leak_suspected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
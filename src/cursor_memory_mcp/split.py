@@ -0,0 +1,167 @@
+"""
+把过大的总结拆分为多个按主题划分的记忆
+
+一条2MB的记忆对Cursor来说只能整体加载或者不加载。总结超过阈值时，写入路径把它拆成
+若干个较小的 ``<task_name>-pNNN`` 记忆（各自有description和globs），再写一条很小的
+父记忆链接这些部分，Cursor可以只加载相关的部分。
+
+拆分逐行流式进行，每次只保留当前块：优先在Markdown标题处断开（代码块中的 ``#`` 不算），
+块过大时退到段落之间（空行），单个段落过大时在句末标点（含中文的。！？；）处断开，
+都没有时按字符切分，不会把多字节字符切开。
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_SPLIT_BYTES = 64 * 1024
+DEFAULT_CHUNK_BYTES = 16 * 1024
+
+# 块达到上限的该比例后，遇到标题就开始新块；更小的小节合并到一起
+MIN_CHUNK_RATIO = 0.25
+
+TITLE_CHARS = 40
+
+# 从小节中间开始的部分，标题加上该后缀
+CONTINUED_SUFFIX = "（续）"
+
+_HEADING_PATTERN = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$")
+_FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+# 句末标点（之后的空白一并留在前一段）
+_SENTENCE_END_PATTERN = re.compile(r"[。！？；!?;]+\s*|[.]\s+")
+
+
+def split_threshold() -> int:
+    """超过该字节数的总结会被拆分"""
+    return int(os.environ.get("CURSOR_MEMORY_SPLIT_BYTES", DEFAULT_SPLIT_BYTES))
+
+
+def chunk_limit() -> int:
+    """每个部分的最大字节数"""
+    return max(int(os.environ.get("CURSOR_MEMORY_CHUNK_BYTES", DEFAULT_CHUNK_BYTES)), 1)
+
+
+def needs_split(summary: str, threshold: Optional[int] = None) -> bool:
+    """总结是否超过拆分阈值"""
+    threshold = split_threshold() if threshold is None else threshold
+    # UTF-8每个字符最多4字节，明显小于阈值时不用编码
+    if len(summary) * 4 <= threshold:
+        return False
+    return len(summary.encode("utf-8")) > threshold
+
+
+def chunk_name(task_name: str, index: int) -> str:
+    """第index（从1开始）个部分的记忆名称"""
+    return f"{task_name}-p{index:03d}"
+
+
+@dataclass
+class Chunk:
+    """拆分出的一个部分"""
+
+    title: str
+    body: str
+
+
+def _byte_len(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+def _cut_point(text: str, limit: int) -> int:
+    """不超过limit字节的最长前缀的字符数，尽量停在句末，其次是空白"""
+    # 先按字节上限找到字符边界
+    end = len(text.encode("utf-8")[:limit].decode("utf-8", errors="ignore"))
+    best = 0
+    for match in _SENTENCE_END_PATTERN.finditer(text, 0, end):
+        best = match.end()
+    if best == 0:
+        best = text.rfind(" ", 0, end) + 1
+    # 上限小于一个字符时也至少前进一个字符
+    return best or end or 1
+
+
+def _split_long_line(line: str, limit: int) -> Iterator[str]:
+    """把超过limit字节的一行切成多段"""
+    while _byte_len(line) > limit:
+        cut = _cut_point(line, limit)
+        yield line[:cut]
+        line = line[cut:]
+    if line:
+        yield line
+
+
+def _clean_title(text: str) -> str:
+    """标题会写入description，去掉会破坏frontmatter的双引号"""
+    return text.strip().lstrip("#").strip().replace('"', "'")[:TITLE_CHARS]
+
+
+def _title_of(lines: List[str]) -> str:
+    for line in lines:
+        if line.strip():
+            return _clean_title(line)
+    return ""
+
+
+class _Builder:
+    """逐行累积当前块"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.lines: List[str] = []
+        self.size = 0
+        # 当前块所属的标题，块从小节中间开始时标记为续
+        self.title: Optional[str] = None
+        self.continued = False
+        # 最近一个空行之后的位置和到那里为止的字节数，用于在段落之间断开
+        self.paragraph_end: Tuple[int, int] = (0, 0)
+
+    def add(self, line: str):
+        self.lines.append(line)
+        self.size += _byte_len(line)
+        if not line.strip():
+            self.paragraph_end = (len(self.lines), self.size)
+
+    def take(self, upto: Optional[int] = None) -> Chunk:
+        """取出前upto行作为一个块，剩下的行留在新块中"""
+        upto = len(self.lines) if upto is None else upto
+        lines, rest = self.lines[:upto], self.lines[upto:]
+        title = self.title or _title_of(lines)
+        if self.continued and title:
+            title = f"{title}{CONTINUED_SUFFIX}"
+        chunk = Chunk(title, "".join(lines).strip("\n"))
+        self.lines = rest
+        self.size = sum(_byte_len(line) for line in rest)
+        self.paragraph_end = (0, 0)
+        self.continued = self.title is not None
+        return chunk
+
+
+def iter_chunks(lines: Iterable[str], limit: Optional[int] = None) -> Iterator[Chunk]:
+    """流式地把总结的各行切分为块
+
+    Args:
+        lines: 总结的各行（保留行尾换行符），例如 ``io.StringIO(text)``
+        limit: 每块的最大字节数，默认取 :func:`chunk_limit`
+    """
+    limit = chunk_limit() if limit is None else limit
+    builder = _Builder(limit)
+    in_fence = False
+    for raw in lines:
+        heading = None if in_fence else _HEADING_PATTERN.match(raw)
+        if _FENCE_PATTERN.match(raw):
+            in_fence = not in_fence
+        if heading and builder.size >= limit * MIN_CHUNK_RATIO:
+            yield builder.take()
+            builder.continued = False
+        if heading and not builder.lines:
+            builder.title = _clean_title(heading.group(1))
+        for line in _split_long_line(raw, limit):
+            if builder.size + _byte_len(line) > limit and builder.lines:
+                lines_end, size = builder.paragraph_end
+                # 后半段有空行时在段落之间断开，剩下的段落留给下一块
+                upto = lines_end if size >= limit / 2 else None
+                yield builder.take(upto)
+            builder.add(line)
+    if any(line.strip() for line in builder.lines):
+        yield builder.take()
@@ -0,0 +1,998 @@
+"""
+项目记忆的库接口
+
+:class:`MemoryStore` 负责创建（含脱敏、globs和关键词、近似重复检测、拆分、历史版本）、
+追加、按小节修改、列出、读取、删除记忆和读取历史版本。MCP工具只是把JSON参数转换为对它的调用；同一进程内的批处理
+脚本可以直接使用它，批量创建时共用布局和清单的写入。
+"""
+
+import contextlib
+import contextvars
+import io
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import reduce
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from pydantic import BaseModel, Field, field_validator
+
+from .access import get_access_counters
+from .append import append_section, format_section, open_locked
+from .frontmatter import parse_memory_file, render_memory_file, set_field
+from .gitinfo import GitRevision, current_revision
+from .globs import derive_globs
+from .history import archive_append, archive_version, get_version, list_versions
+from .keywords import (
+    DEFAULT_KEYWORDS,
+    TermStats,
+    describe,
+    extract_keywords,
+    get_term_stats,
+)
+from .layout import (
+    CHUNKS_FIELD,
+    MemoryLayout,
+    content_hash,
+    get_layout,
+    global_store_path,
+)
+from .minhash import (
+    DEFAULT_THRESHOLD,
+    get_signature_store,
+    merge_signatures,
+    minhash_signature,
+)
+from .patch import Patch, parse_patch, update_memory_file
+from .profiling import to_thread
+from .redaction import Redactor
+from .split import CONTINUED_SUFFIX, chunk_name, iter_chunks, needs_split
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+SCOPE_PROJECT = "project"
+SCOPE_GLOBAL = "global"
+SCOPE_BOTH = "both"
+SCOPES = (SCOPE_PROJECT, SCOPE_GLOBAL, SCOPE_BOTH)
+
+DUPLICATE_REPORT = "report"
+DUPLICATE_MERGE = "merge"
+DUPLICATE_ACTIONS = (DUPLICATE_REPORT, DUPLICATE_MERGE)
+
+# 任务名称用作文件名，创建和导入使用同一组规则
+MAX_TASK_NAME_LENGTH = 50
+
+
+def _validate_project_path(v: str) -> str:
+    """验证项目路径存在且是目录，返回规范化后的绝对路径"""
+    if not v or not v.strip():
+        raise ValueError("project_path不能为空")
+
+    path = Path(v.strip())
+    if not path.exists():
+        raise ValueError(f"项目路径不存在: {v}")
+    if not path.is_dir():
+        raise ValueError(f"项目路径必须是一个目录: {v}")
+
+    return str(path.resolve())
+
+
+def _validate_task_name(v: str) -> str:
+    """验证任务名称只包含可用作文件名的字符，且不超过最大长度"""
+    if not re.match(r"^[a-zA-Z0-9_-]+$", v):
+        raise ValueError("task_name只允许字母、数字、下划线、连字符")
+    if len(v) > MAX_TASK_NAME_LENGTH:
+        raise ValueError(f"task_name不能超过{MAX_TASK_NAME_LENGTH}个字符")
+    return v
+
+
+def _scope_targets(scope: str, project_path: str) -> Dict[str, str]:
+    """写入位置 -> 存储根目录"""
+    targets = {}
+    if scope in (SCOPE_PROJECT, SCOPE_BOTH):
+        targets[SCOPE_PROJECT] = project_path
+    if scope in (SCOPE_GLOBAL, SCOPE_BOTH):
+        store = str(global_store_path().resolve())
+        # 项目本身就是全局存储时只写一次
+        if targets.get(SCOPE_PROJECT) != store:
+            targets[SCOPE_GLOBAL] = store
+    return targets
+
+
+def _create_response(results: Dict[str, Any], globs: str) -> Dict[str, Any]:
+    """合并各个存储位置的写入结果
+
+    只写入一个位置时保持原有的响应格式；写入多个位置时在 ``targets`` 中逐个报告，
+    部分失败时 ``success`` 为false且 ``partial`` 为true。
+    """
+    errors = {
+        scope: f"文件操作失败: {result}"
+        for scope, result in results.items()
+        if isinstance(result, BaseException)
+    }
+    for scope, error in errors.items():
+        logger.error(f"写入{scope}记忆失败: {error}")
+    if len(errors) == len(results):
+        return {"error": "; ".join(errors.values())}
+
+    written = {s: r for s, r in results.items() if s not in errors}
+    primary = written.get(SCOPE_PROJECT) or next(iter(written.values()))
+    version = primary.get("version")
+    response: Dict[str, Any] = {
+        "success": not errors,
+        "message": "成功创建记忆文件",
+        "file_path": primary["file_path"],
+        "version": version,
+        "globs": globs,
+        "created_at": datetime.now().isoformat(),
+    }
+    if primary.get("merged_into"):
+        response["merged_into"] = primary["merged_into"]
+        response["message"] = f"发现近似重复的记忆，已合并到: {primary['merged_into']}"
+    elif version > 1:
+        response["message"] = f"成功更新记忆文件，旧版本已存入历史: v{version - 1}"
+    if primary.get("duplicates"):
+        response["duplicates"] = primary["duplicates"]
+    if primary.get("chunks"):
+        response["chunks"] = primary["chunks"]
+        response["message"] += f"，已拆分为{len(primary['chunks'])}个部分"
+    if len(results) > 1:
+        response["targets"] = {
+            scope: {"error": errors[scope]} if scope in errors else written[scope]
+            for scope in results
+        }
+    if errors:
+        response["partial"] = True
+        response["message"] = f"部分写入失败: {', '.join(errors)}"
+    return response
+
+
+class CreateMemoryRequest(BaseModel):
+    """创建记忆文件的请求模型"""
+
+    task_summary: str = Field(
+        ..., description="当前任务执行的详细上下文总结", min_length=1
+    )
+    task_name: str = Field(
+        ...,
+        description="当前任务的简短名称，用作文件名",
+        min_length=1,
+        max_length=MAX_TASK_NAME_LENGTH,
+    )
+    project_path: str = Field(..., description="当前项目的绝对路径")
+    task_description: Optional[str] = Field(None, description="任务的详细描述")
+    auto_globs: bool = Field(True, description="是否根据总结中提到的文件自动生成globs")
+    auto_description: bool = Field(
+        True, description="是否从总结中提取关键词生成description"
+    )
+    split: bool = Field(True, description="总结过大时是否拆分为多个部分")
+    scope: str = Field(
+        SCOPE_PROJECT, description="写入位置: project项目, global全局存储, both两者"
+    )
+
+    on_duplicate: str = Field(
+        DUPLICATE_REPORT,
+        description="发现近似重复的记忆时: report在响应中报告, merge追加到最相似的记忆",
+    )
+    duplicate_threshold: float = Field(
+        DEFAULT_THRESHOLD, description="近似重复的Jaccard相似度阈值", gt=0, le=1
+    )
+
+    @field_validator("task_name")
+    def validate_task_name(cls, v):
+        """验证任务名称格式"""
+        return _validate_task_name(v)
+
+    @field_validator("on_duplicate")
+    def validate_on_duplicate(cls, v):
+        """验证近似重复的处理方式"""
+        if v not in DUPLICATE_ACTIONS:
+            raise ValueError(f"on_duplicate只能是: {', '.join(DUPLICATE_ACTIONS)}")
+        return v
+
+    @field_validator("scope")
+    def validate_scope(cls, v):
+        """验证写入位置"""
+        if v not in SCOPES:
+            raise ValueError(f"scope只能是: {', '.join(SCOPES)}")
+        return v
+
+    @field_validator("task_summary")
+    def validate_task_summary(cls, v):
+        """验证任务总结不为空"""
+        if not v or not v.strip():
+            raise ValueError("task_summary不能为空字符串")
+        return v.strip()
+
+    @field_validator("project_path")
+    def validate_project_path(cls, v):
+        """验证项目路径是否存在"""
+        return _validate_project_path(v)
+
+
+def _best_effort(name: str, default: Any, func, *args) -> Any:
+    """执行可选的步骤，失败时记录警告并返回默认值"""
+    try:
+        with span(name):
+            return func(*args)
+    except Exception as e:
+        logger.warning(f"{name} 失败: {e}")
+        return default
+
+
+def generate_file_content(
+    task_description: str,
+    task_summary: str,
+    globs: str = "",
+    revision: Optional[GitRevision] = None,
+    keywords: Optional[List[str]] = None,
+) -> str:
+    """生成文件内容，项目在git仓库中时附带写入时的分支和提交
+
+    有关键词时description为 ``<任务描述>: <关键词>``，让Cursor能区分各条记忆。
+    """
+    description = (
+        f"{task_description}: {', '.join(keywords)}"
+        if keywords
+        else f"get the summary of previous step: {task_description}"
+    )
+    fields: Dict[str, Any] = {
+        "description": description,
+        "globs": globs,
+        "alwaysApply": False,
+    }
+    if revision is not None:
+        fields["branch"] = revision.branch
+        fields["commit"] = revision.commit
+    return render_memory_file(fields, task_summary)
+
+
+class _Batch:
+    """批量写入时各存储位置共用的布局实例、已创建的目录和待登记的清单条目
+
+    批次内不再调用 :func:`get_layout`：文件已写入但还没登记时，目录修改时间与清单
+    不一致，每次调用都会触发重建。所有文件写完后每个存储位置只写一次清单。
+    """
+
+    def __init__(self):
+        self.layouts: Dict[str, MemoryLayout] = {}
+        self.pending: Dict[str, Dict[str, Tuple[Path, str]]] = {}
+        self.dirs: Set[Path] = set()
+
+    def layout(self, store_path: str) -> MemoryLayout:
+        layout = self.layouts.get(store_path)
+        if layout is None:
+            layout = self.layouts[store_path] = get_layout(store_path)
+            self.pending[store_path] = {}
+        return layout
+
+    def flush(self):
+        for store_path, items in self.pending.items():
+            self.layouts[store_path].register_many(items)
+            items.clear()
+
+
+class MemoryStore:
+    """项目记忆的库接口
+
+    同一进程内的批处理脚本（迁移、在CI中记录记忆）直接使用它，不经过MCP和JSON；
+    MCP工具也只是它的一层适配。每个操作都有同步版本和 ``a`` 开头的异步版本
+    （在线程中执行同步版本）。
+
+        store = MemoryStore("/path/to/project")
+        store.create("login", "实现了登录接口……")
+        store.append("login", "加上了验证码")
+        store.create_many([{"task_name": "a", "task_summary": "……"}, ...])
+
+    参数错误抛出 ``pydantic.ValidationError`` （``ValueError`` 的子类），所有存储位置
+    都写入失败时抛出 ``OSError``，记忆或版本不存在时抛出 ``KeyError``。
+    """
+
+    def __init__(self, project_path: str, redactor: Optional[Redactor] = None):
+        self.project_path = _validate_project_path(project_path)
+        self.redactor = redactor or Redactor.from_env()
+
+    def _request(self, task_name: str, task_summary: str, **options: Any):
+        return CreateMemoryRequest(
+            project_path=self.project_path,
+            task_name=task_name,
+            task_summary=task_summary,
+            **options,
+        )
+
+    def create(
+        self, task_name: str, task_summary: str, **options: Any
+    ) -> Dict[str, Any]:
+        """创建或覆盖一条记忆，返回和 ``create_cursor_memory`` 工具相同的结果
+
+        Args:
+            task_name: 记忆名称（用作文件名）
+            task_summary: 总结正文
+            **options: ``CreateMemoryRequest`` 的其它字段，例如 ``scope``、
+                ``on_duplicate``、``split``
+        """
+        with span("validate"):
+            request = self._request(task_name, task_summary, **options)
+        return self.create_from(request)
+
+    def create_from(self, request: CreateMemoryRequest) -> Dict[str, Any]:
+        """执行已校验的创建请求"""
+        redacted = self._prepare(request)
+        revision = _best_effort(
+            "git_revision", None, current_revision, request.project_path
+        )
+        # 过大的总结拆分为多个部分和一条链接它们的父记忆
+        targets = _scope_targets(request.scope, request.project_path)
+        if request.split and needs_split(request.task_summary):
+            globs = ""
+            with span("split"):
+                outcome = self._store_split(targets, request, revision)
+        else:
+            globs, outcome = self._store_single(targets, request, revision)
+        return self._result(outcome, globs, redacted)
+
+    def create_many(
+        self, items: Iterable[Mapping[str, Any]], **defaults: Any
+    ) -> List[Dict[str, Any]]:
+        """批量创建记忆，按顺序返回每条的结果
+
+        写入之前校验所有条目（名称在批次内不能重复），然后共用每个存储位置的
+        布局实例、签名库和同一份文档频率，所有文件写完后每个存储位置只写一次清单。
+        某条写入失败时抛出 ``OSError``，之前写入的记忆保留并已登记。
+
+        Args:
+            items: 每条记忆的参数，字段同 :meth:`create`
+            **defaults: 所有条目共用的参数，条目中的同名字段优先
+        """
+        with span("validate", items=0) as validate_span:
+            requests = [self._request(**{**defaults, **item}) for item in items]
+            validate_span.set_attribute("items", len(requests))
+        names = Counter(request.task_name for request in requests)
+        repeated = sorted(name for name, count in names.items() if count > 1)
+        if repeated:
+            raise ValueError(f"批次中的task_name重复: {', '.join(repeated)}")
+
+        revision = _best_effort(
+            "git_revision", None, current_revision, self.project_path
+        )
+        stats = _best_effort("term_stats", None, get_term_stats, self.project_path)
+        batch = _Batch()
+        results = []
+        try:
+            for request in requests:
+                redacted = self._prepare(request)
+                targets = _scope_targets(request.scope, request.project_path)
+                if request.split and needs_split(request.task_summary):
+                    # 拆分的部分逐个登记清单，先登记批次中已写入的文件
+                    batch.flush()
+                    batch = _Batch()
+                    with span("split"):
+                        outcome = self._store_split(targets, request, revision)
+                    globs = ""
+                else:
+                    globs, outcome = self._store_single(
+                        targets, request, revision, stats, batch
+                    )
+                results.append(self._result(outcome, globs, redacted))
+        finally:
+            batch.flush()
+        logger.info(f"批量创建了 {len(results)} 条记忆: {self.project_path}")
+        return results
+
+    def list(self) -> List[Dict[str, Any]]:
+        """从清单列出记忆，不扫描目录"""
+        layout = get_layout(self.project_path)
+        return [
+            {
+                "name": name,
+                "description": meta["description"],
+                "bytes": meta["size"],
+                "created_at": meta["created"],
+                "modified_at": datetime.fromtimestamp(meta["modified"] / 1e9).isoformat(
+                    timespec="seconds"
+                ),
+            }
+            for name, meta in sorted(layout.memories.items())
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """布局、记忆数量和总大小（只读清单）"""
+        return get_layout(self.project_path).stats()
+
+    def read(self, task_name: str) -> Dict[str, Any]:
+        """读取记忆的frontmatter和正文，并记录一次访问
+
+        Raises:
+            KeyError: 记忆不存在
+        """
+        layout = get_layout(self.project_path)
+        if not layout.exists(task_name):
+            raise KeyError(f"记忆不存在: {task_name}")
+        file_path = layout.path_for(task_name)
+        try:
+            content = file_path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            raise KeyError(f"记忆不存在: {task_name}") from None
+        fields, body = parse_memory_file(content)
+        get_access_counters(self.project_path).record([task_name])
+        return {
+            "name": task_name,
+            "file_path": str(file_path),
+            "fields": fields,
+            "body": body,
+            "hash": content_hash(content),
+        }
+
+    def delete(self, task_name: str) -> bool:
+        """删除记忆和拆分出的各个部分，历史版本保留；记忆不存在时返回False"""
+        layout = get_layout(self.project_path)
+        if not layout.exists(task_name):
+            return False
+        chunks = layout.chunks_of(task_name)
+        layout.path_for(task_name).unlink(missing_ok=True)
+        layout.unregister([task_name])
+        self._remove_chunks(layout, task_name, chunks)
+        logger.info(f"已删除记忆: {task_name}")
+        return True
+
+    def append(
+        self, task_name: str, note: str, title: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """向记忆末尾原地追加带时间戳的小节，追加前的内容存为历史版本
+
+        返回和 ``append_cursor_memory`` 工具相同的字段（文件路径、版本、追加方式、
+        追加的字节数、新的大小，有替换时还有 ``redacted``）。
+
+        Raises:
+            KeyError: 记忆不存在
+        """
+        redacted: Counter = Counter()
+        if self.redactor.enabled:
+            with span("redact"):
+                note = self._redact(note, redacted)
+                title = self._redact(title, redacted) if title else title
+        section = format_section(note, title)
+
+        layout = get_layout(self.project_path)
+        if not layout.exists(task_name):
+            raise KeyError(f"记忆不存在: {task_name}")
+        file_path = layout.path_for(task_name)
+        version = 0
+
+        def archive(stat: os.stat_result):
+            nonlocal version
+            old_mtime = datetime.fromtimestamp(stat.st_mtime)
+            with span("archive_version"):
+                version = archive_append(
+                    self.project_path, task_name, stat.st_size, old_mtime
+                )
+
+        try:
+            with span("append", bytes=len(section.encode("utf-8"))) as append_span:
+                result = append_section(file_path, section, archive)
+                append_span.set_attribute("mode", result.mode)
+        except FileNotFoundError:
+            raise KeyError(f"记忆不存在: {task_name}") from None
+        layout.register_append(task_name, file_path)
+        logger.info(f"成功追加记忆: {file_path} ({result.mode}, v{version})")
+        return {
+            "file_path": str(file_path),
+            "version": version,
+            "mode": result.mode,
+            "bytes_appended": result.bytes_appended,
+            "size": result.size,
+            **({"redacted": dict(redacted)} if redacted else {}),
+        }
+
+    def update(
+        self,
+        task_name: str,
+        expected_hash: str,
+        patches: Sequence[Union[Patch, Mapping[str, Any]]],
+    ) -> Dict[str, Any]:
+        """在文件锁内按小节修改记忆，旧内容存为历史版本
+
+        Args:
+            task_name: 记忆名称
+            expected_hash: 调用方读取记忆时的内容哈希
+            patches: 按顺序应用的补丁（:class:`Patch` 或工具参数中的字典）
+
+        Returns:
+            文件路径、新的版本号和内容哈希，有替换时还有 ``redacted``
+
+        Raises:
+            KeyError: 记忆不存在
+            HashMismatch: 记忆在调用方读取之后被修改过
+            PatchError: 补丁无效或无法应用
+        """
+        patches = [
+            patch if isinstance(patch, Patch) else parse_patch(dict(patch))
+            for patch in patches
+        ]
+        redacted: Counter = Counter()
+        if self.redactor.enabled:
+            with span("redact"):
+                for patch in patches:
+                    if patch.content:
+                        patch.content = self._redact(patch.content, redacted)
+                    if isinstance(patch.value, str) and patch.value:
+                        patch.value = self._redact(patch.value, redacted)
+
+        layout = get_layout(self.project_path)
+        if not layout.exists(task_name):
+            raise KeyError(f"记忆不存在: {task_name}")
+        file_path = layout.path_for(task_name)
+        version = 0
+
+        def archive(old_content: str, content: str):
+            nonlocal version
+            old_mtime = datetime.fromtimestamp(file_path.stat().st_mtime)
+            with span("archive_version"):
+                version = archive_version(
+                    self.project_path, task_name, old_content, content, old_mtime
+                )
+
+        try:
+            with span("patch", patches=len(patches)):
+                result = update_memory_file(file_path, expected_hash, patches, archive)
+        except FileNotFoundError:
+            raise KeyError(f"记忆不存在: {task_name}") from None
+        layout.register(task_name, file_path, result.content)
+        logger.info(f"成功更新记忆文件: {file_path} (v{version})")
+        return {
+            "file_path": str(file_path),
+            "version": version,
+            "hash": result.hash,
+            **({"redacted": dict(redacted)} if redacted else {}),
+        }
+
+    def history(self, task_name: str) -> Dict[str, Any]:
+        """列出记忆的历史版本和当前版本
+
+        Raises:
+            KeyError: 记忆不存在，也没有历史
+        """
+        live_file = get_layout(self.project_path).path_for(task_name)
+        history = list_versions(self.project_path, task_name, live_file)
+        if not history["versions"]:
+            raise KeyError(f"记忆不存在: {task_name}")
+        return history
+
+    def version(self, task_name: str, version: int) -> Dict[str, Any]:
+        """读取记忆的指定版本并记录一次访问
+
+        Raises:
+            KeyError: 版本不存在
+        """
+        live_file = get_layout(self.project_path).path_for(task_name)
+        try:
+            content = get_version(self.project_path, task_name, version, live_file)
+        except (KeyError, FileNotFoundError):
+            raise KeyError(f"版本不存在: {task_name} v{version}") from None
+        get_access_counters(self.project_path).record([task_name])
+        return {
+            "task_name": task_name,
+            "version": version,
+            "hash": content_hash(content),
+            "content": content,
+        }
+
+    async def acreate(self, task_name: str, task_summary: str, **options: Any):
+        """:meth:`create` 的异步版本"""
+        return await to_thread(self.create, task_name, task_summary, **options)
+
+    async def acreate_from(self, request: CreateMemoryRequest) -> Dict[str, Any]:
+        """:meth:`create_from` 的异步版本"""
+        return await to_thread(self.create_from, request)
+
+    async def acreate_many(
+        self, items: Iterable[Mapping[str, Any]], **defaults: Any
+    ) -> List[Dict[str, Any]]:
+        """:meth:`create_many` 的异步版本"""
+        return await to_thread(self.create_many, items, **defaults)
+
+    async def alist(self) -> List[Dict[str, Any]]:
+        """:meth:`list` 的异步版本"""
+        return await to_thread(self.list)
+
+    async def aread(self, task_name: str) -> Dict[str, Any]:
+        """:meth:`read` 的异步版本"""
+        return await to_thread(self.read, task_name)
+
+    async def adelete(self, task_name: str) -> bool:
+        """:meth:`delete` 的异步版本"""
+        return await to_thread(self.delete, task_name)
+
+    async def aappend(
+        self, task_name: str, note: str, title: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """:meth:`append` 的异步版本"""
+        return await to_thread(self.append, task_name, note, title)
+
+    async def aupdate(
+        self,
+        task_name: str,
+        expected_hash: str,
+        patches: Sequence[Union[Patch, Mapping[str, Any]]],
+    ) -> Dict[str, Any]:
+        """:meth:`update` 的异步版本"""
+        return await to_thread(self.update, task_name, expected_hash, patches)
+
+    async def ahistory(self, task_name: str) -> Dict[str, Any]:
+        """:meth:`history` 的异步版本"""
+        return await to_thread(self.history, task_name)
+
+    async def aversion(self, task_name: str, version: int) -> Dict[str, Any]:
+        """:meth:`version` 的异步版本"""
+        return await to_thread(self.version, task_name, version)
+
+    def _prepare(self, request: CreateMemoryRequest) -> Counter:
+        """写入之前对总结和描述脱敏并补全默认描述，返回各模式的替换次数"""
+        redacted: Counter = Counter()
+        if self.redactor.enabled:
+            with span("redact"):
+                request.task_summary = self._redact(request.task_summary, redacted)
+                if request.task_description:
+                    request.task_description = self._redact(
+                        request.task_description, redacted
+                    )
+        if not request.task_description:
+            request.task_description = request.task_name
+        return redacted
+
+    def _redact(self, text: str, counts: Counter) -> str:
+        redacted, found = self.redactor.redact(text)
+        counts.update(found)
+        return redacted
+
+    @staticmethod
+    def _result(
+        outcome: Dict[str, Any], globs: str, redacted: Counter
+    ) -> Dict[str, Any]:
+        response = _create_response(outcome, globs)
+        if "error" in response:
+            raise OSError(response["error"])
+        if redacted:
+            response["redacted"] = dict(redacted)
+        return response
+
+    def _frontmatter_extras(
+        self,
+        request: CreateMemoryRequest,
+        summary: str,
+        stats: Optional[TermStats] = None,
+    ) -> Tuple[str, List[str]]:
+        """推导globs和提取description的关键词，失败时不影响记忆写入
+
+        Args:
+            stats: 提取关键词使用的文档频率，默认取项目当前的
+        """
+        globs = ""
+        if request.auto_globs:
+            # 根据总结中提到的文件推导globs
+            globs = _best_effort(
+                "derive_globs", "", derive_globs, request.project_path, summary
+            )
+        keywords: List[str] = []
+        if request.auto_description:
+            # 从总结中提取关键词写入description，失败时退回固定模板
+            if stats is None:
+                keywords = _best_effort(
+                    "keywords", [], describe, request.project_path, summary
+                )
+            else:
+                keywords = _best_effort(
+                    "keywords", [], extract_keywords, summary, stats
+                )
+        return globs, keywords
+
+    def _store_single(
+        self,
+        targets: Dict[str, str],
+        request: CreateMemoryRequest,
+        revision: Optional[GitRevision],
+        stats: Optional[TermStats] = None,
+        batch: Optional[_Batch] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """把总结作为一条记忆写入各个存储位置，返回 (globs, 各位置的结果)
+
+        写入多个位置时并发进行；结果中写入失败的位置是异常对象。
+        """
+        globs, keywords = self._frontmatter_extras(request, request.task_summary, stats)
+        # 生成文件内容，所有存储位置共用同一份
+        content = generate_file_content(
+            request.task_description, request.task_summary, globs, revision, keywords
+        )
+        if len(targets) == 1:
+            scope, store = next(iter(targets.items()))
+            try:
+                return globs, {
+                    scope: self._store_memory(store, request, content, batch)
+                }
+            except Exception as e:
+                return globs, {scope: e}
+
+        results: Dict[str, Any] = {}
+        with ThreadPoolExecutor(len(targets)) as executor:
+            futures = {
+                scope: executor.submit(
+                    contextvars.copy_context().run,
+                    self._store_memory,
+                    store,
+                    request,
+                    content,
+                    batch,
+                )
+                for scope, store in targets.items()
+            }
+            for scope, future in futures.items():
+                try:
+                    results[scope] = future.result()
+                except Exception as e:
+                    results[scope] = e
+        return globs, results
+
+    def _store_split(
+        self,
+        targets: Dict[str, str],
+        request: CreateMemoryRequest,
+        revision: Optional[GitRevision],
+    ) -> Dict[str, Any]:
+        """流式拆分总结，逐个部分写入各存储位置，最后写入链接各部分的父记忆
+
+        每个部分有自己的globs、description和近似重复检测的签名；父记忆的签名是
+        各部分签名的合并，相当于整个总结的签名。拆分写入不检测近似重复。
+        """
+        failed: Dict[str, BaseException] = {}
+        chunks: List[Dict[str, Any]] = []
+        signatures = []
+        # 父记忆改写之前记录的各个部分，写完后删除不再需要的
+        owned = {
+            scope: get_layout(store).chunks_of(request.task_name)
+            for scope, store in targets.items()
+        }
+        # 各部分的关键词都按写入之前的文档频率提取，不必每写一个部分就更新一次
+        stats = _best_effort("term_stats", None, get_term_stats, request.project_path)
+        for index, chunk in enumerate(iter_chunks(io.StringIO(request.task_summary))):
+            name = chunk_name(request.task_name, index + 1)
+            globs, keywords = self._frontmatter_extras(request, chunk.body, stats)
+            content = generate_file_content(
+                f"{request.task_description} - {chunk.title}",
+                chunk.body,
+                globs,
+                revision,
+                keywords,
+            )
+            signature = minhash_signature(chunk.body)
+            for scope, store in targets.items():
+                if scope in failed:
+                    continue
+                try:
+                    self._write_memory_file(store, name, content)
+                except Exception as e:
+                    failed[scope] = e
+            signatures.append((name, signature))
+            chunks.append(
+                {
+                    "name": name,
+                    "title": chunk.title,
+                    "bytes": len(chunk.body.encode("utf-8")),
+                    "globs": globs,
+                }
+            )
+
+        results: Dict[str, Any] = dict(failed)
+        for scope, store in targets.items():
+            if scope in failed:
+                continue
+            try:
+                content = self._index_content(store, request, chunks, revision)
+                result = self._write_memory_file(store, request.task_name, content)
+                merged = reduce(merge_signatures, (s for _, s in signatures))
+                get_signature_store(store).add_many(
+                    [*signatures, (request.task_name, merged)]
+                )
+                names = {chunk["name"] for chunk in chunks}
+                self._remove_chunks(
+                    get_layout(store),
+                    request.task_name,
+                    [name for name in owned[scope] if name not in names],
+                )
+                results[scope] = {**result, "chunks": chunks}
+            except Exception as e:
+                results[scope] = e
+        return {scope: results[scope] for scope in targets}
+
+    def _index_content(
+        self,
+        store_path: str,
+        request: CreateMemoryRequest,
+        chunks: List[Dict[str, Any]],
+        revision: Optional[GitRevision],
+    ) -> str:
+        """父记忆：按顺序链接各个部分，description取前几个部分的标题"""
+        layout = get_layout(store_path)
+        parent_dir = layout.path_for(request.task_name).parent
+        lines = [
+            f"{request.task_description} 的总结较大，已按主题拆分为 "
+            f"{len(chunks)} 个部分，需要时读取相关的部分：",
+            "",
+        ]
+        titles: List[str] = []
+        for chunk in chunks:
+            path = os.path.relpath(layout.path_for(chunk["name"]), parent_dir)
+            lines.append(f"- [{chunk['title'] or chunk['name']}]({path})")
+            title = chunk["title"].removesuffix(CONTINUED_SUFFIX)
+            if title and title not in titles:
+                titles.append(title)
+        content = generate_file_content(
+            request.task_description,
+            "\n".join(lines),
+            revision=revision,
+            keywords=titles[:DEFAULT_KEYWORDS],
+        )
+        # 记录父记忆拥有的部分，以后只删除这些，不误删名称相似的其它记忆
+        return set_field(content, CHUNKS_FIELD, ",".join(c["name"] for c in chunks))
+
+    def _remove_chunks(self, layout: MemoryLayout, task_name: str, names: List[str]):
+        """删除父记忆以前拆分出的、不再需要的部分
+
+        Args:
+            names: 要删除的部分，取自父记忆的清单条目，见 ``chunks_of``
+        """
+        stale = [name for name in names if layout.exists(name)]
+        for name in stale:
+            layout.path_for(name).unlink(missing_ok=True)
+        layout.unregister(stale)
+        if stale:
+            logger.info(f"已删除以前拆分的 {len(stale)} 个部分: {task_name}")
+
+    def _store_memory(
+        self,
+        store_path: str,
+        request: CreateMemoryRequest,
+        content: str,
+        batch: Optional[_Batch] = None,
+    ) -> Dict[str, Any]:
+        """检测近似重复后写入一个存储位置
+
+        按请求报告近似重复的记忆，或者把总结作为新的小节追加到最相似的记忆中。
+        """
+        with span("near_duplicates"):
+            layout = batch.layout(store_path) if batch else get_layout(store_path)
+            signatures = get_signature_store(store_path)
+            signature = minhash_signature(request.task_summary)
+            duplicates = [
+                {"name": name, "similarity": similarity}
+                for name, similarity in signatures.query(
+                    signature, request.duplicate_threshold, exclude=request.task_name
+                )
+                if layout.exists(name)
+            ]
+
+        if duplicates and request.on_duplicate == DUPLICATE_MERGE:
+            target = duplicates[0]["name"]
+            file_path = layout.path_for(target)
+            version = 0
+
+            def archive(stat: os.stat_result):
+                # 合并前的内容存为目标记忆的历史版本
+                nonlocal version
+                old_mtime = datetime.fromtimestamp(stat.st_mtime)
+                with span("archive_version"):
+                    version = archive_append(
+                        store_path, target, stat.st_size, old_mtime
+                    )
+
+            try:
+                append_section(
+                    file_path,
+                    format_section(request.task_summary, request.task_name),
+                    archive,
+                )
+                layout.register_append(target, file_path)
+            except Exception as e:
+                raise OSError(f"合并到记忆失败: {e}") from e
+            signatures.add(
+                target, merge_signatures(signatures.signatures[target], signature)
+            )
+            logger.info(f"近似重复，已合并到: {file_path}")
+            return {
+                "file_path": str(file_path),
+                "version": version,
+                "merged_into": target,
+                "duplicates": duplicates,
+            }
+
+        chunks = layout.chunks_of(request.task_name)
+        result = self._write_memory_file(store_path, request.task_name, content, batch)
+        signatures.add(request.task_name, signature)
+        # 以前被拆分过的记忆，现在整体写入，删除旧的各个部分
+        self._remove_chunks(layout, request.task_name, chunks)
+        if duplicates:
+            result["duplicates"] = duplicates
+        return result
+
+    def _write_memory_file(
+        self,
+        store_path: str,
+        task_name: str,
+        content: str,
+        batch: Optional[_Batch] = None,
+    ) -> Dict[str, Any]:
+        """把记忆写入一个存储位置（项目或全局存储），返回文件路径和版本号
+
+        Args:
+            batch: 给出时目录只创建一次，清单由批次在最后统一登记
+        """
+        # 分片布局下文件位于子目录
+        layout = batch.layout(store_path) if batch else get_layout(store_path)
+        file_path = layout.path_for(task_name)
+
+        # 确保.cursor/rules目录（及分片目录）存在
+        if batch is None or file_path.parent not in batch.dirs:
+            try:
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                logger.info(f"确保.cursor/rules目录存在: {file_path.parent}")
+            except Exception as e:
+                raise OSError(f"无法创建.cursor/rules目录: {e}") from e
+            if batch is not None:
+                batch.dirs.add(file_path.parent)
+
+        try:
+            # 文件已存在时持有与追加相同的文件锁，并发的追加等新文件就位后再写入，
+            # 不会落在被替换掉的旧文件上
+            lock = (
+                os.fdopen(open_locked(file_path), "rb+", buffering=0)
+                if layout.exists(task_name)
+                else contextlib.nullcontext()
+            )
+            with lock as locked:
+                # 旧内容以增量形式存入历史，只保留最新版本
+                version = 1
+                if locked is not None:
+                    with span("archive_version"):
+                        old_content = locked.read().decode("utf-8")
+                        old_mtime = datetime.fromtimestamp(file_path.stat().st_mtime)
+                        version = archive_version(
+                            store_path, task_name, old_content, content, old_mtime
+                        )
+
+                # 使用临时文件确保原子操作；并发写入同名记忆时各用各的临时文件
+                temp_file = file_path.with_suffix(
+                    f".{os.getpid()}.{threading.get_ident()}.tmp"
+                )
+                with span("write", bytes=len(content.encode("utf-8"))):
+                    with open(temp_file, "w", encoding="utf-8") as f:
+                        f.write(content)
+
+                # 替换为正式文件
+                with span("rename"):
+                    temp_file.replace(file_path)
+            if batch is None:
+                layout.register(task_name, file_path, content)
+            else:
+                batch.pending[store_path][task_name] = (file_path, content)
+        except Exception as e:
+            raise OSError(f"写入文件失败: {e}") from e
+
+        logger.info(f"成功创建记忆文件: {file_path} (v{version})")
+        return {"file_path": str(file_path), "version": version}
@@ -0,0 +1,186 @@
+"""
+汇总追踪文件中的延迟分布
+
+读取 :mod:`cursor_memory_mcp.tracing` 写出的JSONL文件（包括轮转出的 ``.1``、``.2`` …），
+按工具统计调用次数、错误数和延迟分位数，并把每个工具的耗时拆分到各个子span上::
+
+    cursor-memory-trace-summary ~/.cursor-memory/traces.jsonl
+    cursor-memory-trace-summary traces.jsonl --json
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# 根span耗时中不属于任何子span的部分
+SELF_TIME = "(self)"
+
+
+def trace_files(path: str) -> List[Path]:
+    """返回追踪文件及其轮转文件，按从旧到新排列"""
+    base = Path(path)
+    rotated = []
+    i = 1
+    while True:
+        candidate = base.with_name(f"{base.name}.{i}")
+        if not candidate.exists():
+            break
+        rotated.append(candidate)
+        i += 1
+    files = list(reversed(rotated))
+    if base.exists():
+        files.append(base)
+    return files
+
+
+def iter_spans(paths: Iterable[Path]) -> Iterator[Dict[str, Any]]:
+    """逐行读取span，跳过无法解析的行（例如写入中途被截断的最后一行）"""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and "span_id" in record:
+                    yield record
+
+
+def _percentile(values: List[float], p: float) -> float:
+    """最近秩法分位数，values须已排序"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(p * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def latency_stats(values: List[float]) -> Dict[str, float]:
+    """计算一组毫秒耗时的分位数、最大值和平均值"""
+    values = sorted(values)
+    return {
+        "p50_ms": round(_percentile(values, 0.50), 3),
+        "p95_ms": round(_percentile(values, 0.95), 3),
+        "p99_ms": round(_percentile(values, 0.99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+    }
+
+
+def summarize(spans: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """按工具汇总根span的延迟，并把耗时拆分到直接子span"""
+    roots: Dict[str, Dict[str, Any]] = {}
+    children: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for s in spans:
+        if s.get("parent_span_id"):
+            children[s["parent_span_id"]].append(s)
+        else:
+            roots[s["span_id"]] = s
+
+    by_tool: Dict[str, Dict[str, Any]] = {}
+    for root in roots.values():
+        tool = root.get("attributes", {}).get("tool", root["name"])
+        stats = by_tool.setdefault(
+            tool,
+            {"durations": [], "errors": 0, "busy": 0, "phases": defaultdict(list)},
+        )
+        duration = root["duration_ms"]
+        stats["durations"].append(duration)
+        if root.get("status") == "ERROR":
+            stats["errors"] += 1
+        if root.get("attributes", {}).get("busy"):
+            stats["busy"] += 1
+
+        # 同名子span（例如重试）在一次调用内合并计算
+        phase_totals: Dict[str, float] = defaultdict(float)
+        for child in _descendants(root["span_id"], children):
+            phase_totals[child["name"]] += child["duration_ms"]
+        direct = sum(c["duration_ms"] for c in children.get(root["span_id"], []))
+        phase_totals[SELF_TIME] = max(0.0, duration - direct)
+        for phase, total in phase_totals.items():
+            stats["phases"][phase].append(total)
+
+    tools = {}
+    for tool, stats in sorted(by_tool.items()):
+        total_time = sum(stats["durations"]) or 1.0
+        phases = {}
+        for phase, values in sorted(
+            stats["phases"].items(), key=lambda item: -sum(item[1])
+        ):
+            phases[phase] = {
+                "count": len(values),
+                **latency_stats(values),
+                "share": round(sum(values) / total_time, 3),
+            }
+        tools[tool] = {
+            "count": len(stats["durations"]),
+            "errors": stats["errors"],
+            "busy": stats["busy"],
+            **latency_stats(stats["durations"]),
+            "phases": phases,
+        }
+    return {"span_count": len(roots) + sum(map(len, children.values())), "tools": tools}
+
+
+def _descendants(
+    span_id: str, children: Dict[str, List[Dict[str, Any]]]
+) -> Iterator[Dict[str, Any]]:
+    """深度优先遍历子孙span"""
+    stack = list(children.get(span_id, []))
+    while stack:
+        s = stack.pop()
+        yield s
+        stack.extend(children.get(s["span_id"], []))
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """把汇总结果格式化为文本表格"""
+    lines = [f"共 {summary['span_count']} 个span"]
+    for tool, stats in summary["tools"].items():
+        lines.append("")
+        lines.append(
+            f"{tool}: {stats['count']} 次调用, 错误 {stats['errors']}, "
+            f"繁忙拒绝 {stats['busy']}"
+        )
+        lines.append(
+            f"  延迟 p50 {stats['p50_ms']:.1f}ms  p95 {stats['p95_ms']:.1f}ms  "
+            f"p99 {stats['p99_ms']:.1f}ms  max {stats['max_ms']:.1f}ms"
+        )
+        lines.append(
+            f"  {'阶段':<20}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}"
+            f"{'p99(ms)':>10}{'占比':>8}"
+        )
+        for phase, p in stats["phases"].items():
+            lines.append(
+                f"  {phase:<20}{p['count']:>8}{p['p50_ms']:>10.2f}"
+                f"{p['p95_ms']:>10.2f}{p['p99_ms']:>10.2f}{p['share']:>8.1%}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(
+        prog="cursor-memory-trace-summary", description="汇总追踪文件中的延迟分布"
+    )
+    parser.add_argument("trace_file", help="追踪文件路径（自动包含轮转文件）")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args(argv)
+
+    files = trace_files(args.trace_file)
+    if not files:
+        print(f"错误: 追踪文件不存在: {args.trace_file}", file=sys.stderr)
+        return 1
+
+    summary = summarize(iter_spans(files))
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(format_summary(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
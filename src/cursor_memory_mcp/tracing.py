@@ -0,0 +1,299 @@
+"""
+工具调用的本地追踪
+
+按OpenTelemetry的数据模型记录span（trace_id、span_id、parent_span_id、起止时间、
+属性和状态），但不依赖opentelemetry包：span在请求结束时放入有界队列，由后台线程
+写入可轮转的本地JSONL文件，写文件不会阻塞事件循环。队列满时直接丢弃并计数。
+
+采样在根span上决定（head-based），子span继承父span的决定；未采样的调用只创建
+一个空操作span，开销可以忽略。
+
+通过环境变量启用::
+
+    CURSOR_MEMORY_TRACE_FILE=/path/to/traces.jsonl
+    CURSOR_MEMORY_TRACE_SAMPLE_RATE=0.1   # 默认 1.0
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+DEFAULT_QUEUE_SIZE = 10000
+
+STATUS_OK = "OK"
+STATUS_ERROR = "ERROR"
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "cursor_memory_current_span", default=None
+)
+
+
+class Span:
+    """一个已采样的span"""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_span_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "status",
+        "error",
+    )
+
+    sampled = True
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent_span_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.status = STATUS_OK
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.status = STATUS_ERROR
+        self.error = message
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class _NoopSpan:
+    """未采样时使用的空操作span"""
+
+    sampled = False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonlSpanExporter:
+    """在后台线程把span写入可轮转的JSONL文件"""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backup_count: int = DEFAULT_BACKUP_COUNT,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict[str, Any]):
+        """把span放入写入队列，队列满时丢弃，不阻塞调用方"""
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0):
+        """等待队列中的span全部写入"""
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def shutdown(self, timeout: float = 5.0):
+        """写完剩余span后停止后台线程"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="cursor-memory-trace-exporter", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "a", encoding="utf-8")
+        try:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    self._queue.task_done()
+                    return
+                # 一次取出已排队的所有span，合并成一次写入
+                lines = [record]
+                stop = False
+                while True:
+                    try:
+                        more = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if more is None:
+                        stop = True
+                        break
+                    lines.append(more)
+                try:
+                    f.write(
+                        "".join(
+                            json.dumps(r, ensure_ascii=False, separators=(",", ":"))
+                            + "\n"
+                            for r in lines
+                        )
+                    )
+                    f.flush()
+                    if f.tell() >= self.max_bytes:
+                        f.close()
+                        self._rotate()
+                        f = open(self.path, "a", encoding="utf-8")
+                except (OSError, TypeError, ValueError) as e:
+                    logger.warning(f"写入追踪文件失败: {e}")
+                for _ in range(len(lines) + stop):
+                    self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            f.close()
+
+    def _rotate(self):
+        """traces.jsonl -> traces.jsonl.1 -> ... -> traces.jsonl.N"""
+        for i in range(self.backup_count - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{i}")
+            if source.exists():
+                source.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backup_count > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+
+class Tracer:
+    """创建span并交给导出器"""
+
+    def __init__(
+        self, exporter: Optional[JsonlSpanExporter] = None, sample_rate: float = 1.0
+    ):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None and self.sample_rate > 0
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """根据环境变量创建追踪器，未设置追踪文件时不记录任何span"""
+        path = os.environ.get("CURSOR_MEMORY_TRACE_FILE")
+        if not path:
+            return cls()
+        sample_rate = float(os.environ.get("CURSOR_MEMORY_TRACE_SAMPLE_RATE", 1.0))
+        return cls(JsonlSpanExporter(path), sample_rate)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Any]:
+        """在当前上下文中开始一个span
+
+        没有父span时作为根span并决定是否采样；父span未采样时子span也不采样。
+        块内抛出的异常会记录到span状态中并继续向上抛出。
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        parent = _current_span.get()
+        if parent is None:
+            if random.random() >= self.sample_rate:
+                token = _current_span.set(NOOP_SPAN)
+                try:
+                    yield NOOP_SPAN
+                finally:
+                    _current_span.reset(token)
+                return
+            span = Span(name, f"{random.getrandbits(128):032x}", None)
+        elif not parent.sampled:
+            yield NOOP_SPAN
+            return
+        else:
+            span = Span(name, parent.trace_id, parent.span_id)
+
+        span.attributes.update(attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self.exporter.export(span.to_dict())
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """返回进程内共享的追踪器"""
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> Tracer:
+    """替换进程内共享的追踪器，返回旧的追踪器"""
+    global _tracer
+    previous, _tracer = _tracer, tracer
+    return previous
+
+
+def span(name: str, **attributes: Any):
+    """使用共享追踪器开始一个span"""
+    return _tracer.span(name, **attributes)
+
+
+def current_span() -> Any:
+    """返回当前span，不在追踪中时返回空操作span"""
+    return _current_span.get() or NOOP_SPAN
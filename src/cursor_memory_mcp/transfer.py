@@ -0,0 +1,318 @@
+"""
+记忆文件的批量导出与导入
+
+导出格式为JSONL（每行一条记忆），可选gzip压缩。导出和导入都是流式处理：
+任意时刻只在内存中保留当前批次的记录，因此可以处理十万级的记忆集合。导入的正文和
+description与创建记忆时一样先经过脱敏（见 :mod:`.redaction`）。
+"""
+
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Set
+
+from .frontmatter import parse_memory_file, render_memory_file
+from .layout import (
+    MEMORY_SUFFIX,
+    MemoryLayout,
+    content_hash,
+    get_layout,
+    memory_name,
+    rules_dir,
+)
+from .redaction import Redactor
+from .store import MAX_TASK_NAME_LENGTH, _validate_task_name
+
+__all__ = [
+    "MEMORY_SUFFIX",
+    "content_hash",
+    "rules_dir",
+    "export_memories",
+    "import_memories",
+]
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+DEFAULT_BATCH_SIZE = 500
+
+# 导入结果中最多保留的错误条数
+_MAX_REPORTED_ERRORS = 20
+
+
+@dataclass
+class ExportStats:
+    """导出统计"""
+
+    exported: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ImportStats:
+    """导入统计"""
+
+    imported: int = 0
+    renamed: int = 0
+    skipped_duplicates: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+    # 模式名 -> 导入时脱敏替换的次数
+    redacted: Counter = field(default_factory=Counter)
+
+    def add_error(self, message: str):
+        self.failed += 1
+        if len(self.errors) < _MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+
+def iter_memory_records(layout: MemoryLayout, stats: ExportStats) -> Iterator[Dict]:
+    """逐个读取记忆文件并生成导出记录"""
+    for entry in layout.iter_files():
+        try:
+            with open(entry.path, encoding="utf-8") as f:
+                text = f.read()
+            modified_at = datetime.fromtimestamp(entry.stat().st_mtime)
+        except (OSError, UnicodeDecodeError) as e:
+            stats.errors.append(f"{entry.name}: {e}")
+            continue
+
+        fields, body = parse_memory_file(text)
+        yield {
+            "name": memory_name(entry.name),
+            "frontmatter": fields,
+            "body": body,
+            "modified_at": modified_at.isoformat(),
+        }
+
+
+def _open_output(output: str, compress: bool, overwrite: bool) -> IO[str]:
+    """打开导出目标，"-" 表示标准输出
+
+    Raises:
+        FileExistsError: 文件已存在且overwrite为False
+    """
+    if output == "-":
+        if compress:
+            raw = gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb")
+            return io.TextIOWrapper(raw, encoding="utf-8")
+        return io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", write_through=True)
+    # 不覆盖时以独占方式创建，检查和创建之间不会被其它进程抢先
+    mode = "w" if overwrite else "x"
+    try:
+        if compress:
+            return gzip.open(output, f"{mode}t", encoding="utf-8")
+        return open(output, mode, encoding="utf-8")
+    except FileExistsError:
+        raise FileExistsError(f"输出文件已存在: {output}") from None
+
+
+def _open_input(source: str) -> IO[str]:
+    """打开导入源，根据文件头自动识别gzip，"-" 表示标准输入"""
+    if source == "-":
+        raw: IO[bytes] = sys.stdin.buffer
+    else:
+        raw = open(source, "rb")
+    buffered = io.BufferedReader(raw) if not hasattr(raw, "peek") else raw
+    if buffered.peek(2)[:2] == GZIP_MAGIC:
+        buffered = gzip.GzipFile(fileobj=buffered, mode="rb")
+    return io.TextIOWrapper(buffered, encoding="utf-8")
+
+
+def export_memories(
+    project_path: str,
+    output: str,
+    compress: Optional[bool] = None,
+    overwrite: bool = False,
+) -> ExportStats:
+    """把项目的所有记忆导出为JSONL
+
+    Args:
+        project_path: 项目根目录
+        output: 输出文件路径，"-" 表示标准输出
+        compress: 是否gzip压缩，None时根据输出文件后缀(.gz)判断
+        overwrite: 输出文件已存在时是否覆盖
+
+    Raises:
+        FileExistsError: 输出文件已存在且overwrite为False
+    """
+    if compress is None:
+        compress = output.endswith(".gz")
+
+    stats = ExportStats()
+    stream = _open_output(output, compress, overwrite)
+    try:
+        for record in iter_memory_records(get_layout(project_path), stats):
+            stream.write(json.dumps(record, ensure_ascii=False))
+            stream.write("\n")
+            stats.exported += 1
+    finally:
+        if output == "-" and not compress:
+            # 不关闭进程的标准输出
+            stream.flush()
+            stream.detach()
+        else:
+            stream.close()
+
+    logger.info(f"导出完成: {stats.exported} 条记忆 -> {output}")
+    return stats
+
+
+def allocate_name(name: str, taken: Set[str]) -> str:
+    """为导入的记忆分配不冲突的名称
+
+    导入从不覆盖已有的记忆（创建记忆时同名会原地替换并归档旧版本，导入则是合并
+    另一份记忆集合）：名称已被占用时追加时间戳，同一秒内仍然冲突时再追加序号。
+    必要时截短原名称，结果仍满足创建记忆时的名称规则。
+    """
+    if name not in taken:
+        return name
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    suffix = 1
+    candidate = ""
+    while not candidate or candidate in taken:
+        tail = f"_{stamp}" if suffix == 1 else f"_{stamp}_{suffix}"
+        candidate = name[: MAX_TASK_NAME_LENGTH - len(tail)] + tail
+        suffix += 1
+    return candidate
+
+
+def _write_memory(
+    layout: MemoryLayout, name: str, content: str, mtime: Optional[float]
+) -> Path:
+    """原子地写入单个记忆文件"""
+    created = datetime.fromtimestamp(mtime) if mtime is not None else None
+    file_path = layout.path_for(name, created)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = file_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_file, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(temp_file, file_path)
+    if mtime is not None:
+        os.utime(file_path, (mtime, mtime))
+    return file_path
+
+
+def _record_content(record: Dict[str, Any], redactor: Redactor, counts: Counter) -> str:
+    """根据导入记录生成文件内容，正文和description先脱敏"""
+    body = record.get("body")
+    if not isinstance(body, str):
+        raise ValueError("缺少body字段")
+    fields = record.get("frontmatter") or {}
+    if not isinstance(fields, dict):
+        raise ValueError("frontmatter字段必须是对象")
+    body, found = redactor.redact(body)
+    counts.update(found)
+    if isinstance(fields.get("description"), str):
+        description, found = redactor.redact(fields["description"])
+        fields = {**fields, "description": description}
+        counts.update(found)
+    return render_memory_file(fields, body)
+
+
+def _record_mtime(record: Dict[str, Any]) -> Optional[float]:
+    modified_at = record.get("modified_at")
+    if not modified_at:
+        return None
+    try:
+        return datetime.fromisoformat(modified_at).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _iter_batches(stream: IO[str], batch_size: int) -> Iterator[List[tuple]]:
+    """按批次读取JSONL行，返回 (行号, 行内容) 列表"""
+    batch = []
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        batch.append((line_no, line))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_memories(
+    project_path: str,
+    source: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    redactor: Optional[Redactor] = None,
+) -> ImportStats:
+    """从JSONL导入记忆到项目
+
+    内容完全相同的记忆会被跳过；名称已被占用且内容不同时，导入的记忆按
+    :func:`allocate_name` 改名，已有的记忆保持不变。名称不符合创建记忆的规则
+    （字符和长度）的记录计为失败。
+
+    Args:
+        project_path: 项目根目录
+        source: 输入文件路径（可以是gzip压缩的），"-" 表示标准输入
+        batch_size: 每批写入的记录数
+        redactor: 脱敏器，默认根据环境变量创建
+    """
+    redactor = redactor or Redactor.from_env()
+    rules_dir(project_path).mkdir(parents=True, exist_ok=True)
+    # 已存在的名称和内容哈希直接从清单读取，不需要读取每个文件
+    layout = get_layout(project_path)
+    taken: Set[str] = set(layout.names())
+    hashes = layout.hashes()
+    new_files: Dict[str, tuple] = {}
+
+    stats = ImportStats()
+    stream = _open_input(source)
+    try:
+        for batch in _iter_batches(stream, batch_size):
+            for line_no, line in batch:
+                try:
+                    record = json.loads(line)
+                    name = record.get("name")
+                    if not isinstance(name, str):
+                        raise ValueError(f"非法的记忆名称: {name!r}")
+                    _validate_task_name(name)
+                    content = _record_content(record, redactor, stats.redacted)
+                except (ValueError, AttributeError) as e:
+                    stats.add_error(f"第{line_no}行: {e}")
+                    continue
+
+                digest = content_hash(content)
+                if digest in hashes:
+                    stats.skipped_duplicates += 1
+                    continue
+
+                final_name = allocate_name(name, taken)
+                try:
+                    path = _write_memory(
+                        layout, final_name, content, _record_mtime(record)
+                    )
+                    new_files[final_name] = (path, content)
+                except OSError as e:
+                    stats.add_error(f"第{line_no}行: 写入文件失败: {e}")
+                    continue
+
+                taken.add(final_name)
+                hashes.add(digest)
+                stats.imported += 1
+                if final_name != name:
+                    stats.renamed += 1
+
+            # 每批写入完成后更新一次清单
+            layout.register_many(new_files)
+            new_files.clear()
+            logger.info(f"导入进度: 已导入 {stats.imported} 条记忆")
+    finally:
+        if source == "-":
+            stream.detach()
+        else:
+            stream.close()
+
+    return stats
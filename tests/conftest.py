@@ -4,6 +4,7 @@ pytest配置文件
 配置pytest测试环境和fixture
 """
 
+import os
 import shutil
 import tempfile
 from pathlib import Path
@@ -19,6 +20,23 @@ def test_project_root():
     shutil.rmtree(temp_dir, ignore_errors=True)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def isolated_global_store():
+    """把全局存储（包括项目登记表）指向临时目录，测试不写入用户目录
+
+    通过环境变量设置，测试中启动的服务子进程也会继承。
+    """
+    temp_dir = tempfile.mkdtemp(prefix="cursor_mcp_global_")
+    previous = os.environ.get("CURSOR_MEMORY_GLOBAL_DIR")
+    os.environ["CURSOR_MEMORY_GLOBAL_DIR"] = temp_dir
+    yield Path(temp_dir)
+    if previous is None:
+        os.environ.pop("CURSOR_MEMORY_GLOBAL_DIR", None)
+    else:
+        os.environ["CURSOR_MEMORY_GLOBAL_DIR"] = previous
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
 @pytest.fixture(scope="function")
 def temp_cursor_dir(test_project_root):
     """为每个测试创建临时.cursor目录"""
@@ -0,0 +1,230 @@
+"""
+访问频率统计和alwaysApply重新平衡的测试
+"""
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.access import AccessCounters, _plan, get_access_counters
+from cursor_memory_mcp.frontmatter import parse_memory_file
+from cursor_memory_mcp.server import CursorMemoryMCP
+
+DAY = 86400
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def test_scores_decay(temp_dir):
+    """分数每经过一个半衰期减半"""
+    counters = AccessCounters(str(temp_dir), half_life=DAY)
+    now = time.time()
+    counters.record(["a", "a"], now=now - 2 * DAY)
+    counters.record(["b"], weight=0.5, now=now)
+    scores = counters.scores(now=now)
+    assert scores["a"] == pytest.approx(0.5)
+    assert scores["b"] == pytest.approx(0.5)
+
+
+def test_flush_merges_processes(temp_dir):
+    """多个进程的增量在保存时累加，不互相覆盖"""
+    a = AccessCounters(str(temp_dir), half_life=DAY)
+    b = AccessCounters(str(temp_dir), half_life=DAY)
+    a.record(["x", "y"])
+    b.record(["x"])
+    a.flush()
+    b.flush()
+    a.flush()  # 没有新增量时不写文件
+
+    fresh = AccessCounters(str(temp_dir), half_life=DAY)
+    fresh.load()
+    scores = fresh.scores()
+    assert scores["x"] == pytest.approx(2, rel=1e-3)
+    assert scores["y"] == pytest.approx(1, rel=1e-3)
+    assert b.scores()["y"] == pytest.approx(1, rel=1e-3)
+
+
+def test_atime_sampling(temp_dir):
+    """atime比上次采样新时记为一次访问，第一次采样只记录基准"""
+    path = temp_dir / "m.mdc"
+    path.write_text("x", encoding="utf-8")
+    counters = AccessCounters(str(temp_dir), half_life=DAY)
+    counters.sample_atimes({"m": path})
+    assert counters.scores()["m"] == 0
+    counters.sample_atimes({"m": path})
+    assert counters.scores()["m"] == 0
+
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns + 10**9, stat.st_mtime_ns))
+    counters.sample_atimes({"m": path})
+    assert counters.scores()["m"] == pytest.approx(1, rel=1e-3)
+
+
+def test_plan_respects_budget_and_hysteresis():
+    """预算内按分数提升，分数在两个阈值之间的记忆保持原状"""
+    memories = [
+        {"name": "hot", "tokens": 100, "always_apply": False},
+        {"name": "huge", "tokens": 5000, "always_apply": False},
+        {"name": "warm", "tokens": 100, "always_apply": True, "auto": True},
+        {"name": "cold", "tokens": 100, "always_apply": True, "auto": True},
+        {"name": "lukewarm", "tokens": 100, "always_apply": False},
+        # 用户手写的alwaysApply规则，分数为0也不降级
+        {"name": "standards", "tokens": 100, "always_apply": True},
+    ]
+    scores = {"hot": 10, "huge": 20, "warm": 1, "cold": 0.1, "lukewarm": 2}
+    kept, promoted, demoted = _plan(
+        memories, scores, top_n=5, budget_tokens=1000, min_score=3, stale_score=0.5
+    )
+    assert [e["name"] for e in kept] == ["warm", "standards"]
+    assert [e["name"] for e in promoted] == ["hot"]
+    assert [e["name"] for e in demoted] == ["cold"]
+
+    _, promoted, _ = _plan(
+        memories, scores, top_n=2, budget_tokens=10000, min_score=3, stale_score=0.5
+    )
+    assert promoted == []
+
+
+@pytest.mark.asyncio
+async def test_rebalance_tool(temp_dir):
+    """读取和搜索计入访问，重新平衡只改写frontmatter"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    for name in ("deploy", "lint", "cache"):
+        await server._handle_tool_call(
+            "create_cursor_memory",
+            {
+                "task_summary": f"{name} 的处理步骤和注意事项",
+                "task_name": name,
+                "project_path": project,
+            },
+        )
+    for _ in range(4):
+        await server._handle_tool_call(
+            "get_memory_version",
+            {"project_path": project, "task_name": "deploy", "version": 1},
+        )
+    await server._handle_tool_call(
+        "get_memory_version",
+        {"project_path": project, "task_name": "lint", "version": 1},
+    )
+    assert get_access_counters(project).scores()["deploy"] == pytest.approx(4, 1e-3)
+
+    path = temp_dir / ".cursor" / "rules" / "deploy.mdc"
+    before = path.read_text(encoding="utf-8")
+
+    async def rebalance(**options):
+        result = await server._handle_tool_call(
+            "rebalance_always_apply", {"project_path": project, **options}
+        )
+        return json.loads(result[0]["text"])
+
+    plan = await rebalance(dry_run=True)
+    assert [m["name"] for m in plan["promoted"]] == ["deploy"]
+    assert path.read_text(encoding="utf-8") == before
+
+    report = await rebalance()
+    assert report["always_apply"] == ["deploy"]
+    fields, body = parse_memory_file(path.read_text(encoding="utf-8"))
+    assert fields["alwaysApply"] is True
+    assert body == parse_memory_file(before)[1]
+
+    # 分数低于stale_score时降级
+    report = await rebalance(stale_score=100, min_score=100)
+    assert [m["name"] for m in report["demoted"]] == ["deploy"]
+    assert report["always_apply"] == []
+    assert parse_memory_file(path.read_text(encoding="utf-8"))[0]["alwaysApply"] is (
+        False
+    )
+
+    invalid = await rebalance(top_n=-1)
+    assert "参数验证失败" in invalid["error"]
+
+
+@pytest.mark.asyncio
+async def test_rebalance_keeps_history(temp_dir):
+    """重新平衡前的内容存为历史版本，更早的版本仍能准确还原"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    path = temp_dir / ".cursor" / "rules" / "deploy.mdc"
+    versions = []
+    for summary in ("第一版部署步骤", "第二版部署步骤"):
+        await server._handle_tool_call(
+            "create_cursor_memory",
+            {"task_summary": summary, "task_name": "deploy", "project_path": project},
+        )
+        versions.append(path.read_text(encoding="utf-8"))
+
+    async def read(version):
+        result = await server._handle_tool_call(
+            "get_memory_version",
+            {"project_path": project, "task_name": "deploy", "version": version},
+        )
+        return json.loads(result[0]["text"])["content"]
+
+    for _ in range(5):
+        await read(2)
+    result = await server._handle_tool_call(
+        "rebalance_always_apply", {"project_path": project}
+    )
+    assert json.loads(result[0]["text"])["always_apply"] == ["deploy"]
+
+    assert "alwaysApply: true" in path.read_text(encoding="utf-8")
+    assert await read(1) == versions[0]
+    assert await read(2) == versions[1]
+    assert "alwaysApply: true" not in await read(1)
+
+
+@pytest.mark.asyncio
+async def test_rebalance_leaves_hand_written_rules(temp_dir):
+    """手写的alwaysApply规则不会被降级；提升只改写alwaysApply这一行"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    rules = temp_dir / ".cursor" / "rules"
+    rules.mkdir(parents=True)
+    standards = rules / "standards.mdc"
+    standards.write_text(
+        '---\ndescription: "团队规范"\nalwaysApply: true\n---\n统一使用ruff\n',
+        encoding="utf-8",
+    )
+    react = rules / "react.mdc"
+    react.write_text(
+        "---\ndescription: React 组件规范\nglobs:\n  - src/**/*.tsx\n"
+        "  - src/**/*.jsx\nalwaysApply: false\n---\n函数组件\n",
+        encoding="utf-8",
+    )
+    for _ in range(5):
+        await server._handle_tool_call(
+            "get_memory_version",
+            {"project_path": project, "task_name": "react", "version": 1},
+        )
+
+    async def rebalance(**options):
+        result = await server._handle_tool_call(
+            "rebalance_always_apply", {"project_path": project, **options}
+        )
+        return json.loads(result[0]["text"])
+
+    report = await rebalance()
+    assert report["demoted"] == []
+    assert report["always_apply"] == ["react", "standards"]
+    assert react.read_text(encoding="utf-8") == (
+        "---\ndescription: React 组件规范\nglobs:\n  - src/**/*.tsx\n"
+        "  - src/**/*.jsx\nalwaysApply: true\nautoAlwaysApply: true\n---\n函数组件\n"
+    )
+
+    # 提升的记忆分数过低时降级并去掉标记，手写规则保持不变
+    report = await rebalance(stale_score=100, min_score=100)
+    assert [m["name"] for m in report["demoted"]] == ["react"]
+    assert report["always_apply"] == ["standards"]
+    assert "autoAlwaysApply" not in react.read_text(encoding="utf-8")
+    assert "alwaysApply: true" in standards.read_text(encoding="utf-8")
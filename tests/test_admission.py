@@ -0,0 +1,231 @@
+"""
+准入控制与背压的测试
+"""
+
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import psutil
+import pytest
+
+from cursor_memory_mcp.admission import AdmissionController, Overloaded, payload_size
+from cursor_memory_mcp.server import CursorMemoryMCP
+from cursor_memory_mcp.store import MemoryStore
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_per_client():
+    """每个客户端独立限速，超限时给出重试间隔"""
+    controller = AdmissionController(rate=10, burst=2)
+    for _ in range(2):
+        async with controller.admit("a", 0):
+            pass
+    with pytest.raises(Overloaded) as exc_info:
+        async with controller.admit("a", 0):
+            pass
+    assert 0 < exc_info.value.retry_after <= 0.1
+
+    # 其它客户端不受影响
+    async with controller.admit("b", 0):
+        pass
+    assert controller.stats.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_queued_bytes_budget():
+    """已接纳请求的总字节数超出预算时拒绝"""
+    controller = AdmissionController(max_queued_bytes=100, rate=0)
+    async with controller.admit("a", 80):
+        with pytest.raises(Overloaded, match="总大小"):
+            async with controller.admit("a", 30):
+                pass
+        async with controller.admit("a", 20):
+            pass
+    assert controller.stats.queued_bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_nested_payload_counts_against_budget(temp_dir):
+    """嵌套参数（patches）同样计入排队字节预算"""
+    store = MemoryStore(str(temp_dir))
+    store.create("notes", "".join(f"## 第{i}节\n旧内容\n\n" for i in range(8)))
+    patches = [
+        {"op": "replace", "heading": f"第{i}节", "content": "x" * 4096}
+        for i in range(8)
+    ]
+    assert payload_size({"patches": patches}) > 8 * 4096
+    arguments = {
+        "project_path": str(temp_dir),
+        "task_name": "notes",
+        "expected_hash": store.read("notes")["hash"],
+        "patches": patches,
+    }
+
+    mcp_server = CursorMemoryMCP(
+        admission=AdmissionController(max_queued_bytes=16 * 1024, rate=0)
+    )
+    result = await mcp_server._handle_tool_call("update_cursor_memory", arguments)
+    data = json.loads(result[0]["text"])
+    assert data["busy"] is True
+    assert "总大小" in data["error"]
+
+    # 同样的补丁在预算之内可以正常应用
+    mcp_server = CursorMemoryMCP(
+        admission=AdmissionController(max_queued_bytes=64 * 1024, rate=0)
+    )
+    result = await mcp_server._handle_tool_call("update_cursor_memory", arguments)
+    assert json.loads(result[0]["text"])["success"] is True
+
+
+@pytest.mark.asyncio
+async def test_in_flight_and_queue_limits():
+    """同时执行数不超过上限，队列满时立即拒绝，等待超时也被拒绝"""
+    controller = AdmissionController(
+        max_in_flight=2, max_queue_length=2, max_queue_wait=0.05, rate=0
+    )
+    running = []
+    peak = 0
+    release = asyncio.Event()
+
+    async def call():
+        nonlocal peak
+        async with controller.admit("a", 0):
+            running.append(1)
+            peak = max(peak, len(running))
+            await release.wait()
+            running.pop()
+
+    holders = [asyncio.create_task(call()) for _ in range(2)]
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(call()) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    start = time.monotonic()
+    with pytest.raises(Overloaded, match="等待队列已满"):
+        await call()
+    assert time.monotonic() - start < 0.01
+
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert all(isinstance(r, Overloaded) for r in results)
+    assert "超时" in results[0].reason
+
+    release.set()
+    await asyncio.gather(*holders)
+    assert peak == 2
+    assert controller.stats.in_flight == 0
+    assert controller.stats.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_server_returns_busy_error():
+    """过载时工具调用返回结构化的繁忙错误"""
+    mcp_server = CursorMemoryMCP(admission=AdmissionController(rate=1, burst=1))
+    await mcp_server._handle_tool_call("analyze_rule_budget", {"project_path": "/"})
+    result = await mcp_server._handle_tool_call(
+        "analyze_rule_budget", {"project_path": "/"}
+    )
+    data = json.loads(result[0]["text"])
+    assert data["busy"] is True
+    assert data["retry_after"] > 0
+    assert "服务繁忙" in data["error"]
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_overload_10x(monkeypatch):
+    """负载测试：10倍过载下内存有界、被接纳请求的p99稳定、拒绝快速返回"""
+    service_time = 0.01
+    max_in_flight = 4
+    capacity = max_in_flight / service_time
+    offered_rate = capacity * 10
+    duration = 2.0
+    payload = 64 * 1024
+
+    mcp_server = CursorMemoryMCP(
+        admission=AdmissionController(
+            max_in_flight=max_in_flight,
+            max_queue_length=16,
+            max_queued_bytes=2 * 1024 * 1024,
+            max_queue_wait=0.1,
+            rate=0,
+        )
+    )
+
+    async def fake_dispatch(name, arguments):
+        await asyncio.sleep(service_time)
+        return [{"type": "text", "text": "{}"}]
+
+    monkeypatch.setattr(mcp_server, "_dispatch_tool", fake_dispatch)
+
+    admitted = []
+    rejected = []
+
+    async def one_call(i):
+        arguments = {"task_summary": "x" * payload + str(i)}
+        start = time.perf_counter()
+        result = await mcp_server._handle_tool_call("create_cursor_memory", arguments)
+        elapsed = time.perf_counter() - start
+        (rejected if "busy" in result[0]["text"] else admitted).append((start, elapsed))
+
+    process = psutil.Process()
+    baseline_rss = process.memory_info().rss
+    peak_rss = baseline_rss
+    peak_queued_bytes = 0
+    tasks = []
+    begin = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - begin < duration:
+        due = int((time.perf_counter() - begin) * offered_rate)
+        while sent < due:
+            tasks.append(asyncio.create_task(one_call(sent)))
+            sent += 1
+        tasks = [t for t in tasks if not t.done()]
+        peak_queued_bytes = max(
+            peak_queued_bytes, mcp_server.admission.stats.queued_bytes
+        )
+        peak_rss = max(peak_rss, process.memory_info().rss)
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    rss_growth = peak_rss - baseline_rss
+
+    admitted_latency = [e for _, e in admitted]
+    half = begin + duration / 2
+    first_half = [e for s, e in admitted if s < half]
+    second_half = [e for s, e in admitted if s >= half]
+    p99 = _percentile(admitted_latency, 0.99)
+    reject_p99 = _percentile([e for _, e in rejected], 0.99)
+    throughput = len(admitted) / duration
+
+    print(
+        f"\n10倍过载: 发送 {sent}, 接纳 {len(admitted)}, 拒绝 {len(rejected)}, "
+        f"吞吐 {throughput:.0f}/s (容量 {capacity:.0f}/s), "
+        f"接纳p99 {p99 * 1000:.1f}ms (前半 {_percentile(first_half, 0.99) * 1000:.1f}ms, "
+        f"后半 {_percentile(second_half, 0.99) * 1000:.1f}ms), "
+        f"拒绝p99 {reject_p99 * 1000:.2f}ms, "
+        f"排队字节峰值 {peak_queued_bytes / 1024 / 1024:.1f}MB, "
+        f"RSS增长 {rss_growth / 1024 / 1024:.1f}MB"
+    )
+    assert len(rejected) > len(admitted)
+    assert throughput > capacity * 0.5
+    # 被接纳请求的延迟受排队等待上限约束，且前后半段一致（没有持续恶化）
+    assert p99 < 0.1 + service_time * 10
+    assert _percentile(second_half, 0.99) < _percentile(first_half, 0.99) * 2 + 0.02
+    assert reject_p99 < 0.01
+    # 不加限制时所有负载同时驻留约需 sent * 64KB（约500MB）
+    assert peak_queued_bytes <= 2 * 1024 * 1024
+    assert rss_growth < sent * payload / 8
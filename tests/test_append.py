@@ -0,0 +1,266 @@
+"""
+原地追加记忆的测试
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp import append
+from cursor_memory_mcp.append import (
+    MODE_APPEND,
+    MODE_REWRITE,
+    append_section,
+    format_section,
+)
+from cursor_memory_mcp.frontmatter import parse_memory_file
+from cursor_memory_mcp.history import get_version, history_size
+from cursor_memory_mcp.layout import get_layout
+from cursor_memory_mcp.search import search_project
+from cursor_memory_mcp.server import CursorMemoryMCP
+from cursor_memory_mcp.store import MemoryStore
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+@pytest.fixture
+def memory_file(temp_dir):
+    """带frontmatter的记忆文件"""
+    path = temp_dir / "task.mdc"
+    path.write_text(
+        CursorMemoryMCP()._generate_file_content("任务", "初始内容"), encoding="utf-8"
+    )
+    return path
+
+
+def test_format_section():
+    """小节标题是时间戳加可选标题"""
+    now = datetime(2026, 1, 2, 3, 4, 5)
+    assert format_section("内容\n\n", now=now) == "## 2026-01-02 03:04:05\n内容\n"
+    assert format_section("x", "进展", now).startswith("## 2026-01-02 03:04:05 进展\n")
+
+
+def test_append_keeps_frontmatter(memory_file):
+    """追加在文件末尾，frontmatter保持不变，小节之间空一行"""
+    before = memory_file.read_text(encoding="utf-8")
+    fields_before, _ = parse_memory_file(before)
+    result = append_section(memory_file, "## a\n第一条\n")
+    append_section(memory_file, "## b\n第二条\n")
+
+    content = memory_file.read_text(encoding="utf-8")
+    assert result.mode == MODE_APPEND
+    # 生成的记忆文件末尾没有换行，补上空行
+    assert result.size == len(before.encode("utf-8")) + 2 + result.bytes_appended
+    assert content.startswith(before)
+    assert content.endswith("\n\n## a\n第一条\n\n## b\n第二条\n")
+    fields, body = parse_memory_file(content)
+    assert fields == fields_before
+    assert "第二条" in body
+
+
+def test_append_without_trailing_newline(temp_dir):
+    """文件末尾没有换行时补上空行"""
+    path = temp_dir / "m.mdc"
+    path.write_text("正文", encoding="utf-8")
+    append_section(path, "## a\nx\n")
+    assert path.read_text(encoding="utf-8") == "正文\n\n## a\nx\n"
+
+
+def test_hardlinked_file_is_rewritten(memory_file):
+    """有其它硬链接时重写文件，不修改链接指向的旧内容"""
+    link = memory_file.with_name("snapshot.mdc")
+    os.link(memory_file, link)
+    before = link.read_text(encoding="utf-8")
+    result = append_section(memory_file, "## a\nx\n")
+    assert result.mode == MODE_REWRITE
+    assert link.read_text(encoding="utf-8") == before
+    assert memory_file.read_text(encoding="utf-8") == before + "\n\n## a\nx\n"
+
+
+def test_short_write_falls_back_to_rewrite(memory_file, monkeypatch):
+    """单次写入不完整时截断回原长度再重写，不留下半个小节"""
+    before = memory_file.read_text(encoding="utf-8")
+    real_write = os.write
+
+    def short_write(fd, data):
+        return real_write(fd, data[:3])
+
+    monkeypatch.setattr(append.os, "write", short_write)
+    result = append_section(memory_file, "## a\nx\n")
+    assert result.mode == MODE_REWRITE
+    assert memory_file.read_text(encoding="utf-8") == before + "\n\n## a\nx\n"
+
+
+def test_concurrent_appends(memory_file):
+    """并发追加不丢失也不交错"""
+
+    def worker(i):
+        for j in range(20):
+            append_section(memory_file, f"## t{i}-{j}\n{'内容' * 50}\n")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    content = memory_file.read_text(encoding="utf-8")
+    sections = content.split("\n\n## t")[1:]
+    assert len(sections) == 80
+    assert all(s.rstrip("\n").endswith("内容" * 50) for s in sections)
+
+
+@pytest.mark.asyncio
+async def test_append_tool(temp_dir):
+    """工具追加小节并更新清单，搜索能找到追加的内容"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    await server._handle_tool_call(
+        "create_cursor_memory",
+        {"task_summary": "初始内容", "task_name": "task", "project_path": project},
+    )
+    original = get_layout(project).path_for("task").read_text(encoding="utf-8")
+    result = await server._handle_tool_call(
+        "append_cursor_memory",
+        {
+            "project_path": project,
+            "task_name": "task",
+            "note": "补充：Redis连接池改为懒加载",
+            "title": "后续",
+        },
+    )
+    data = json.loads(result[0]["text"])
+    assert data["success"] is True
+    assert data["mode"] == MODE_APPEND
+
+    path = Path(data["file_path"])
+    meta = get_layout(project).memories["task"]
+    assert meta["size"] == path.stat().st_size == data["size"]
+    assert meta["hash"] is None
+    assert len(get_layout(project).hashes()) == 1
+    assert search_project(project, "懒加载", 3)["results"][0]["name"] == "task"
+
+    # 追加前的内容存为历史版本，仍能准确还原
+    assert data["version"] == 2
+    result = await server._handle_tool_call(
+        "get_memory_version",
+        {"project_path": project, "task_name": "task", "version": 1},
+    )
+    assert json.loads(result[0]["text"])["content"] == original
+    await server._handle_tool_call(
+        "append_cursor_memory",
+        {"project_path": project, "task_name": "task", "note": "第二次"},
+    )
+    result = await server._handle_tool_call(
+        "get_memory_version",
+        {"project_path": project, "task_name": "task", "version": 2},
+    )
+    content = json.loads(result[0]["text"])["content"]
+    assert "懒加载" in content and "第二次" not in content
+    assert path.read_text(encoding="utf-8").startswith(content)
+
+
+def test_rewrite_waits_for_append_lock(temp_dir):
+    """整体重写持有追加使用的文件锁，追加不会写到被替换掉的旧文件上"""
+    store = MemoryStore(str(temp_dir))
+    store.create("task", "初始内容")
+    path = get_layout(str(temp_dir)).path_for("task")
+
+    fd = append.open_locked(path)
+    writer = threading.Thread(target=store.create, args=("task", "新内容"))
+    writer.start()
+    time.sleep(0.2)
+    assert writer.is_alive()
+    assert "初始内容" in path.read_text(encoding="utf-8")
+    os.close(fd)
+    writer.join()
+
+    append_section(path, "## a\n追加\n")
+    content = path.read_text(encoding="utf-8")
+    assert "新内容" in content and content.endswith("## a\n追加\n")
+
+
+@pytest.mark.asyncio
+async def test_append_tool_errors(temp_dir):
+    """记忆不存在或内容为空时返回错误"""
+    server = CursorMemoryMCP()
+    result = await server._handle_tool_call(
+        "append_cursor_memory",
+        {"project_path": str(temp_dir), "task_name": "missing", "note": "x"},
+    )
+    assert json.loads(result[0]["text"])["error"] == "记忆不存在: missing"
+    result = await server._handle_tool_call(
+        "append_cursor_memory",
+        {"project_path": str(temp_dir), "task_name": "missing", "note": "  "},
+    )
+    assert "参数验证失败" in json.loads(result[0]["text"])["error"]
+
+
+def _rewrite_update(path: Path, section: str):
+    """对照组：每次更新都读取整个文件再原子替换"""
+    content = path.read_text(encoding="utf-8")
+    separator = "\n" if content.endswith("\n") else "\n\n"
+    temp_file = path.with_suffix(".tmp")
+    temp_file.write_text(f"{content}{separator}{section}", encoding="utf-8")
+    temp_file.replace(path)
+
+
+def test_append_history_is_proportional_to_appends(temp_dir):
+    """追加只记录旧的长度，不读取记忆文件；每个旧版本都能还原"""
+    project = str(temp_dir)
+    store = MemoryStore(project)
+    store.create("task", "初始内容" * 2000)
+    path = get_layout(project).path_for("task")
+    versions = [path.read_text(encoding="utf-8")]
+    for i in range(30):
+        store.append("task", f"第{i}次进展")
+        versions.append(path.read_text(encoding="utf-8"))
+
+    # 每次追加只在历史中增加一条很短的记录
+    assert history_size(project, "task") < 30 * 200
+    for version, expected in enumerate(versions[:-1], 1):
+        assert get_version(project, "task", version, path) == expected
+
+
+@pytest.mark.slow
+def test_append_benchmark(temp_dir):
+    """基准：1000次经由 MemoryStore 的追加（含归档）与每次重写整个文件的耗时对比"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    content = server._generate_file_content("任务", "初始内容" * 500)
+    notes = [f"第{i}次进展：" + "记录" * 100 for i in range(1000)]
+    sections = [format_section(note) for note in notes]
+    store = MemoryStore(project)
+    store.create("task", "初始内容" * 500)
+    path = get_layout(project).path_for("task")
+    start = time.perf_counter()
+    for note in notes:
+        store.append("task", note)
+    append_seconds = time.perf_counter() - start
+    size = path.stat().st_size
+    history_bytes = history_size(project, "task")
+
+    path = temp_dir / "rewrite.mdc"
+    path.write_text(content, encoding="utf-8")
+    start = time.perf_counter()
+    for section in sections:
+        _rewrite_update(path, section)
+    rewrite_seconds = time.perf_counter() - start
+
+    print(
+        f"\n1000次追加: 追加并归档 {append_seconds * 1000:.0f}ms, "
+        f"重写 {rewrite_seconds * 1000:.0f}ms, 最终文件 {size / 1024:.0f}KB, "
+        f"历史 {history_bytes / 1024:.0f}KB"
+    )
+    assert append_seconds < rewrite_seconds
+    assert history_bytes < 1000 * 200
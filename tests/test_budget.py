@@ -0,0 +1,141 @@
+"""
+上下文预算分析的测试
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp import budget
+from cursor_memory_mcp.budget import (
+    analyze_rule_budget,
+    estimate_tokens,
+    find_near_duplicates,
+    simhash,
+)
+from cursor_memory_mcp.frontmatter import render_memory_file
+from cursor_memory_mcp.server import CursorMemoryMCP
+
+
+@pytest.fixture
+def project():
+    """创建临时项目目录"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        (root / ".cursor" / "rules").mkdir(parents=True)
+        yield root
+
+
+def _write(project: Path, name: str, body: str, always_apply: bool = False):
+    content = render_memory_file(
+        {"description": name, "globs": "", "alwaysApply": always_apply}, body
+    )
+    (project / ".cursor" / "rules" / f"{name}.mdc").write_text(
+        content, encoding="utf-8"
+    )
+
+
+def test_estimate_tokens_cjk():
+    """中文文本按字计数，英文按每4个字符计数"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("实现了用户登录功能") == 9
+    assert estimate_tokens("实现了用户登录功能", "simple") == 3
+    assert estimate_tokens("登录 login") == 4
+
+
+def test_near_duplicates():
+    """措辞略有不同的总结被识别为近似重复"""
+    base = (
+        "实现了用户登录功能，包括密码验证、JWT token生成和刷新逻辑。"
+        "登录失败时记录审计日志并限制重试次数。会话过期后前端自动跳转到登录页，"
+        "刷新令牌保存在httpOnly cookie中。新增了单元测试覆盖密码错误、"
+        "账号锁定和令牌过期三种场景。"
+    )
+    fingerprints = {
+        "a": simhash(base),
+        "b": simhash(base.replace("审计日志", "操作日志")),
+        "c": simhash("重构了数据库迁移脚本，为订单表增加了复合索引并清理历史数据。"),
+    }
+    pairs = find_near_duplicates(fingerprints)
+    assert [(a, b) for a, b, _ in pairs] == [("a", "b")]
+
+
+def test_analyze_rule_budget(project):
+    """报告包含总量、alwaysApply、最大记忆和建议"""
+    _write(project, "big_always", "规则" * 1500, always_apply=True)
+    _write(project, "small", "a short english note")
+    summary = "修复了支付回调的重复通知问题，增加了幂等校验和重试队列。" * 10
+    _write(project, "dup_one", summary)
+    _write(project, "dup_two", summary + "补充。")
+
+    report = analyze_rule_budget(str(project), budget_tokens=1000)
+    assert report["memory_count"] == 4
+    assert report["always_apply"] == ["big_always"]
+    assert report["always_apply_tokens"] > 3000
+    assert report["largest"][0]["name"] == "big_always"
+    assert report["total_tokens"] == sum(m["tokens"] for m in report["memories"])
+    assert [(p["a"], p["b"]) for p in report["near_duplicates"]] == [
+        ("dup_one", "dup_two")
+    ]
+    text = "\n".join(report["recommendations"])
+    assert "超出预算" in text
+    assert "big_always" in text
+    assert "建议合并" in text
+
+
+def test_repeat_uses_cache(project, monkeypatch):
+    """未变化的文件在重复分析时不会重新读取和估算"""
+    for i in range(5):
+        _write(project, f"memory_{i}", f"第{i}条记忆内容")
+    first = analyze_rule_budget(str(project))
+
+    calls = []
+    monkeypatch.setattr(budget, "estimate_tokens", lambda *a: calls.append(a) or 0)
+    second = analyze_rule_budget(str(project))
+    assert calls == []
+    assert second["total_tokens"] == first["total_tokens"]
+
+    time.sleep(0.01)
+    _write(project, "memory_0", "修改后的内容")
+    analyze_rule_budget(str(project))
+    assert len(calls) == len(budget.ESTIMATORS)
+
+
+@pytest.mark.asyncio
+async def test_tool(project):
+    """analyze_rule_budget 工具"""
+    _write(project, "memory", "内容")
+    mcp_server = CursorMemoryMCP()
+    result = await mcp_server._analyze_rule_budget(
+        {"project_path": str(project), "estimator": "simple"}
+    )
+    data = json.loads(result[0]["text"])
+    assert data["success"] is True
+    assert data["estimator"] == "simple"
+
+    result = await mcp_server._analyze_rule_budget(
+        {"project_path": str(project), "estimator": "unknown"}
+    )
+    assert "参数验证失败" in json.loads(result[0]["text"])["error"]
+
+
+@pytest.mark.slow
+def test_repeat_report_is_instant(project):
+    """基准：1000条记忆的重复分析"""
+    for i in range(1000):
+        _write(project, f"memory_{i:04d}", f"第{i}条记忆：实现了模块{i}的功能。" * 50)
+
+    start = time.perf_counter()
+    analyze_rule_budget(str(project))
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analyze_rule_budget(str(project))
+    warm = time.perf_counter() - start
+
+    print(f"\n1000条记忆: 首次分析 {cold:.2f}s, 重复分析 {warm * 1000:.0f}ms")
+    assert warm < cold / 3
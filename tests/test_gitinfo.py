@@ -0,0 +1,166 @@
+"""
+git分支和提交的读取，以及按修订查询记忆的测试
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.frontmatter import parse_memory_file
+from cursor_memory_mcp.gitinfo import GitRevision, current_revision, find_git_dirs
+from cursor_memory_mcp.layout import get_layout
+from cursor_memory_mcp.server import CursorMemoryMCP
+
+SHA_A = "a" * 40
+SHA_B = "b" * 40
+SHA_C = "c" * 40
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _write(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def _bump_mtime(path: Path):
+    """保证修改时间变化（有的文件系统时间精度较低）"""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_loose_and_packed_refs(temp_dir):
+    """依次从松散引用和packed-refs解析分支，引用文件变化后缓存失效"""
+    git = temp_dir / ".git"
+    _write(git / "HEAD", "ref: refs/heads/main\n")
+    _write(
+        git / "packed-refs",
+        f"# pack-refs with: peeled fully-peeled sorted\n"
+        f"{SHA_A} refs/heads/main\n{SHA_C} refs/tags/v1\n^{SHA_B}\n",
+    )
+    project = temp_dir / "service"
+    project.mkdir()
+    assert current_revision(str(project)) == GitRevision("main", SHA_A)
+
+    _write(git / "refs" / "heads" / "main", SHA_B + "\n")
+    assert current_revision(str(project)) == GitRevision("main", SHA_B)
+
+    # 切换到还没有提交的分支
+    _write(git / "HEAD", "ref: refs/heads/feature/x\n")
+    _bump_mtime(git / "HEAD")
+    assert current_revision(str(project)) == GitRevision("feature/x", None)
+
+    # 分离HEAD
+    _write(git / "HEAD", SHA_C + "\n")
+    _bump_mtime(git / "HEAD")
+    assert current_revision(str(project)) == GitRevision(None, SHA_C)
+
+
+def test_worktree_gitdir_file(temp_dir):
+    """工作树的.git文件指向私有目录，分支引用在公共目录中"""
+    common = temp_dir / "main" / ".git"
+    private = common / "worktrees" / "wt"
+    _write(common / "refs" / "heads" / "topic", SHA_B + "\n")
+    _write(private / "HEAD", "ref: refs/heads/topic\n")
+    _write(private / "commondir", "../..\n")
+    worktree = temp_dir / "wt"
+    _write(worktree / ".git", f"gitdir: {private}\n")
+
+    dirs = find_git_dirs(str(worktree))
+    assert dirs.git_dir == private.resolve()
+    assert dirs.common_dir == common.resolve()
+    assert current_revision(str(worktree)) == GitRevision("topic", SHA_B)
+    assert current_revision(str(temp_dir)) is None
+
+
+async def _call(server, name, **arguments):
+    result = await server._handle_tool_call(name, arguments)
+    return json.loads(result[0]["text"])
+
+
+def _git(cwd: Path, *args: str):
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+def _head(cwd: Path) -> str:
+    return subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="需要git")
+@pytest.mark.asyncio
+async def test_query_by_branch_and_since(temp_dir):
+    """记忆记录写入时的分支和提交，可以按分支或某个提交之后查询"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    _git(temp_dir, "init", "-q", "-b", "main")
+    _git(temp_dir, "commit", "-q", "--allow-empty", "-m", "init")
+    first = _head(temp_dir)
+
+    async def create(name, summary):
+        data = await _call(
+            server,
+            "create_cursor_memory",
+            task_summary=summary,
+            task_name=name,
+            project_path=project,
+        )
+        assert data["success"] is True
+
+    await create("deploy", "部署步骤：先构建镜像再滚动发布")
+    fields, _ = parse_memory_file(
+        (temp_dir / ".cursor" / "rules" / "deploy.mdc").read_text(encoding="utf-8")
+    )
+    assert (fields["branch"], fields["commit"]) == ("main", first)
+
+    _git(temp_dir, "checkout", "-q", "-b", "feature")
+    _git(temp_dir, "commit", "-q", "--allow-empty", "-m", "feature work")
+    second = _head(temp_dir)
+    await create("cache", "Redis缓存的过期策略和淘汰策略")
+    _git(temp_dir, "commit", "-q", "--allow-empty", "-m", "more")
+    await create("lint", "ruff配置：行宽88，开启isort")
+
+    data = await _call(server, "find_memories_by_revision", project_path=project)
+    assert data["head"]["branch"] == "feature"
+    assert [m["name"] for m in data["memories"]] == ["cache", "lint"]
+
+    data = await _call(
+        server, "find_memories_by_revision", project_path=project, branch="main"
+    )
+    assert [m["name"] for m in data["memories"]] == ["deploy"]
+
+    data = await _call(
+        server, "find_memories_by_revision", project_path=project, since=second[:8]
+    )
+    assert data["since"] == second
+    assert sorted(m["name"] for m in data["memories"]) == ["cache", "lint"]
+    assert get_layout(project).memories["lint"]["commit"] != second
+
+    data = await _call(
+        server, "find_memories_by_revision", project_path=project, since="deadbeef"
+    )
+    assert "deadbeef" in data["error"]
+    data = await _call(
+        server, "find_memories_by_revision", project_path=project, since="xyz"
+    )
+    assert "参数验证失败" in data["error"]
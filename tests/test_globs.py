@@ -0,0 +1,177 @@
+"""
+项目文件索引与globs推导的测试
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.file_index import ProjectFileIndex, get_file_index
+from cursor_memory_mcp.globs import build_globs, derive_globs, extract_candidates
+from cursor_memory_mcp.server import CursorMemoryMCP
+
+
+@pytest.fixture
+def project():
+    """创建一个带有源码和.gitignore的项目"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        files = [
+            "src/app/main.py",
+            "src/app/user_service.py",
+            "src/app/auth/login.py",
+            "src/app/auth/token.py",
+            "src/app/auth/session.py",
+            "src/components/Button.tsx",
+            "README.md",
+            "build/output.js",
+            "logs/debug.log",
+            "docs/keep.log",
+        ]
+        for f in files:
+            path = root / f
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("x")
+        (root / ".gitignore").write_text("build/\n*.log\n!docs/keep.log\n")
+        yield root
+
+
+def test_index_respects_gitignore(project):
+    """被.gitignore忽略的文件和目录不进入索引"""
+    index = ProjectFileIndex(str(project))
+    index.refresh()
+    files = set(index.files())
+    assert "src/app/main.py" in files
+    assert "build/output.js" not in files
+    assert "logs/debug.log" not in files
+    assert "docs/keep.log" in files
+    assert ".gitignore" in files
+
+
+def test_index_incremental_refresh(project):
+    """新增文件在刷新后可见，目录未变化时复用缓存"""
+    index = ProjectFileIndex(str(project))
+    assert index.refresh(max_age=0) is True
+    assert index.refresh(max_age=0) is False
+
+    time.sleep(0.01)
+    (project / "src" / "app" / "new_module.py").write_text("x")
+    assert index.refresh(max_age=0) is True
+    assert "src/app/new_module.py" in index.files()
+
+    # 持久化的缓存可以被新实例直接复用
+    reloaded = ProjectFileIndex(str(project))
+    assert reloaded.refresh(max_age=0) is False
+    assert sorted(reloaded.files()) == sorted(index.files())
+
+
+def test_index_rebuilds_on_gitignore_change(project):
+    """修改.gitignore后重新过滤"""
+    index = ProjectFileIndex(str(project))
+    index.refresh(max_age=0)
+    time.sleep(0.01)
+    (project / ".gitignore").write_text("*.log\n")
+    index.refresh(max_age=0)
+    assert "build/output.js" in index.files()
+    assert "docs/keep.log" not in index.files()
+
+
+def test_extract_candidates():
+    """从总结中提取路径、目录和标识符"""
+    candidates = extract_candidates(
+        "修改了 src/app/main.py 和 ./README.md，重构 UserService，整理 src/components/ 目录"
+    )
+    assert {"src/app/main.py", "README.md"} <= candidates["paths"]
+    assert "src/components" in candidates["dirs"]
+    assert "user_service" in candidates["identifiers"]
+
+
+def test_build_globs_collapses_directories():
+    """同目录同扩展名的多个文件合并为通配模式"""
+    globs = build_globs(
+        ["src/a/x.py", "src/a/y.py", "src/a/z.py", "src/b/only.ts", "src/a/w.md"]
+    )
+    assert globs == ["src/a/w.md", "src/a/*.py", "src/b/only.ts"]
+
+
+def test_derive_globs(project):
+    """推导出精确的globs"""
+    summary = (
+        "修复了 main.py 里的启动问题，调整了 UserService，"
+        "并改动 auth/login.py、auth/token.py、auth/session.py。"
+        "另外 build/output.js 是生成的文件，不相关的 missing.py 也被提到。"
+    )
+    globs = derive_globs(str(project), summary).split(",")
+    assert globs == [
+        "src/app/auth/*.py",
+        "src/app/main.py",
+        "src/app/user_service.py",
+    ]
+
+    assert derive_globs(str(project), "整理 src/components/ 下的组件") == (
+        "src/components/**"
+    )
+    assert derive_globs(str(project), "纯文本总结，没有提到任何文件") == ""
+
+
+@pytest.mark.asyncio
+async def test_create_memory_writes_globs(project):
+    """创建记忆时frontmatter包含推导出的globs"""
+    mcp_server = CursorMemoryMCP()
+    result = await mcp_server._create_cursor_memory(
+        {
+            "task_summary": "修改了 src/components/Button.tsx 的样式",
+            "task_name": "button_style",
+            "project_path": str(project),
+        }
+    )
+    assert json.loads(result[0]["text"])["globs"] == "src/components/Button.tsx"
+    content = (project / ".cursor" / "rules" / "button_style.mdc").read_text()
+    assert "globs: src/components/Button.tsx\n" in content
+
+    result = await mcp_server._create_cursor_memory(
+        {
+            "task_summary": "修改了 src/components/Button.tsx 的样式",
+            "task_name": "button_style_manual",
+            "project_path": str(project),
+            "auto_globs": False,
+        }
+    )
+    assert json.loads(result[0]["text"])["globs"] == ""
+
+
+@pytest.mark.slow
+def test_warm_index_100k_files():
+    """基准：十万文件仓库的热缓存刷新在一秒以内"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        for d in range(1000):
+            directory = root / f"pkg{d // 50}" / f"mod{d}"
+            directory.mkdir(parents=True)
+            for i in range(100):
+                (directory / f"file{i}.py").touch()
+
+        start = time.perf_counter()
+        get_file_index(temp_dir, max_age=0)
+        cold = time.perf_counter() - start
+
+        # 新进程：从持久化缓存启动
+        start = time.perf_counter()
+        index = ProjectFileIndex(temp_dir)
+        index.refresh(max_age=0)
+        assert len(index.files()) == 100_000
+        warm_start = time.perf_counter() - start
+
+        start = time.perf_counter()
+        get_file_index(temp_dir, max_age=0)
+        warm = time.perf_counter() - start
+
+        print(
+            f"\n十万文件索引: 冷启动 {cold:.2f}s, "
+            f"从缓存启动 {warm_start:.2f}s, 热刷新 {warm * 1000:.1f}ms"
+        )
+        assert warm < 1.0
+        assert warm_start < 1.0
@@ -0,0 +1,195 @@
+"""
+记忆版本历史的测试
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp import history
+from cursor_memory_mcp.history import (
+    INDEX_SUFFIX,
+    SNAPSHOT_DELTA_RATIO,
+    apply_delta,
+    archive_version,
+    get_version,
+    history_file,
+    history_size,
+    make_delta,
+)
+from cursor_memory_mcp.server import CursorMemoryMCP
+
+
+@pytest.fixture
+def mcp_server():
+    """创建MCP服务器实例"""
+    return CursorMemoryMCP()
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _summary(version: int, lines: int = 50) -> str:
+    """生成第version个版本的任务总结：每个版本只改动少量行"""
+    body = [f"第{i}行：实现了模块{i}的功能" for i in range(lines)]
+    body[version % lines] = f"第{version % lines}行：在版本{version}中修改"
+    body.append(f"版本 {version} 的进展")
+    return "\n".join(body)
+
+
+async def _write_versions(mcp_server, project: Path, count: int, lines: int = 50):
+    for version in range(1, count + 1):
+        await mcp_server._create_cursor_memory(
+            {
+                "task_summary": _summary(version, lines),
+                "task_name": "evolving_task",
+                "project_path": str(project),
+                # description固定，内容可以和 _generate_file_content 的结果比较
+                "auto_description": False,
+            }
+        )
+
+
+def test_delta_round_trip():
+    """增量可以从基准还原出目标"""
+    base = "a\nb\nc\nd\n"
+    target = "a\nB\nc\ne\nf"
+    assert apply_delta(base, make_delta(base, target)) == target
+    assert apply_delta(target, make_delta(target, base)) == base
+    assert apply_delta("", make_delta("", "新内容")) == "新内容"
+    # 追加小节后旧内容是新内容的前缀
+    for old in ("a\nb\n", "a\nb", "a\r", ""):
+        new = old + "\n\n## s\nx\n"
+        assert apply_delta(new, make_delta(new, old)) == old
+
+
+@pytest.mark.asyncio
+async def test_every_version_reconstructs(mcp_server, temp_dir):
+    """跨越多个快照之后，每个版本都能被准确还原"""
+    count = 25
+    await _write_versions(mcp_server, temp_dir, count)
+
+    rules = temp_dir / ".cursor" / "rules"
+    assert [p.name for p in rules.iterdir()] == ["evolving_task.mdc"]
+    lines = history_file(str(temp_dir), "evolving_task").read_text(encoding="utf-8")
+    kinds = [json.loads(line)["kind"] for line in lines.splitlines()]
+    assert kinds.count("snapshot") >= 2 and kinds.count("delta") > count // 2
+
+    live_file = rules / "evolving_task.mdc"
+    for version in range(1, count + 1):
+        content = get_version(str(temp_dir), "evolving_task", version, live_file)
+        assert content == mcp_server._generate_file_content(
+            "evolving_task", _summary(version)
+        )
+
+
+@pytest.mark.asyncio
+async def test_reconstruction_bounded_by_delta_bytes(mcp_server, temp_dir, monkeypatch):
+    """还原任意版本应用的增量总量不超过一份内容的大小"""
+    count = 30
+    await _write_versions(mcp_server, temp_dir, count)
+
+    applied = []
+    original = history.apply_delta
+    monkeypatch.setattr(
+        history,
+        "apply_delta",
+        lambda base, ops: applied.append(len(json.dumps(ops))) or original(base, ops),
+    )
+
+    live_file = temp_dir / ".cursor" / "rules" / "evolving_task.mdc"
+    size = live_file.stat().st_size
+    for version in range(1, count + 1):
+        applied.clear()
+        get_version(str(temp_dir), "evolving_task", version, live_file)
+        assert sum(applied) < size * SNAPSHOT_DELTA_RATIO
+
+
+def test_index_avoids_rescanning(temp_dir, monkeypatch):
+    """归档读取索引而不是整个历史文件，索引与历史文件不符时重新扫描"""
+    project = str(temp_dir)
+    contents = [_summary(v) for v in range(6)]
+    for v in range(1, len(contents)):
+        archive_version(project, "task", contents[v - 1], contents[v])
+    path = history_file(project, "task")
+    assert path.with_suffix(INDEX_SUFFIX).is_file()
+
+    def scan(path):
+        raise AssertionError("不应重新扫描历史文件")
+
+    with monkeypatch.context() as m:
+        m.setattr(history, "_scan_index", scan)
+        version = archive_version(project, "task", contents[-1], "最新")
+    assert version == 7
+
+    # 中断的写入或从快照恢复后，索引与历史文件不符
+    first = path.read_bytes().splitlines(keepends=True)[0]
+    path.write_bytes(first)
+    assert archive_version(project, "task", contents[1], "最新") == 3
+
+
+@pytest.mark.asyncio
+async def test_history_tools(mcp_server, temp_dir):
+    """get_memory_history / get_memory_version 工具"""
+    await _write_versions(mcp_server, temp_dir, 3)
+
+    result = await mcp_server._get_memory_history(
+        {"project_path": str(temp_dir), "task_name": "evolving_task"}
+    )
+    data = json.loads(result[0]["text"])
+    assert data["latest_version"] == 3
+    assert [v["kind"] for v in data["versions"]] == ["delta", "delta", "live"]
+
+    result = await mcp_server._get_memory_version(
+        {"project_path": str(temp_dir), "task_name": "evolving_task", "version": 2}
+    )
+    assert json.loads(result[0]["text"])["content"].endswith(_summary(2))
+
+    result = await mcp_server._get_memory_version(
+        {"project_path": str(temp_dir), "task_name": "evolving_task", "version": 9}
+    )
+    assert "版本不存在" in json.loads(result[0]["text"])["error"]
+
+    result = await mcp_server._get_memory_history(
+        {"project_path": str(temp_dir), "task_name": "missing_task"}
+    )
+    assert "记忆不存在" in json.loads(result[0]["text"])["error"]
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_storage_saved_at_100_versions(mcp_server, temp_dir):
+    """基准：100个版本时增量历史相对完整副本节省的存储"""
+    count = 100
+    await _write_versions(mcp_server, temp_dir, count, lines=400)
+
+    full_copies = sum(
+        len(
+            mcp_server._generate_file_content("evolving_task", _summary(v, 400)).encode(
+                "utf-8"
+            )
+        )
+        for v in range(1, count)
+    )
+    delta_bytes = history_size(str(temp_dir), "evolving_task")
+    saved = 1 - delta_bytes / full_copies
+
+    live_file = temp_dir / ".cursor" / "rules" / "evolving_task.mdc"
+    start = time.perf_counter()
+    for version in range(1, count + 1):
+        get_version(str(temp_dir), "evolving_task", version, live_file)
+    per_version_ms = (time.perf_counter() - start) * 1000 / count
+
+    print(
+        f"\n100个版本: 完整副本 {full_copies / 1024:.1f}KB, "
+        f"增量历史 {delta_bytes / 1024:.1f}KB, 节省 {saved:.1%}, "
+        f"平均还原耗时 {per_version_ms:.2f}ms"
+    )
+    assert saved > 0.8
@@ -0,0 +1,115 @@
+"""
+进程内传输和嵌入API的测试
+"""
+
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp import CursorMemoryMCP, ToolCallError, connect
+from cursor_memory_mcp.admission import AdmissionController
+from cursor_memory_mcp.trace_summary import iter_spans, trace_files
+from cursor_memory_mcp.tracing import JsonlSpanExporter, Tracer, set_tracer
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _create_arguments(project, name, summary="修改了 main.py 的登录逻辑"):
+    return {"task_summary": summary, "task_name": name, "project_path": project}
+
+
+@pytest.mark.asyncio
+async def test_full_protocol_path(temp_dir):
+    """经过初始化和工具分发创建、列出记忆，业务错误和协议错误分开返回"""
+    project = str(temp_dir)
+    async with connect() as client:
+        assert "create_cursor_memory" in await client.list_tools()
+
+        data = await client.call(
+            "create_cursor_memory", **_create_arguments(project, "login")
+        )
+        assert data["success"] is True
+        assert Path(data["file_path"]).is_file()
+
+        data = await client.call("list_cursor_memories", project_path=project)
+        assert [m["name"] for m in data["memories"]] == ["login"]
+
+        for name, summary in (("blank", "   "), ("bad name!", "总结")):
+            data = await client.call(
+                "create_cursor_memory", **_create_arguments(project, name, summary)
+            )
+            assert "参数验证失败" in data["error"]
+
+        with pytest.raises(ToolCallError, match="未知工具"):
+            await client.call("no_such_tool")
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_separate_clients(temp_dir):
+    """同一个服务实例上的每个连接是独立的客户端，并发请求都能完成"""
+    server = CursorMemoryMCP()
+    tracer = Tracer(JsonlSpanExporter(str(temp_dir / "traces.jsonl")))
+    previous = set_tracer(tracer)
+    try:
+        async with connect(server) as first, connect(server) as second:
+            results = await asyncio.gather(
+                *(
+                    client.call(
+                        "create_cursor_memory",
+                        **_create_arguments(str(temp_dir), f"task_{i}"),
+                    )
+                    for i, client in enumerate([first, second] * 3)
+                )
+            )
+    finally:
+        tracer.exporter.shutdown()
+        set_tracer(previous)
+    assert all(r["success"] for r in results)
+    roots = [
+        s
+        for s in iter_spans(trace_files(str(tracer.exporter.path)))
+        if s["name"] == "call_tool"
+    ]
+    client_ids = {s["attributes"]["client_id"] for s in roots}
+    assert len(roots) == 6 and len(client_ids) == 2
+    assert all(c.startswith("session-") for c in client_ids)
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_protocol_overhead_benchmark(temp_dir):
+    """基准：同样的写入直接调用和经过进程内MCP协议的耗时差"""
+    project = str(temp_dir)
+    # 不让速率限制影响测量
+    server = CursorMemoryMCP(admission=AdmissionController(rate=1e9, burst=10**9))
+    calls = 300
+
+    start = time.perf_counter()
+    for i in range(calls):
+        await server._handle_tool_call(
+            "create_cursor_memory", _create_arguments(project, f"direct_{i % 20}")
+        )
+    direct = (time.perf_counter() - start) / calls
+
+    async with connect(server) as client:
+        start = time.perf_counter()
+        for i in range(calls):
+            await client.call(
+                "create_cursor_memory", **_create_arguments(project, f"mcp_{i % 20}")
+            )
+        protocol = (time.perf_counter() - start) / calls
+
+    overhead = protocol - direct
+    print(
+        f"\n直接调用 {direct * 1000:.2f}ms, 进程内协议 {protocol * 1000:.2f}ms, "
+        f"协议开销 {overhead * 1000:.2f}ms/次"
+    )
+    assert overhead < 0.005
@@ -0,0 +1,303 @@
+"""
+关键词提取和自动description的测试
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.frontmatter import parse_memory_file
+from cursor_memory_mcp.keywords import (
+    candidate_phrases,
+    extract_keywords,
+    get_term_stats,
+)
+from cursor_memory_mcp.layout import get_layout
+from cursor_memory_mcp.server import CursorMemoryMCP
+
+# 固定语料：(名称, 总结, 人工标注的关键词)
+CORPUS = [
+    (
+        "deploy",
+        "部署步骤：先构建镜像再滚动发布。发布前需要跑数据库迁移，迁移脚本在"
+        " scripts/migrate.py。发布后用 kubectl rollout status 观察进度，"
+        "健康检查失败时执行 rollback.sh 回滚。",
+        [
+            "构建镜像",
+            "滚动发布",
+            "数据库迁移",
+            "kubectl rollout status",
+            "rollback.sh",
+            "回滚",
+            "scripts/migrate.py",
+        ],
+    ),
+    (
+        "redis_cache",
+        "Redis缓存的过期策略：热点数据的TTL设为10分钟，写入时先更新数据库再删除缓存。"
+        "缓存穿透用布隆过滤器拦截，缓存雪崩时给TTL加随机抖动。",
+        [
+            "过期策略",
+            "热点数据",
+            "TTL",
+            "删除缓存",
+            "缓存穿透",
+            "布隆过滤器",
+            "缓存雪崩",
+            "随机抖动",
+            "Redis",
+        ],
+    ),
+    (
+        "lint",
+        "ruff配置：行宽88，开启isort规则，black负责格式化。pre-commit 钩子里先跑"
+        " ruff check --fix 再跑 black。CI中的 lint 任务失败时不允许合并。",
+        [
+            "ruff",
+            "isort",
+            "black",
+            "pre-commit",
+            "ruff check",
+            "lint",
+            "行宽",
+            "格式化",
+        ],
+    ),
+    (
+        "auth_token",
+        "登录接口返回JWT访问令牌，有效期15分钟；刷新令牌存在HttpOnly Cookie中，"
+        "有效期7天。令牌签名密钥从环境变量读取，轮换密钥时新旧密钥同时生效一天。",
+        [
+            "JWT",
+            "访问令牌",
+            "刷新令牌",
+            "HttpOnly Cookie",
+            "签名密钥",
+            "轮换密钥",
+            "登录接口",
+            "环境变量",
+        ],
+    ),
+    (
+        "flaky_tests",
+        "Flaky tests in the payment service were caused by shared fixtures mutating"
+        " the global clock. Fixed by freezing time with freezegun and isolating the"
+        " database per test with transactional rollbacks.",
+        [
+            "flaky tests",
+            "payment service",
+            "shared fixtures",
+            "global clock",
+            "freezegun",
+            "freezing time",
+            "transactional rollbacks",
+        ],
+    ),
+    (
+        "db_pool",
+        "数据库连接池配置：SQLAlchemy 的 pool_size 设为20，max_overflow 为10，"
+        "pool_pre_ping 开启以剔除失效连接。连接池耗尽时接口超时，监控指标在 Grafana 面板。",
+        [
+            "连接池",
+            "SQLAlchemy",
+            "pool_size",
+            "max_overflow",
+            "pool_pre_ping",
+            "失效连接",
+            "Grafana",
+            "接口超时",
+            "连接池耗尽",
+        ],
+    ),
+    (
+        "frontend_build",
+        "前端构建从webpack迁移到Vite，构建时间从90秒降到12秒。环境变量改用"
+        " VITE_ 前缀，旧的 process.env 引用需要替换为 import.meta.env。",
+        [
+            "webpack",
+            "Vite",
+            "构建时间",
+            "VITE_",
+            "process.env",
+            "import.meta.env",
+            "前端构建",
+            "环境变量",
+        ],
+    ),
+    (
+        "logging",
+        "Structured logging with structlog: every request gets a request_id bound in"
+        " middleware, logs are emitted as JSON and shipped to Loki. Avoid logging"
+        " request bodies because they can contain personal data.",
+        [
+            "structured logging",
+            "structlog",
+            "request_id",
+            "middleware",
+            "JSON",
+            "Loki",
+            "personal data",
+            "request bodies",
+        ],
+    ),
+    (
+        "i18n",
+        "国际化：文案放在 locales/zh.json 和 locales/en.json，组件中用 t() 取值。"
+        "新增文案时两个语言文件都要补齐，缺失的键在CI中由 i18n-check 脚本报错。",
+        [
+            "国际化",
+            "locales/zh.json",
+            "locales/en.json",
+            "文案",
+            "语言文件",
+            "i18n-check",
+            "缺失的键",
+        ],
+    ),
+    (
+        "search_index",
+        "搜索索引按内容哈希增量更新，BM25打分，CJK文本按二元组切分。"
+        "进程池在第一次搜索时创建，工作进程缓存已加载的索引。",
+        [
+            "搜索索引",
+            "内容哈希",
+            "增量更新",
+            "BM25",
+            "二元组",
+            "进程池",
+            "工作进程",
+            "CJK",
+        ],
+    ),
+]
+
+
+def _matches(keyword: str, gold: list) -> bool:
+    """提取的短语和某个标注关键词互相包含即算命中"""
+    keyword = keyword.lower()
+    return any(keyword in g.lower() or g.lower() in keyword for g in gold)
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _write_corpus(project: Path):
+    rules = project / ".cursor" / "rules"
+    rules.mkdir(parents=True)
+    for name, summary, _ in CORPUS:
+        (rules / f"{name}.mdc").write_text(
+            f'---\ndescription: "{name}"\nglobs:\nalwaysApply: false\n---\n{summary}',
+            encoding="utf-8",
+        )
+
+
+def test_candidate_phrases():
+    """在虚词和标点处断开，英文短语最多3个单词"""
+    phrases = candidate_phrases(
+        "先构建镜像再滚动发布。Use kubectl rollout status to watch the deploy"
+    )
+    assert phrases[:2] == ["构建镜像", "滚动发布"]
+    assert "kubectl rollout status" in phrases
+    assert "watch" in phrases
+
+
+def test_precision_on_corpus(temp_dir):
+    """在固定语料上，提取的关键词大部分命中人工标注"""
+    _write_corpus(temp_dir)
+    stats = get_term_stats(str(temp_dir))
+    assert len(stats.docs) == len(CORPUS)
+
+    hits = total = 0
+    for _, summary, gold in CORPUS:
+        keywords = extract_keywords(summary, stats)
+        assert keywords
+        hits += sum(_matches(k, gold) for k in keywords)
+        total += len(keywords)
+    precision = hits / total
+    print(f"\n关键词precision@5: {precision:.2f}")
+    assert precision >= 0.8
+
+
+def test_stats_update_incrementally(temp_dir):
+    """清单变化后只重新分词变化了的记忆，删除的记忆从文档频率中去掉"""
+    _write_corpus(temp_dir)
+    stats = get_term_stats(str(temp_dir))
+    assert stats.indexed == len(CORPUS)
+    assert (stats.df["ruff"], stats.df["缓存"]) == (1, 2)
+
+    layout = get_layout(str(temp_dir))
+    path = layout.path_for("lint")
+    path.write_text("---\nglobs:\n---\n缓存预热脚本", encoding="utf-8")
+    layout.register("lint", path, path.read_text(encoding="utf-8"))
+    assert get_term_stats(str(temp_dir)).indexed == 1
+    assert stats.df["缓存"] == 3
+    assert "ruff" not in stats.df
+
+
+@pytest.mark.asyncio
+async def test_create_writes_keyword_description(temp_dir):
+    """创建记忆时description带有总结的关键词，可以关闭"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    _, summary, gold = CORPUS[1]
+
+    async def create(name, **options):
+        result = await server._handle_tool_call(
+            "create_cursor_memory",
+            {
+                "task_summary": summary,
+                "task_name": name,
+                "project_path": project,
+                **options,
+            },
+        )
+        data = json.loads(result[0]["text"])
+        assert data["success"] is True
+        text = Path(data["file_path"]).read_text(encoding="utf-8")
+        return parse_memory_file(text)[0]["description"]
+
+    description = await create("redis_cache")
+    assert description.startswith("redis_cache: ")
+    keywords = description.split(": ", 1)[1].split(", ")
+    assert len(keywords) == 5
+    assert sum(_matches(k, gold) for k in keywords) >= 4
+
+    description = await create("plain", auto_description=False)
+    assert description == "get the summary of previous step: plain"
+
+
+@pytest.mark.slow
+def test_extraction_benchmark(temp_dir):
+    """基准：2000条记忆的项目中每次写入提取关键词的耗时"""
+    project = str(temp_dir)
+    rules = temp_dir / ".cursor" / "rules"
+    rules.mkdir(parents=True)
+    for i in range(2000):
+        _, summary, _ = CORPUS[i % len(CORPUS)]
+        (rules / f"m{i}.mdc").write_text(
+            f"---\nglobs:\n---\n{summary} 第{i}条", encoding="utf-8"
+        )
+    get_term_stats(project)
+    layout = get_layout(project)
+
+    timings = []
+    for i in range(50):
+        _, summary, _ = CORPUS[i % len(CORPUS)]
+        path = layout.path_for(f"m{i}")
+        content = f"---\nglobs:\n---\n{summary} 修改{i}"
+        path.write_text(content, encoding="utf-8")
+        layout.register(f"m{i}", path, content)
+        start = time.perf_counter()
+        extract_keywords(summary, get_term_stats(project))
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    median = timings[len(timings) // 2] * 1000
+    print(f"\n关键词提取 2000条记忆: 中位数 {median:.2f}ms")
+    assert median < 5
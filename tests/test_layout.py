@@ -0,0 +1,286 @@
+"""
+分片目录布局与迁移的测试
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.budget import analyze_rule_budget
+from cursor_memory_mcp.layout import (
+    MemoryLayout,
+    get_layout,
+    hash_shard,
+    manifest_file,
+    reshard,
+)
+from cursor_memory_mcp.server import CursorMemoryMCP, main
+from cursor_memory_mcp.transfer import export_memories, import_memories
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _make_flat_project(root: Path, count: int) -> Path:
+    project = root / "project"
+    rules = project / ".cursor" / "rules"
+    rules.mkdir(parents=True)
+    for i in range(count):
+        (rules / f"task_{i}.mdc").write_text(f"内容 {i}", encoding="utf-8")
+    return project
+
+
+def _contents(project: Path) -> dict:
+    rules = project / ".cursor" / "rules"
+    return {p.stem: p.read_text(encoding="utf-8") for p in rules.rglob("*.mdc")}
+
+
+class TestLayout:
+    """测试名称到路径的转换"""
+
+    def test_flat_by_default(self, temp_dir):
+        """没有清单时使用平铺布局"""
+        layout = MemoryLayout(str(temp_dir))
+        assert layout.scheme == "flat"
+        assert layout.path_for("task") == temp_dir / ".cursor" / "rules" / "task.mdc"
+
+    def test_sharded_paths(self, temp_dir):
+        """hash按名称哈希分片，date按创建月份分片"""
+        layout = MemoryLayout(str(temp_dir))
+        layout.scheme = "hash"
+        shard = hash_shard("task")
+        assert len(shard) == 2
+        assert layout.path_for("task").parent.name == shard
+
+        layout.scheme = "date"
+        path = layout.path_for("task", datetime(2024, 5, 3))
+        assert path.relative_to(layout.root).as_posix() == "2024/05/task.mdc"
+
+    def test_corrupt_manifest_rebuilt(self, temp_dir):
+        """清单损坏时遍历目录重建；布局无从得知，退回平铺布局"""
+        project = _make_flat_project(temp_dir, 20)
+        reshard(str(project), "hash")
+        manifest_file(str(project)).write_text("{broken", encoding="utf-8")
+
+        layout = MemoryLayout(str(project))
+        assert layout.scheme == "flat"
+        assert len(layout.names()) == 20
+        assert layout.path_for("task_0").parent.name == hash_shard("task_0")
+        assert json.loads(manifest_file(str(project)).read_text())["scheme"] == "flat"
+
+    def test_nested_rules_keep_flat(self, temp_dir):
+        """手写的嵌套规则不会把平铺项目改成分片布局"""
+        project = _make_flat_project(temp_dir, 3)
+        nested = project / ".cursor" / "rules" / "frontend" / "react.mdc"
+        nested.parent.mkdir()
+        nested.write_text("React组件规范", encoding="utf-8")
+
+        layout = get_layout(str(project))
+        assert layout.scheme == "flat"
+        assert layout.path_for("react") == nested
+        assert layout.path_for("login") == project / ".cursor" / "rules" / "login.mdc"
+
+
+class TestReshard:
+    """测试原地迁移"""
+
+    def test_round_trip(self, temp_dir):
+        """flat -> hash -> date -> flat，内容和修改时间保持不变"""
+        project = _make_flat_project(temp_dir, 50)
+        expected = _contents(project)
+        old_mtime = (project / ".cursor" / "rules" / "task_0.mdc").stat().st_mtime
+
+        stats = reshard(str(project), "hash")
+        assert stats.moved == 50 and not stats.errors
+        rules = project / ".cursor" / "rules"
+        assert not list(rules.glob("*.mdc"))
+        assert _contents(project) == expected
+        assert len(get_layout(str(project)).names()) == 50
+
+        reshard(str(project), "date")
+        assert _contents(project) == expected
+        month = datetime.fromtimestamp(old_mtime).strftime("%Y/%m")
+        assert (rules / month / "task_0.mdc").stat().st_mtime == old_mtime
+
+        stats = reshard(str(project), "flat")
+        assert stats.moved == 50
+        assert _contents(project) == expected
+        assert sorted(p.name for p in rules.iterdir()) == sorted(
+            f"{name}.mdc" for name in expected
+        )
+        manifest = json.loads(manifest_file(str(project)).read_text())
+        assert manifest["scheme"] == "flat"
+        assert {m["shard"] for m in manifest["memories"].values()} == {""}
+
+    def test_resume_interrupted(self, temp_dir):
+        """中断后新旧位置同时存在同一文件，重新运行不会产生重复"""
+        project = _make_flat_project(temp_dir, 10)
+        rules = project / ".cursor" / "rules"
+        # 模拟分片已发布、旧文件尚未删除时中断
+        shard = rules / hash_shard("task_3")
+        shard.mkdir()
+        os.link(rules / "task_3.mdc", shard / "task_3.mdc")
+        (rules / ".reshard-leftover").mkdir()
+
+        stats = reshard(str(project), "hash")
+        assert not stats.errors
+        assert len(list(rules.rglob("task_3.mdc"))) == 1
+        assert len(_contents(project)) == 10
+        assert not (rules / ".reshard-leftover").exists()
+
+    def test_cli(self, temp_dir, capsys):
+        """reshard子命令输出迁移统计"""
+        project = _make_flat_project(temp_dir, 5)
+        assert main(["reshard", str(project), "--scheme", "hash"]) == 0
+        result = json.loads(capsys.readouterr().out)
+        assert result["scheme"] == "hash"
+        assert result["moved"] == 5
+
+
+class TestShardedProject:
+    """测试分片布局下的工具和批量操作"""
+
+    @pytest.mark.asyncio
+    async def test_create_and_history(self, temp_dir):
+        """创建、更新记忆都写入分片目录并登记到清单"""
+        project = _make_flat_project(temp_dir, 3)
+        reshard(str(project), "hash")
+        server = CursorMemoryMCP()
+        arguments = {
+            "task_summary": "新任务",
+            "task_name": "new_task",
+            "project_path": str(project),
+        }
+        for summary in ("第一版", "第二版"):
+            arguments["task_summary"] = summary
+            result = await server._create_cursor_memory(arguments)
+            assert json.loads(result[0]["text"])["success"] is True
+
+        rules = project / ".cursor" / "rules"
+        assert (rules / hash_shard("new_task") / "new_task.mdc").exists()
+        assert not (rules / "new_task.mdc").exists()
+        assert "new_task" in MemoryLayout(str(project)).shards
+
+        result = await server._get_memory_history(
+            {"task_name": "new_task", "project_path": str(project)}
+        )
+        assert len(json.loads(result[0]["text"])["versions"]) == 2
+
+    def test_budget_and_transfer(self, temp_dir):
+        """预算分析和导出导入可以处理分片布局"""
+        project = _make_flat_project(temp_dir, 30)
+        reshard(str(project), "date")
+        assert analyze_rule_budget(str(project))["memory_count"] == 30
+
+        output = temp_dir / "memories.jsonl"
+        assert export_memories(str(project), str(output)).exported == 30
+
+        target = temp_dir / "target"
+        target.mkdir()
+        reshard(str(target), "hash")
+        assert import_memories(str(target), str(output)).imported == 30
+        assert len(MemoryLayout(str(target)).names()) == 30
+        assert not list((target / ".cursor" / "rules").glob("*.mdc"))
+
+
+class TestManifest:
+    """测试增量维护的记忆清单"""
+
+    @pytest.mark.asyncio
+    async def test_create_updates_metadata(self, temp_dir):
+        """创建记忆时写入元数据，更新时保留创建时间并递增代数"""
+        server = CursorMemoryMCP()
+        arguments = {
+            "task_summary": "第一版",
+            "task_name": "task",
+            "task_description": "示例任务",
+            "project_path": str(temp_dir),
+        }
+        await server._create_cursor_memory(arguments)
+        first = json.loads(manifest_file(str(temp_dir)).read_text())
+        meta = first["memories"]["task"]
+        path = temp_dir / ".cursor" / "rules" / "task.mdc"
+        assert meta["size"] == path.stat().st_size
+        assert meta["description"].startswith("示例任务: ")
+        assert meta["shard"] == ""
+
+        arguments["task_summary"] = "第二版，内容更长"
+        await server._create_cursor_memory(arguments)
+        second = json.loads(manifest_file(str(temp_dir)).read_text())
+        assert second["generation"] > first["generation"]
+        assert second["memories"]["task"]["created"] == meta["created"]
+        assert second["memories"]["task"]["hash"] != meta["hash"]
+
+    def test_detects_out_of_band_changes(self, temp_dir):
+        """清单之外新增或删除文件后，目录修改时间变化触发重建"""
+        project = _make_flat_project(temp_dir, 3)
+        rules = project / ".cursor" / "rules"
+        assert get_layout(str(project)).names() == ["task_0", "task_1", "task_2"]
+
+        (rules / "manual.mdc").write_text("手工添加", encoding="utf-8")
+        (rules / "task_0.mdc").unlink()
+        layout = get_layout(str(project))
+        assert layout.names() == ["manual", "task_1", "task_2"]
+        assert layout.is_consistent()
+
+    @pytest.mark.asyncio
+    async def test_list_reads_manifest(self, temp_dir, monkeypatch):
+        """列出记忆只读取清单，不遍历目录"""
+        from cursor_memory_mcp import layout as layout_module
+
+        project = _make_flat_project(temp_dir, 4)
+        get_layout(str(project))
+
+        def fail(*args, **kwargs):
+            raise AssertionError("不应遍历目录")
+
+        monkeypatch.setattr(layout_module, "walk_memory_files", fail)
+        monkeypatch.setattr(layout_module, "iter_memory_files", fail)
+        result = await CursorMemoryMCP()._list_cursor_memories(
+            {"project_path": str(project)}
+        )
+        data = json.loads(result[0]["text"])
+        assert data["success"] is True
+        assert data["memory_count"] == 4
+        assert data["total_bytes"] == sum(m["bytes"] for m in data["memories"])
+        assert [m["name"] for m in data["memories"]][0] == "task_0"
+
+    def test_upgrades_old_manifest(self, temp_dir):
+        """旧版本清单保留布局，元数据通过扫描目录补全"""
+        project = _make_flat_project(temp_dir, 5)
+        reshard(str(project), "hash")
+        manifest_file(str(project)).write_text(
+            json.dumps({"version": 1, "scheme": "hash", "shards": {}}),
+            encoding="utf-8",
+        )
+        layout = MemoryLayout(str(project))
+        assert layout.scheme == "hash"
+        assert layout.memories["task_1"]["hash"]
+        assert layout.memories["task_1"]["shard"] == hash_shard("task_1")
+
+    def test_concurrent_registers(self, temp_dir):
+        """多个实例同时写入时清单不会丢失条目"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        project = _make_flat_project(temp_dir, 0)
+
+        def write(worker):
+            layout = MemoryLayout(str(project))
+            for i in range(25):
+                name = f"w{worker}_{i}"
+                path = layout.path_for(name)
+                path.write_text(name, encoding="utf-8")
+                layout.register(name, path, name)
+
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(write, range(4)))
+        layout = MemoryLayout(str(project))
+        assert len(layout.names()) == 100
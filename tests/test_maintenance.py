@@ -0,0 +1,122 @@
+"""
+多项目离线维护命令的测试
+"""
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.layout import get_layout, rules_dir
+from cursor_memory_mcp.maintenance import resolve_projects
+from cursor_memory_mcp.minhash import signature_file
+from cursor_memory_mcp.search import index_file
+from cursor_memory_mcp.server import main
+from cursor_memory_mcp.store import MemoryStore
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _make_projects(root: Path, count: int = 3):
+    projects = []
+    for i in range(count):
+        project = root / "repos" / f"repo{i}"
+        project.mkdir(parents=True)
+        MemoryStore(str(project)).create_many(
+            [
+                {"task_name": f"task_{k}", "task_summary": f"项目{i}第{k}条总结"}
+                for k in range(i + 1)
+            ]
+        )
+        projects.append(str(project.resolve()))
+    return projects
+
+
+def test_resolve_projects(temp_dir):
+    """glob只匹配目录并去重，直接给出的路径必须存在"""
+    projects = _make_projects(temp_dir)
+    (temp_dir / "repos" / "notes.txt").write_text("x")
+    pattern = str(temp_dir / "repos" / "*")
+    assert resolve_projects([pattern, projects[0]]) == projects
+    assert resolve_projects([str(temp_dir / "none*")]) == []
+    with pytest.raises(ValueError, match="项目路径不存在"):
+        resolve_projects([str(temp_dir / "missing")])
+
+
+def test_reindex_stats_compact(temp_dir, capsys):
+    """维护命令在进程池中处理每个项目，进度写到标准错误"""
+    projects = _make_projects(temp_dir)
+    pattern = str(temp_dir / "repos" / "*")
+    for project in projects:
+        index_file(project).unlink(missing_ok=True)
+
+    assert main(["reindex", pattern, "--full", "-j", "2"]) == 0
+    captured = capsys.readouterr()
+    summary = json.loads(captured.out)
+    assert summary["succeeded"] == 3 and summary["jobs"] == 2
+    assert [r["memories"] for r in summary["projects"].values()] == [1, 2, 3]
+    assert all(r["signatures"] == r["memories"] for r in summary["projects"].values())
+    assert all(index_file(p).is_file() for p in projects)
+    assert captured.err.count("完成") == 3
+
+    assert main(["stats", *projects, "-j", "1"]) == 0
+    stats = json.loads(capsys.readouterr().out)["projects"]
+    assert [s["memory_count"] for s in stats.values()] == [1, 2, 3]
+
+    stale = rules_dir(projects[0]) / "task_0.mdc.tmp"
+    stale.write_text("x")
+    os.utime(stale, (time.time() - 7200,) * 2)
+    assert main(["compact", projects[0], "--keep", "0", "-j", "1"]) == 0
+    result = json.loads(capsys.readouterr().out)["projects"][projects[0]]
+    assert result["temp_files_removed"] == 1 and not stale.exists()
+    assert signature_file(projects[0]).is_file()
+    assert get_layout(projects[0]).is_consistent()
+
+
+def test_failures_and_errors(temp_dir, capsys):
+    """单个项目失败时其它项目照常完成，退出码为1"""
+    projects = _make_projects(temp_dir, 2)
+    signature_file(projects[1]).unlink()
+    signature_file(projects[1]).mkdir()
+    assert main(["compact", *projects, "-j", "1"]) == 1
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["succeeded"] == 1 and summary["failed"] == 1
+    assert "error" in summary["projects"][projects[1]]
+
+    assert main(["stats", str(temp_dir / "none*")]) == 1
+    assert "没有匹配的项目" in capsys.readouterr().err
+
+
+def test_export_many(temp_dir, capsys):
+    """多个项目并行导出到输出目录，每个项目一个文件"""
+    projects = _make_projects(temp_dir)
+    assert main(["export", *projects]) == 1
+    assert "-o" in capsys.readouterr().err
+
+    output = temp_dir / "exports"
+    assert main(["export", *projects, "-o", str(output), "--gzip", "-j", "2"]) == 0
+    results = json.loads(capsys.readouterr().out)["projects"]
+    assert [r["exported"] for r in results.values()] == [1, 2, 3]
+    files = sorted(p.name for p in output.iterdir())
+    assert len(files) == 3 and all(f.endswith(".jsonl.gz") for f in files)
+
+    target = temp_dir / "restored"
+    target.mkdir()
+    assert main(["import", str(target), results[projects[2]]["output"]]) == 0
+    assert json.loads(capsys.readouterr().out)["imported"] == 3
+
+
+def test_bench(capsys):
+    """bench输出两种调用方式的延迟分位数"""
+    assert main(["bench", "--calls", "5"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["calls"] == 5
+    assert report["direct"]["p50_ms"] > 0 and report["inprocess"]["p50_ms"] > 0
@@ -0,0 +1,215 @@
+"""
+MinHash近似重复检测的测试
+"""
+
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp import minhash
+from cursor_memory_mcp.frontmatter import parse_memory_file
+from cursor_memory_mcp.layout import get_layout
+from cursor_memory_mcp.minhash import (
+    SignatureStore,
+    estimate_jaccard,
+    get_signature_store,
+    minhash_signature,
+    signature_file,
+)
+from cursor_memory_mcp.server import CursorMemoryMCP
+
+SUMMARY = (
+    "修复JWT token过期后refresh失败的问题，改为在中间件里统一续期，并补充了单元测试"
+)
+REWORDED = (
+    "修复JWT token过期后refresh失败的问题，改成在中间件里统一续期，并补充了单元测试"
+)
+UNRELATED = (
+    "Docker构建缓存失效，调整COPY顺序让依赖层可以复用，镜像构建时间从8分钟降到2分钟"
+)
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _random_text(rng: random.Random, words: int = 40) -> str:
+    vocabulary = "缓存 连接池 超时 重试 日志 编码 索引 迁移 权限 部署 测试 配置".split()
+    return " ".join(
+        rng.choice(vocabulary) + str(rng.randrange(10000)) for _ in range(words)
+    )
+
+
+def test_similarity_estimate():
+    """措辞略有不同的文本相似度高，无关文本相似度低"""
+    a = minhash_signature(SUMMARY)
+    assert estimate_jaccard(a, minhash_signature(SUMMARY)) == 1.0
+    assert estimate_jaccard(a, minhash_signature(REWORDED)) > 0.8
+    assert estimate_jaccard(a, minhash_signature(UNRELATED)) < 0.2
+
+
+def test_pure_python_matches_numpy(monkeypatch):
+    """纯Python实现与NumPy实现的签名完全相同"""
+    if minhash.np is None:
+        pytest.skip("没有安装NumPy")
+    expected = minhash_signature(SUMMARY * 50)
+    expected_similarity = estimate_jaccard(expected, minhash_signature(REWORDED))
+    monkeypatch.setattr(minhash, "np", None)
+    assert minhash_signature(SUMMARY * 50) == expected
+    assert estimate_jaccard(expected, minhash_signature(REWORDED)) == (
+        expected_similarity
+    )
+
+
+def test_store_persistence_and_compaction(temp_dir):
+    """签名持久化，同名以最后一条为准，失效记录过多时压缩"""
+    store = SignatureStore(str(temp_dir))
+    store.add("jwt", minhash_signature(SUMMARY))
+    store.add("docker", minhash_signature(UNRELATED))
+    assert store.query(minhash_signature(REWORDED))[0][0] == "jwt"
+    assert store.query(minhash_signature(REWORDED), exclude="jwt") == []
+
+    # 另一个进程中的实例只读取新增的记录
+    other = SignatureStore(str(temp_dir))
+    other.refresh()
+    for _ in range(3):
+        store.add("jwt", minhash_signature(UNRELATED))
+    other.refresh()
+    assert other.records == 5 and len(other) == 2
+    assert other.query(minhash_signature(SUMMARY)) == []
+
+    size = signature_file(str(temp_dir)).stat().st_size
+    other.compact()
+    assert signature_file(str(temp_dir)).stat().st_size < size
+    store.refresh()
+    assert store.records == 2
+    assert {n for n, _ in store.query(minhash_signature(UNRELATED))} == {
+        "jwt",
+        "docker",
+    }
+
+
+def test_backfill_existing_memories(temp_dir):
+    """第一次使用时为已有的记忆补算签名"""
+    rules = temp_dir / ".cursor" / "rules"
+    rules.mkdir(parents=True)
+    content = CursorMemoryMCP()._generate_file_content("jwt", SUMMARY)
+    (rules / "jwt.mdc").write_text(content, encoding="utf-8")
+    get_layout(str(temp_dir))
+    minhash._stores.clear()
+    store = get_signature_store(str(temp_dir))
+    assert store.query(minhash_signature(REWORDED))[0][0] == "jwt"
+
+
+@pytest.mark.asyncio
+async def test_create_reports_and_merges_duplicates(temp_dir):
+    """创建时报告近似重复的记忆，merge时追加到已有记忆"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+
+    async def create(name, summary, **options):
+        result = await server._handle_tool_call(
+            "create_cursor_memory",
+            {
+                "task_summary": summary,
+                "task_name": name,
+                "project_path": project,
+                **options,
+            },
+        )
+        return json.loads(result[0]["text"])
+
+    first = await create("jwt_fix", SUMMARY)
+    assert "duplicates" not in first
+    # 更新同名记忆不算重复
+    assert "duplicates" not in await create("jwt_fix", SUMMARY)
+    assert "duplicates" not in await create("docker", UNRELATED)
+
+    reported = await create("jwt_again", REWORDED)
+    assert reported["duplicates"][0]["name"] == "jwt_fix"
+    assert reported["duplicates"][0]["similarity"] >= 0.8
+    assert Path(reported["file_path"]).exists()
+
+    before = {
+        name: get_layout(project).path_for(name).read_text(encoding="utf-8")
+        for name in ("jwt_fix", "jwt_again")
+    }
+    merged = await create("jwt_third", REWORDED + "。", on_duplicate="merge")
+    target = merged["merged_into"]
+    assert target in ("jwt_fix", "jwt_again")
+    assert not (temp_dir / ".cursor" / "rules" / "jwt_third.mdc").exists()
+    content = Path(merged["file_path"]).read_text(encoding="utf-8")
+    body = parse_memory_file(content)[1]
+    assert "jwt_third" in body and body.count("统一续期") == 2
+
+    # 合并前的内容存为目标记忆的上一个版本
+    result = await server._handle_tool_call(
+        "get_memory_version",
+        {
+            "project_path": project,
+            "task_name": target,
+            "version": merged["version"] - 1,
+        },
+    )
+    assert json.loads(result[0]["text"])["content"] == before[target]
+
+    invalid = await create("x", SUMMARY, on_duplicate="drop")
+    assert "参数验证失败" in invalid["error"]
+
+
+@pytest.mark.slow
+def test_minhash_benchmark(temp_dir):
+    """基准：5万条记忆时的签名计算、插入和查询延迟"""
+    rng = random.Random(1)
+    texts = [_random_text(rng) for _ in range(50000)]
+
+    start = time.perf_counter()
+    signatures = [minhash_signature(text) for text in texts]
+    signing_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+    store = SignatureStore(str(temp_dir))
+    start = time.perf_counter()
+    store.add_many((f"m{i}", s) for i, s in enumerate(signatures[:49000]))
+    bulk_s = time.perf_counter() - start
+
+    inserts = []
+    for i in range(49000, 50000):
+        start = time.perf_counter()
+        store.add(f"m{i}", signatures[i])
+        inserts.append((time.perf_counter() - start) * 1000)
+
+    queries = []
+    found = 0
+    for i in range(0, 50000, 250):
+        # 替换几个词，构造近似重复
+        words = texts[i].split()
+        words[rng.randrange(len(words))] = "改写"
+        signature = minhash_signature(" ".join(words))
+        start = time.perf_counter()
+        matches = store.query(signature)
+        queries.append((time.perf_counter() - start) * 1000)
+        found += any(name == f"m{i}" for name, _ in matches)
+
+    reloaded = SignatureStore(str(temp_dir))
+    start = time.perf_counter()
+    reloaded.refresh()
+    load_s = time.perf_counter() - start
+
+    print(
+        f"\nMinHash 5万条 ({'NumPy' if minhash.np is not None else '纯Python'}): "
+        f"签名 {signing_ms:.2f}ms/条, 批量插入4.9万条 {bulk_s:.1f}s, "
+        f"单条插入 p50 {statistics.median(inserts):.2f}ms, "
+        f"查询 p50 {statistics.median(queries):.3f}ms, "
+        f"加载 {load_s:.1f}s, 召回 {found}/{len(queries)}"
+    )
+    assert len(reloaded) == 50000
+    assert found >= len(queries) * 0.95
+    assert statistics.median(queries) < 5
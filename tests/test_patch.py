@@ -0,0 +1,215 @@
+"""
+按小节修改记忆的测试
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.frontmatter import parse_memory_file
+from cursor_memory_mcp.layout import content_hash, get_layout
+from cursor_memory_mcp.patch import (
+    HashMismatch,
+    PatchError,
+    apply_patches,
+    parse_patch,
+    update_memory_file,
+)
+from cursor_memory_mcp.server import CursorMemoryMCP
+
+DOCUMENT = """---
+description: "任务"
+globs:
+alwaysApply: false
+---
+开头说明
+
+## 背景
+旧的背景
+
+### 细节
+细节内容
+
+## 方案
+```python
+# 不是标题
+print(1)
+```
+
+## 结果
+成功
+"""
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _apply(*patches):
+    return apply_patches(DOCUMENT, [parse_patch(p) for p in patches])
+
+
+def test_replace_section():
+    """替换标题下的内容和下级小节，保留标题行和其它小节"""
+    result = _apply({"op": "replace", "heading": "## 背景", "content": "新的背景"})
+    assert "## 背景\n新的背景\n\n## 方案\n" in result
+    assert "细节" not in result
+    assert result.startswith(DOCUMENT[: DOCUMENT.index("## 背景")])
+
+
+def test_replace_subsection_and_match_without_hashes():
+    """下级小节可以单独替换，标题匹配时忽略#"""
+    result = _apply({"op": "replace", "heading": "细节", "content": "新细节\n\n"})
+    assert "旧的背景\n\n### 细节\n新细节\n\n## 方案" in result
+
+
+def test_insert_and_delete():
+    """insert插入到小节末尾（下级小节之后），delete删除整个小节"""
+    result = _apply(
+        {"op": "insert", "heading": "背景", "content": "补充说明"},
+        {"op": "delete", "heading": "结果"},
+        {"op": "insert", "content": "## 结论\n完成"},
+    )
+    assert "细节内容\n\n补充说明\n\n## 方案" in result
+    assert "## 结果" not in result
+    assert result.endswith("print(1)\n```\n\n## 结论\n完成\n")
+
+
+def test_code_block_is_not_heading():
+    """代码块中的#行不作为标题"""
+    with pytest.raises(PatchError, match="标题不存在"):
+        _apply({"op": "delete", "heading": "不是标题"})
+    result = _apply({"op": "replace", "heading": "方案", "content": "x"})
+    assert "print(1)" not in result
+
+
+def test_set_fields():
+    """修改frontmatter字段，正文不变"""
+    result = _apply(
+        {"op": "set", "field": "alwaysApply", "value": True},
+        {"op": "set", "field": "globs", "value": "src/**/*.py"},
+    )
+    fields, body = parse_memory_file(result)
+    assert fields == {
+        "description": "任务",
+        "globs": "src/**/*.py",
+        "alwaysApply": True,
+    }
+    assert body == parse_memory_file(DOCUMENT)[1]
+
+
+def test_invalid_patches():
+    """不合法的补丁在应用前被拒绝"""
+    for patch in (
+        {"op": "move"},
+        {"op": "replace", "content": "x"},
+        {"op": "insert", "heading": "背景"},
+        {"op": "set", "field": "name", "value": "x"},
+        {"op": "set", "field": "alwaysApply", "value": "yes"},
+    ):
+        with pytest.raises(PatchError):
+            parse_patch(patch)
+
+
+def test_update_rejects_stale_hash(temp_dir):
+    """内容哈希不一致时拒绝更新，文件不变"""
+    path = temp_dir / "m.mdc"
+    path.write_text(DOCUMENT, encoding="utf-8")
+    patches = [parse_patch({"op": "delete", "heading": "结果"})]
+    with pytest.raises(HashMismatch) as e:
+        update_memory_file(path, content_hash("旧内容"), patches)
+    assert e.value.current_hash == content_hash(DOCUMENT)
+    assert path.read_text(encoding="utf-8") == DOCUMENT
+
+    result = update_memory_file(path, content_hash(DOCUMENT), patches)
+    assert result.hash == content_hash(path.read_text(encoding="utf-8"))
+    assert "## 结果" not in path.read_text(encoding="utf-8")
+
+
+@pytest.mark.asyncio
+async def test_update_tool(temp_dir):
+    """读取版本得到哈希，更新后旧版本进入历史，旧哈希不能再次使用"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    await server._handle_tool_call(
+        "create_cursor_memory",
+        {
+            "task_summary": "## 背景\n旧的背景\n\n## 结果\n成功",
+            "task_name": "task",
+            "project_path": project,
+        },
+    )
+    result = await server._handle_tool_call(
+        "get_memory_version",
+        {"project_path": project, "task_name": "task", "version": 1},
+    )
+    read = json.loads(result[0]["text"])
+    arguments = {
+        "project_path": project,
+        "task_name": "task",
+        "expected_hash": read["hash"],
+        "patches": [
+            {"op": "replace", "heading": "背景", "content": "新的背景"},
+            {"op": "set", "field": "description", "value": "修正后的背景"},
+        ],
+    }
+    result = await server._handle_tool_call("update_cursor_memory", arguments)
+    data = json.loads(result[0]["text"])
+    assert data["success"] is True
+    assert data["version"] == 2
+
+    content = Path(data["file_path"]).read_text(encoding="utf-8")
+    assert "新的背景" in content and "旧的背景" not in content
+    meta = get_layout(project).memories["task"]
+    assert meta["hash"] == data["hash"]
+    assert meta["description"] == "修正后的背景"
+
+    result = await server._handle_tool_call("update_cursor_memory", arguments)
+    conflict = json.loads(result[0]["text"])
+    assert conflict["conflict"] is True
+    assert conflict["current_hash"] == data["hash"]
+
+    arguments["expected_hash"] = data["hash"]
+    arguments["patches"] = [{"op": "delete", "heading": "不存在"}]
+    result = await server._handle_tool_call("update_cursor_memory", arguments)
+    assert "标题不存在" in json.loads(result[0]["text"])["error"]
+
+
+@pytest.mark.slow
+def test_patch_benchmark():
+    """基准：补丁应用的耗时随文件大小线性增长"""
+    timings = {}
+    for sections in (2000, 4000, 8000, 16000):
+        body = "".join(
+            f"## 第{i}节\n" + f"第{i}节的内容，记录一次排查过程。\n" * 10 + "\n"
+            for i in range(sections)
+        )
+        text = f'---\ndescription: "大记忆"\nglobs:\nalwaysApply: false\n---\n{body}'
+        patches = [
+            parse_patch({"op": "replace", "heading": "第0节", "content": "开头"}),
+            parse_patch(
+                {"op": "insert", "heading": f"第{sections // 2}节", "content": "中间"}
+            ),
+            parse_patch({"op": "delete", "heading": f"第{sections - 1}节"}),
+            parse_patch({"op": "set", "field": "alwaysApply", "value": True}),
+        ]
+        runs = []
+        for _ in range(5):
+            start = time.perf_counter()
+            apply_patches(text, patches)
+            runs.append(time.perf_counter() - start)
+        timings[len(text.encode("utf-8"))] = min(runs)
+
+    sizes = sorted(timings)
+    print(
+        "\n补丁应用: "
+        + ", ".join(f"{s / 1024 / 1024:.1f}MB {timings[s] * 1000:.1f}ms" for s in sizes)
+    )
+    # 文件大小增加到8倍，耗时的增长应接近8倍而不是64倍
+    assert timings[sizes[-1]] / timings[sizes[0]] < 16
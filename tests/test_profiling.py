@@ -0,0 +1,153 @@
+"""
+按需性能剖析的测试
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.profiling import (
+    Profiler,
+    default_output_dir,
+    profile_report,
+    to_thread,
+)
+from cursor_memory_mcp.server import CursorMemoryMCP
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _allocate():
+    return [bytearray(1024) for _ in range(200)]
+
+
+@pytest.mark.asyncio
+async def test_profiles_next_n_calls(temp_dir):
+    """只剖析接下来的N次调用，之后自动关闭"""
+    profiler = Profiler()
+    profiler.start(str(temp_dir), calls=2, mode="both")
+    kept = []
+
+    async def call():
+        kept.append(_allocate())
+        return "ok"
+
+    for _ in range(3):
+        assert await profiler.run("demo", call) == "ok"
+
+    assert not profiler.active
+    assert profiler.saved == 2
+    assert len(list(temp_dir.glob("*.prof"))) == 2
+    assert len(list(temp_dir.glob("*.alloc.json"))) == 2
+
+    report = profile_report(str(temp_dir), top_n=50)
+    assert report["profiles"] == 2
+    assert any("_allocate" in f["function"] for f in report["functions"])
+    assert "test_profiling.py" in report["allocations"][0]["site"]
+
+
+@pytest.mark.asyncio
+async def test_slow_threshold(temp_dir):
+    """设置阈值时只保存慢调用"""
+    profiler = Profiler()
+    profiler.start(str(temp_dir), calls=1, slow_ms=20)
+
+    async def fast():
+        pass
+
+    async def slow():
+        await asyncio.sleep(0.03)
+
+    await profiler.run("fast", fast)
+    assert profiler.active and profiler.saved == 0
+    await profiler.run("slow", slow)
+    assert not profiler.active
+    assert [p.name.split("_", 2)[2] for p in temp_dir.glob("*.prof")] == [
+        "slow_0001.prof"
+    ]
+
+
+def _worker_only():
+    return sum(i * i for i in range(20000))
+
+
+@pytest.mark.asyncio
+async def test_profiles_worker_threads(temp_dir):
+    """交给工作线程执行的函数也出现在剖析结果中"""
+    profiler = Profiler()
+    profiler.start(str(temp_dir), calls=1)
+
+    async def call():
+        return await to_thread(_worker_only)
+
+    assert await profiler.run("demo", call) == _worker_only()
+    report = profile_report(str(temp_dir), top_n=100)
+    assert any("_worker_only" in f["function"] for f in report["functions"])
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX权限")
+def test_private_output_dir(temp_dir):
+    """默认目录每个用户一个且权限为0700，其它用户可以写入的目录被拒绝"""
+    assert default_output_dir().endswith(f"-{os.getuid()}")
+    private = temp_dir / "profiles"
+    Profiler(str(private)).start(calls=1)
+    assert private.stat().st_mode & 0o777 == 0o700
+
+    shared = temp_dir / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        Profiler(str(shared)).start(calls=1)
+    with pytest.raises(PermissionError):
+        profile_report(str(shared))
+
+
+def test_disabled_by_default(monkeypatch):
+    """未设置环境变量时不开启剖析"""
+    monkeypatch.delenv("CURSOR_MEMORY_PROFILE_DIR", raising=False)
+    assert Profiler.from_env().active is False
+
+
+@pytest.mark.asyncio
+async def test_profiling_tools(temp_dir):
+    """start_profiling 和 get_profile_report 工具"""
+    project = temp_dir / "project"
+    project.mkdir()
+    profiles = temp_dir / "profiles"
+    elsewhere = temp_dir / "elsewhere"
+    mcp_server = CursorMemoryMCP(profiler=Profiler(str(profiles)))
+
+    # 客户端不能指定输出目录
+    result = await mcp_server._handle_tool_call(
+        "start_profiling", {"calls": 1, "output_dir": str(elsewhere)}
+    )
+    data = json.loads(result[0]["text"])
+    assert data["active"] is True
+    assert data["output_dir"] == str(profiles)
+
+    await mcp_server._handle_tool_call(
+        "create_cursor_memory",
+        {"task_summary": "总结", "task_name": "demo", "project_path": str(project)},
+    )
+
+    result = await mcp_server._handle_tool_call("get_profile_report", {"top_n": 5})
+    data = json.loads(result[0]["text"])
+    assert data["success"] is True
+    assert data["status"]["active"] is False
+    assert data["profiles"] == 1
+    assert len(data["functions"]) == 5
+    assert len(list(profiles.glob("*.prof"))) == 1
+    assert not elsewhere.exists()
+
+    result = await mcp_server._handle_tool_call("start_profiling", {"mode": "gpu"})
+    assert "参数验证失败" in json.loads(result[0]["text"])["error"]
@@ -0,0 +1,165 @@
+"""
+消息录制与回放的测试
+"""
+
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import anyio
+import mcp.types as types
+import pytest
+from mcp.shared.message import SessionMessage
+
+from cursor_memory_mcp.replay import (
+    load_recording,
+    record_messages,
+    redact_message,
+    replay,
+)
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _messages(project_path, count=3):
+    messages = [
+        {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": "initialize",
+            "params": {
+                "protocolVersion": "2024-11-05",
+                "capabilities": {},
+                "clientInfo": {"name": "test", "version": "1.0"},
+            },
+        },
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+    ]
+    for i in range(count):
+        messages.append(
+            {
+                "jsonrpc": "2.0",
+                "id": 3 + i,
+                "method": "tools/call",
+                "params": {
+                    "name": "create_cursor_memory",
+                    "arguments": {
+                        "task_summary": f"第{i}次总结：修改了 main.py",
+                        "task_name": "replay_task",
+                        "project_path": project_path,
+                    },
+                },
+            }
+        )
+    return messages
+
+
+def test_redact_message():
+    """脱敏保留长度和中英文比例，任务名映射稳定"""
+    message = _messages("/home/alice/secret-project")[3]
+    redacted = redact_message(message)
+    arguments = redacted["params"]["arguments"]
+    original = message["params"]["arguments"]
+    assert arguments["task_summary"] == "字x字字字字字字字 xxxxxxx"
+    assert len(arguments["task_name"]) == len(original["task_name"])
+    assert redact_message(message)["params"]["arguments"]["task_name"] == (
+        arguments["task_name"]
+    )
+    assert "alice" not in json.dumps(redacted)
+    assert redact_message(_messages("/p")[0]) == _messages("/p")[0]
+
+
+def test_redact_nested_arguments():
+    """补丁等嵌套参数中的内容同样被脱敏，结构字段保留"""
+    message = {
+        "jsonrpc": "2.0",
+        "id": 7,
+        "method": "tools/call",
+        "params": {
+            "name": "update_cursor_memory",
+            "arguments": {
+                "project_path": "/home/alice/secret-project",
+                "task_name": "login",
+                "patches": [
+                    {"op": "replace", "heading": "密钥", "content": "token abc123"},
+                    {"op": "set", "field": "description", "value": "alice的笔记"},
+                    {"op": "set", "field": "alwaysApply", "value": True},
+                ],
+            },
+        },
+    }
+    arguments = redact_message(message)["params"]["arguments"]
+    assert "alice" not in json.dumps(arguments, ensure_ascii=False)
+    assert arguments["patches"] == [
+        {"op": "replace", "heading": "字字", "content": "xxxxx xxxxxx"},
+        {"op": "set", "field": "description", "value": "xxxxx字字字"},
+        {"op": "set", "field": "alwaysApply", "value": True},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_record_messages(temp_dir):
+    """录制流把消息转发给服务，同时写入文件"""
+    path = temp_dir / "recording.jsonl"
+    send, receive = anyio.create_memory_object_stream(10)
+    for message in _messages("/p", count=1):
+        await send.send(SessionMessage(types.JSONRPCMessage.model_validate(message)))
+    await send.send(ValueError("无法解析的行"))
+    await send.aclose()
+
+    forwarded = []
+    async with record_messages(receive, str(path)) as recorded:
+        async for item in recorded:
+            forwarded.append(item)
+
+    assert len(forwarded) == 5
+    records = load_recording(str(path))
+    assert [r["message"].get("method") for r in records] == [
+        "initialize",
+        "notifications/initialized",
+        "tools/list",
+        "tools/call",
+    ]
+    assert records[3]["message"]["params"]["arguments"]["task_name"] == "replay_task"
+    assert all(r["t"] >= 0 for r in records)
+
+
+@pytest.mark.asyncio
+async def test_record_then_replay(temp_dir):
+    """录制真实服务进程收到的消息，再以最快速度回放到新进程"""
+    project = temp_dir / "project"
+    project.mkdir()
+    recording = temp_dir / "recording.jsonl"
+    stdin = "".join(json.dumps(m) + "\n" for m in _messages(str(project)))
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "cursor_memory_mcp.server",
+            "serve",
+            "--record",
+            str(recording),
+        ],
+        input=stdin.encode(),
+        capture_output=True,
+        timeout=30,
+    )
+    assert len(load_recording(str(recording))) == 6
+
+    report = await replay(
+        str(recording), speed=0, project_root=str(temp_dir / "replay"), timeout=30
+    )
+    assert report["responses"] == 5
+    assert report["unanswered"] == 0
+    assert report["errors"] == 0
+    assert report["by_method"]["tools/call:create_cursor_memory"]["count"] == 3
+    assert report["throughput_rps"] > 0
+    assert (temp_dir / "replay" / "project_0" / ".cursor" / "rules").is_dir()
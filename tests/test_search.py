@@ -0,0 +1,236 @@
+"""
+项目登记表与跨项目搜索的测试
+"""
+
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp import search
+from cursor_memory_mcp.access import SEARCH_WEIGHT, get_access_counters
+from cursor_memory_mcp.layout import manifest_file
+from cursor_memory_mcp.registry import ProjectRegistry
+from cursor_memory_mcp.search import (
+    index_file,
+    search_all_projects,
+    search_project,
+    tokenize,
+)
+from cursor_memory_mcp.server import CursorMemoryMCP
+
+_TOPICS = [
+    ("jwt_refresh", "修复JWT token过期后refresh失败的问题，改为在中间件里统一续期"),
+    ("redis_pool", "Redis连接池耗尽，调大max_connections并加上超时重试"),
+    ("docker_cache", "Docker构建缓存失效，调整COPY顺序让依赖层可以复用"),
+    ("flaky_tests", "pytest并发测试不稳定，临时目录改用tmp_path隔离"),
+    ("utf8_logs", "日志中文乱码，统一把handler的encoding设置为utf-8"),
+]
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _make_project(root: Path, name: str, memories: dict) -> str:
+    project = root / name
+    rules = project / ".cursor" / "rules"
+    rules.mkdir(parents=True)
+    for task_name, summary in memories.items():
+        content = CursorMemoryMCP()._generate_file_content(task_name, summary)
+        (rules / f"{task_name}.mdc").write_text(content, encoding="utf-8")
+    return str(project)
+
+
+def test_tokenize():
+    """ASCII按单词切分，CJK按二元组切分"""
+    assert tokenize("修复JWT token过期") == ["修复", "jwt", "token", "过期"]
+    assert tokenize("a 用 b_c") == ["用", "b_c"]
+
+
+def test_registry(temp_dir):
+    """登记表去重、持久化，并忽略不存在的目录"""
+    path = temp_dir / "projects.json"
+    registry = ProjectRegistry(path)
+    project = _make_project(temp_dir, "p", {"task": "内容"})
+    assert registry.add(project) is True
+    assert registry.add(project) is False
+    assert registry.add(str(temp_dir / "missing")) is False
+    (temp_dir / "no_rules").mkdir()
+    registry.add(str(temp_dir / "no_rules"))
+    assert ProjectRegistry(path).projects() == [project]
+
+
+def test_search_project_reuses_index(temp_dir):
+    """索引按内容哈希增量更新，未变化的记忆不重新分词"""
+    project = _make_project(temp_dir, "p", dict(_TOPICS))
+    first = search_project(project, "JWT过期", 3)
+    assert first["results"][0]["name"] == "jwt_refresh"
+    assert "JWT" in first["results"][0]["snippet"]
+    assert first["indexed"] == len(_TOPICS)
+    assert index_file(project).exists()
+
+    # 新进程（清空进程内缓存）从磁盘上的索引启动
+    search._indexes.clear()
+    rules = Path(project) / ".cursor" / "rules"
+    (rules / "new_task.mdc").write_text("Redis 哨兵切换", encoding="utf-8")
+    second = search_project(project, "redis", 3)
+    assert second["indexed"] == 1
+    assert {r["name"] for r in second["results"]} == {"redis_pool", "new_task"}
+
+
+def test_search_all_projects(temp_dir):
+    """多个项目并行搜索，合并前k条"""
+    projects = [
+        _make_project(
+            temp_dir, f"p{i}", {f"{name}_{i}": text for name, text in _TOPICS}
+        )
+        for i in range(3)
+    ]
+    report = search_all_projects("Docker 缓存", projects, top_k=4, max_workers=2)
+    assert report["projects_searched"] == 3
+    assert report["memories_searched"] == 15
+    assert not report["timed_out"] and not report["errors"]
+    # 只有每个项目的docker_cache包含查询词
+    assert sorted(r["name"] for r in report["results"]) == [
+        "docker_cache_0",
+        "docker_cache_1",
+        "docker_cache_2",
+    ]
+    report = search_all_projects("Docker 缓存 测试", projects, top_k=4)
+    assert len(report["results"]) == 4
+    assert report["results"][0]["name"].startswith("docker_cache")
+    assert search_all_projects("  ", projects)["results"] == []
+
+
+def test_search_timeout(temp_dir):
+    """超时的项目单独列出，整体延迟受超时限制"""
+    projects = [
+        _make_project(temp_dir, f"p{i}", {f"m{j}": "内容 " * 2000 for j in range(50)})
+        for i in range(4)
+    ]
+    start = time.perf_counter()
+    report = search_all_projects("内容", projects, timeout=0.001, max_workers=2)
+    assert time.perf_counter() - start < 1.0
+    assert report["timed_out"]
+    assert report["projects_searched"] + len(report["timed_out"]) == 4
+
+
+def test_timed_out_search_does_not_block_pool(temp_dir):
+    """已经开始执行的超时任务所在的进程池被终止，后续搜索不排在它们后面"""
+    small = _make_project(temp_dir, "small", dict(_TOPICS))
+    heavy = _make_project(
+        temp_dir, "heavy", {f"m{j}": f"内容 深入 {j} " * 5000 for j in range(100)}
+    )
+    # 先让工作进程启动，超时的任务才会真正开始执行
+    assert search_all_projects("Redis", [small], max_workers=1)["results"]
+    pool = search._pool
+    processes = list(pool._processes.values())
+
+    report = search_all_projects("内容", [heavy], timeout=0.3, max_workers=1)
+    assert report["timed_out"] == [heavy]
+    assert search._pool is not pool
+    for process in processes:
+        process.join(timeout=5)
+        assert not process.is_alive()
+
+    report = search_all_projects("Redis", [small], timeout=30, max_workers=1)
+    assert report["projects_searched"] == 1 and not report["timed_out"]
+
+
+def test_other_projects_read_only(temp_dir):
+    """其它项目只读打开：不写入清单和索引，目录变化仍然能搜索到"""
+    own = _make_project(temp_dir, "own", dict(_TOPICS[:2]))
+    other = _make_project(temp_dir, "other", dict(_TOPICS[2:]))
+    projects = [own, other]
+
+    report = search_all_projects("Docker 缓存", projects, writable=[own])
+    assert report["results"][0]["name"] == "docker_cache"
+    assert index_file(own).exists() and manifest_file(own).exists()
+    assert not (Path(other) / ".cursor" / "cache").exists()
+    assert not manifest_file(other).exists()
+
+    _make_project(temp_dir, "new", {"pnpm_lock": "pnpm锁文件冲突，重新生成lockfile"})
+    (temp_dir / "new" / ".cursor" / "rules" / "pnpm_lock.mdc").rename(
+        Path(other) / ".cursor" / "rules" / "pnpm_lock.mdc"
+    )
+    report = search_all_projects("pnpm 锁文件", projects, writable=[own])
+    assert report["results"][0]["name"] == "pnpm_lock"
+    assert sorted(p.name for p in (Path(other) / ".cursor").iterdir()) == ["rules"]
+
+
+@pytest.mark.asyncio
+async def test_search_tool_uses_registry(temp_dir):
+    """服务记录调用过的项目，search_all_projects在这些项目中搜索"""
+    server = CursorMemoryMCP(registry=ProjectRegistry(temp_dir / "projects.json"))
+    project = temp_dir / "project"
+    project.mkdir()
+    await server._handle_tool_call(
+        "create_cursor_memory",
+        {
+            "task_summary": _TOPICS[1][1],
+            "task_name": "redis_pool",
+            "project_path": str(project),
+        },
+    )
+    result = await server._handle_tool_call(
+        "search_all_projects", {"query": "连接池", "top_k": 5}
+    )
+    data = json.loads(result[0]["text"])
+    assert data["success"] is True
+    assert data["results"][0]["name"] == "redis_pool"
+    assert data["results"][0]["project"] == str(project.resolve())
+
+    # 从其它项目发起的搜索不改变命中项目的访问计数
+    counters = get_access_counters(str(project.resolve()))
+    other = temp_dir / "other"
+    other.mkdir()
+    await server._handle_tool_call(
+        "search_all_projects", {"query": "连接池", "project_path": str(other)}
+    )
+    assert "redis_pool" not in counters.scores()
+    await server._handle_tool_call(
+        "search_all_projects", {"query": "连接池", "project_path": str(project)}
+    )
+    assert counters.scores()["redis_pool"] == pytest.approx(SEARCH_WEIGHT, rel=0.01)
+
+
+@pytest.mark.slow
+def test_search_benchmark(temp_dir):
+    """基准：100个项目各50条记忆，冷索引和热索引的搜索延迟"""
+    projects = [
+        _make_project(
+            temp_dir,
+            f"p{i}",
+            {
+                f"{name}_{j}": f"{text} 第{j}次记录，项目{i}"
+                for j in range(10)
+                for name, text in _TOPICS
+            },
+        )
+        for i in range(100)
+    ]
+    start = time.perf_counter()
+    cold = search_all_projects("Redis 连接池", projects, timeout=30)
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for query in ["Redis 连接池", "JWT 过期", "Docker 缓存", "日志乱码", "pytest"] * 4:
+        report = search_all_projects(query, projects, timeout=30)
+        latencies.append(report["elapsed_ms"])
+        assert report["projects_searched"] == 100
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"\n跨项目搜索: 100个项目 {cold['memories_searched']} 条记忆, "
+        f"冷启动 {cold_ms:.0f}ms, 热缓存 p50 {p50:.0f}ms, p95 {p95:.0f}ms"
+    )
+    assert cold["memories_searched"] == 5000
+    assert p95 < 2000
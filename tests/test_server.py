@@ -4,7 +4,6 @@ Cursor Memory MCP Server 的测试套件
 
 import json
 import tempfile
-from datetime import datetime
 from pathlib import Path
 from unittest.mock import patch
 
@@ -163,7 +162,7 @@ alwaysApply: false
         # 验证文件内容
         content = file_path.read_text(encoding="utf-8")
         expected_content = """---
-description: "get the summary of previous step: 实现用户登录系统"
+description: "实现用户登录系统: 用户登录功能, 成功完成, 实现"
 globs:
 alwaysApply: false
 ---
@@ -172,7 +171,7 @@ alwaysApply: false
 
     @pytest.mark.asyncio
     async def test_create_cursor_memory_duplicate_filename(self, mcp_server, temp_dir):
-        """测试重复文件名处理"""
+        """测试重复文件名处理：只保留最新版本，旧版本进入历史"""
         # 先创建一个文件
         cursor_dir = temp_dir / ".cursor" / "rules"
         cursor_dir.mkdir(parents=True)
@@ -185,22 +184,23 @@ alwaysApply: false
             "project_path": str(temp_dir),
         }
 
-        # 模拟当前时间
-        mock_time = datetime(2024, 1, 1, 12, 0, 0)
-        with patch("cursor_memory_mcp.server.datetime") as mock_datetime:
-            mock_datetime.now.return_value = mock_time
-            mock_datetime.strftime = mock_time.strftime
-
-            result = await mcp_server._create_cursor_memory(arguments)
+        result = await mcp_server._create_cursor_memory(arguments)
 
         # 验证返回结果
         response_data = json.loads(result[0]["text"])
         assert response_data["success"] is True
-        assert "文件名已调整为" in response_data["message"]
+        assert response_data["version"] == 2
+        assert "旧版本已存入历史" in response_data["message"]
 
-        # 验证新文件被创建
-        new_file = cursor_dir / "test_task_20240101_120000.mdc"
-        assert new_file.exists()
+        # 验证没有创建带时间戳的新文件，正式文件是最新内容
+        assert [p.name for p in cursor_dir.iterdir()] == ["test_task.mdc"]
+        assert existing_file.read_text(encoding="utf-8").endswith("这是第二个任务")
+
+        # 验证旧版本可以从历史中读取
+        result = await mcp_server._get_memory_version(
+            {"project_path": str(temp_dir), "task_name": "test_task", "version": 1}
+        )
+        assert json.loads(result[0]["text"])["content"] == "existing content"
 
     @pytest.mark.asyncio
     async def test_create_cursor_memory_validation_error(self, mcp_server):
@@ -235,7 +235,7 @@ alwaysApply: false
         file_path = cursor_dir / "test_task.mdc"
         content = file_path.read_text(encoding="utf-8")
 
-        assert 'description: "get the summary of previous step: test_task"' in content
+        assert 'description: "test_task: 任务总结"' in content
 
     @pytest.mark.asyncio
     async def test_create_cursor_memory_permission_error(self, mcp_server, temp_dir):
@@ -258,6 +258,77 @@ alwaysApply: false
             assert "文件操作失败" in response_data["error"]
 
 
+class TestScope:
+    """测试写入项目和/或全局存储"""
+
+    @pytest.fixture
+    def dirs(self, monkeypatch):
+        """临时的项目目录和全局存储目录"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = Path(temp_dir)
+            project = root / "project"
+            project.mkdir()
+            store = root / "global"
+            monkeypatch.setenv("CURSOR_MEMORY_GLOBAL_DIR", str(store))
+            yield project, store
+
+    async def _create(self, project, scope):
+        result = await CursorMemoryMCP()._create_cursor_memory(
+            {
+                "task_summary": "使用uv管理Python环境",
+                "task_name": "tooling",
+                "project_path": str(project),
+                "scope": scope,
+            }
+        )
+        return json.loads(result[0]["text"])
+
+    @pytest.mark.asyncio
+    async def test_both(self, dirs):
+        """两个位置写入相同的内容，并分别报告结果"""
+        project, store = dirs
+        response = await self._create(project, "both")
+        assert response["success"] is True
+        assert set(response["targets"]) == {"project", "global"}
+        project_file = project / ".cursor" / "rules" / "tooling.mdc"
+        global_file = store / ".cursor" / "rules" / "tooling.mdc"
+        assert response["file_path"] == str(project_file)
+        assert response["targets"]["global"]["file_path"] == str(global_file)
+        assert project_file.read_text() == global_file.read_text()
+
+        response = await self._create(project, "both")
+        assert response["targets"]["global"]["version"] == 2
+
+    @pytest.mark.asyncio
+    async def test_global_only(self, dirs):
+        """只写全局存储时项目目录不变"""
+        project, store = dirs
+        response = await self._create(project, "global")
+        assert response["success"] is True
+        assert "targets" not in response
+        assert (store / ".cursor" / "rules" / "tooling.mdc").exists()
+        assert not (project / ".cursor" / "rules").exists()
+
+    @pytest.mark.asyncio
+    async def test_partial_failure(self, dirs):
+        """一个位置写入失败时报告部分成功"""
+        project, store = dirs
+        store.write_text("不是目录")
+        response = await self._create(project, "both")
+        assert response["success"] is False
+        assert response["partial"] is True
+        assert response["targets"]["project"]["version"] == 1
+        assert "文件操作失败" in response["targets"]["global"]["error"]
+        assert (project / ".cursor" / "rules" / "tooling.mdc").exists()
+
+    @pytest.mark.asyncio
+    async def test_invalid_scope(self, dirs):
+        """未知的scope返回参数验证错误"""
+        project, _ = dirs
+        response = await self._create(project, "team")
+        assert "参数验证失败" in response["error"]
+
+
 @pytest.mark.asyncio
 async def test_tool_listing():
     """测试工具列表功能"""
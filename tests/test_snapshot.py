@@ -0,0 +1,221 @@
+"""
+记忆快照的测试
+"""
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.layout import get_layout, manifest_file
+from cursor_memory_mcp.server import CursorMemoryMCP
+from cursor_memory_mcp.snapshot import (
+    create_snapshot,
+    list_snapshots,
+    restore_snapshot,
+    snapshots_dir,
+)
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+async def _call(server, name, **arguments):
+    result = await server._handle_tool_call(name, arguments)
+    return json.loads(result[0]["text"])
+
+
+async def _create(server, project, name, summary):
+    return await _call(
+        server,
+        "create_cursor_memory",
+        task_summary=summary,
+        task_name=name,
+        project_path=project,
+        on_duplicate="report",
+    )
+
+
+def _disk_usage(path: Path, exclude=()) -> int:
+    """目录中文件实际占用的块（硬链接只算一次，不计exclude中的inode）"""
+    seen = set(exclude)
+    total = 0
+    for directory, _, files in os.walk(path):
+        for filename in files:
+            stat = os.stat(os.path.join(directory, filename))
+            if stat.st_ino not in seen:
+                seen.add(stat.st_ino)
+                total += stat.st_blocks * 512
+    return total
+
+
+@pytest.mark.asyncio
+async def test_snapshot_links_files(temp_dir):
+    """快照复制变化了的记忆，未变化的链接上一个快照，从不与live文件共用inode"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    await _create(server, project, "deploy", "部署步骤：先构建镜像再滚动发布")
+    await _create(server, project, "deploy", "部署步骤：先跑迁移再滚动发布")
+
+    data = await _call(server, "snapshot_cursor_memories", project_path=project)
+    assert data["success"] is True
+    assert data["memories"] == 1
+    assert data["linked"] == 1 and data["copied"] == 1  # 历史文件链接，记忆复制
+    first = snapshots_dir(project) / data["snapshot_id"] / "rules" / "deploy.mdc"
+    live = temp_dir / ".cursor" / "rules" / "deploy.mdc"
+    assert not os.path.samefile(first, live)
+    assert first.stat().st_mtime_ns == live.stat().st_mtime_ns
+    assert [s["id"] for s in data["snapshots"]] == [data["snapshot_id"]]
+
+    data = await _call(server, "snapshot_cursor_memories", project_path=project)
+    assert data["linked"] == 2 and data["copied"] == 0
+    second = snapshots_dir(project) / data["snapshot_id"] / "rules" / "deploy.mdc"
+    assert os.path.samefile(first, second)
+    assert not os.path.samefile(second, live)
+
+
+@pytest.mark.asyncio
+async def test_restore_after_in_place_edit(temp_dir):
+    """编辑器原地保存live文件后，快照中的内容不变，恢复时换回"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    await _create(server, project, "deploy", "部署步骤：先构建镜像再滚动发布")
+    live = temp_dir / ".cursor" / "rules" / "deploy.mdc"
+    before = live.read_bytes()
+    snapshot_id = create_snapshot(project).snapshot_id
+
+    inode = live.stat().st_ino
+    with open(live, "r+b") as f:
+        f.write(before.replace("镜像".encode("utf-8"), "二进制".encode("utf-8")))
+    assert live.stat().st_ino == inode
+    snapshot = snapshots_dir(project) / snapshot_id
+    assert (snapshot / "rules" / "deploy.mdc").read_bytes() == before
+
+    stats = restore_snapshot(project, snapshot_id, backup=False)
+    assert (stats.restored, stats.unchanged) == (1, 0)
+    assert live.read_bytes() == before
+
+
+@pytest.mark.asyncio
+async def test_restore_rolls_back_changes(temp_dir):
+    """恢复后改写、追加、新建的记忆和历史都回到快照时的状态"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    await _create(server, project, "deploy", "部署步骤：先构建镜像再滚动发布")
+    await _create(server, project, "lint", "ruff配置：行宽88，开启isort")
+    rules = temp_dir / ".cursor" / "rules"
+    before = {p.name: p.read_text(encoding="utf-8") for p in rules.glob("*.mdc")}
+    snapshot_id = create_snapshot(project, "before-import").snapshot_id
+    assert snapshot_id.endswith("-before-import")
+
+    await _create(server, project, "deploy", "部署改为蓝绿发布，保留回滚脚本")
+    await _call(
+        server,
+        "append_cursor_memory",
+        project_path=project,
+        task_name="lint",
+        note="新增了mypy检查",
+    )
+    await _create(server, project, "cache", "Redis缓存的过期策略")
+    # 快照中的文件是副本，原地追加不影响快照
+    snapshot = snapshots_dir(project) / snapshot_id
+    assert (snapshot / "rules" / "lint.mdc").read_text(encoding="utf-8") == (
+        before["lint.mdc"]
+    )
+
+    data = await _call(
+        server, "restore_snapshot", project_path=project, snapshot_id=snapshot_id
+    )
+    assert data["success"] is True
+    assert (data["restored"], data["unchanged"], data["removed"]) == (2, 0, 1)
+    after = {p.name: p.read_text(encoding="utf-8") for p in rules.glob("*.mdc")}
+    assert after == before
+    assert sorted(get_layout(project).memories) == ["deploy", "lint"]
+    history = await _call(
+        server, "get_memory_history", project_path=project, task_name="deploy"
+    )
+    assert len(history["versions"]) == 1
+
+    # 恢复之前的状态也留了快照，可以撤销恢复
+    backup = data["backup_id"]
+    assert backup.endswith("-before-restore")
+    restore_snapshot(project, backup, backup=False)
+    assert sorted(get_layout(project).memories) == ["cache", "deploy", "lint"]
+    assert "蓝绿发布" in (rules / "deploy.mdc").read_text(encoding="utf-8")
+
+
+def test_retention(temp_dir, monkeypatch):
+    """超过保留数量时删除最旧的快照"""
+    project = str(temp_dir)
+    monkeypatch.setenv("CURSOR_MEMORY_SNAPSHOT_KEEP", "2")
+    ids = [create_snapshot(project).snapshot_id for _ in range(3)]
+    assert [s["id"] for s in list_snapshots(project)] == ids[1:]
+    stats = create_snapshot(project, keep=1)
+    assert stats.pruned == ids[1:]
+    assert [s["id"] for s in list_snapshots(project)] == [stats.snapshot_id]
+
+
+@pytest.mark.asyncio
+async def test_unknown_snapshot(temp_dir):
+    """快照不存在时返回错误和已有的快照"""
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    snapshot_id = create_snapshot(project).snapshot_id
+    for bad in ("missing", "../..", ".tmp-x"):
+        data = await _call(
+            server, "restore_snapshot", project_path=project, snapshot_id=bad
+        )
+        assert "快照不存在" in data["error"]
+        assert data["snapshots"] == [snapshot_id]
+
+
+@pytest.mark.slow
+def test_snapshot_benchmark(temp_dir):
+    """基准：1万条记忆的快照耗时和额外占用的空间"""
+    project = str(temp_dir)
+    rules = temp_dir / ".cursor" / "rules"
+    rules.mkdir(parents=True)
+    content = '---\ndescription: "m"\nglobs:\nalwaysApply: false\n---\n' + "x" * 2000
+    for i in range(10000):
+        (rules / f"m{i}.mdc").write_text(content, encoding="utf-8")
+    get_layout(project)
+
+    start = time.perf_counter()
+    first = create_snapshot(project)
+    first_s = time.perf_counter() - start
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        stats = create_snapshot(project)
+        timings.append(time.perf_counter() - start)
+    live_inodes = {p.stat().st_ino for p in rules.iterdir()}
+    live_inodes.add(manifest_file(project).stat().st_ino)
+    extra = _disk_usage(snapshots_dir(project), live_inodes)
+    live = _disk_usage(rules)
+    assert not live_inodes & {
+        p.stat().st_ino for p in snapshots_dir(project).glob("*/rules/*")
+    }
+
+    start = time.perf_counter()
+    restored = restore_snapshot(project, stats.snapshot_id, backup=False)
+    restore_s = time.perf_counter() - start
+
+    print(
+        f"\n快照 1万条记忆: 首次 {first_s * 1000:.0f}ms, "
+        f"之后 {min(timings) * 1000:.0f}ms, "
+        f"4个快照额外空间 {extra / 1024 / 1024:.1f}MB "
+        f"(记忆本身 {live / 1024 / 1024:.1f}MB), "
+        f"无变化时恢复 {restore_s * 1000:.0f}ms"
+    )
+    assert first.copied == 10000
+    assert stats.linked == 10000 and stats.copied == 0
+    assert restored.unchanged == 10000
+    # 只有第一个快照占用空间，之后的都链接它
+    assert extra < live * 1.1
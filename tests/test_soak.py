@@ -0,0 +1,88 @@
+"""
+多进程浸泡测试工具的测试
+"""
+
+import json
+
+import pytest
+
+from cursor_memory_mcp.soak import main, run_soak, summarize_resources
+
+
+def _samples(rss_step, fds_step, count=20):
+    return [
+        {
+            "t": i * 1.0,
+            "rss": 50 * 1024 * 1024 + i * rss_step,
+            "fds": 10 + i * fds_step,
+            "cpu_percent": 5.0,
+            "read_bytes": i * 100,
+            "write_bytes": i * 1000,
+        }
+        for i in range(count)
+    ]
+
+
+def test_summarize_resources_detects_drift():
+    """比较前后四分之一时间段，持续增长判定为疑似泄漏"""
+    stable = summarize_resources(_samples(0, 0))
+    assert stable["rss_growth"] == 0
+    assert stable["rss_slope_bytes_per_min"] == 0
+    assert stable["write_bytes"] == 19000
+    assert stable["leak_suspected"] is False
+
+    rss_leak = summarize_resources(_samples(2 * 1024 * 1024, 0))
+    assert rss_leak["rss_growth"] == 30 * 1024 * 1024
+    assert rss_leak["rss_slope_bytes_per_min"] == 120 * 1024 * 1024
+    assert rss_leak["leak_suspected"] is True
+
+    fd_leak = summarize_resources(_samples(0, 1))
+    assert fd_leak["fds_growth"] == 15
+    assert fd_leak["leak_suspected"] is True
+
+    assert summarize_resources([]) == {}
+
+
+@pytest.mark.asyncio
+async def test_short_soak_run(tmp_path):
+    """短时间运行一个进程，报告结构完整且没有错误"""
+    report = await run_soak(
+        processes=1, projects=2, duration=1.0, interval=0.2, work_dir=str(tmp_path)
+    )
+    assert report["schema"] == 1
+    assert report["requests"] > 0
+    assert report["errors"] == 0
+    assert report["by_tool"]["create_cursor_memory"]["count"] > 0
+    process = report["processes"][0]
+    assert process["exit_code"] is not None
+    assert process["resources"]["samples"] >= 5
+    assert process["resources"]["rss_peak"] > 0
+    assert "samples" not in process
+    assert list((tmp_path / "project_0" / ".cursor" / "rules").glob("*.mdc"))
+
+
+@pytest.mark.slow
+def test_soak_no_leaks(tmp_path):
+    """基准：4个进程共享8个项目运行30秒，没有错误和资源泄漏"""
+    output = tmp_path / "soak.json"
+    code = main(
+        [
+            "--processes",
+            "4",
+            "--duration",
+            "30",
+            "--work-dir",
+            str(tmp_path / "projects"),
+            "-o",
+            str(output),
+        ]
+    )
+    report = json.loads(output.read_text())
+    print(
+        f"\n浸泡测试: {report['requests']} 次请求, 吞吐 {report['throughput_rps']}/s, "
+        f"p50 {report['latency']['p50_ms']}ms, p99 {report['latency']['p99_ms']}ms, "
+        f"错误率 {report['error_rate']}, 漂移 {report['drift']}"
+    )
+    assert code == 0
+    assert report["error_rate"] == 0
+    assert report["drift"]["leak_suspected"] is False
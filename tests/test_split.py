@@ -0,0 +1,181 @@
+"""
+过大总结拆分的测试
+"""
+
+import io
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.frontmatter import parse_memory_file
+from cursor_memory_mcp.layout import get_layout
+from cursor_memory_mcp.server import CursorMemoryMCP
+from cursor_memory_mcp.split import iter_chunks, needs_split
+from cursor_memory_mcp.store import MemoryStore
+
+SECTION = "先构建镜像再滚动发布，发布前跑数据库迁移。"
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def _summary(sections: int, repeat: int = 60) -> str:
+    parts = []
+    for i in range(sections):
+        parts.append(f"## 第{i}部分 模块{i}\n")
+        parts.append(f"修改了 src/module_{i}.py。\n\n" + SECTION * repeat + "\n\n")
+    return "".join(parts)
+
+
+def test_split_at_headings():
+    """在标题处断开，代码块中的 # 不算标题，过小的小节和后面的小节合并"""
+    text = (
+        "# 简介\n很短\n"
+        "# 部署\n"
+        + SECTION * 50
+        + "\n```bash\n# 这是注释\nmake deploy\n```\n"
+        + "# 回滚\n"
+        + SECTION * 50
+    )
+    chunks = list(iter_chunks(io.StringIO(text), limit=4096))
+    assert [c.title for c in chunks] == ["简介", "回滚"]
+    assert "# 部署" in chunks[0].body and "# 这是注释" in chunks[0].body
+    assert chunks[1].body.startswith("# 回滚\n")
+
+
+def test_long_cjk_paragraph():
+    """没有换行的长段落在句末断开，每块不超过上限，不切开多字节字符"""
+    text = SECTION * 2000
+    chunks = list(iter_chunks(io.StringIO(text), limit=4096))
+    assert len(chunks) > 1
+    assert all(len(c.body.encode("utf-8")) <= 4096 for c in chunks)
+    assert all(c.body.endswith("。") for c in chunks)
+    assert "".join(c.body for c in chunks) == text
+
+
+def test_streams_input():
+    """第一块在读完全部输入之前产出"""
+    consumed = 0
+
+    def lines():
+        nonlocal consumed
+        for line in io.StringIO(_summary(20)):
+            consumed += 1
+            yield line
+
+    chunks = iter_chunks(lines(), limit=4096)
+    next(chunks)
+    assert consumed < 20
+
+
+def test_needs_split(monkeypatch):
+    """按UTF-8字节数判断，CJK文本的字节数是字符数的3倍"""
+    monkeypatch.setenv("CURSOR_MEMORY_SPLIT_BYTES", "300")
+    assert not needs_split("a" * 300)
+    assert needs_split("中" * 101)
+
+
+async def _create(server, project, summary, **options):
+    result = await server._handle_tool_call(
+        "create_cursor_memory",
+        {
+            "task_summary": summary,
+            "task_name": "release",
+            "project_path": project,
+            **options,
+        },
+    )
+    return json.loads(result[0]["text"])
+
+
+def _fields(path: Path) -> dict:
+    return parse_memory_file(path.read_text(encoding="utf-8"))[0]
+
+
+@pytest.mark.asyncio
+async def test_create_splits_large_summary(temp_dir, monkeypatch):
+    """过大的总结写成多个部分和一条父记忆，重新写入时删除多余的部分"""
+    monkeypatch.setenv("CURSOR_MEMORY_SPLIT_BYTES", "8192")
+    monkeypatch.setenv("CURSOR_MEMORY_CHUNK_BYTES", "4096")
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    (temp_dir / "src").mkdir()
+    for i in range(6):
+        (temp_dir / "src" / f"module_{i}.py").write_text("", encoding="utf-8")
+
+    data = await _create(server, project, _summary(6))
+    assert data["success"] is True
+    chunks = data["chunks"]
+    assert [c["name"] for c in chunks] == [f"release-p{i:03d}" for i in range(1, 7)]
+    assert [c["globs"] for c in chunks] == [f"src/module_{i}.py" for i in range(6)]
+
+    rules = temp_dir / ".cursor" / "rules"
+    parent = (rules / "release.mdc").read_text(encoding="utf-8")
+    assert "[第0部分 模块0](release-p001.mdc)" in parent
+    assert len(parent.encode("utf-8")) < 1024
+    descriptions = {_fields(rules / f"{c['name']}.mdc")["description"] for c in chunks}
+    assert len(descriptions) == 6
+    assert all(d.startswith("release - 第") for d in descriptions)
+
+    # 拆分成更少的部分时删除多余的部分，整体写入时删除所有部分
+    data = await _create(server, project, _summary(3))
+    assert len(data["chunks"]) == 3
+    assert data["version"] == 2
+    assert sorted(get_layout(project).memories) == [
+        "release",
+        "release-p001",
+        "release-p002",
+        "release-p003",
+    ]
+    data = await _create(server, project, _summary(3), split=False)
+    assert "chunks" not in data
+    assert [p.name for p in rules.glob("*.mdc")] == ["release.mdc"]
+    assert sorted(get_layout(project).memories) == ["release"]
+
+
+@pytest.mark.asyncio
+async def test_only_owned_chunks_removed(temp_dir, monkeypatch):
+    """只删除父记忆记录的部分，名称相似的其它记忆不受影响"""
+    monkeypatch.setenv("CURSOR_MEMORY_SPLIT_BYTES", "8192")
+    monkeypatch.setenv("CURSOR_MEMORY_CHUNK_BYTES", "4096")
+    server = CursorMemoryMCP()
+    project = str(temp_dir)
+    store = MemoryStore(project)
+    await _create(server, project, _summary(3))
+    owned = ["release-p001", "release-p002", "release-p003"]
+    assert get_layout(project).chunks_of("release") == owned
+    assert _fields(temp_dir / ".cursor" / "rules" / "release.mdc")["chunks"] == (
+        ",".join(owned)
+    )
+    # 编号紧接在拆分出的部分后面的手写记忆
+    store.create("release-p004", "手写的第4条发布检查项")
+
+    await _create(server, project, _summary(3))
+    await _create(server, project, _summary(3), split=False)
+    assert sorted(get_layout(project).memories) == ["release", "release-p004"]
+    await _create(server, project, _summary(3))
+    assert store.delete("release")
+    assert sorted(get_layout(project).memories) == ["release-p004"]
+
+
+@pytest.mark.slow
+def test_split_benchmark():
+    """基准：拆分2MB的中文总结"""
+    text = _summary(400, repeat=85)
+    start = time.perf_counter()
+    chunks = list(iter_chunks(io.StringIO(text)))
+    elapsed = time.perf_counter() - start
+    size = len(text.encode("utf-8"))
+    print(
+        f"\n拆分 {size / 1024 / 1024:.1f}MB: {len(chunks)} 个部分, "
+        f"{elapsed * 1000:.0f}ms ({size / elapsed / 1024 / 1024:.0f}MB/s)"
+    )
+    assert size > 2 * 1024 * 1024
+    assert all(len(c.body.encode("utf-8")) <= 16 * 1024 for c in chunks)
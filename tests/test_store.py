@@ -0,0 +1,166 @@
+"""
+MemoryStore库接口的测试
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+from pydantic import ValidationError
+
+from cursor_memory_mcp.layout import content_hash, get_layout
+from cursor_memory_mcp.patch import HashMismatch
+from cursor_memory_mcp.store import MemoryStore
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录用于测试"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+def test_create_read_list_delete(temp_dir):
+    """同步接口的完整流程，结果格式和MCP工具一致"""
+    store = MemoryStore(str(temp_dir))
+    result = store.create("login", "修改了 main.py 的登录逻辑", auto_description=False)
+    assert result["success"] is True
+    assert result["version"] == 1
+    assert store.create("login", "改为JWT登录")["version"] == 2
+
+    memory = store.read("login")
+    assert memory["body"] == "改为JWT登录"
+    assert memory["fields"]["description"].startswith("login")
+    assert [m["name"] for m in store.list()] == ["login"]
+
+    assert store.delete("login") is True
+    assert store.delete("login") is False
+    assert store.list() == []
+    with pytest.raises(KeyError):
+        store.read("login")
+
+
+def test_errors(temp_dir):
+    """参数错误抛出ValidationError，项目路径不存在时构造失败"""
+    store = MemoryStore(str(temp_dir))
+    with pytest.raises(ValidationError, match="task_name"):
+        store.create("bad name!", "总结")
+    with pytest.raises(ValueError, match="项目路径不存在"):
+        MemoryStore(str(temp_dir / "missing"))
+
+
+def test_create_many_single_manifest_write(temp_dir):
+    """批量创建先校验所有条目，写完后只写一次清单"""
+    store = MemoryStore(str(temp_dir))
+    store.create("existing", "旧的总结")
+    generation = get_layout(str(temp_dir)).generation
+
+    items = [
+        {"task_name": f"task_{i}", "task_summary": f"第{i}条：修改了 module_{i}.py"}
+        for i in range(20)
+    ]
+    items.append({"task_name": "existing", "task_summary": "新的总结"})
+    results = store.create_many(items, auto_globs=False)
+    assert [r["version"] for r in results] == [1] * 20 + [2]
+
+    layout = get_layout(str(temp_dir))
+    assert layout.generation == generation + 1
+    assert len(layout.memories) == 21
+    assert layout.is_consistent()
+    assert store.read("existing")["body"] == "新的总结"
+
+    # 任何一条不合法时不写入任何记忆
+    with pytest.raises(ValidationError):
+        store.create_many(
+            [
+                {"task_name": "fine", "task_summary": "总结"},
+                {"task_name": "blank", "task_summary": "  "},
+            ]
+        )
+    with pytest.raises(ValueError, match="重复"):
+        store.create_many([{"task_name": "a", "task_summary": "总结"}] * 2)
+    assert "fine" not in get_layout(str(temp_dir)).memories
+
+
+def test_append_update_history(temp_dir):
+    """追加、按小节修改和历史版本都经由MemoryStore，旧内容可以按版本读出"""
+    store = MemoryStore(str(temp_dir))
+    store.create("login", "## 背景\n旧的背景", auto_description=False)
+    original = store.version("login", 1)["content"]
+
+    appended = store.append("login", "加上了验证码", "进展")
+    assert appended["mode"] and appended["bytes_appended"] > 0
+    assert "加上了验证码" in store.read("login")["body"]
+
+    current = get_layout(str(temp_dir)).path_for("login").read_text(encoding="utf-8")
+    with pytest.raises(HashMismatch):
+        store.update("login", "0" * 64, [{"op": "delete", "heading": "背景"}])
+    patches = [{"op": "replace", "heading": "背景", "content": "新的背景"}]
+    updated = store.update("login", content_hash(current), patches)
+    assert updated["version"] == appended["version"] + 1
+    assert "新的背景" in store.read("login")["body"]
+
+    history = store.history("login")
+    assert history["latest_version"] == updated["version"]
+    assert store.version("login", 1)["content"] == original
+    assert store.version("login", updated["version"] - 1)["content"] == current
+
+    for call in (
+        lambda: store.append("missing", "x"),
+        lambda: store.update("missing", "", patches),
+        lambda: store.history("missing"),
+        lambda: store.version("login", 99),
+    ):
+        with pytest.raises(KeyError):
+            call()
+
+
+@pytest.mark.asyncio
+async def test_async_variants(temp_dir):
+    """异步版本在线程中执行，结果相同"""
+    store = MemoryStore(str(temp_dir))
+    results = await store.acreate_many(
+        [{"task_name": f"t{i}", "task_summary": f"总结{i}"} for i in range(3)]
+    )
+    assert all(r["success"] for r in results)
+    assert (await store.acreate("t0", "更新"))["version"] == 2
+    assert (await store.aread("t0"))["body"] == "更新"
+    assert len(await store.alist()) == 3
+    assert (await store.aappend("t0", "进展"))["bytes_appended"] > 0
+    history = await store.ahistory("t0")
+    assert (await store.aversion("t0", 1))["content"]
+    current = (await store.aversion("t0", history["latest_version"]))["hash"]
+    patch = {"op": "insert", "content": "## 结论\n完成"}
+    assert (await store.aupdate("t0", current, [patch]))["hash"] != current
+    assert await store.adelete("t1") is True
+
+
+@pytest.mark.slow
+def test_create_many_benchmark(temp_dir):
+    """基准：批量创建和逐条创建1000条记忆"""
+    count = 1000
+
+    def items(prefix):
+        return [
+            {
+                "task_name": f"{prefix}{i}",
+                "task_summary": " ".join(f"term{i * 31 + k}" for k in range(40)),
+            }
+            for i in range(count)
+        ]
+
+    (temp_dir / "one").mkdir()
+    (temp_dir / "many").mkdir()
+    store = MemoryStore(str(temp_dir / "one"))
+    start = time.perf_counter()
+    for item in items("m"):
+        store.create(**item)
+    single = time.perf_counter() - start
+
+    store = MemoryStore(str(temp_dir / "many"))
+    start = time.perf_counter()
+    store.create_many(items("m"))
+    batch = time.perf_counter() - start
+    print(f"\n{count}条记忆: 逐条 {single:.2f}s, 批量 {batch:.2f}s")
+    assert batch < single
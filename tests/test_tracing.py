@@ -0,0 +1,149 @@
+"""
+追踪与追踪汇总的测试
+"""
+
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from cursor_memory_mcp.server import CursorMemoryMCP
+from cursor_memory_mcp.trace_summary import (
+    SELF_TIME,
+    format_summary,
+    iter_spans,
+    summarize,
+    trace_files,
+)
+from cursor_memory_mcp.tracing import JsonlSpanExporter, Tracer, set_tracer, span
+
+
+@pytest.fixture
+def temp_dir():
+    """创建临时目录"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+@pytest.fixture
+def tracer(temp_dir):
+    """安装一个写入临时文件、全量采样的追踪器"""
+    tracer = Tracer(JsonlSpanExporter(str(temp_dir / "traces.jsonl")), 1.0)
+    previous = set_tracer(tracer)
+    yield tracer
+    tracer.exporter.shutdown()
+    set_tracer(previous)
+
+
+def _read_spans(tracer):
+    tracer.exporter.flush()
+    return list(iter_spans(trace_files(str(tracer.exporter.path))))
+
+
+def test_nested_spans(tracer):
+    """子span继承trace_id并指向父span，异常记录为错误状态"""
+    with span("root", tool="demo") as root:
+        with span("child"):
+            pass
+        with pytest.raises(ValueError):
+            with span("failing"):
+                raise ValueError("boom")
+        root.set_attribute("project", "/tmp/p")
+
+    spans = {s["name"]: s for s in _read_spans(tracer)}
+    assert spans["root"]["parent_span_id"] is None
+    assert spans["root"]["attributes"] == {"tool": "demo", "project": "/tmp/p"}
+    assert spans["child"]["trace_id"] == spans["root"]["trace_id"]
+    assert spans["child"]["parent_span_id"] == spans["root"]["span_id"]
+    assert spans["failing"]["status"] == "ERROR"
+    assert "boom" in spans["failing"]["error"]
+
+
+def test_head_sampling(temp_dir):
+    """未采样的根span及其子span都不导出"""
+    tracer = Tracer(JsonlSpanExporter(str(temp_dir / "traces.jsonl")), 0.0)
+    with tracer.span("root") as root:
+        with tracer.span("child") as child:
+            assert not root.sampled and not child.sampled
+    assert not (temp_dir / "traces.jsonl").exists()
+
+    disabled = Tracer()
+    with disabled.span("root") as root:
+        assert not root.sampled
+
+
+def test_exporter_rotation(temp_dir):
+    """文件超过大小上限后轮转，只保留指定数量的备份"""
+    exporter = JsonlSpanExporter(
+        str(temp_dir / "traces.jsonl"), max_bytes=200, backup_count=2
+    )
+    for i in range(50):
+        exporter.export({"span_id": str(i), "padding": "x" * 50})
+        exporter.flush()
+    exporter.shutdown()
+
+    names = sorted(p.name for p in temp_dir.iterdir())
+    assert names == ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"]
+    ids = [
+        int(s["span_id"])
+        for s in iter_spans(trace_files(str(temp_dir / "traces.jsonl")))
+    ]
+    assert ids == sorted(ids)
+    assert ids[-1] == 49
+
+
+def test_exporter_drops_when_full(temp_dir):
+    """队列满时丢弃span而不是阻塞"""
+    exporter = JsonlSpanExporter(str(temp_dir / "traces.jsonl"), queue_size=1)
+    # 写入线程尚未启动时直接占满队列
+    exporter._start = lambda: None
+    exporter.export({"span_id": "1"})
+    exporter.export({"span_id": "2"})
+    assert exporter.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_create_memory_spans(tracer, temp_dir):
+    """create_cursor_memory 调用记录各阶段的子span"""
+    project = temp_dir / "project"
+    project.mkdir()
+    mcp_server = CursorMemoryMCP()
+    arguments = {
+        "task_summary": "实现了登录功能",
+        "task_name": "login",
+        "project_path": str(project),
+    }
+    await mcp_server._handle_tool_call("create_cursor_memory", arguments)
+    await mcp_server._handle_tool_call("create_cursor_memory", arguments)
+    await mcp_server._handle_tool_call("create_cursor_memory", {"task_name": "x"})
+
+    spans = _read_spans(tracer)
+    roots = [s for s in spans if s["parent_span_id"] is None]
+    assert len(roots) == 3
+    assert roots[0]["attributes"]["tool"] == "create_cursor_memory"
+    assert roots[0]["attributes"]["project"] == str(project.resolve())
+    assert roots[0]["attributes"]["payload_bytes"] > 0
+    assert roots[2]["status"] == "ERROR"
+
+    second = {s["name"] for s in spans if s["trace_id"] == roots[1]["trace_id"]}
+    assert second == {
+        "call_tool",
+        "validate",
+        "redact",
+        "derive_globs",
+        "keywords",
+        "git_revision",
+        "near_duplicates",
+        "archive_version",
+        "write",
+        "rename",
+    }
+
+    summary = summarize(spans)
+    stats = summary["tools"]["create_cursor_memory"]
+    assert stats["count"] == 3
+    assert stats["errors"] == 1
+    assert stats["phases"]["validate"]["count"] == 3
+    assert stats["phases"]["archive_version"]["count"] == 1
+    assert SELF_TIME in stats["phases"]
+    assert "create_cursor_memory" in format_summary(summary)